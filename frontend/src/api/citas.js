@@ -4,6 +4,12 @@ export const citasService = {
   // Obtener todas las citas
   getAll: () => api.get('/citas/'),
   
+  // Obtener solo las citas creadas, modificadas o eliminadas desde el cursor (sin cursor: todas)
+  getCambios: (cursor) => api.get('/citas/citas/cambios/', { params: cursor ? { cursor } : {} }),
+  
+  // Mapa de ocupación por día y tipo de cita (sin mes: el año completo)
+  getOcupacion: (anio, mes) => api.get('/citas/citas/ocupacion/', { params: mes ? { anio, mes } : { anio } }),
+  
   // Obtener citas por fecha
   getByFecha: (fecha) => api.get(`/citas/?fecha=${fecha}`),
   
@@ -51,6 +57,21 @@ export const citasService = {
   // Eliminar una cita - Usar el endpoint específico con AllowAny permissions
   delete: (id) => api.delete(`/citas/eliminar/${id}/`),
   
+  // Primeros horarios libres desde una fecha (cualquier recurso), para la recepción
+  getProximosLibres: ({ tipoCita = 'podologia', duracion = 60, desde, limite = 5, dias = 60 } = {}) =>
+    api.get('/citas/citas/proximos_libres/', {
+      params: { tipo_cita: tipoCita, duracion, limite, dias, ...(desde ? { desde } : {}) },
+    }),
+  
+  // Cancelar, confirmar o reprogramar varias citas: { accion, ids | filtro, fecha, hora, desplazar_dias }
+  operacionMasiva: (operacion) => api.post('/citas/citas/masivo/', operacion),
+  
+  // Lista de espera y respuesta a las ofertas de horario (token del correo)
+  getListaEspera: (params = {}) => api.get('/citas/espera/', { params }),
+  agregarListaEspera: (entrada) => api.post('/citas/espera/', entrada),
+  aceptarOfertaEspera: (token) => api.post('/citas/espera/aceptar/', { token }),
+  rechazarOfertaEspera: (token) => api.post('/citas/espera/rechazar/', { token }),
+  
   // Obtener horarios disponibles - Usando el nuevo endpoint
   getHorariosDisponibles: (fecha, tipoCita = 'podologia') => {
     console.log(`🔍 SOLICITANDO HORARIOS: fecha=${fecha}, tipo_cita=${tipoCita}`);
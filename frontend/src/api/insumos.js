@@ -19,6 +19,27 @@ export const insumosService = {
   // Obtener insumos con stock crítico
   getStockCritico: () => api.get('/insumos/stock_critico/'),
   
+  // Alertas: stock crítico, vencidos y por vencer en los próximos `dias`
+  getAlertas: (dias = 30) => api.get('/insumos/alertas/', { params: { dias } }),
+  
+  // Lotes con existencias de un insumo (en orden de consumo) y recepción de varios lotes
+  getLotes: (id) => api.get(`/insumos/${id}/lotes/`),
+  recibirLotes: (lotes, motivo) => api.post('/insumos/recibir_lotes/', { lotes, motivo }),
+  
+  // Pronóstico de consumo y cantidades sugeridas a pedir (cálculo nocturno)
+  getReposicion: (soloReponer = false) => api.get('/insumos/reposicion/', { params: { solo_reponer: soloReponer } }),
+  
+  // Historial de movimientos: filtros insumo, tipo_movimiento, desde, hasta; paginado
+  // por cursor (seguir `next` de la respuesta)
+  getMovimientos: (params = {}) => api.get('/insumos/movimientos/', { params }),
+  getMovimientosPagina: (url) => api.get(url),
+  getResumenMovimientos: (periodo = 'dia', params = {}) =>
+    api.get('/insumos/movimientos/resumen/', { params: { ...params, periodo } }),
+  
+  // Valor del inventario y costo de materiales por mes (agrupar: 'tratamiento' o 'paciente')
+  getValorizacion: () => api.get('/insumos/valorizacion/'),
+  getCostos: (agrupar = 'tratamiento', params = {}) => api.get('/insumos/costos/', { params: { ...params, agrupar } }),
+  
   // Actualizar stock
   updateStock: (id, cantidad) => api.patch(`/insumos/${id}/stock/`, { cantidad }),
 }; 
\ No newline at end of file
@@ -4,6 +4,9 @@ export const pacientesService = {
   // Obtener todos los pacientes
   getAll: () => api.get('/pacientes/'),
   
+  // Obtener solo los pacientes creados, modificados o eliminados desde el cursor (sin cursor: todos)
+  getCambios: (cursor) => api.get('/pacientes/cambios/', { params: cursor ? { cursor } : {} }),
+  
   // Obtener un paciente por RUT
   getByRut: (rut) => api.get(`/pacientes/?rut=${rut}`),
   
@@ -112,5 +115,41 @@ export const pacientesService = {
       }
       throw error;
     }
-  }
-}; 
\ No newline at end of file
+  },
+
+  // PDF de una ficha clínica
+  getFichaPdf: (id) => api.get(`/pacientes/fichas/${id}/pdf/`, { responseType: 'blob' }),
+
+  // Lote de PDF de fichas: { paciente } o { desde, hasta } (YYYY-MM-DD). Devuelve { tarea, fichas }
+  generarPdfLote: (filtros) => api.post('/pacientes/fichas/pdf-lote/', filtros),
+
+  // Descarga del lote: 202 con { estado } mientras se genera, luego el ZIP
+  descargarPdfLote: (tarea) => api.get(`/pacientes/fichas/pdf-lote/${tarea}/`, { responseType: 'blob' }),
+
+  // Fotos de una ficha (con URLs de miniatura, versión web y original)
+  getAdjuntos: (fichaId) => api.get(`/pacientes/fichas/${fichaId}/adjuntos/`),
+
+  // Sube una foto por partes: inicia la subida, envía cada parte y la completa.
+  // Las variantes se generan en segundo plano (estado 'procesando' hasta quedar 'listo')
+  subirAdjunto: async (fichaId, archivo, { tipo = 'otro', descripcion = '' } = {}) => {
+    const { data: adjunto } = await api.post(`/pacientes/fichas/${fichaId}/adjuntos/`, {
+      nombre: archivo.name, tipo_contenido: archivo.type, tamano: archivo.size, tipo, descripcion,
+    });
+    for (let numero = 0; numero < adjunto.total_partes; numero += 1) {
+      const formData = new FormData();
+      formData.append('parte', archivo.slice(numero * adjunto.tamano_parte, (numero + 1) * adjunto.tamano_parte));
+      await api.put(`/pacientes/adjuntos/${adjunto.id}/partes/${numero}/`, formData);
+    }
+    return api.post(`/pacientes/adjuntos/${adjunto.id}/completar/`);
+  },
+
+  // Imagen de un adjunto: 'miniatura', 'web' u 'original' (el navegador la guarda en caché)
+  getArchivoAdjunto: (adjuntoId, variante = 'miniatura') =>
+    api.get(`/pacientes/adjuntos/${adjuntoId}/${variante}/`, { responseType: 'blob' }),
+
+  deleteAdjunto: (adjuntoId) => api.delete(`/pacientes/adjuntos/${adjuntoId}/`),
+
+  // Búsqueda de texto en las notas clínicas, por relevancia y paginada.
+  // filtros: { tipo: 'ficha' | 'paciente', paciente, page, page_size }. El fragmento viene en HTML
+  buscarNotas: (q, filtros = {}) => api.get('/pacientes/buscar/', { params: { q, ...filtros } }),
+};
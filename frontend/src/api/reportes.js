@@ -0,0 +1,15 @@
+import api from './axios';
+
+export const reportesService = {
+  // Indicadores de la clínica en un rango (YYYY-MM-DD; por defecto, los últimos 30 días)
+  getIndicadores: (desde, hasta) => api.get('/reportes/indicadores/', { params: { desde, hasta } }),
+  
+  // Los mismos indicadores por período: 'dia', 'semana' o 'mes'
+  getSerie: (desde, hasta, periodo = 'dia') => api.get('/reportes/serie/', { params: { desde, hasta, periodo } }),
+
+  // Exportación en CSV o XLSX de 'citas', 'pacientes', 'fichas' o 'movimientos' (columnas: lista de nombres)
+  exportar: (recurso, { formato = 'csv', columnas, desde, hasta } = {}) => api.get(`/exportar/${recurso}/`, {
+    params: { formato, columnas: columnas ? columnas.join(',') : undefined, desde, hasta },
+    responseType: 'blob',
+  }),
+};
@@ -69,6 +69,7 @@ const CalendarioCitas = () => {
   const [autoRefresh, setAutoRefresh] = useState(true);
   const [lastUpdate, setLastUpdate] = useState(new Date());
   const autoRefreshInterval = useRef(null);
+  const [enVivo, setEnVivo] = useState(false);
   const [modalOpen, setModalOpen] = useState(false);
   const [notificacion, setNotificacion] = useState({ visible: false, mensaje: '', tipo: 'info' });
 
@@ -95,8 +96,8 @@ const CalendarioCitas = () => {
   useEffect(() => {
     cargarDatos();
     
-    // Iniciar el intervalo de actualización automática
-    if (autoRefresh) {
+    // Iniciar el intervalo de actualización automática (no hace falta con los eventos en vivo)
+    if (autoRefresh && !enVivo) {
       autoRefreshInterval.current = setInterval(() => {
         if (!modalOpen) {
           cargarDatos();
@@ -111,7 +112,70 @@ const CalendarioCitas = () => {
         clearInterval(autoRefreshInterval.current);
       }
     };
-  }, [autoRefresh, modalOpen]);
+  }, [autoRefresh, modalOpen, enVivo]);
+  
+  // Eventos en vivo de la agenda (SSE). Si el servidor no los soporta, se sigue consultando cada 30 segundos.
+  // EventSource no envía headers: cada conexión pide antes un token de corta duración (no el JWT de la sesión,
+  // que quedaría en los logs de acceso al ir en la URL)
+  useEffect(() => {
+    if (!localStorage.getItem('authToken') || typeof EventSource === 'undefined') {
+      return undefined;
+    }
+    
+    let fuente = null;
+    let reconexion = null;
+    let cerrado = false;
+    
+    const aplicarEvento = (e) => {
+      const evento = JSON.parse(e.data);
+      if (evento.accion === 'eliminada') {
+        citasPorIdRef.current.delete(evento.id);
+      } else {
+        citasPorIdRef.current.set(evento.id, formatearCita(evento.cita));
+      }
+      setCitas(Array.from(citasPorIdRef.current.values()));
+    };
+    
+    const conectar = async () => {
+      let token;
+      try {
+        const response = await axiosInstance.post('/citas/eventos/token/');
+        token = response.data.token;
+      } catch (error) {
+        reconexion = setTimeout(conectar, 30000);
+        return;
+      }
+      if (cerrado) {
+        return;
+      }
+      let conectado = false;
+      fuente = new EventSource(`/api/citas/eventos/?token=${encodeURIComponent(token)}`);
+      
+      // Al (re)conectar se recuperan los cambios ocurridos mientras no había conexión
+      fuente.addEventListener('conectado', () => {
+        conectado = true;
+        setEnVivo(true);
+        cargarDatos();
+      });
+      ['creada', 'actualizada', 'eliminada'].forEach(tipo => fuente.addEventListener(tipo, aplicarEvento));
+      
+      // El token solo sirve para conectar: cada reconexión pide uno nuevo
+      fuente.onerror = () => {
+        setEnVivo(false);
+        fuente.close();
+        reconexion = setTimeout(conectar, conectado ? 3000 : 30000);
+      };
+    };
+    conectar();
+    
+    return () => {
+      cerrado = true;
+      clearTimeout(reconexion);
+      if (fuente) {
+        fuente.close();
+      }
+    };
+  }, []);
   
   // Efecto para controlar el estado de los modales
   useEffect(() => {
@@ -120,51 +184,69 @@ const CalendarioCitas = () => {
     setModalOpen(isAnyModalOpen);
   }, [showForm, showEditForm, showDeleteConfirm, selectedEvent]);
 
+  // Sincronización por cambios: cursor del último pedido y copia local por id
+  const cursoresRef = useRef({ citas: null, pacientes: null });
+  const citasPorIdRef = useRef(new Map());
+  const pacientesPorIdRef = useRef(new Map());
+
+  // Aplica una respuesta del feed de cambios sobre la copia local
+  const aplicarCambios = (mapa, datos, transformar = (item) => item) => {
+    if (datos.completo) {
+      mapa.clear();
+    }
+    datos.eliminados.forEach(id => mapa.delete(id));
+    datos.cambios.forEach(item => mapa.set(item.id, transformar(item)));
+  };
+
+  // Transformar una cita para el formato del calendario
+  const formatearCita = (cita) => {
+    console.log('Cita original del backend:', cita); // Ver los datos originales
+    console.log('tipo_cita en backend:', typeof cita.tipo_cita, cita.tipo_cita);
+    
+    // Crear una copia del objeto cita con tipo_cita asegurado
+    const citaConTipo = {
+      ...cita,
+      tipo_cita: cita.tipo_cita || 'podologia' // Asegurar que tiene tipo_cita
+    };
+    
+    console.log('Cita procesada para calendario:', citaConTipo);
+    
+    // Verificar si la cita tiene duración extendida (2 horas)
+    const duracionEnMinutos = cita.duracion_extendida 
+      ? 120 // 2 horas si es extendida
+      : (cita.tratamiento?.duracion_minutos || 60); // Usar la duración del tratamiento o 60 minutos por defecto
+    
+    return {
+      id: cita.id,
+      title: `${cita.paciente_nombre} - ${cita.tipo_tratamiento || cita.tratamiento_nombre}${cita.duracion_extendida ? ' (2h)' : ''}`,
+      start: new Date(`${cita.fecha}T${cita.hora}`),
+      end: new Date(new Date(`${cita.fecha}T${cita.hora}`).getTime() + duracionEnMinutos * 60000),
+      paciente: cita.paciente_nombre,
+      paciente_rut: cita.paciente_rut,
+      tratamiento: cita.tipo_tratamiento || cita.tratamiento_nombre,
+      estado: cita.estado,
+      resource: {
+        ...citaConTipo,
+        duracion_extendida: cita.duracion_extendida || false // Asegurar que tiene el campo duracion_extendida
+      }, 
+    };
+  };
+
   const cargarDatos = async () => {
     try {
+      // Solo se descargan los cambios desde la última actualización
       const [citasRes, pacientesRes] = await Promise.all([
-        citasService.getAll(),
-        pacientesService.getAll()
+        citasService.getCambios(cursoresRef.current.citas),
+        pacientesService.getCambios(cursoresRef.current.pacientes)
       ]);
       
-      // Transformar las citas para el formato del calendario
-      const citasFormateadas = Array.isArray(citasRes.data) 
-        ? citasRes.data.map(cita => {
-            console.log('Cita original del backend:', cita); // Ver los datos originales
-            console.log('tipo_cita en backend:', typeof cita.tipo_cita, cita.tipo_cita);
-            
-            // Crear una copia del objeto cita con tipo_cita asegurado
-            const citaConTipo = {
-              ...cita,
-              tipo_cita: cita.tipo_cita || 'podologia' // Asegurar que tiene tipo_cita
-            };
-            
-            console.log('Cita procesada para calendario:', citaConTipo);
-            
-            // Verificar si la cita tiene duración extendida (2 horas)
-            const duracionEnMinutos = cita.duracion_extendida 
-              ? 120 // 2 horas si es extendida
-              : (cita.tratamiento?.duracion_minutos || 60); // Usar la duración del tratamiento o 60 minutos por defecto
-            
-            return {
-                id: cita.id,
-                title: `${cita.paciente_nombre} - ${cita.tipo_tratamiento || cita.tratamiento_nombre}${cita.duracion_extendida ? ' (2h)' : ''}`,
-                start: new Date(`${cita.fecha}T${cita.hora}`),
-                end: new Date(new Date(`${cita.fecha}T${cita.hora}`).getTime() + duracionEnMinutos * 60000),
-                paciente: cita.paciente_nombre,
-                paciente_rut: cita.paciente_rut,
-                tratamiento: cita.tipo_tratamiento || cita.tratamiento_nombre,
-                estado: cita.estado,
-                resource: {
-                  ...citaConTipo,
-                  duracion_extendida: cita.duracion_extendida || false // Asegurar que tiene el campo duracion_extendida
-                }, 
-            }
-        })
-        : [];
+      // Solo se formatean las citas que cambiaron
+      aplicarCambios(citasPorIdRef.current, citasRes.data, formatearCita);
+      aplicarCambios(pacientesPorIdRef.current, pacientesRes.data);
+      cursoresRef.current = { citas: citasRes.data.cursor, pacientes: pacientesRes.data.cursor };
       
-      setCitas(citasFormateadas);
-      setPacientes(pacientesRes.data);
+      setCitas(Array.from(citasPorIdRef.current.values()));
+      setPacientes(Array.from(pacientesPorIdRef.current.values()));
       
       // Mostrar notificación solo si no es la carga inicial
       if (!loading) {
@@ -172,6 +254,10 @@ const CalendarioCitas = () => {
       }
     } catch (error) {
       console.error('Error al cargar datos:', error);
+      // Ante un error se descarta la copia local y la próxima carga es completa
+      cursoresRef.current = { citas: null, pacientes: null };
+      citasPorIdRef.current.clear();
+      pacientesPorIdRef.current.clear();
       setCitas([]);
       if (!loading) {
         mostrarNotificacion('Error al actualizar citas', 'error');
@@ -751,6 +837,7 @@ const CalendarioCitas = () => {
                   <option value="reservada">Reservada</option>
                   <option value="confirmada">Confirmada</option>
                   <option value="completada">Completada</option>
+                  <option value="no_asistio">No asistió</option>
                   <option value="cancelada">Cancelada</option>
                 </select>
               </div>
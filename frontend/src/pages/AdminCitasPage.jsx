@@ -1112,6 +1112,7 @@ const AdminCitasPage = () => {
                     if (cita.estado === 'confirmada') estadoClase = "bg-green-100 text-green-800";
                     else if (cita.estado === 'completada') estadoClase = "bg-green-100 text-green-800";
                     else if (cita.estado === 'cancelada') estadoClase = "bg-red-100 text-red-800";
+                    else if (cita.estado === 'no_asistio') estadoClase = "bg-gray-100 text-gray-800";
 
                     // Si la fecha es inválida, mostrar una fila de error
                     if (!fechaValida) {
@@ -1367,6 +1368,7 @@ const AdminCitasPage = () => {
                     <option value="reservada">Reservada</option>
                     <option value="confirmada">Confirmada</option>
                     <option value="completada">Completada</option>
+                    <option value="no_asistio">No asistió</option>
                     <option value="cancelada">Cancelada</option>
                   </select>
                 </div>
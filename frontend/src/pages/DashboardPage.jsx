@@ -87,6 +87,8 @@ const DashboardPage = () => {
         return 'bg-blue-100 text-blue-800';
       case 'cancelada':
         return 'bg-red-100 text-red-800';
+      case 'no_asistio':
+        return 'bg-gray-100 text-gray-800';
       default:
         return 'bg-yellow-100 text-yellow-800';
     }
@@ -0,0 +1,181 @@
+"""
+Disponibilidad de la agenda sobre varios recursos (profesionales o boxes).
+
+`cargar_agenda` lee en dos consultas los recursos activos de un tipo de cita y
+todas sus citas del rango pedido, sin importar cuántos recursos o días haya.
+`Agenda` guarda por recurso los intervalos ocupados ordenados por inicio, junto
+con el máximo fin acumulado, de modo que saber si un recurso está libre en un
+intervalo es una búsqueda binaria, y recorrer los horarios de un rango en orden
+responde "primer horario libre de cualquier recurso" en una sola pasada.
+
+Las citas sin recurso (cargas masivas) se cuentan en el primer recurso del tipo.
+Si un tipo de cita no tiene recursos se usa un recurso implícito (None), que es
+el comportamiento anterior de un solo recurso por tipo de cita. Las citas
+canceladas liberan su horario (ver Cita.ESTADOS_INACTIVOS).
+"""
+from bisect import bisect_left, insort
+from datetime import time, timedelta
+
+from django.core.exceptions import ValidationError
+
+from .models import Cita, Recurso
+
+# Horas de inicio ofrecidas, en bloques de una hora (8:00 a 22:00); la agenda cierra a las 23:00
+HORA_APERTURA = 8
+HORA_CIERRE = 22
+
+MINUTOS_DIA = 24 * 60
+
+
+def horas_inicio(duracion=60):
+    """Horas en que puede empezar una cita de `duracion` minutos sin pasar del cierre."""
+    ultima = HORA_CIERRE + 1 - (duracion + 59) // 60
+    return range(HORA_APERTURA, ultima + 1)
+
+
+def minuto_absoluto(fecha, hora):
+    """Minutos desde el origen del calendario; permite comparar instantes de días distintos."""
+    return fecha.toordinal() * MINUTOS_DIA + hora.hour * 60 + hora.minute
+
+
+class Agenda:
+    """Intervalos ocupados de cada recurso de un tipo de cita, listos para consultar disponibilidad."""
+
+    def __init__(self, recursos, citas):
+        """
+        `recursos`: ids de los recursos en orden de preferencia.
+        `citas`: tuplas (recurso_id, fecha, hora, duracion_minutos).
+        """
+        self.recursos = list(recursos) or [None]
+        principal = self.recursos[0]
+        intervalos = {recurso: [] for recurso in self.recursos}
+        for recurso, fecha, hora, duracion in citas:
+            if recurso is None:
+                recurso = principal
+            # Las citas de recursos inactivos no afectan a los recursos ofrecidos
+            if recurso in intervalos:
+                inicio = minuto_absoluto(fecha, hora)
+                intervalos[recurso].append((inicio, inicio + duracion))
+
+        self._inicios = {}
+        self._fines_maximos = {}
+        for recurso, lista in intervalos.items():
+            lista.sort()
+            self._inicios[recurso] = [inicio for inicio, _ in lista]
+            fines, maximo = [], None
+            for _, fin in lista:
+                maximo = fin if maximo is None else max(maximo, fin)
+                fines.append(maximo)
+            self._fines_maximos[recurso] = fines
+
+    def libre(self, recurso, inicio, fin):
+        """Indica si el recurso no tiene citas que se crucen con [inicio, fin)."""
+        # Última cita que empieza antes de `fin`; hay cruce si alguna de ellas termina después de `inicio`
+        indice = bisect_left(self._inicios[recurso], fin) - 1
+        return indice < 0 or self._fines_maximos[recurso][indice] <= inicio
+
+    def recursos_libres(self, fecha, hora, duracion=60):
+        inicio = minuto_absoluto(fecha, hora)
+        return [recurso for recurso in self.recursos if self.libre(recurso, inicio, inicio + duracion)]
+
+    def reservar(self, recurso, fecha, hora, duracion=60):
+        """Agrega una cita a la agenda en memoria (por ejemplo, al planificar varias reservas)."""
+        inicio = minuto_absoluto(fecha, hora)
+        inicios, fines = self._inicios[recurso], self._fines_maximos[recurso]
+        insort(inicios, inicio)
+        indice = inicios.index(inicio)
+        anterior = fines[indice - 1] if indice else inicio
+        fines.insert(indice, max(anterior, inicio + duracion))
+        for i in range(indice + 1, len(fines)):
+            fines[i] = max(fines[i], fines[i - 1])
+
+    def horas_disponibles(self, fecha, duracion=60):
+        """Horas de inicio ('HH:00') en que al menos un recurso está libre."""
+        return [
+            f"{hora:02d}:00"
+            for hora in horas_inicio(duracion)
+            if self.recursos_libres(fecha, time(hora), duracion)
+        ]
+
+    def horarios_libres(self, desde, hasta, duracion=60, despues_de=None):
+        """
+        Recorre en orden los horarios del rango [desde, hasta] y entrega
+        (fecha, hora, recursos libres) de cada horario con al menos un recurso libre.
+        `despues_de` (datetime) descarta los horarios que empiezan antes.
+
+        Es un barrido: como los horarios avanzan en el tiempo, cada recurso mantiene
+        un puntero a sus citas que solo avanza, y el recorrido completo cuesta
+        O(horarios × recursos + citas).
+        """
+        minimo = minuto_absoluto(despues_de.date(), despues_de.time()) if despues_de else None
+        punteros = {recurso: 0 for recurso in self.recursos}
+        fecha = desde
+        while fecha <= hasta:
+            for hora in horas_inicio(duracion):
+                inicio = minuto_absoluto(fecha, time(hora))
+                fin = inicio + duracion
+                if minimo is not None and inicio < minimo:
+                    continue
+                libres = []
+                for recurso in self.recursos:
+                    inicios = self._inicios[recurso]
+                    indice = punteros[recurso]
+                    # Citas que empiezan antes del fin del horario
+                    while indice < len(inicios) and inicios[indice] < fin:
+                        indice += 1
+                    punteros[recurso] = indice
+                    if indice == 0 or self._fines_maximos[recurso][indice - 1] <= inicio:
+                        libres.append(recurso)
+                if libres:
+                    yield fecha, time(hora), libres
+            fecha += timedelta(days=1)
+
+    def primer_horario_libre(self, desde, hasta, duracion=60):
+        """Primer (fecha, hora, recurso) libre del rango, o None si la agenda está llena."""
+        for fecha, hora, libres in self.horarios_libres(desde, hasta, duracion):
+            return fecha, hora, libres[0]
+        return None
+
+
+def cargar_agenda(tipo_cita, desde, hasta, excluir=None, bloquear=False):
+    """
+    Agenda de `tipo_cita` entre `desde` y `hasta` en dos consultas. `excluir` omite
+    una cita o una lista de ids (las que se están moviendo). Con `bloquear`, los
+    recursos quedan bloqueados (SELECT ... FOR UPDATE) hasta el fin de la
+    transacción para serializar reservas.
+    """
+    recursos = Recurso.objects.filter(tipo_cita=tipo_cita, activo=True).order_by('orden', 'id')
+    if bloquear:
+        recursos = recursos.select_for_update()
+    nombres = dict(recursos.values_list('id', 'nombre'))
+    citas = Cita.objects.filter(tipo_cita=tipo_cita, fecha__gte=desde, fecha__lte=hasta).exclude(
+        estado__in=Cita.ESTADOS_INACTIVOS
+    )
+    if isinstance(excluir, (list, tuple, set)):
+        citas = citas.exclude(pk__in=excluir)
+    elif excluir:
+        citas = citas.exclude(pk=excluir)
+    agenda = Agenda(nombres, citas.order_by().values_list('recurso_id', 'fecha', 'hora', 'duracion_cita'))
+    agenda.nombres = nombres
+    return agenda
+
+
+def asignar_recurso(cita):
+    """
+    Asigna a la cita un recurso libre en su horario: conserva el actual si sigue libre
+    y si no, el primero disponible. Lanza ValidationError si no hay ninguno.
+    """
+    campo = Cita._meta.get_field
+    fecha = campo('fecha').to_python(cita.fecha)
+    hora = campo('hora').to_python(cita.hora)
+    duracion = campo('duracion_cita').to_python(cita.duracion_cita)
+
+    agenda = cargar_agenda(cita.tipo_cita, fecha, fecha, excluir=cita.pk, bloquear=True)
+    libres = agenda.recursos_libres(fecha, hora, duracion)
+    if not libres:
+        raise ValidationError(
+            f'Ya existe una cita de {cita.tipo_cita} programada para la fecha {fecha} a las '
+            f'{hora:%H:%M}. Por favor seleccione otro horario.'
+        )
+    if cita.recurso_id not in libres:
+        cita.recurso_id = libres[0]
@@ -6,4 +6,12 @@ class CitasConfig(AppConfig):
     name = 'citas'
 
     def ready(self):
+        from podoclinic.invalidacion import registrar_modelo
+        from .models import Cita, Tratamiento
+
+        # Bus de invalidación de cachés locales: una cita afecta a su fecha y, si se
+        # movió, a la anterior (_fecha_guardada se actualiza en Cita.save después de las señales).
+        registrar_modelo(Cita, clave=lambda cita: {cita.fecha, getattr(cita, '_fecha_guardada', None)})
+        registrar_modelo(Tratamiento)
+
         import citas.signals  # Importar las señales al iniciar la aplicación
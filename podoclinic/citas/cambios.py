@@ -0,0 +1,72 @@
+"""
+Feed de cambios (delta-sync) para el calendario de citas.
+
+El cliente guarda el `cursor` que devuelve cada respuesta y lo envía en la
+siguiente consulta; solo recibe los registros creados o modificados desde
+entonces y los ids eliminados (tombstones de `Eliminacion`). Sin cursor, o con
+uno más antiguo que la retención de eliminaciones, recibe la lista completa.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Eliminacion
+
+# El cursor devuelto retrocede este margen para incluir escrituras de
+# transacciones que aún no confirmaban al momento de la consulta
+MARGEN_CURSOR = timedelta(seconds=5)
+
+# Eliminaciones más antiguas se depuran; un cursor anterior obliga a recargar todo
+RETENCION_ELIMINACIONES = timedelta(days=30)
+
+
+def leer_cursor(valor):
+    """Convierte el cursor recibido en datetime aware. Devuelve None si no viene."""
+    if not valor:
+        return None
+    # Un '+' sin codificar en la URL llega como espacio
+    fecha = parse_datetime(valor.strip().replace(' ', '+'))
+    if fecha is None:
+        raise ValueError(f'Cursor inválido: {valor}')
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha
+
+
+def respuesta_cambios(request, queryset, modelo, serializar, filtrar_cambios=None):
+    """
+    Arma la respuesta del feed de cambios para `queryset`.
+
+    `serializar(queryset)` devuelve los datos serializados de los registros y
+    `filtrar_cambios(queryset, desde)` permite ampliar qué cuenta como cambio
+    (por defecto, `ultima_actualizacion >= desde`).
+    """
+    ahora = timezone.now()
+    try:
+        desde = leer_cursor(request.query_params.get('cursor'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    completo = desde is None or desde < ahora - RETENCION_ELIMINACIONES
+    if completo:
+        registros = queryset
+        eliminados = []
+    else:
+        if filtrar_cambios:
+            registros = filtrar_cambios(queryset, desde)
+        else:
+            registros = queryset.filter(ultima_actualizacion__gte=desde)
+        eliminados = list(
+            Eliminacion.objects.filter(modelo=modelo, fecha__gte=desde)
+            .order_by().values_list('objeto_id', flat=True).distinct()
+        )
+
+    return Response({
+        'cursor': (ahora - MARGEN_CURSOR).isoformat(),
+        'completo': completo,
+        'cambios': serializar(registros),
+        'eliminados': eliminados,
+    })
@@ -0,0 +1,74 @@
+"""
+Cierre nocturno de las citas pasadas.
+
+Las citas quedan 'reservada' o 'confirmada' hasta que alguien las edita, y las
+consultas de citas activas (recordatorios, paneles) terminan recorriendo filas
+viejas. El cierre pasa las citas activas de días anteriores a:
+
+- 'completada' si estaban confirmadas o tienen una ficha clínica asociada;
+- 'no_asistio' en otro caso.
+
+Cada estado nuevo se aplica con UPDATE por lotes de ids, y cada lote deja su
+auditoría en HistorialEstadoCita en la misma transacción. Como toda escritura
+masiva, cada lote pasa por `propagar_escritura_masiva` (citas/masivo.py): resumen
+de ocupación, días pendientes de los reportes, cachés y agendas en vivo.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .masivo import propagar_escritura_masiva
+from .models import Cita, HistorialEstadoCita
+
+logger = logging.getLogger(__name__)
+
+# Citas por transacción: acota el tiempo de bloqueo de cada UPDATE
+LOTE_CIERRE = 2000
+
+# (estado nuevo, condición), en orden: la última regla toma el resto
+REGLAS_CIERRE = (
+    ('completada', Q(estado='confirmada') | Q(fichaclinica__isnull=False)),
+    ('no_asistio', Q()),
+)
+
+
+def cerrar_citas_pasadas(hasta=None, lote=LOTE_CIERRE):
+    """
+    Cierra las citas activas anteriores a `hasta` (por defecto, hoy). Devuelve
+    {estado nuevo: cantidad de citas}.
+    """
+    hasta = hasta or timezone.localdate()
+    pasadas = Cita.objects.filter(fecha__lt=hasta, estado__in=Cita.ESTADOS_ACTIVOS)
+    totales = {}
+
+    for estado_nuevo, condicion in REGLAS_CIERRE:
+        totales[estado_nuevo] = 0
+        while True:
+            with transaction.atomic():
+                filas = list(
+                    pasadas.filter(condicion).order_by('id')
+                    .select_for_update(of=('self',))
+                    .values_list('id', 'estado')[:lote]
+                )
+                if not filas:
+                    break
+                ahora = timezone.now()
+                HistorialEstadoCita.objects.bulk_create([
+                    HistorialEstadoCita(cita_id=pk, estado_anterior=estado, estado_nuevo=estado_nuevo)
+                    for pk, estado in filas
+                ])
+                # ultima_actualizacion explícita: el UPDATE no aplica auto_now (feed de cambios)
+                ids = [pk for pk, _ in filas]
+                Cita.objects.filter(pk__in=ids).update(estado=estado_nuevo, ultima_actualizacion=ahora)
+                propagar_escritura_masiva(
+                    list(Cita.objects.filter(pk__in=ids).select_related('paciente', 'tratamiento', 'recurso')),
+                    'actualizada',
+                )
+            totales[estado_nuevo] += len(filas)
+            if len(filas) < lote:
+                break
+
+    logger.info(f"Cierre de citas anteriores a {hasta}: {totales}")
+    return totales
@@ -0,0 +1,188 @@
+"""
+Lista de espera: ofrecer los horarios que se liberan.
+
+Cuando una cita se cancela o se elimina, `ofrecer_horario` busca al primer paciente
+en espera cuya ventana calce con el horario liberado. Es una sola consulta sobre el
+índice parcial de entradas en espera (tipo_cita, fecha_desde), por lo que se puede
+ejecutar en línea en cada cancelación. La oferta se envía por correo (tarea de
+Celery) y vence después de LISTA_ESPERA_VIGENCIA_OFERTA minutos: una tarea con ETA
+la expira y ofrece el horario al siguiente; el barrido periódico
+`expirar_ofertas_vencidas` cubre las tareas perdidas. Antes de cada oferta se
+comprueba en la agenda que el horario siga libre: si alguien lo reservó mientras
+tanto, la cadena de ofertas se corta.
+
+Las cancelaciones masivas (citas/operaciones.py) no ofrecen los horarios: se usan
+cuando la clínica cierra.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .agenda import cargar_agenda
+from .models import Cita, ListaEspera
+
+logger = logging.getLogger(__name__)
+
+
+def vigencia_oferta():
+    return timedelta(minutes=getattr(settings, 'LISTA_ESPERA_VIGENCIA_OFERTA', 120))
+
+
+class OfertaNoVigente(ValidationError):
+    """La oferta ya fue respondida, venció o su horario dejó de estar libre."""
+
+
+def buscar_candidato(tipo_cita, fecha, hora, duracion, excluir_pacientes=()):
+    """
+    Primera entrada en espera (la más antigua) que acepta el horario, bloqueada para
+    esta transacción. Se omiten las entradas bloqueadas por otra oferta en curso y
+    las que ya recibieron (y dejaron pasar) este mismo horario.
+    """
+    candidatos = (
+        ListaEspera.objects.filter(
+            estado='esperando', tipo_cita=tipo_cita,
+            fecha_desde__lte=fecha, fecha_hasta__gte=fecha, duracion_cita__lte=duracion,
+        )
+        .filter(Q(hora_desde__isnull=True) | Q(hora_desde__lte=hora))
+        .filter(Q(hora_hasta__isnull=True) | Q(hora_hasta__gte=hora))
+        .exclude(oferta_fecha=fecha, oferta_hora=hora)
+        .exclude(paciente_id__in=excluir_pacientes)
+        .order_by('fecha_creacion', 'id')
+    )
+    return candidatos.select_for_update(skip_locked=True).first()
+
+
+def ofrecer_horario(tipo_cita, fecha, hora, duracion=60, recurso_id=None, excluir_pacientes=()):
+    """
+    Ofrece el horario liberado al primer candidato de la lista de espera, si sigue
+    libre en algún recurso (se prefiere `recurso_id`). El correo y el vencimiento se
+    encolan después del commit. Devuelve la entrada o None.
+    """
+    inicio = timezone.make_aware(datetime.combine(fecha, hora))
+    ahora = timezone.now()
+    if inicio <= ahora:
+        return None
+
+    with transaction.atomic():
+        # Entre la liberación y la oferta (o entre una oferta y la siguiente) el
+        # horario pudo reservarse por otra vía
+        libres = cargar_agenda(tipo_cita, fecha, fecha).recursos_libres(fecha, hora, duracion)
+        if not libres:
+            logger.info(f"Horario {fecha} {hora:%H:%M} ({tipo_cita}) ya no está libre: no se ofrece")
+            return None
+        if recurso_id not in libres:
+            recurso_id = libres[0]
+        entrada = buscar_candidato(tipo_cita, fecha, hora, duracion, excluir_pacientes)
+        if entrada is None:
+            return None
+        entrada.estado = 'ofrecida'
+        entrada.oferta_fecha, entrada.oferta_hora, entrada.oferta_recurso_id = fecha, hora, recurso_id
+        # La oferta nunca dura más allá del inicio de la cita
+        entrada.oferta_expira = min(ahora + vigencia_oferta(), inicio)
+        entrada.token = uuid.uuid4()
+        entrada.save()
+        transaction.on_commit(lambda: _encolar_oferta(entrada.pk, entrada.token, entrada.oferta_expira))
+
+    logger.info(f"Horario {fecha} {hora:%H:%M} ({tipo_cita}) ofrecido a la entrada de espera {entrada.pk}")
+    return entrada
+
+
+def ofrecer_horario_liberado(cita):
+    """Ofrece el horario de una cita cancelada o eliminada; los errores solo se registran."""
+    campo = Cita._meta.get_field
+    try:
+        ofrecer_horario(
+            cita.tipo_cita, campo('fecha').to_python(cita.fecha), campo('hora').to_python(cita.hora),
+            campo('duracion_cita').to_python(cita.duracion_cita), cita.recurso_id,
+            excluir_pacientes=[cita.paciente_id],
+        )
+    except Exception as e:
+        logger.error(f"Error al ofrecer el horario de la cita {cita.pk} a la lista de espera: {str(e)}")
+
+
+def _encolar_oferta(entrada_id, token, expira):
+    from .tasks import enviar_oferta_espera, expirar_oferta_espera
+
+    try:
+        enviar_oferta_espera.delay(entrada_id)
+        expirar_oferta_espera.apply_async((entrada_id, str(token)), eta=expira)
+    except Exception as e:
+        # Sin broker la oferta queda registrada; el barrido periódico la vencerá
+        logger.error(f"No se pudo encolar la oferta de la entrada de espera {entrada_id}: {str(e)}")
+
+
+def _liberar(entrada):
+    """Devuelve la entrada a la espera y ofrece su horario al siguiente candidato."""
+    fecha, hora, recurso = entrada.oferta_fecha, entrada.oferta_hora, entrada.oferta_recurso_id
+    entrada.estado = 'esperando'
+    entrada.oferta_expira = None
+    entrada.token = None
+    entrada.save(update_fields=['estado', 'oferta_expira', 'token'])
+    transaction.on_commit(lambda: ofrecer_horario(entrada.tipo_cita, fecha, hora, entrada.duracion_cita, recurso))
+
+
+def aceptar_oferta(token):
+    """
+    Crea la cita de la oferta. Lanza ListaEspera.DoesNotExist si el token no existe y
+    OfertaNoVigente si la oferta venció o el horario ya se ocupó.
+    """
+    with transaction.atomic():
+        entrada = ListaEspera.objects.select_for_update().get(token=token)
+        if entrada.estado != 'ofrecida' or entrada.oferta_expira <= timezone.now():
+            raise OfertaNoVigente('La oferta ya no está vigente')
+        cita = Cita(
+            paciente_id=entrada.paciente_id, tratamiento_id=entrada.tratamiento_id,
+            fecha=entrada.oferta_fecha, hora=entrada.oferta_hora, tipo_cita=entrada.tipo_cita,
+            duracion_cita=entrada.duracion_cita, recurso_id=entrada.oferta_recurso_id,
+        )
+        try:
+            with transaction.atomic():
+                cita.save()
+        except ValidationError:
+            ocupado = True
+            # El horario se tomó por otra vía: la entrada vuelve a la espera
+            entrada.estado, entrada.oferta_expira, entrada.token = 'esperando', None, None
+            entrada.save(update_fields=['estado', 'oferta_expira', 'token'])
+        else:
+            ocupado = False
+            entrada.estado, entrada.cita = 'aceptada', cita
+            entrada.save(update_fields=['estado', 'cita'])
+    if ocupado:
+        raise OfertaNoVigente('El horario ofrecido ya no está disponible')
+    return cita
+
+
+def rechazar_oferta(token):
+    """El paciente rechaza el horario: sigue en espera y el horario pasa al siguiente."""
+    with transaction.atomic():
+        entrada = ListaEspera.objects.select_for_update().get(token=token)
+        if entrada.estado != 'ofrecida':
+            raise OfertaNoVigente('La oferta ya no está vigente')
+        _liberar(entrada)
+    return entrada
+
+
+def expirar_oferta(entrada_id, token=None):
+    """Vence la oferta si sigue pendiente (y, con `token`, si es la misma oferta). Devuelve True si venció."""
+    with transaction.atomic():
+        entrada = ListaEspera.objects.select_for_update().filter(
+            pk=entrada_id, estado='ofrecida', oferta_expira__lte=timezone.now()
+        ).first()
+        if entrada is None or (token and str(entrada.token) != str(token)):
+            return False
+        _liberar(entrada)
+    return True
+
+
+def expirar_ofertas_vencidas():
+    """Vence todas las ofertas pendientes cuyo plazo pasó. Devuelve cuántas venció."""
+    vencidas = ListaEspera.objects.filter(
+        estado='ofrecida', oferta_expira__lte=timezone.now()
+    ).values_list('pk', flat=True)
+    return sum(expirar_oferta(pk) for pk in list(vencidas))
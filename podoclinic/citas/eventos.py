@@ -0,0 +1,199 @@
+"""
+Canal de eventos en vivo de la agenda (Server-Sent Events).
+
+Las señales de Cita publican cada creación, actualización o eliminación en un
+canal pub/sub de Redis (después del commit). Cada conexión SSE se suscribe a ese
+canal, por lo que los eventos llegan a los clientes de todos los workers.
+
+La publicación no bloquea la petición (podoclinic/publicacion.py) y se omite, sin
+serializar la cita, cuando no hay conexiones SSE suscritas al canal.
+
+La vista es asíncrona: se sirve por ASGI (podoclinic.asgi:application) en un
+proceso aparte (servicio `eventos` de docker-compose.yml), porque bajo ASGI Django
+lee completos los iteradores síncronos de StreamingHttpResponse y el resto de la
+API (exportaciones, ZIP de PDF) sigue en WSGI. Bajo WSGI la vista responde 503 y
+el cliente sigue usando el feed de cambios por consulta periódica.
+"""
+import json
+import logging
+import time
+from datetime import date
+
+import redis
+import redis.asyncio as redis_asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from podoclinic.publicacion import PublicadorRedis
+
+logger = logging.getLogger(__name__)
+
+CANAL_AGENDA = 'podoclinic:agenda'
+
+# Comentario SSE periódico para que proxies y navegadores no corten la conexión
+INTERVALO_LATIDO = 15
+
+# Cada conexión se cierra después de este tiempo y el navegador reconecta solo;
+# acota los recursos de clientes que se desconectaron sin aviso
+DURACION_MAXIMA_CONEXION = 300
+
+# Tiempo (ms) que el navegador espera antes de reconectar (más largo si Redis falla)
+REINTENTO_MS = 3000
+REINTENTO_ERROR_MS = 30000
+
+# Segundos de validez del token de conexión al flujo (solo se revisa al conectar).
+# EventSource no envía headers y el token viaja en la URL, que queda en los logs de
+# acceso: por eso no se acepta ahí el JWT de la sesión, sino este token firmado,
+# de corta duración y que solo sirve para abrir el flujo
+VIGENCIA_TOKEN_FLUJO = 60
+SAL_TOKEN_FLUJO = 'citas.eventos.flujo'
+
+def _url_redis():
+    return getattr(settings, 'AGENDA_EVENTOS_REDIS_URL', None) or settings.CELERY_BROKER_URL
+
+
+publicador = PublicadorRedis('eventos de agenda', _url_redis)
+
+
+def publicar_evento(evento):
+    """Encola el evento para publicarlo en Redis. Nunca bloquea ni interrumpe al llamador."""
+    publicador.publicar(CANAL_AGENDA, json.dumps(evento, cls=DjangoJSONEncoder))
+
+
+def publicar_evento_cita(accion, cita, fecha_anterior=None):
+    """
+    Publica el evento de una cita cuando la transacción confirme (si se revierte,
+    no se publica nada). Sin suscriptores no se serializa la cita.
+    """
+    evento = {
+        'accion': accion,
+        'id': cita.pk,
+        'fecha': cita.fecha,
+        'fecha_anterior': fecha_anterior if fecha_anterior != cita.fecha else None,
+    }
+
+    def enviar():
+        if not publicador.hay_suscriptores(CANAL_AGENDA):
+            return
+        if accion != 'eliminada':
+            from .serializers import CitaSerializer
+            evento['cita'] = CitaSerializer(cita).data
+        publicar_evento(evento)
+
+    transaction.on_commit(enviar)
+
+
+def evento_en_ventana(evento, desde, hasta):
+    """Indica si el evento afecta el rango de fechas [desde, hasta] del suscriptor."""
+    for valor in (evento.get('fecha'), evento.get('fecha_anterior')):
+        if not valor:
+            continue
+        fecha = date.fromisoformat(valor[:10])
+        if (desde is None or fecha >= desde) and (hasta is None or fecha <= hasta):
+            return True
+    return False
+
+
+def formatear_evento(evento):
+    """Serializa el evento en formato SSE (`event:` + `data:`)."""
+    return f"event: {evento['accion']}\ndata: {json.dumps(evento, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def _flujo_eventos(desde, hasta):
+    cliente = redis_asyncio.Redis.from_url(_url_redis())
+    pubsub = cliente.pubsub()
+    limite = time.monotonic() + DURACION_MAXIMA_CONEXION
+    try:
+        await pubsub.subscribe(CANAL_AGENDA)
+        # Al (re)conectar el cliente debe ponerse al día con el feed de cambios
+        yield f"retry: {REINTENTO_MS}\nevent: conectado\ndata: {{}}\n\n"
+        while time.monotonic() < limite:
+            mensaje = await pubsub.get_message(ignore_subscribe_messages=True, timeout=INTERVALO_LATIDO)
+            if mensaje is None:
+                yield ": latido\n\n"
+                continue
+            try:
+                evento = json.loads(mensaje['data'])
+            except (TypeError, ValueError):
+                logger.warning(f"Evento de agenda inválido: {mensaje['data']!r}")
+                continue
+            if evento_en_ventana(evento, desde, hasta):
+                yield formatear_evento(evento)
+    except (redis.RedisError, OSError) as e:
+        logger.error(f"Error en la suscripción de eventos de agenda: {str(e)}")
+        yield f"retry: {REINTENTO_ERROR_MS}\n\n"
+    finally:
+        try:
+            await pubsub.aclose()
+            await cliente.aclose()
+        except (redis.RedisError, OSError):
+            pass
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def token_eventos(request):
+    """POST /api/citas/eventos/token/: token de conexión al flujo para el usuario autenticado."""
+    return Response({
+        'token': signing.dumps({'usuario': request.user.pk}, salt=SAL_TOKEN_FLUJO),
+        'vigencia': VIGENCIA_TOKEN_FLUJO,
+    })
+
+
+def _usuario_autenticado(request):
+    """Valida el JWT del header Authorization o el token de conexión de `?token=`."""
+    autenticacion = JWTAuthentication()
+    header = autenticacion.get_header(request)
+    if header:
+        try:
+            usuario = autenticacion.get_user(autenticacion.get_validated_token(autenticacion.get_raw_token(header)))
+        except (InvalidToken, TokenError):
+            return None
+        return usuario if usuario.is_active else None
+
+    token = request.GET.get('token')
+    if not token:
+        return None
+    try:
+        datos = signing.loads(token, salt=SAL_TOKEN_FLUJO, max_age=VIGENCIA_TOKEN_FLUJO)
+    except signing.BadSignature:
+        return None
+    return get_user_model().objects.filter(pk=datos.get('usuario'), is_active=True).first()
+
+
+async def eventos_agenda(request):
+    """
+    GET /api/citas/eventos/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&token=<token de token_eventos>
+
+    Flujo SSE con los eventos `creada`, `actualizada` y `eliminada` de las citas
+    cuya fecha (o fecha anterior, si se movieron) cae en el rango pedido.
+    """
+    if 'wsgi.version' in request.META:
+        return JsonResponse(
+            {'error': 'Los eventos en vivo requieren servir la aplicación por ASGI'}, status=503
+        )
+
+    usuario = await sync_to_async(_usuario_autenticado)(request)
+    if usuario is None:
+        return JsonResponse({'error': 'No autorizado'}, status=401)
+
+    try:
+        desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else None
+        hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else None
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}, status=400)
+
+    response = StreamingHttpResponse(_flujo_eventos(desde, hasta), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx no debe acumular el flujo
+    return response
@@ -0,0 +1,186 @@
+import json
+import random
+import subprocess
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from citas.models import Cita, Tratamiento
+from insumos.models import Insumo, MovimientoInsumo
+from pacientes.models import Paciente, FichaClinica
+from podoclinic.benchmark import medir
+from podoclinic.sembrado import GeneradorDatos
+from usuarios.models import Usuario
+
+ESCENARIOS = ['citas_disponibles', 'crear_cita_admin', 'fichas_paciente', 'stock_critico', 'backup_sql', 'restore_json']
+ESCENARIOS_PESADOS = {'backup_sql', 'restore_json'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia (p50/p95) y throughput de los endpoints de agenda, fichas, '
+        'stock crítico y respaldo sobre una base de prueba sembrada. '
+        'Usa la base de datos configurada (PostgreSQL, o SQLite con DB_ENGINE=sqlite) '
+        'pero nunca la base real: crea una base de prueba aparte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=50000)
+        parser.add_argument('--citas', type=int, default=500000)
+        parser.add_argument('--insumos', type=int, default=200)
+        parser.add_argument('--movimientos', type=int, default=1000000)
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla del generador aleatorio')
+        parser.add_argument('--repeticiones', type=int, default=30)
+        parser.add_argument('--repeticiones-pesadas', type=int, default=3,
+                            help='Repeticiones para respaldo/restauración')
+        parser.add_argument('--muestra-restore', type=int, default=1000,
+                            help='Registros por tabla usados en el escenario restore_json')
+        parser.add_argument('--escenarios', type=str, default=','.join(ESCENARIOS),
+                            help=f'Lista separada por comas de: {", ".join(ESCENARIOS)}')
+        parser.add_argument('--salida', type=str, help='Archivo JSON de resultados (por defecto stdout)')
+        parser.add_argument('--mantener-db', action='store_true',
+                            help='Reutiliza la base de prueba entre ejecuciones (evita volver a sembrar)')
+
+    def handle(self, *args, **options):
+        escenarios = [e.strip() for e in options['escenarios'].split(',') if e.strip()]
+        desconocidos = set(escenarios) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}')
+
+        setup_test_environment()
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['mantener_db'])
+        try:
+            self._sembrar(options)
+            resultados = {
+                'fecha': timezone.now().isoformat(),
+                'commit': self._commit_actual(),
+                'motor': connection.vendor,
+                'volumenes': {
+                    'pacientes': Paciente.objects.count(),
+                    'citas': Cita.objects.count(),
+                    'fichas': FichaClinica.objects.count(),
+                    'insumos': Insumo.objects.count(),
+                    'movimientos': MovimientoInsumo.objects.count(),
+                },
+                'escenarios': self._ejecutar(escenarios, options),
+            }
+        finally:
+            if not options['mantener_db']:
+                connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            teardown_test_environment()
+
+        contenido = json.dumps(resultados, ensure_ascii=False, indent=2)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+        else:
+            self.stdout.write(contenido)
+
+    def _commit_actual(self):
+        try:
+            resultado = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+            )
+            return resultado.stdout.strip()
+        except (subprocess.SubprocessError, FileNotFoundError):
+            return None
+
+    # ----- Sembrado -----
+
+    def _sembrar(self, opciones):
+        """Siembra los volúmenes pedidos con el generador de seed_scale; no hace nada si ya existen."""
+        if Cita.objects.count() < opciones['citas']:
+            self.stderr.write('Sembrando datos de prueba...')
+            GeneradorDatos(semilla=opciones['semilla'], log=self.stderr.write).generar(
+                pacientes=opciones['pacientes'],
+                citas=opciones['citas'],
+                insumos=opciones['insumos'],
+                movimientos=opciones['movimientos'],
+            )
+        Usuario.objects.get_or_create(username='benchmark', defaults={'rol': 'admin'})
+
+    # ----- Escenarios -----
+
+    def _ejecutar(self, escenarios, opciones):
+        client = Client()
+        rng = random.Random(opciones['semilla'])
+        usuario = Usuario.objects.get(username='benchmark')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(usuario).access_token}'}
+
+        fechas = [d.isoformat() for d in Cita.objects.order_by().values_list('fecha', flat=True).distinct()[:500]]
+        pacientes_con_fichas = list(
+            FichaClinica.objects.order_by().values_list('paciente_id', flat=True).distinct()[:500]
+        )
+        paciente_rut = Paciente.objects.values_list('rut', flat=True).first()
+        fecha_libre = (Cita.objects.aggregate(m=Max('fecha'))['m'] or date.today()) + timedelta(days=1)
+
+        def verificar(response, esperado=200):
+            if response.status_code != esperado:
+                raise CommandError(f'Respuesta inesperada {response.status_code}: {response.content[:300]!r}')
+
+        def citas_disponibles(i):
+            verificar(client.get('/api/citas/disponibles/', {
+                'fecha': rng.choice(fechas), 'tipo_cita': 'podologia'
+            }))
+
+        def crear_cita_admin(i):
+            # Cada iteración usa un horario libre distinto
+            verificar(client.post('/api/citas/crear_cita_admin/', {
+                'paciente': paciente_rut, 'tratamiento': 'Podología general',
+                'fecha': (fecha_libre + timedelta(days=i // 15)).isoformat(),
+                'hora': f'{8 + i % 15:02d}:00', 'tipo_cita': 'podologia',
+            }, content_type='application/json'), 201)
+
+        def fichas_paciente(i):
+            verificar(client.get('/api/pacientes/fichas/', {'paciente': rng.choice(pacientes_con_fichas)}))
+
+        def stock_critico(i):
+            verificar(client.get('/api/insumos/stock_critico/', **auth))
+
+        def backup_sql(i):
+            verificar(client.get('/api/pacientes/backup/'))
+
+        from podoclinic.views import restore_from_backup_data
+        muestra = opciones['muestra_restore']
+        datos_respaldo = {
+            'pacientes': json.loads(serializers.serialize('json', Paciente.objects.all()[:muestra])),
+            'tratamientos': json.loads(serializers.serialize('json', Tratamiento.objects.all())),
+            'citas': json.loads(serializers.serialize('json', Cita.objects.all()[:muestra])),
+        }
+
+        def restore_json(i):
+            # Restaurar y deshacer, para que cada iteración parta del mismo estado
+            with transaction.atomic():
+                restore_from_backup_data(datos_respaldo)
+                transaction.set_rollback(True)
+
+        funciones = {
+            'citas_disponibles': citas_disponibles,
+            'crear_cita_admin': crear_cita_admin,
+            'fichas_paciente': fichas_paciente,
+            'stock_critico': stock_critico,
+            'backup_sql': backup_sql,
+            'restore_json': restore_json,
+        }
+
+        resultados = {}
+        for nombre in escenarios:
+            pesado = nombre in ESCENARIOS_PESADOS
+            self.stderr.write(f'Midiendo {nombre}...')
+            resultados[nombre] = medir(
+                funciones[nombre],
+                repeticiones=opciones['repeticiones_pesadas'] if pesado else opciones['repeticiones'],
+                calentamiento=0 if pesado else 2,
+            )
+        return resultados
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.cierre import cerrar_citas_pasadas
+
+
+class Command(BaseCommand):
+    help = (
+        'Pasa las citas reservadas o confirmadas de días anteriores a "completada" o '
+        '"no_asistio" (lo mismo que la tarea nocturna de Celery).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasta', help='Cerrar las citas anteriores a esta fecha YYYY-MM-DD (por defecto, hoy)')
+
+    def handle(self, *args, **options):
+        try:
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Formato de fecha inválido. Use YYYY-MM-DD')
+
+        totales = cerrar_citas_pasadas(hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f"Citas cerradas: {totales['completada']} completadas, {totales['no_asistio']} sin asistencia"
+        ))
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.ocupacion import reconstruir_ocupacion
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula desde cero el resumen de ocupación diaria (OcupacionDiaria) con un solo '
+        'GROUP BY sobre las citas. Necesario tras cargas masivas que no disparan señales.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto, todas)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto, todas)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Formato de fecha inválido. Use YYYY-MM-DD')
+
+        filas = reconstruir_ocupacion(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f'Ocupación reconstruida: {filas} días por tipo de cita'))
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.models import Cita
+from podoclinic.sembrado import GeneradorDatos
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos a escala (pacientes con RUT válido, citas sin solapes, '
+        'fichas con productos usados y movimientos de stock consistentes) para benchmarks '
+        'y ensayos de migraciones. Escribe en la base de datos configurada.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=5000)
+        parser.add_argument('--citas', type=int, default=50000)
+        parser.add_argument('--insumos', type=int, default=150)
+        parser.add_argument('--proporcion-fichas', type=float, default=0.8,
+                            help='Fracción de citas completadas que tienen ficha clínica')
+        parser.add_argument('--max-productos', type=int, default=3,
+                            help='Máximo de productos usados por ficha')
+        parser.add_argument('--movimientos', type=int, default=0,
+                            help='Mínimo de movimientos de stock (se completa con mermas)')
+        parser.add_argument('--ocupacion', type=float, default=0.6,
+                            help='Probabilidad de que cada hora de la agenda esté ocupada')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5000, help='Tamaño de lote para bulk_create')
+        parser.add_argument('--anexar', action='store_true',
+                            help='Permite agregar datos a una base que ya tiene citas')
+
+    def handle(self, *args, **options):
+        if not 0 < options['ocupacion'] <= 1:
+            raise CommandError('--ocupacion debe estar entre 0 y 1')
+        if Cita.objects.exists() and not options['anexar']:
+            raise CommandError('La base de datos ya tiene citas. Use --anexar para agregar datos sintéticos.')
+
+        generador = GeneradorDatos(
+            semilla=options['semilla'], lote=options['lote'],
+            log=lambda mensaje: self.stderr.write(mensaje)
+        )
+        resumen = generador.generar(
+            pacientes=options['pacientes'],
+            citas=options['citas'],
+            insumos=options['insumos'],
+            proporcion_fichas=options['proporcion_fichas'],
+            max_productos=options['max_productos'],
+            movimientos=options['movimientos'],
+            ocupacion=options['ocupacion'],
+        )
+        self.stdout.write(json.dumps(resumen, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {resumen["segundos_total"]} s'))
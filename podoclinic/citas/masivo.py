@@ -0,0 +1,33 @@
+"""
+Efectos de las escrituras masivas de citas.
+
+bulk_create, bulk_update y QuerySet.update no disparan las señales de Cita. Quien
+las use debe llamar a `propagar_escritura_masiva` dentro de la misma transacción,
+para actualizar el resumen de ocupación, marcar los días de los reportes y avisar
+a cachés y agendas en vivo (ambos avisos salen después del commit). Además debe fijar
+`ultima_actualizacion` en el UPDATE, porque auto_now tampoco se aplica.
+"""
+from podoclinic.invalidacion import publicar_cambio
+
+from .eventos import publicar_evento_cita
+from .ocupacion import reconstruir_ocupacion
+
+
+def propagar_escritura_masiva(citas, accion, fechas_anteriores=None):
+    """
+    `citas`: instancias ya guardadas (con paciente, tratamiento y recurso cargados,
+    porque el evento incluye la cita serializada). `accion`: 'creada', 'actualizada'
+    o 'eliminada'. `fechas_anteriores`: {id: fecha} de las citas que cambiaron de día.
+    """
+    fechas_anteriores = fechas_anteriores or {}
+    fechas = {cita.fecha for cita in citas} | set(fechas_anteriores.values())
+    if not fechas:
+        return
+    reconstruir_ocupacion(fechas=fechas)
+    # Días antiguos de los reportes (incluidos los días de origen de las citas movidas)
+    from reportes.hechos import marcar_dias_pendientes
+    marcar_dias_pendientes(fechas)
+    for fecha in sorted(fechas):
+        publicar_cambio('citas.cita', str(fecha))
+    for cita in citas:
+        publicar_evento_cita(accion, cita, fechas_anteriores.get(cita.pk))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0008_alter_cita_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['fecha', 'tipo_cita'], name='cita_fecha_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('estado__in', ['reservada', 'confirmada']), ('recordatorio_enviado', False)), fields=['fecha'], name='cita_recordatorio_pend_idx'),
+        ),
+    ]
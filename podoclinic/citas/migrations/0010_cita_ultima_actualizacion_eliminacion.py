@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_cita_cita_fecha_tipo_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='ultima_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='Eliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('cita', 'Cita'), ('paciente', 'Paciente')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['modelo', 'fecha'], name='eliminacion_modelo_fecha_idx')],
+            },
+        ),
+    ]
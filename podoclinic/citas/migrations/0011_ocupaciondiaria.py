@@ -0,0 +1,43 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:28
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def poblar_ocupacion(apps, schema_editor):
+    # Misma agregación que citas.ocupacion.reconstruir_ocupacion, con los modelos históricos
+    Cita = apps.get_model('citas', 'Cita')
+    OcupacionDiaria = apps.get_model('citas', 'OcupacionDiaria')
+    filas = (
+        Cita.objects.exclude(estado='cancelada').order_by()
+        .values('fecha', 'tipo_cita').annotate(total=Count('id'), minutos=Sum('duracion_cita'))
+    )
+    OcupacionDiaria.objects.bulk_create(
+        [OcupacionDiaria(fecha=f['fecha'], tipo_cita=f['tipo_cita'], citas=f['total'], minutos=f['minutos']) for f in filas],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0010_cita_ultima_actualizacion_eliminacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcupacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_cita', models.CharField(choices=[('podologia', 'Podología'), ('manicura', 'Manicura')], max_length=20)),
+                ('citas', models.IntegerField(default=0)),
+                ('minutos', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ocupaciondiaria',
+            constraint=models.UniqueConstraint(fields=('fecha', 'tipo_cita'), name='ocupacion_fecha_tipo_uniq'),
+        ),
+        migrations.RunPython(poblar_ocupacion, migrations.RunPython.noop),
+    ]
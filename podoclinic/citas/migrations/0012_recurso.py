@@ -0,0 +1,55 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def crear_recursos_iniciales(apps, schema_editor):
+    # Hasta ahora había un solo recurso por tipo de cita: crearlo y asignarle sus citas
+    Cita = apps.get_model('citas', 'Cita')
+    Recurso = apps.get_model('citas', 'Recurso')
+    for tipo_cita, nombre in [('podologia', 'Box podología'), ('manicura', 'Box manicura')]:
+        recurso = Recurso.objects.create(nombre=nombre, tipo='box', tipo_cita=tipo_cita)
+        Cita.objects.filter(tipo_cita=tipo_cita, recurso__isnull=True).update(recurso=recurso)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0011_ocupaciondiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recurso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('tipo', models.CharField(choices=[('profesional', 'Profesional'), ('box', 'Box')], default='profesional', max_length=20)),
+                ('tipo_cita', models.CharField(choices=[('podologia', 'Podología'), ('manicura', 'Manicura')], default='podologia', max_length=20)),
+                ('activo', models.BooleanField(default=True)),
+                ('orden', models.PositiveSmallIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['tipo_cita', 'orden', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='recurso',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='citas', to='citas.recurso'),
+        ),
+        migrations.RunPython(crear_recursos_iniciales, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cita',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('recurso__isnull', False), models.Q(('estado', 'cancelada'), _negated=True)), fields=('fecha', 'hora', 'recurso'), name='cita_fecha_hora_recurso_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('recurso__isnull', True), models.Q(('estado', 'cancelada'), _negated=True)), fields=('fecha', 'hora', 'tipo_cita'), name='cita_fecha_hora_tipo_uniq'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0006_paciente_ultima_actualizacion'),
+        ('citas', '0012_recurso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieCitas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_cita', models.CharField(choices=[('podologia', 'Podología'), ('manicura', 'Manicura')], default='podologia', max_length=20)),
+                ('hora', models.TimeField()),
+                ('duracion_cita', models.IntegerField(choices=[(60, '1 hora'), (120, '2 horas')], default=60)),
+                ('frecuencia', models.CharField(choices=[('semanal', 'Semanal'), ('quincenal', 'Cada dos semanas'), ('mensual', 'Mensual')], default='semanal', max_length=20)),
+                ('fecha_inicio', models.DateField()),
+                ('repeticiones', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fecha_fin', models.DateField(blank=True, null=True)),
+                ('excepciones', models.JSONField(blank=True, default=list)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_citas', to='pacientes.paciente')),
+                ('recurso', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='citas.recurso')),
+                ('tratamiento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='citas.tratamiento')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas', to='citas.seriecitas'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0006_paciente_ultima_actualizacion'),
+        ('citas', '0013_seriecitas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListaEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo_cita', models.CharField(choices=[('podologia', 'Podología'), ('manicura', 'Manicura')], default='podologia', max_length=20)),
+                ('duracion_cita', models.IntegerField(choices=[(60, '1 hora'), (120, '2 horas')], default=60)),
+                ('fecha_desde', models.DateField()),
+                ('fecha_hasta', models.DateField()),
+                ('hora_desde', models.TimeField(blank=True, null=True)),
+                ('hora_hasta', models.TimeField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('esperando', 'Esperando'), ('ofrecida', 'Oferta enviada'), ('aceptada', 'Aceptada'), ('cancelada', 'Cancelada')], default='esperando', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('oferta_fecha', models.DateField(blank=True, null=True)),
+                ('oferta_hora', models.TimeField(blank=True, null=True)),
+                ('oferta_expira', models.DateTimeField(blank=True, null=True)),
+                ('token', models.UUIDField(blank=True, null=True, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='cita',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='citas.cita'),
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='oferta_recurso',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='citas.recurso'),
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='paciente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listas_espera', to='pacientes.paciente'),
+        ),
+        migrations.AddField(
+            model_name='listaespera',
+            name='tratamiento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='citas.tratamiento'),
+        ),
+        migrations.AddIndex(
+            model_name='listaespera',
+            index=models.Index(condition=models.Q(('estado', 'esperando')), fields=['tipo_cita', 'fecha_desde', 'fecha_creacion'], name='espera_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listaespera',
+            index=models.Index(condition=models.Q(('estado', 'ofrecida')), fields=['oferta_expira'], name='espera_oferta_vence_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0014_listaespera'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialEstadoCita',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('reservada', 'Reservada'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('no_asistio', 'No asistió'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('reservada', 'Reservada'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('no_asistio', 'No asistió'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('origen', models.CharField(default='cierre_nocturno', max_length=30)),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='cita',
+            name='estado',
+            field=models.CharField(choices=[('reservada', 'Reservada'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('no_asistio', 'No asistió'), ('cancelada', 'Cancelada')], default='reservada', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('estado__in', ['reservada', 'confirmada'])), fields=['fecha', 'tipo_cita'], name='cita_activa_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='historialestadocita',
+            name='cita',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_estados', to='citas.cita'),
+        ),
+    ]
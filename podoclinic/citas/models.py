@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 
 class Tratamiento(models.Model):
     TIPOS_TRATAMIENTO = [
@@ -26,6 +26,7 @@ class Cita(models.Model):
         ('reservada', 'Reservada'),
         ('confirmada', 'Confirmada'),
         ('completada', 'Completada'),
+        ('no_asistio', 'No asistió'),
         ('cancelada', 'Cancelada'),
     ]
     
@@ -41,6 +42,9 @@ class Cita(models.Model):
     
     paciente = models.ForeignKey('pacientes.Paciente', on_delete=models.CASCADE)
     tratamiento = models.ForeignKey(Tratamiento, on_delete=models.CASCADE)
+    # Profesional o box asignado; se elige automáticamente al guardar si no se indica
+    recurso = models.ForeignKey('Recurso', on_delete=models.PROTECT, null=True, blank=True, related_name='citas')
+    serie = models.ForeignKey('SerieCitas', on_delete=models.SET_NULL, null=True, blank=True, related_name='citas')
     fecha = models.DateField()
     hora = models.TimeField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default='reservada')
@@ -49,14 +53,254 @@ class Cita(models.Model):
     recordatorio_enviado = models.BooleanField(default=False)
     duracion_extendida = models.BooleanField(default=False)  # Para compatibilidad con código existente
     duracion_cita = models.IntegerField(choices=DURACIONES, default=60)  # Nueva duración en minutos
+    ultima_actualizacion = models.DateTimeField(auto_now=True, db_index=True)  # Cursor del feed de cambios
+    
+    # Estados de las citas que no ocupan la agenda: su horario queda libre
+    ESTADOS_INACTIVOS = ('cancelada',)
+    # Citas por atender; el cierre nocturno (citas/cierre.py) saca de aquí las pasadas
+    ESTADOS_ACTIVOS = ('reservada', 'confirmada')
+    
+    # Campos de los que depende el resumen de ocupación diaria
+    CAMPOS_OCUPACION = ('fecha', 'tipo_cita', 'duracion_cita', 'estado')
+    # Campos que definen el horario que la cita ocupa en la agenda de su recurso
+    CAMPOS_AGENDA = ('fecha', 'hora', 'tipo_cita', 'duracion_cita', 'recurso_id')
     
     class Meta:
-        unique_together = ['fecha', 'hora', 'tipo_cita']  # No puede haber dos citas del mismo tipo al mismo tiempo
+        constraints = [
+            # Un recurso no puede tener dos citas activas que empiecen a la misma hora
+            models.UniqueConstraint(
+                fields=['fecha', 'hora', 'recurso'], name='cita_fecha_hora_recurso_uniq',
+                condition=models.Q(recurso__isnull=False) & ~models.Q(estado='cancelada'),
+            ),
+            # Citas sin recurso (cargas masivas): un solo recurso implícito por tipo de cita
+            models.UniqueConstraint(
+                fields=['fecha', 'hora', 'tipo_cita'], name='cita_fecha_hora_tipo_uniq',
+                condition=models.Q(recurso__isnull=True) & ~models.Q(estado='cancelada'),
+            ),
+        ]
+        indexes = [
+            # Disponibilidad: citas de un día para un tipo de agenda
+            models.Index(fields=['fecha', 'tipo_cita'], name='cita_fecha_tipo_idx'),
+            # Recordatorios: solo las citas activas que aún no tienen recordatorio
+            models.Index(
+                fields=['fecha'], name='cita_recordatorio_pend_idx',
+                condition=models.Q(recordatorio_enviado=False, estado__in=['reservada', 'confirmada']),
+            ),
+            # Citas por atender; con el cierre nocturno solo contiene citas de hoy en adelante
+            models.Index(
+                fields=['fecha', 'tipo_cita'], name='cita_activa_fecha_idx',
+                condition=models.Q(estado__in=['reservada', 'confirmada']),
+            ),
+        ]
         
     def __str__(self):
         return f"{self.paciente.nombre} - {self.fecha} {self.hora}"
         
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._recordar_valores_guardados()
+        return instancia
+    
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # Las recargas parciales (campos diferidos) no reflejan el resto de la fila
+        if fields is None:
+            self._recordar_valores_guardados()
+    
+    def _recordar_valores_guardados(self):
+        # Fecha guardada en la base, para avisar a la agenda cuando una cita cambia de día
+        self._fecha_guardada = self.__dict__.get('fecha')
+        # Valores guardados que determinan su aporte a OcupacionDiaria
+        self._ocupacion_guardada = tuple(self.__dict__.get(campo) for campo in self.CAMPOS_OCUPACION)
+        self._agenda_guardada = tuple(self.__dict__.get(campo) for campo in self.CAMPOS_AGENDA)
+        
+    def _horario_cambiado(self):
+        if self._state.adding or self.recurso_id is None:
+            return True
+        # Una cita cancelada que se reactiva vuelve a ocupar su horario
+        ocupacion = getattr(self, '_ocupacion_guardada', None)
+        if ocupacion and ocupacion[3] in self.ESTADOS_INACTIVOS:
+            return True
+        guardado = getattr(self, '_agenda_guardada', None)
+        return guardado is None or guardado != tuple(getattr(self, campo) for campo in self.CAMPOS_AGENDA)
+        
     def save(self, *args, **kwargs):
         # Sincronizar duracion_extendida con duracion_cita
         self.duracion_extendida = (self.duracion_cita == 120)
-        super().save(*args, **kwargs)
+        # La asignación de recurso y la señal post_save (OcupacionDiaria) van en la misma transacción
+        with transaction.atomic():
+            campos = kwargs.get('update_fields')
+            if (self.estado not in self.ESTADOS_INACTIVOS and self._horario_cambiado()
+                    and (campos is None or set(campos) & {'fecha', 'hora', 'tipo_cita', 'duracion_cita', 'recurso', 'estado'})):
+                from .agenda import asignar_recurso
+                asignar_recurso(self)
+                if campos is not None:
+                    kwargs['update_fields'] = set(campos) | {'recurso'}
+            super().save(*args, **kwargs)
+        # Los valores guardados se actualizan después de todas las señales post_save,
+        # que los leen como valores anteriores sin importar su orden de registro
+        self._recordar_valores_guardados()
+        self._agenda_guardada = tuple(getattr(self, campo) for campo in self.CAMPOS_AGENDA)
+
+
+
+class Recurso(models.Model):
+    """
+    Profesional o box que atiende las citas de un tipo de agenda. Cada recurso
+    activo tiene su propia agenda; la disponibilidad se calcula sobre todos ellos
+    (ver citas/agenda.py).
+    """
+    TIPOS = [
+        ('profesional', 'Profesional'),
+        ('box', 'Box'),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    tipo = models.CharField(max_length=20, choices=TIPOS, default='profesional')
+    tipo_cita = models.CharField(max_length=20, choices=Cita.TIPOS_CITA, default='podologia')
+    activo = models.BooleanField(default=True)
+    orden = models.PositiveSmallIntegerField(default=0)  # Preferencia al asignar citas
+
+    class Meta:
+        ordering = ['tipo_cita', 'orden', 'id']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.get_tipo_cita_display()})"
+
+
+class SerieCitas(models.Model):
+    """
+    Serie de citas recurrentes (por ejemplo, tratamientos de hongos o brackets):
+    una regla de repetición más las fechas exceptuadas. Las citas de la serie se
+    crean todas juntas (ver citas/series.py) y apuntan a ella con `Cita.serie`.
+    """
+    FRECUENCIAS = [
+        ('semanal', 'Semanal'),
+        ('quincenal', 'Cada dos semanas'),
+        ('mensual', 'Mensual'),
+    ]
+
+    paciente = models.ForeignKey('pacientes.Paciente', on_delete=models.CASCADE, related_name='series_citas')
+    tratamiento = models.ForeignKey(Tratamiento, on_delete=models.CASCADE)
+    recurso = models.ForeignKey(Recurso, on_delete=models.PROTECT, null=True, blank=True)  # Preferido
+    tipo_cita = models.CharField(max_length=20, choices=Cita.TIPOS_CITA, default='podologia')
+    hora = models.TimeField()
+    duracion_cita = models.IntegerField(choices=Cita.DURACIONES, default=60)
+    frecuencia = models.CharField(max_length=20, choices=FRECUENCIAS, default='semanal')
+    fecha_inicio = models.DateField()
+    repeticiones = models.PositiveSmallIntegerField(null=True, blank=True)
+    fecha_fin = models.DateField(null=True, blank=True)
+    excepciones = models.JSONField(default=list, blank=True)  # Fechas ISO sin cita
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Serie {self.get_frecuencia_display().lower()} de {self.paciente.nombre} desde {self.fecha_inicio}"
+
+
+class HistorialEstadoCita(models.Model):
+    """
+    Auditoría de los cambios de estado que no hace una persona (por ahora, el cierre
+    nocturno de citas pasadas). Se escribe con bulk_create junto al UPDATE de las citas.
+    """
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name='historial_estados')
+    estado_anterior = models.CharField(max_length=20, choices=Cita.ESTADOS)
+    estado_nuevo = models.CharField(max_length=20, choices=Cita.ESTADOS)
+    origen = models.CharField(max_length=30, default='cierre_nocturno')
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Cita {self.cita_id}: {self.estado_anterior} → {self.estado_nuevo} ({self.origen})"
+
+
+class ListaEspera(models.Model):
+    """
+    Paciente en lista de espera para un tipo de cita, con su ventana preferida de
+    fechas (y opcionalmente de horas de inicio). Cuando se cancela o elimina una cita,
+    el horario liberado se ofrece por correo al primero en la lista que calce
+    (ver citas/espera.py); la oferta vence después de un tiempo.
+    """
+    ESTADOS = [
+        ('esperando', 'Esperando'),
+        ('ofrecida', 'Oferta enviada'),
+        ('aceptada', 'Aceptada'),
+        ('cancelada', 'Cancelada'),
+    ]
+
+    paciente = models.ForeignKey('pacientes.Paciente', on_delete=models.CASCADE, related_name='listas_espera')
+    tratamiento = models.ForeignKey(Tratamiento, on_delete=models.CASCADE)
+    tipo_cita = models.CharField(max_length=20, choices=Cita.TIPOS_CITA, default='podologia')
+    duracion_cita = models.IntegerField(choices=Cita.DURACIONES, default=60)
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    hora_desde = models.TimeField(null=True, blank=True)  # Hora de inicio más temprana aceptada
+    hora_hasta = models.TimeField(null=True, blank=True)  # Hora de inicio más tardía aceptada
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='esperando')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)  # Prioridad: el más antiguo primero
+    # Última oferta enviada; se conserva al rechazarla o vencer para no volver a ofrecer ese horario
+    oferta_fecha = models.DateField(null=True, blank=True)
+    oferta_hora = models.TimeField(null=True, blank=True)
+    oferta_recurso = models.ForeignKey(Recurso, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    oferta_expira = models.DateTimeField(null=True, blank=True)
+    token = models.UUIDField(null=True, blank=True, unique=True)
+    cita = models.ForeignKey(Cita, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        indexes = [
+            # Búsqueda del candidato al liberarse un horario: solo las entradas en espera
+            models.Index(
+                fields=['tipo_cita', 'fecha_desde', 'fecha_creacion'], name='espera_tipo_fecha_idx',
+                condition=models.Q(estado='esperando'),
+            ),
+            # Barrido de ofertas vencidas
+            models.Index(
+                fields=['oferta_expira'], name='espera_oferta_vence_idx',
+                condition=models.Q(estado='ofrecida'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente.nombre} espera {self.tipo_cita} entre {self.fecha_desde} y {self.fecha_hasta}"
+
+
+class Eliminacion(models.Model):
+    """
+    Registro (tombstone) de una cita o paciente eliminado. Permite que los clientes
+    que sincronizan por cambios quiten el registro de su copia local.
+    """
+    MODELOS = [
+        ('cita', 'Cita'),
+        ('paciente', 'Paciente'),
+    ]
+
+    modelo = models.CharField(max_length=20, choices=MODELOS)
+    objeto_id = models.BigIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['modelo', 'fecha'], name='eliminacion_modelo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_modelo_display()} {self.objeto_id} eliminado el {self.fecha}"
+
+
+class OcupacionDiaria(models.Model):
+    """
+    Resumen desnormalizado de la agenda: citas activas y minutos reservados por día
+    y tipo de cita. Lo mantienen las señales de Cita (ver citas/ocupacion.py).
+    """
+    fecha = models.DateField()
+    tipo_cita = models.CharField(max_length=20, choices=Cita.TIPOS_CITA)
+    citas = models.IntegerField(default=0)
+    minutos = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # También sirve de índice para leer un rango de fechas
+            models.UniqueConstraint(fields=['fecha', 'tipo_cita'], name='ocupacion_fecha_tipo_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} {self.tipo_cita}: {self.minutos} min en {self.citas} citas"
@@ -0,0 +1,141 @@
+"""
+Resumen de ocupación diaria de la agenda (citas y minutos reservados por día y tipo_cita).
+
+Las señales de Cita mantienen la tabla OcupacionDiaria de forma incremental, en la
+misma transacción que el cambio de la cita. Las escrituras masivas (bulk_create,
+QuerySet.update) no disparan señales: después de ellas hay que llamar a
+`reconstruir_ocupacion`, que recalcula el rango con un solo GROUP BY
+(también disponible como `manage.py reconstruir_ocupacion`).
+
+Las citas canceladas no ocupan la agenda.
+"""
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .agenda import HORA_APERTURA, HORA_CIERRE
+from .models import Cita, OcupacionDiaria, Recurso
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_INACTIVOS = Cita.ESTADOS_INACTIVOS
+
+# Bloques de una hora de 8:00 a 22:00 de un recurso
+CAPACIDAD_MINUTOS_DIA = (HORA_CIERRE - HORA_APERTURA + 1) * 60
+
+
+def _normalizar(valores):
+    """Convierte (fecha, tipo_cita, duracion_cita, estado) a sus tipos de Python; None si falta alguno."""
+    if valores is None or any(valor is None for valor in valores):
+        return None
+    return tuple(
+        Cita._meta.get_field(campo).to_python(valor)
+        for campo, valor in zip(Cita.CAMPOS_OCUPACION, valores)
+    )
+
+
+def aporte(valores):
+    """Aporte a la ocupación como (fecha, tipo_cita, minutos), o None si la cita no ocupa la agenda."""
+    valores = _normalizar(valores)
+    if valores is None:
+        return None
+    fecha, tipo_cita, duracion, estado = valores
+    if estado in ESTADOS_INACTIVOS:
+        return None
+    return fecha, tipo_cita, duracion
+
+
+def valores_cita(cita):
+    return tuple(getattr(cita, campo) for campo in Cita.CAMPOS_OCUPACION)
+
+
+def _sumar(fecha, tipo_cita, citas, minutos):
+    """Suma (o resta) al día con un UPDATE atómico; crea la fila si aún no existe."""
+    filtro = OcupacionDiaria.objects.filter(fecha=fecha, tipo_cita=tipo_cita)
+    if filtro.update(citas=F('citas') + citas, minutos=F('minutos') + minutos):
+        if citas < 0:
+            filtro.filter(citas__lte=0).delete()
+        return
+    if citas < 0:
+        # Restar de un día sin fila: el resumen estaba desfasado
+        logger.warning(f"Ocupación de {fecha} ({tipo_cita}) sin registrar; ejecute reconstruir_ocupacion")
+        return
+    try:
+        with transaction.atomic():
+            OcupacionDiaria.objects.create(fecha=fecha, tipo_cita=tipo_cita, citas=citas, minutos=minutos)
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        filtro.update(citas=F('citas') + citas, minutos=F('minutos') + minutos)
+
+
+def registrar_cambio(anterior, nuevo):
+    """
+    Aplica a OcupacionDiaria el paso de la cita de los valores `anterior` a `nuevo`
+    (tuplas de CAMPOS_OCUPACION; None si la cita no existía o ya no existe).
+    """
+    antes, despues = aporte(anterior), aporte(nuevo)
+    if antes == despues:
+        return
+    if antes is not None:
+        _sumar(antes[0], antes[1], -1, -antes[2])
+    if despues is not None:
+        _sumar(despues[0], despues[1], 1, despues[2])
+
+
+def reconstruir_ocupacion(desde=None, hasta=None, fechas=None):
+    """
+    Recalcula OcupacionDiaria desde Cita para el rango [desde, hasta] (todo si no se
+    indica), o solo para los días de `fechas`, con un solo GROUP BY. Devuelve la
+    cantidad de filas escritas.
+    """
+    citas = Cita.objects.exclude(estado__in=ESTADOS_INACTIVOS)
+    resumen = OcupacionDiaria.objects.all()
+    if fechas is not None:
+        citas = citas.filter(fecha__in=fechas)
+        resumen = resumen.filter(fecha__in=fechas)
+    if desde:
+        citas = citas.filter(fecha__gte=desde)
+        resumen = resumen.filter(fecha__gte=desde)
+    if hasta:
+        citas = citas.filter(fecha__lte=hasta)
+        resumen = resumen.filter(fecha__lte=hasta)
+
+    filas = [
+        OcupacionDiaria(fecha=fila['fecha'], tipo_cita=fila['tipo_cita'], citas=fila['total'], minutos=fila['minutos'])
+        for fila in citas.order_by().values('fecha', 'tipo_cita').annotate(
+            total=Count('id'), minutos=Sum('duracion_cita')
+        )
+    ]
+    with transaction.atomic():
+        resumen.delete()
+        OcupacionDiaria.objects.bulk_create(filas, batch_size=5000)
+    return len(filas)
+
+
+def capacidad_por_tipo():
+    """Minutos reservables por día para cada tipo de cita: un bloque diario por recurso activo."""
+    recursos = dict(
+        Recurso.objects.filter(activo=True).order_by().values('tipo_cita')
+        .annotate(total=Count('id')).values_list('tipo_cita', 'total')
+    )
+    # Sin recursos configurados se asume el recurso implícito de cada tipo
+    return {tipo: CAPACIDAD_MINUTOS_DIA * max(recursos.get(tipo, 0), 1) for tipo, _ in Cita.TIPOS_CITA}
+
+
+def mapa_ocupacion(desde, hasta, tipo_cita=None, capacidad=None):
+    """Filas del resumen entre `desde` y `hasta` (un solo rango sobre el índice único)."""
+    capacidad = capacidad or capacidad_por_tipo()
+    filas = OcupacionDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if tipo_cita:
+        filas = filas.filter(tipo_cita=tipo_cita)
+    return [
+        {
+            'fecha': fila['fecha'],
+            'tipo_cita': fila['tipo_cita'],
+            'citas': fila['citas'],
+            'minutos': fila['minutos'],
+            'porcentaje': round(100 * fila['minutos'] / capacidad.get(fila['tipo_cita'], CAPACIDAD_MINUTOS_DIA), 1),
+        }
+        for fila in filas.order_by('fecha', 'tipo_cita').values('fecha', 'tipo_cita', 'citas', 'minutos')
+    ]
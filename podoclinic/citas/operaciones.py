@@ -0,0 +1,162 @@
+"""
+Operaciones masivas sobre citas: cancelar, confirmar o reprogramar un grupo de citas
+(por ejemplo, todas las de un día en que la clínica cierra).
+
+Las citas se leen en una sola consulta y, al reprogramar, los horarios nuevos se
+revisan en memoria contra una sola carga de la agenda por tipo de cita
+(`cargar_agenda`, recursos bloqueados), con las mismas reglas que la disponibilidad:
+horas en punto dentro del horario de atención (`horas_inicio`) y nunca en el
+pasado. Los cambios se escriben con bulk_update en
+una transacción y los avisos a los pacientes se encolan como una sola tarea de
+Celery después del commit.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .agenda import cargar_agenda, horas_inicio, minuto_absoluto
+from .masivo import propagar_escritura_masiva
+from .models import Cita
+
+logger = logging.getLogger(__name__)
+
+ACCIONES = ('cancelar', 'confirmar', 'reprogramar')
+
+# Tope de citas por operación
+MAX_CITAS_OPERACION = 500
+
+# Estados desde los que cada acción cambia la cita; las demás citas se dejan igual
+ESTADOS_ORIGEN = {
+    'cancelar': ('reservada', 'confirmada'),
+    'confirmar': ('reservada',),
+    'reprogramar': ('reservada', 'confirmada'),
+}
+
+
+class ConflictoOperacion(ValidationError):
+    """Algunas citas no tienen horario libre (o válido) en su nueva fecha y hora."""
+
+    def __init__(self, conflictos):
+        self.conflictos = conflictos
+        super().__init__(
+            f'{len(conflictos)} cita(s) no tienen horario libre: '
+            + ', '.join(str(conflicto['id']) for conflicto in conflictos)
+        )
+
+
+def _horario_invalido(fecha, hora, duracion, minimo):
+    """Motivo por el que el horario no se ofrecería en la agenda, o None si es válido."""
+    if hora.minute or hora.second or hora.hour not in horas_inicio(duracion):
+        return 'fuera del horario de atención'
+    if minuto_absoluto(fecha, hora) < minimo:
+        return 'horario pasado'
+    return None
+
+
+def _reprogramar(citas, fecha, hora, desplazar_dias):
+    """
+    Asigna a cada cita su nuevo horario y un recurso libre (conserva el suyo si
+    puede). Devuelve (citas movidas, {id: fecha anterior}, conflictos).
+    """
+    ahora = timezone.localtime()
+    minimo = minuto_absoluto(ahora.date(), ahora.time())
+    destinos, conflictos = {}, []
+    for cita in citas:
+        nueva_fecha = fecha or cita.fecha + timedelta(days=desplazar_dias or 0)
+        nueva_hora = hora or cita.hora
+        motivo = _horario_invalido(nueva_fecha, nueva_hora, cita.duracion_cita, minimo)
+        if motivo:
+            conflictos.append({'id': cita.pk, 'fecha': nueva_fecha, 'hora': nueva_hora, 'motivo': motivo})
+        else:
+            destinos[cita.pk] = (nueva_fecha, nueva_hora)
+
+    movidas, fechas_anteriores = [], {}
+    por_tipo = {}
+    for cita in citas:
+        if cita.pk in destinos:
+            por_tipo.setdefault(cita.tipo_cita, []).append(cita)
+    for tipo_cita, grupo in por_tipo.items():
+        fechas = [destinos[cita.pk][0] for cita in grupo]
+        # Las citas que se mueven no cuentan como ocupadas en la agenda
+        agenda = cargar_agenda(tipo_cita, min(fechas), max(fechas),
+                               excluir=[cita.pk for cita in grupo], bloquear=True)
+        for cita in sorted(grupo, key=lambda c: destinos[c.pk]):
+            nueva_fecha, nueva_hora = destinos[cita.pk]
+            libres = agenda.recursos_libres(nueva_fecha, nueva_hora, cita.duracion_cita)
+            if not libres:
+                conflictos.append({'id': cita.pk, 'fecha': nueva_fecha, 'hora': nueva_hora,
+                                   'motivo': 'sin recurso libre'})
+                continue
+            recurso = cita.recurso_id if cita.recurso_id in libres else libres[0]
+            # Reservar en memoria para que las citas del lote no choquen entre sí
+            agenda.reservar(recurso, nueva_fecha, nueva_hora, cita.duracion_cita)
+            if nueva_fecha != cita.fecha:
+                fechas_anteriores[cita.pk] = cita.fecha
+            cita.fecha, cita.hora, cita.recurso_id = nueva_fecha, nueva_hora, recurso
+            movidas.append(cita)
+    return movidas, fechas_anteriores, conflictos
+
+
+def operar_citas(queryset, accion, fecha=None, hora=None, desplazar_dias=None,
+                 omitir_conflictos=False, notificar=True):
+    """
+    Aplica `accion` a las citas de `queryset`. Para 'reprogramar' se indica la
+    nueva `fecha` o `desplazar_dias`, y opcionalmente la nueva `hora`.
+
+    Si alguna cita reprogramada no tiene horario libre lanza ConflictoOperacion sin
+    cambiar nada, salvo con `omitir_conflictos` (esas citas quedan como estaban).
+    Devuelve (citas modificadas, conflictos).
+    """
+    if accion not in ACCIONES:
+        raise ValidationError(f'Acción no válida: {accion}')
+    if accion == 'reprogramar' and not fecha and not desplazar_dias:
+        raise ValidationError('Indique la nueva fecha o los días a desplazar')
+
+    with transaction.atomic():
+        # Una sola lectura; se bloquean solo las filas de citas (recurso es un LEFT JOIN)
+        citas = list(
+            queryset.filter(estado__in=ESTADOS_ORIGEN[accion])
+            .select_related('paciente', 'tratamiento', 'recurso')
+            .select_for_update(of=('self',))
+            .order_by('fecha', 'hora', 'id')[:MAX_CITAS_OPERACION + 1]
+        )
+        if len(citas) > MAX_CITAS_OPERACION:
+            raise ValidationError(f'La operación no puede afectar a más de {MAX_CITAS_OPERACION} citas')
+
+        fechas_anteriores, conflictos = {}, []
+        if accion == 'reprogramar':
+            citas, fechas_anteriores, conflictos = _reprogramar(citas, fecha, hora, desplazar_dias)
+            if conflictos and not omitir_conflictos:
+                raise ConflictoOperacion(conflictos)
+            campos = ['fecha', 'hora', 'recurso', 'ultima_actualizacion']
+        else:
+            for cita in citas:
+                cita.estado = 'cancelada' if accion == 'cancelar' else 'confirmada'
+            campos = ['estado', 'ultima_actualizacion']
+
+        if citas:
+            # bulk_update no aplica auto_now ni dispara señales
+            ahora = timezone.now()
+            for cita in citas:
+                cita.ultima_actualizacion = ahora
+            Cita.objects.bulk_update(citas, campos, batch_size=MAX_CITAS_OPERACION)
+            propagar_escritura_masiva(citas, 'actualizada', fechas_anteriores=fechas_anteriores)
+            if notificar:
+                ids = [cita.pk for cita in citas]
+                transaction.on_commit(lambda: _encolar_avisos(ids, accion))
+
+    logger.info(f"Operación masiva '{accion}': {len(citas)} citas modificadas, {len(conflictos)} en conflicto")
+    return citas, conflictos
+
+
+def _encolar_avisos(ids, accion):
+    from .tasks import enviar_avisos_citas
+
+    try:
+        enviar_avisos_citas.delay(ids, accion)
+    except Exception as e:
+        # Sin broker los cambios ya están guardados; solo se pierden los avisos
+        logger.error(f"No se pudieron encolar los avisos de {len(ids)} citas: {str(e)}")
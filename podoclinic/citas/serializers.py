@@ -1,5 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Tratamiento, Cita
+from .agenda import HORA_APERTURA, HORA_CIERRE
+from .models import Tratamiento, Cita, ListaEspera, Recurso, SerieCitas
 from pacientes.models import Paciente
 
 class TratamientoSerializer(serializers.ModelSerializer):
@@ -7,19 +9,96 @@ class TratamientoSerializer(serializers.ModelSerializer):
         model = Tratamiento
         fields = '__all__'
 
+class RecursoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Recurso
+        fields = '__all__'
+
 class CitaSerializer(serializers.ModelSerializer):
     paciente_rut = serializers.CharField(source='paciente.rut', read_only=True)
     paciente_nombre = serializers.CharField(source='paciente.nombre', read_only=True)
     paciente_apellido = serializers.CharField(source='paciente.apellido', read_only=True)
     tipo_tratamiento = serializers.CharField(source='tratamiento.descripcion', read_only=True)
+    recurso_nombre = serializers.CharField(source='recurso.nombre', read_only=True, default=None)
     
     class Meta:
         model = Cita
         fields = [
             'id', 'paciente_rut', 'paciente_nombre', 'paciente_apellido',
             'tipo_tratamiento', 'fecha', 'hora', 'estado', 'tipo_cita',
-            'duracion_extendida', 'duracion_cita', 'fecha_creacion'
+            'duracion_extendida', 'duracion_cita', 'fecha_creacion',
+            'recurso', 'recurso_nombre'
+        ]
+
+class SerieCitasSerializer(serializers.ModelSerializer):
+    paciente = serializers.SlugRelatedField(slug_field='rut', queryset=Paciente.objects.all())
+    paciente_nombre = serializers.CharField(source='paciente.nombre', read_only=True)
+    # Estado de las citas que se crean (la serie no lo guarda)
+    estado = serializers.ChoiceField(choices=Cita.ESTADOS, write_only=True, required=False)
+    
+    class Meta:
+        model = SerieCitas
+        fields = '__all__'
+        read_only_fields = ['fecha_creacion']
+    
+    def validate(self, data):
+        if not data.get('repeticiones') and not data.get('fecha_fin'):
+            raise serializers.ValidationError('Indique repeticiones o fecha_fin')
+        return data
+
+class ModificarSerieSerializer(serializers.Serializer):
+    """Cambios para "esta y las siguientes" citas de una serie."""
+    desde = serializers.DateField()
+    hora = serializers.TimeField(required=False)
+    duracion_cita = serializers.ChoiceField(choices=Cita.DURACIONES, required=False)
+    estado = serializers.ChoiceField(choices=Cita.ESTADOS, required=False)
+    recurso = serializers.PrimaryKeyRelatedField(queryset=Recurso.objects.filter(activo=True), required=False)
+    tratamiento = serializers.PrimaryKeyRelatedField(queryset=Tratamiento.objects.all(), required=False)
+
+class ListaEsperaSerializer(serializers.ModelSerializer):
+    paciente = serializers.SlugRelatedField(slug_field='rut', queryset=Paciente.objects.all())
+    paciente_nombre = serializers.CharField(source='paciente.nombre', read_only=True)
+    
+    class Meta:
+        model = ListaEspera
+        # El token solo viaja en el correo de la oferta
+        exclude = ['token']
+        read_only_fields = [
+            'estado', 'fecha_creacion', 'oferta_fecha', 'oferta_hora', 'oferta_recurso',
+            'oferta_expira', 'cita',
         ]
+    
+    def validate(self, data):
+        if data.get('fecha_desde') and data.get('fecha_hasta') and data['fecha_desde'] > data['fecha_hasta']:
+            raise serializers.ValidationError('fecha_desde no puede ser posterior a fecha_hasta')
+        if data.get('hora_desde') and data.get('hora_hasta') and data['hora_desde'] > data['hora_hasta']:
+            raise serializers.ValidationError('hora_desde no puede ser posterior a hora_hasta')
+        return data
+
+class OperacionMasivaSerializer(serializers.Serializer):
+    """Acción sobre un grupo de citas, indicado por `ids` o por `filtro` (mismos campos que el listado)."""
+    accion = serializers.ChoiceField(choices=['cancelar', 'confirmar', 'reprogramar'])
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filtro = serializers.DictField(required=False, allow_empty=False)
+    fecha = serializers.DateField(required=False)
+    hora = serializers.TimeField(required=False)
+    desplazar_dias = serializers.IntegerField(required=False)
+    omitir_conflictos = serializers.BooleanField(default=False)
+    notificar = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filtro' in data):
+            raise serializers.ValidationError('Indique ids o filtro (solo uno de ellos)')
+        if data['accion'] == 'reprogramar' and not data.get('fecha') and not data.get('desplazar_dias'):
+            raise serializers.ValidationError('Para reprogramar indique fecha o desplazar_dias')
+        # Mismas horas que ofrece la agenda; el fin de cada cita según su duración se revisa al reprogramar
+        hora = data.get('hora')
+        if hora and (hora.minute or hora.second or not HORA_APERTURA <= hora.hour <= HORA_CIERRE):
+            raise serializers.ValidationError(
+                {'hora': f'La hora debe ser en punto, entre las {HORA_APERTURA}:00 y las {HORA_CIERRE}:00'})
+        if data.get('fecha') and data['fecha'] < timezone.localdate():
+            raise serializers.ValidationError({'fecha': 'La nueva fecha no puede ser anterior a hoy'})
+        return data
 
 class ReservaCitaSerializer(serializers.Serializer):
     nombre = serializers.CharField(max_length=100)
@@ -0,0 +1,211 @@
+"""
+Series de citas recurrentes.
+
+La serie guarda la regla (frecuencia, fecha de inicio, repeticiones o fecha de fin)
+y las fechas exceptuadas. Al crearla se revisan todas las ocurrencias contra la
+agenda de una vez (`cargar_agenda`: una consulta por rango) y las citas se insertan
+con un solo bulk_create, todo en una transacción. Editar "esta y las siguientes"
+es un único UPDATE sobre las citas de la serie desde una fecha.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .agenda import cargar_agenda
+from .masivo import propagar_escritura_masiva
+from .models import Cita, Recurso, SerieCitas
+
+# Tope de ocurrencias por serie (dos años de citas semanales)
+MAX_OCURRENCIAS = 104
+
+# Campos de las citas que se pueden cambiar en "esta y las siguientes"
+CAMPOS_EDITABLES = ('hora', 'duracion_cita', 'estado', 'recurso', 'tratamiento')
+
+
+class ConflictoSerie(ValidationError):
+    """Algunas ocurrencias de la serie chocan con citas existentes."""
+
+    def __init__(self, fechas):
+        self.fechas = sorted(fechas)
+        super().__init__(
+            f'{len(self.fechas)} fecha(s) de la serie no tienen horario libre: '
+            + ', '.join(fecha.isoformat() for fecha in self.fechas)
+        )
+
+
+def _sumar_meses(fecha, meses):
+    """Mismo día `meses` después; si el mes es más corto, su último día."""
+    mes = fecha.month - 1 + meses
+    anio, mes = fecha.year + mes // 12, mes % 12 + 1
+    return date(anio, mes, min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def ocurrencia(fecha_inicio, frecuencia, numero):
+    if frecuencia == 'mensual':
+        return _sumar_meses(fecha_inicio, numero)
+    return fecha_inicio + timedelta(weeks=2 * numero if frecuencia == 'quincenal' else numero)
+
+
+def fechas_serie(serie):
+    """Fechas de la serie según su regla, sin las excepciones."""
+    if not serie.repeticiones and not serie.fecha_fin:
+        raise ValidationError('La serie necesita repeticiones o fecha_fin')
+    excepciones = {date.fromisoformat(str(fecha)) for fecha in serie.excepciones or []}
+    fechas = []
+    for numero in range(serie.repeticiones or MAX_OCURRENCIAS + 1):
+        fecha = ocurrencia(serie.fecha_inicio, serie.frecuencia, numero)
+        if serie.fecha_fin and fecha > serie.fecha_fin:
+            break
+        if numero >= MAX_OCURRENCIAS:
+            raise ValidationError(f'La serie no puede tener más de {MAX_OCURRENCIAS} citas')
+        if fecha not in excepciones:
+            fechas.append(fecha)
+    return fechas
+
+
+def _planificar(agenda, fechas, hora, duracion, recurso_preferido, fijo=None):
+    """
+    Recurso para cada fecha: el preferido si está libre y si no, el primero libre.
+    Con `fijo` ({fecha: recurso_id}) cada fecha debe quedar en ese recurso.
+    Devuelve ({fecha: recurso_id}, [fechas en conflicto]).
+    """
+    asignados, conflictos = {}, []
+    for fecha in fechas:
+        libres = agenda.recursos_libres(fecha, hora, duracion)
+        if fijo is not None:
+            recurso = fijo[fecha]
+            # Las citas sin recurso se cuentan en el primero (ver Agenda)
+            evaluado = agenda.recursos[0] if recurso is None else recurso
+            if evaluado not in libres:
+                conflictos.append(fecha)
+                continue
+        elif libres:
+            recurso = evaluado = recurso_preferido if recurso_preferido in libres else libres[0]
+        else:
+            conflictos.append(fecha)
+            continue
+        asignados[fecha] = recurso
+        # Reservar en memoria para que las ocurrencias no choquen entre sí
+        agenda.reservar(evaluado, fecha, hora, duracion)
+    return asignados, conflictos
+
+
+def crear_serie(serie, omitir_conflictos=False, estado='reservada'):
+    """
+    Guarda la serie (instancia sin guardar) y crea todas sus citas. Si alguna fecha
+    no tiene horario libre lanza ConflictoSerie sin crear nada; con
+    `omitir_conflictos` esas fechas pasan a ser excepciones de la serie.
+    Devuelve (serie, citas creadas).
+    """
+    fechas = fechas_serie(serie)
+    if not fechas:
+        raise ValidationError('La serie no tiene fechas')
+
+    with transaction.atomic():
+        agenda = cargar_agenda(serie.tipo_cita, fechas[0], fechas[-1], bloquear=True)
+        asignados, conflictos = _planificar(
+            agenda, fechas, serie.hora, serie.duracion_cita, serie.recurso_id
+        )
+        if conflictos and (not omitir_conflictos or not asignados):
+            raise ConflictoSerie(conflictos)
+        if conflictos:
+            serie.excepciones = sorted(
+                set(serie.excepciones or []) | {fecha.isoformat() for fecha in conflictos}
+            )
+        serie.save()
+
+        recursos = Recurso.objects.in_bulk(set(asignados.values()) - {None})
+        citas = Cita.objects.bulk_create([
+            Cita(
+                paciente=serie.paciente, tratamiento=serie.tratamiento, serie=serie,
+                recurso=recursos.get(recurso), fecha=fecha, hora=serie.hora,
+                tipo_cita=serie.tipo_cita, estado=estado, duracion_cita=serie.duracion_cita,
+                duracion_extendida=serie.duracion_cita == 120,
+            )
+            for fecha, recurso in sorted(asignados.items())
+        ])
+        if citas and citas[0].pk is None:
+            # Motores sin RETURNING en bulk_create: recuperar los ids
+            citas = list(serie.citas.select_related('paciente', 'tratamiento', 'recurso').order_by('fecha'))
+        propagar_escritura_masiva(citas, 'creada')
+    return serie, citas
+
+
+def modificar_siguientes(serie, desde, cambios):
+    """
+    Aplica `cambios` (subconjunto de CAMPOS_EDITABLES) a las citas de la serie desde
+    la fecha `desde` con un solo UPDATE, después de revisar los horarios con una
+    consulta por rango. Si `desde` es posterior al inicio, la serie se divide: las
+    citas siguientes pasan a una serie nueva con la regla actualizada. Un estado
+    activo no reactiva las citas canceladas de la serie.
+    Devuelve (serie de las citas modificadas, cantidad de citas modificadas).
+    """
+    cambios = {campo: valor for campo, valor in cambios.items() if valor is not None}
+    desconocidos = set(cambios) - set(CAMPOS_EDITABLES)
+    if desconocidos:
+        raise ValidationError(f'Campos no editables: {", ".join(sorted(desconocidos))}')
+
+    estado = cambios.get('estado')
+    activa = estado is None or estado not in Cita.ESTADOS_INACTIVOS
+    with transaction.atomic():
+        siguientes = serie.citas.filter(fecha__gte=desde)
+        actuales = list(siguientes.values_list('id', 'fecha', 'recurso_id', 'estado'))
+        if not actuales:
+            return serie, 0
+        # Las citas canceladas una a una siguen canceladas: un estado activo no las reactiva
+        activas = [(pk, fecha, recurso) for pk, fecha, recurso, estado_actual in actuales
+                   if estado_actual not in Cita.ESTADOS_INACTIVOS]
+
+        hora = cambios.get('hora', serie.hora)
+        duracion = cambios.get('duracion_cita', serie.duracion_cita)
+        if activa and activas and {'hora', 'duracion_cita', 'recurso', 'estado'} & set(cambios):
+            # Cada cita conserva su recurso salvo que se pida otro; debe estar libre en el nuevo horario
+            recurso_nuevo = cambios['recurso'].pk if cambios.get('recurso') else None
+            fijo = {fecha: recurso_nuevo or recurso for _, fecha, recurso in activas}
+            fechas = sorted(fijo)
+            agenda = cargar_agenda(serie.tipo_cita, fechas[0], fechas[-1],
+                                   excluir=[pk for pk, _, _, _ in actuales], bloquear=True)
+            _, conflictos = _planificar(agenda, fechas, hora, duracion, None, fijo=fijo)
+            if conflictos:
+                raise ConflictoSerie(conflictos)
+
+        # "Esta y las siguientes": desde una fecha intermedia, la serie se divide
+        if desde > serie.fecha_inicio:
+            # Ocurrencias de la regla anteriores a `desde` (excepciones incluidas)
+            anteriores = 0
+            while ocurrencia(serie.fecha_inicio, serie.frecuencia, anteriores) < desde:
+                anteriores += 1
+            nueva = SerieCitas.objects.get(pk=serie.pk)
+            nueva.pk = None
+            nueva.fecha_inicio = ocurrencia(serie.fecha_inicio, serie.frecuencia, anteriores)
+            if serie.repeticiones:
+                nueva.repeticiones = max(serie.repeticiones - anteriores, 1)
+                serie.repeticiones = anteriores
+            else:
+                serie.fecha_fin = desde - timedelta(days=1)
+            nueva.excepciones = [f for f in serie.excepciones or [] if date.fromisoformat(f) >= desde]
+            serie.excepciones = [f for f in serie.excepciones or [] if date.fromisoformat(f) < desde]
+            serie.save()
+            serie = nueva
+        for campo, valor in cambios.items():
+            if campo != 'estado':
+                setattr(serie, campo, valor)
+        serie.save()
+
+        ids = [pk for pk, _, _, _ in actuales]
+        valores = dict(cambios, serie=serie, ultima_actualizacion=timezone.now())
+        if 'duracion_cita' in cambios:
+            valores['duracion_extendida'] = cambios['duracion_cita'] == 120
+        if estado is not None and activa and len(activas) < len(actuales):
+            valores.pop('estado')
+            Cita.objects.filter(pk__in=[pk for pk, _, _ in activas]).update(estado=estado)
+        cantidad = Cita.objects.filter(pk__in=ids).update(**valores)
+
+        propagar_escritura_masiva(
+            list(Cita.objects.filter(pk__in=ids).select_related('paciente', 'tratamiento', 'recurso')),
+            'actualizada',
+        )
+    return serie, cantidad
@@ -1,9 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
-from .models import Cita
+from .espera import ofrecer_horario_liberado
+from .eventos import publicar_evento_cita
+from .ocupacion import reconstruir_ocupacion, registrar_cambio, valores_cita
+from .models import Cita, Eliminacion
+from pacientes.models import Paciente
 import logging
 import threading
 import os
@@ -189,4 +194,64 @@ def enviar_correo_confirmacion(sender, instance, created, **kwargs):
             try:
                 enviar_correo_en_segundo_plano(instance.paciente, instance)
             except Exception as e2:
-                logger.error(f"Error al enviar correo directamente: {str(e2)}") 
\ No newline at end of file
+                logger.error(f"Error al enviar correo directamente: {str(e2)}") 
+
+
+@receiver(post_delete, sender=Cita)
+@receiver(post_delete, sender=Paciente)
+def registrar_eliminacion(sender, instance, **kwargs):
+    """
+    Guarda un registro de eliminación para el feed de cambios del calendario.
+    También se dispara para las citas borradas en cascada al eliminar un paciente.
+    """
+    Eliminacion.objects.create(modelo=sender._meta.model_name, objeto_id=instance.pk)
+
+
+@receiver(post_save, sender=Cita)
+def publicar_cambio_cita(sender, instance, created, **kwargs):
+    """Publica la creación o actualización de la cita en el canal de eventos de la agenda."""
+    fecha_anterior = getattr(instance, '_fecha_guardada', None)
+    publicar_evento_cita('creada' if created else 'actualizada', instance, fecha_anterior)
+
+
+@receiver(post_delete, sender=Cita)
+def publicar_eliminacion_cita(sender, instance, **kwargs):
+    """Publica la eliminación de la cita en el canal de eventos de la agenda."""
+    publicar_evento_cita('eliminada', instance)
+
+
+@receiver(post_save, sender=Cita)
+def ofrecer_horario_cancelado(sender, instance, created, **kwargs):
+    """Al cancelar una cita, ofrece su horario a la lista de espera (después del commit)."""
+    anterior = getattr(instance, '_ocupacion_guardada', None)
+    if created or not anterior or anterior[3] in Cita.ESTADOS_INACTIVOS:
+        return
+    if instance.estado in Cita.ESTADOS_INACTIVOS:
+        transaction.on_commit(lambda: ofrecer_horario_liberado(instance))
+
+
+@receiver(post_delete, sender=Cita)
+def ofrecer_horario_eliminado(sender, instance, **kwargs):
+    """Al eliminar una cita activa, ofrece su horario a la lista de espera (después del commit)."""
+    if instance.estado not in Cita.ESTADOS_INACTIVOS:
+        transaction.on_commit(lambda: ofrecer_horario_liberado(instance))
+
+
+@receiver(post_save, sender=Cita)
+def actualizar_ocupacion_cita(sender, instance, created, **kwargs):
+    """Ajusta el resumen OcupacionDiaria según el estado anterior y el nuevo de la cita."""
+    nuevo = valores_cita(instance)
+    anterior = None if created else getattr(instance, '_ocupacion_guardada', None)
+    if not created and (anterior is None or None in anterior):
+        # Instancia no leída de la base (o con campos diferidos): no se conoce su aporte
+        # anterior, así que se recalcula el día desde las citas
+        fecha = Cita._meta.get_field('fecha').to_python(instance.fecha)
+        reconstruir_ocupacion(desde=fecha, hasta=fecha)
+    else:
+        registrar_cambio(anterior, nuevo)
+
+
+@receiver(post_delete, sender=Cita)
+def descontar_ocupacion_cita(sender, instance, **kwargs):
+    """Descuenta del resumen OcupacionDiaria la cita eliminada."""
+    registrar_cambio(getattr(instance, '_ocupacion_guardada', None) or valores_cita(instance), None)
@@ -3,13 +3,16 @@ from django.utils import timezone
 from datetime import timedelta
 from .models import Cita
 from .utils import enviar_confirmacion_whatsapp
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Recordatorios marcados por transacción: si el worker se cae, a lo sumo se reenvía un lote
+LOTE_RECORDATORIOS = 100
+
 @shared_task
 def enviar_correo_confirmacion_cita(paciente_id, cita_id):
     """
@@ -62,33 +65,192 @@ def enviar_correo_confirmacion_cita(paciente_id, cita_id):
         logger.error(error_msg)
         return error_msg
 
+ASUNTOS_AVISO = {
+    'cancelar': "Cancelación de su Cita - PodoClinic",
+    'confirmar': "Confirmación de su Cita - PodoClinic",
+    'reprogramar': "Cambio de horario de su Cita - PodoClinic",
+}
+
+@shared_task
+def enviar_avisos_citas(cita_ids, accion):
+    """
+    Tarea asíncrona que avisa a los pacientes de una operación masiva sobre sus
+    citas (cancelación, confirmación o cambio de horario). Lee las citas en una
+    consulta y envía todos los correos por una sola conexión.
+    """
+    from citas.models import Cita
+
+    citas = Cita.objects.filter(id__in=cita_ids).select_related('paciente').order_by('fecha', 'hora')
+    mensajes = []
+    for cita in citas:
+        paciente = cita.paciente
+        if not paciente.correo:
+            logger.warning(f"No se puede avisar la cita {cita.id}: Paciente {paciente.nombre} no tiene correo registrado")
+            continue
+        contexto = {
+            'accion': accion,
+            'nombre_paciente': paciente.nombre,
+            'fecha_cita': cita.fecha.strftime('%d de %B de %Y'),
+            'hora_cita': cita.hora.strftime('%H:%M'),
+            'tipo_cita': cita.get_tipo_cita_display(),
+            'nombre_clinica': 'PodoClinic',
+            'telefono_clinica': '+56 9 1234 5678',
+            'whatsapp_clinica': '+56 9 1234 5678',
+            'direccion_clinica': 'Villa El Bosque - Alcalde Sergio Jorquera N°65, La Cruz'
+        }
+        mensajes.append(EmailMessage(
+            subject=ASUNTOS_AVISO[accion],
+            body=render_to_string('emails/aviso_cita_texto.txt', contexto),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[paciente.correo],
+        ))
+
+    try:
+        enviados = get_connection(fail_silently=False).send_messages(mensajes) if mensajes else 0
+    except Exception as e:
+        error_msg = f"Error al enviar avisos de citas: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
+
+    logger.info(f"Enviados {enviados} avisos de '{accion}' de {len(cita_ids)} citas")
+    return f"Enviados {enviados} avisos"
+
+@shared_task
+def enviar_oferta_espera(entrada_id):
+    """
+    Tarea asíncrona que ofrece por correo un horario liberado a un paciente de la
+    lista de espera, con el enlace para aceptarlo.
+    """
+    from citas.models import ListaEspera
+
+    try:
+        entrada = ListaEspera.objects.select_related('paciente').get(id=entrada_id, estado='ofrecida')
+    except ListaEspera.DoesNotExist:
+        return f"La entrada {entrada_id} ya no tiene una oferta pendiente"
+
+    paciente = entrada.paciente
+    if not paciente.correo:
+        logger.warning(f"No se puede ofrecer el horario: Paciente {paciente.nombre} no tiene correo registrado")
+        return "Paciente sin correo"
+
+    contexto = {
+        'nombre_paciente': paciente.nombre,
+        'fecha_cita': entrada.oferta_fecha.strftime('%d de %B de %Y'),
+        'hora_cita': entrada.oferta_hora.strftime('%H:%M'),
+        'tipo_cita': entrada.get_tipo_cita_display(),
+        'vence': timezone.localtime(entrada.oferta_expira).strftime('%d/%m/%Y %H:%M'),
+        'enlace': f"{settings.LISTA_ESPERA_URL_RESPUESTA}?token={entrada.token}",
+        'nombre_clinica': 'PodoClinic',
+        'telefono_clinica': '+56 9 1234 5678',
+        'whatsapp_clinica': '+56 9 1234 5678',
+        'direccion_clinica': 'Villa El Bosque - Alcalde Sergio Jorquera N°65, La Cruz'
+    }
+    try:
+        send_mail(
+            subject="Horario disponible - PodoClinic",
+            message=render_to_string('emails/oferta_espera_texto.txt', contexto),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[paciente.correo],
+            fail_silently=False,
+        )
+    except Exception as e:
+        error_msg = f"Error al enviar oferta de lista de espera: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
+
+    logger.info(f"Oferta de {contexto['fecha_cita']} {contexto['hora_cita']} enviada a {paciente.correo}")
+    return f"Oferta enviada a {paciente.correo}"
+
+@shared_task
+def expirar_oferta_espera(entrada_id, token):
+    """Tarea con ETA: vence la oferta si no se respondió y ofrece el horario al siguiente."""
+    from citas.espera import expirar_oferta
+
+    return "Oferta vencida" if expirar_oferta(entrada_id, token) else "Oferta ya respondida"
+
+@shared_task
+def expirar_ofertas_vencidas():
+    """
+    Tarea programada que vence las ofertas de lista de espera cuyo plazo pasó
+    (respaldo de las tareas con ETA que se hayan perdido).
+    """
+    from citas.espera import expirar_ofertas_vencidas as expirar
+
+    vencidas = expirar()
+    logger.info(f"Vencidas {vencidas} ofertas de lista de espera")
+    return f"Vencidas {vencidas} ofertas de lista de espera"
+
 @shared_task
-def enviar_recordatorios_citas():
+def enviar_recordatorios_citas(lote=LOTE_RECORDATORIOS):
     """
-    Tarea programada para enviar recordatorios de citas próximas
+    Tarea programada para enviar recordatorios de citas próximas.
+
+    Cada lote de citas se marca y se encola en la misma transacción: si el worker
+    se cae a mitad de camino, a lo sumo se reenvían los recordatorios de un lote.
     """
     from citas.models import Cita
     from datetime import date, timedelta
+    from django.db import transaction
     
     # Buscar citas para mañana que no tengan recordatorio enviado
     fecha_manana = date.today() + timedelta(days=1)
-    citas_manana = Cita.objects.filter(
+    pendientes = Cita.objects.filter(
         fecha=fecha_manana,
         recordatorio_enviado=False,
-        estado__in=['reservada', 'confirmada']
+        estado__in=Cita.ESTADOS_ACTIVOS
     )
     
-    for cita in citas_manana:
-        try:
-            enviar_correo_confirmacion_cita.delay(
-                paciente_id=cita.paciente.id,
-                cita_id=cita.id
+    enviados, fallidos = 0, []
+    while True:
+        with transaction.atomic():
+            citas = list(
+                pendientes.exclude(id__in=fallidos).order_by('id').select_for_update()
+                .values_list('id', 'paciente_id')[:lote]
             )
-            # Marcar que se envió el recordatorio
-            cita.recordatorio_enviado = True
-            cita.save(update_fields=['recordatorio_enviado'])
-            logger.info(f"Recordatorio enviado para cita {cita.id}")
-        except Exception as e:
-            logger.error(f"Error al enviar recordatorio para cita {cita.id}: {str(e)}")
+            if not citas:
+                break
+            # Se marcan antes de encolar: si algo falla, el lote vuelve a quedar pendiente
+            Cita.objects.filter(id__in=[cita_id for cita_id, _ in citas]).update(recordatorio_enviado=True)
+            fallidos_lote = []
+            for cita_id, paciente_id in citas:
+                try:
+                    enviar_correo_confirmacion_cita.delay(
+                        paciente_id=paciente_id,
+                        cita_id=cita_id
+                    )
+                    enviados += 1
+                    logger.info(f"Recordatorio enviado para cita {cita_id}")
+                except Exception as e:
+                    logger.error(f"Error al enviar recordatorio para cita {cita_id}: {str(e)}")
+                    fallidos_lote.append(cita_id)
+            if fallidos_lote:
+                Cita.objects.filter(id__in=fallidos_lote).update(recordatorio_enviado=False)
+                fallidos.extend(fallidos_lote)
+        if len(citas) < lote:
+            break
     
-    return f"Procesados {citas_manana.count()} recordatorios"
\ No newline at end of file
+    return f"Procesados {enviados} recordatorios"
+
+@shared_task
+def depurar_eliminaciones():
+    """
+    Tarea programada que borra los registros de eliminación más antiguos que la
+    retención del feed de cambios (los clientes con cursores anteriores recargan todo).
+    """
+    from citas.cambios import RETENCION_ELIMINACIONES
+    from citas.models import Eliminacion
+
+    borrados, _ = Eliminacion.objects.filter(fecha__lt=timezone.now() - RETENCION_ELIMINACIONES).delete()
+    logger.info(f"Depurados {borrados} registros de eliminación")
+    return f"Depurados {borrados} registros de eliminación"
+
+@shared_task
+def cerrar_citas_pasadas():
+    """
+    Tarea programada (cada noche) que pasa las citas activas de días anteriores a
+    'completada' o 'no_asistio' con UPDATE por lotes (ver citas/cierre.py).
+    """
+    from citas.cierre import cerrar_citas_pasadas as cerrar
+
+    totales = cerrar()
+    return f"Cerradas {totales['completada']} citas completadas y {totales['no_asistio']} sin asistencia"
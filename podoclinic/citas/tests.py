@@ -1,3 +1,1508 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from itertools import count
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+from django.core.exceptions import ValidationError
+from django.core import mail, signing
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from insumos.models import Insumo, MovimientoInsumo
+from pacientes.models import FichaClinica, Paciente, UsoProductoEnFicha
+from pacientes.utils import validar_rut
+from podoclinic import invalidacion
+from podoclinic.benchmark import medir
+from podoclinic.invalidacion import CacheLocal, procesar_mensaje
+from podoclinic.publicacion import PublicadorRedis
+from podoclinic.sembrado import GeneradorDatos
+from podoclinic.testing import PlanConsultaMixin, PresupuestoConsultasMixin
+from reportes.models import DiaPendiente
+from usuarios.models import Usuario
+from . import eventos
+from .eventos import evento_en_ventana
+from .agenda import Agenda, cargar_agenda
+from .cierre import cerrar_citas_pasadas
+from .espera import expirar_oferta, ofrecer_horario
+from .models import Cita, HistorialEstadoCita, ListaEspera, OcupacionDiaria, Recurso, SerieCitas, Tratamiento
+from .ocupacion import CAPACIDAD_MINUTOS_DIA, reconstruir_ocupacion
+from .series import MAX_OCURRENCIAS, fechas_serie
+from .tasks import enviar_avisos_citas, enviar_oferta_espera, enviar_recordatorios_citas, expirar_ofertas_vencidas
+from .utils import buscar_tratamiento
+
+logger = logging.getLogger(__name__)
+
+
+class CitasQueryBudgetTest(PresupuestoConsultasMixin, TestCase):
+    """
+    Los endpoints de citas no deben ejecutar más consultas al crecer los datos.
+
+    Quedan fuera test-email/, test-email-paciente/ y diagnostico-email/ (diagnóstico
+    del servidor de correo, sin recorrer citas) y eventos/ (stream SSE que no lee
+    citas de la base).
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='recepcion', password='clave-segura-123')
+        self.client.force_authenticate(self.usuario)
+        self.secuencia = count()
+        self.fecha = date(2030, 3, 4)
+
+    def _sembrar_citas(self, cantidad, fecha=None):
+        """Crea citas con paciente y tratamiento propios (el peor caso para N+1)."""
+        citas = []
+        for _ in range(cantidad):
+            i = next(self.secuencia)
+            paciente = Paciente.objects.create(
+                rut=f'{10000000 + i}-0', nombre=f'Paciente {i}',
+                telefono='912345678', correo=f'p{i}@example.com'
+            )
+            tratamiento = Tratamiento.objects.create(nombre='general', descripcion=f'Tratamiento {i}', precio=10000)
+            citas.append(Cita(
+                paciente=paciente, tratamiento=tratamiento,
+                fecha=fecha or self.fecha + timedelta(days=i),
+                hora=time(8 + i // 60, i % 60),
+            ))
+        # bulk_create no dispara la señal de correo
+        Cita.objects.bulk_create(citas)
+
+    def test_listado_citas(self):
+        self.assertConsultasConstantes(self._sembrar_citas, '/api/citas/citas/')
+
+    def test_listado_citas_filtrado_por_fecha(self):
+        self.assertConsultasConstantes(
+            lambda n: self._sembrar_citas(n, fecha=self.fecha),
+            f'/api/citas/citas/?fecha={self.fecha.isoformat()}'
+        )
+
+    def test_listado_tratamientos(self):
+        def sembrar(cantidad):
+            Tratamiento.objects.bulk_create([
+                Tratamiento(nombre='general', precio=1000) for _ in range(cantidad)
+            ])
+        self.assertConsultasConstantes(sembrar, '/api/citas/tratamientos/')
+
+    def test_debug_citas(self):
+        self.assertConsultasConstantes(self._sembrar_citas, '/api/citas/debug/')
+
+    def test_horarios_disponibles(self):
+        self.assertConsultasConstantes(
+            lambda n: self._sembrar_citas(n, fecha=self.fecha),
+            f'/api/citas/disponibles/?fecha={self.fecha.isoformat()}'
+        )
+
+    def test_accion_disponibles(self):
+        self.assertConsultasConstantes(
+            lambda n: self._sembrar_citas(n, fecha=self.fecha),
+            f'/api/citas/citas/disponibles/?fecha={self.fecha.isoformat()}'
+        )
+
+    def test_crear_cita_admin(self):
+        paciente = Paciente.objects.create(
+            rut='11.111.111-1', nombre='Nuevo', telefono='912345678', correo='nuevo@example.com'
+        )
+        Tratamiento.objects.create(nombre='general', precio=10000)
+
+        # Días distintos: ambas creaciones insertan su fila de OcupacionDiaria
+        def crear(fecha):
+            return self.contar_consultas('/api/citas/crear_cita_admin/', 'post', {
+                'paciente': paciente.rut, 'tratamiento': 'Podología general',
+                'fecha': fecha, 'hora': '09:00', 'tipo_cita': 'podologia',
+            }, format='json')
+
+        self._sembrar_citas(self.N)
+        consultas_n, response = crear('2031-01-01')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        self._sembrar_citas(self.N * 9)
+        consultas_10n, response = crear('2031-01-02')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(consultas_10n, consultas_n)
+
+    def test_actualizar_cita(self):
+        self._sembrar_citas(1)
+        cita = Cita.objects.latest('id')
+
+        def actualizar(hora):
+            return self.contar_consultas(f'/api/citas/actualizar/{cita.id}/', 'put', {
+                'paciente': cita.paciente.rut, 'tratamiento': 'Podología general', 'hora': hora, 'estado': 'confirmada',
+            }, format='json')
+
+        self._sembrar_citas(self.N)
+        consultas_n, response = actualizar('10:00')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self._sembrar_citas(self.N * 9)
+        consultas_10n, response = actualizar('11:00')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(consultas_10n, consultas_n)
+
+    def test_eliminar_cita(self):
+        def eliminar():
+            self._sembrar_citas(1)
+            return self.contar_consultas(f"/api/citas/eliminar/{Cita.objects.latest('id').id}/", 'delete')
+
+        self._sembrar_citas(self.N)
+        consultas_n, response = eliminar()
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self._sembrar_citas(self.N * 9)
+        consultas_10n, response = eliminar()
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(consultas_10n, consultas_n)
+
+    def test_recordatorios_citas(self):
+        manana = date.today() + timedelta(days=1)
+
+        def ejecutar(lote=100, error=None):
+            with mock.patch('citas.tasks.enviar_correo_confirmacion_cita.delay', side_effect=error) as delay:
+                with CaptureQueriesContext(connection) as ctx:
+                    enviar_recordatorios_citas(lote=lote)
+            actualizaciones = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+            return len(ctx.captured_queries), len(actualizaciones), delay.call_count
+
+        self._sembrar_citas(self.N, fecha=manana)
+        consultas_n, _, enviados = ejecutar()
+        self.assertEqual(enviados, self.N)
+
+        self._sembrar_citas(self.N * 10, fecha=manana)
+        consultas_10n, _, enviados = ejecutar()
+        self.assertEqual(enviados, self.N * 10)
+        # Un lote: select de citas pendientes + un UPDATE en bloque, sin importar cuántas sean
+        self.assertEqual(consultas_10n, consultas_n)
+        self.assertFalse(Cita.objects.filter(fecha=manana, recordatorio_enviado=False).exists())
+
+        # Lotes de N citas: un UPDATE por lote
+        self._sembrar_citas(self.N * 10, fecha=manana)
+        _, actualizaciones, enviados = ejecutar(lote=self.N)
+        self.assertEqual((actualizaciones, enviados), (10, self.N * 10))
+
+        # Una cita que no se pudo encolar queda pendiente para la próxima ejecución
+        self._sembrar_citas(self.N, fecha=manana)
+        fallida = Cita.objects.filter(fecha=manana, recordatorio_enviado=False).earliest('id')
+
+        def encolar(paciente_id, cita_id):
+            if cita_id == fallida.id:
+                raise ConnectionError('broker caído')
+
+        ejecutar(lote=2, error=encolar)
+        self.assertEqual(list(Cita.objects.filter(fecha=manana, recordatorio_enviado=False)), [fallida])
+
+
+class SeedScaleTest(TestCase):
+    """El generador de datos sintéticos debe producir datos válidos y consistentes."""
+
+    OPCIONES = {'pacientes': 200, 'citas': 1500, 'insumos': 12, 'movimientos': 3000}
+
+    def test_datos_validos_y_consistentes(self):
+        resumen = GeneradorDatos(semilla=7, lote=500).generar(**self.OPCIONES)
+
+        self.assertEqual(Cita.objects.count(), 1500)
+        self.assertEqual(resumen['cita'], 1500)
+        self.assertGreaterEqual(MovimientoInsumo.objects.count(), 3000)
+        self.assertTrue(all(validar_rut(rut) for rut in Paciente.objects.values_list('rut', flat=True)))
+
+        # Sin solapes por (fecha, tipo_cita), considerando citas de 2 horas
+        ocupadas = set()
+        for fecha, hora, tipo_cita, duracion in Cita.objects.values_list('fecha', 'hora', 'tipo_cita', 'duracion_cita'):
+            for h in range(hora.hour, hora.hour + duracion // 60):
+                self.assertNotIn((fecha, h, tipo_cita), ocupadas)
+                ocupadas.add((fecha, h, tipo_cita))
+            self.assertTrue(8 <= hora.hour <= 22)
+
+        # Fichas solo para citas completadas, con costo igual a sus productos
+        self.assertFalse(FichaClinica.objects.exclude(cita__estado='completada').exists())
+        ficha = FichaClinica.objects.filter(productos_usados__isnull=False).first()
+        self.assertEqual(ficha.costo_total, ficha.sumar_costo_productos())
+
+        # Cada uso tiene su salida, y el stock final coincide con el libro de movimientos
+        self.assertEqual(
+            MovimientoInsumo.objects.filter(motivo__startswith='Uso en ficha').aggregate(t=Sum('cantidad'))['t'],
+            UsoProductoEnFicha.objects.aggregate(t=Sum('cantidad'))['t'],
+        )
+        for insumo in Insumo.objects.all():
+            movimientos = MovimientoInsumo.objects.filter(insumo=insumo)
+            entradas = movimientos.filter(tipo_movimiento='entrada').aggregate(t=Sum('cantidad'))['t'] or 0
+            salidas = movimientos.filter(tipo_movimiento='salida').aggregate(t=Sum('cantidad'))['t'] or 0
+            self.assertEqual(insumo.stock_actual, entradas - salidas)
+            self.assertGreaterEqual(insumo.stock_actual, 0)
+
+    def test_misma_semilla_mismos_datos(self):
+        def generar():
+            with transaction.atomic():
+                GeneradorDatos(semilla=3, lote=200).generar(pacientes=50, citas=300, insumos=5)
+                datos = list(Cita.objects.order_by('fecha', 'hora', 'tipo_cita').values_list(
+                    'fecha', 'hora', 'tipo_cita', 'estado', 'duracion_cita', 'paciente__rut'))
+                transaction.set_rollback(True)
+            return datos
+
+        self.assertEqual(generar(), generar())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_copy_en_postgresql(self):
+        with mock.patch.object(GeneradorDatos, '_copiar', autospec=True, side_effect=GeneradorDatos._copiar) as copiar:
+            GeneradorDatos(semilla=5, lote=100).generar(pacientes=20, citas=300, insumos=4)
+        self.assertTrue({Cita, FichaClinica, MovimientoInsumo} <= {llamada.args[1] for llamada in copiar.call_args_list})
+        self.assertEqual(Cita.objects.count(), 300)
+        self.assertFalse(FichaClinica.objects.exclude(cita__estado='completada').exists())
+        # Los ids se tomaron de la secuencia: las inserciones normales siguen después
+        ultima = Cita.objects.order_by('-id').first()
+        nueva = Cita.objects.create(paciente=ultima.paciente, tratamiento=ultima.tratamiento,
+                                    fecha=date(2099, 1, 5), hora=time(9))
+        self.assertGreater(nueva.id, ultima.id)
+
+    def test_comando_no_sobrescribe_base_con_datos(self):
+        GeneradorDatos(semilla=1).generar(pacientes=5, citas=10, insumos=2)
+        with self.assertRaises(CommandError):
+            call_command('seed_scale', citas=10, stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('seed_scale', pacientes=5, citas=10, insumos=2, anexar=True,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(Cita.objects.count(), 20)
+
+
+@skipUnless(os.environ.get('PODOCLINIC_BENCHMARK'), 'Benchmarks desactivados (PODOCLINIC_BENCHMARK=1 para ejecutarlos)')
+class BenchmarkEndpointsTest(TestCase):
+    """
+    Casos de benchmark sobre un volumen moderado. Para volúmenes reales y
+    resultados comparables entre commits usar `manage.py benchmark`.
+    """
+
+    P95_MAXIMO_MS = float(os.environ.get('PODOCLINIC_BENCHMARK_P95_MS', 250))
+
+    @classmethod
+    def setUpTestData(cls):
+        GeneradorDatos(semilla=42).generar(pacientes=1000, citas=10000, insumos=100, movimientos=20000)
+        cls.usuario = Usuario.objects.create_user(username='benchmark', password='clave-segura-123')
+
+    @classmethod
+    def setUpClass(cls):
+        # Fuera de setUpTestData, que entrega una copia a cada prueba
+        cls.resultados = {}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        # Un solo registro con todas las mediciones de la clase
+        logger.info(f"Benchmark de endpoints: {json.dumps(cls.resultados, sort_keys=True)}")
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _medir(self, nombre, url, **params):
+        def peticion(i):
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        resultado = medir(peticion, repeticiones=20)
+        self.resultados[nombre] = resultado
+        self.assertLess(resultado['p95_ms'], self.P95_MAXIMO_MS, json.dumps({nombre: resultado}))
+
+    def test_citas_disponibles(self):
+        fecha = Cita.objects.values_list('fecha', flat=True).first()
+        self._medir('citas_disponibles', '/api/citas/disponibles/', fecha=fecha.isoformat())
+
+    def test_fichas_paciente(self):
+        paciente_id = FichaClinica.objects.values_list('paciente_id', flat=True).first()
+        self._medir('fichas_paciente', '/api/pacientes/fichas/', paciente=paciente_id)
+
+    def test_stock_critico(self):
+        self._medir('stock_critico', '/api/insumos/stock_critico/')
+
+
+class CitasPlanConsultaTest(PlanConsultaMixin, TestCase):
+    """Las consultas de agenda y recordatorios deben usar índices con datos a escala."""
+
+    @classmethod
+    def setUpTestData(cls):
+        GeneradorDatos(semilla=11).generar(
+            pacientes=500, citas=8000, insumos=5, proporcion_fichas=0
+        )
+
+    def setUp(self):
+        self.analizar_tablas(Cita)
+
+    def test_disponibilidad_por_fecha_y_tipo(self):
+        fecha = Cita.objects.values_list('fecha', flat=True).first()
+        self.assertUsaIndice(Cita.objects.filter(fecha=fecha, tipo_cita='podologia'))
+
+    def test_recordatorios_pendientes(self):
+        manana = date.today() + timedelta(days=1)
+        self.assertUsaIndice(
+            Cita.objects.filter(
+                fecha=manana, recordatorio_enviado=False, estado__in=['reservada', 'confirmada']
+            ).values_list('id', 'paciente_id')
+        )
+
+
+class CambiosCitasTest(PresupuestoConsultasMixin, TestCase):
+    """El feed de cambios debe devolver solo lo modificado desde el cursor."""
+
+    URL = '/api/citas/citas/cambios/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='agenda', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        self.secuencia = count()
+        self.hace_una_hora = timezone.now() - timedelta(hours=1)
+
+    def _sembrar_historial(self, cantidad):
+        """Crea citas antiguas (fuera de cualquier cursor reciente)."""
+        citas = []
+        for _ in range(cantidad):
+            i = next(self.secuencia)
+            paciente = Paciente.objects.create(
+                rut=f'{20000000 + i}-0', nombre=f'Paciente {i}', telefono='912345678', correo=f'h{i}@example.com'
+            )
+            citas.append(Cita(paciente=paciente, tratamiento=self.tratamiento,
+                              fecha=date(2030, 1, 1) + timedelta(days=i), hora=time(9)))
+        Cita.objects.bulk_create(citas)
+        Cita.objects.update(ultima_actualizacion=self.hace_una_hora)
+        Paciente.objects.update(ultima_actualizacion=self.hace_una_hora)
+
+    def _cambios(self, cursor=None):
+        response = self.client.get(self.URL, {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_sin_cursor_devuelve_todo(self):
+        self._sembrar_historial(5)
+        datos = self._cambios()
+        self.assertTrue(datos['completo'])
+        self.assertEqual(len(datos['cambios']), 5)
+        self.assertEqual(datos['eliminados'], [])
+
+    def test_solo_cambios_desde_el_cursor(self):
+        self._sembrar_historial(5)
+        cursor = (timezone.now() - timedelta(minutes=1)).isoformat()
+
+        datos = self._cambios(cursor)
+        self.assertFalse(datos['completo'])
+        self.assertEqual(datos['cambios'], [])
+
+        modificada, eliminada, del_paciente = Cita.objects.order_by('id')[:3]
+        modificada.estado = 'confirmada'
+        modificada.save()
+        eliminada_id = eliminada.id
+        eliminada.delete()
+        del_paciente.paciente.nombre = 'Nombre corregido'
+        del_paciente.paciente.save()
+
+        datos = self._cambios(cursor)
+        self.assertEqual({c['id'] for c in datos['cambios']}, {modificada.id, del_paciente.id})
+        self.assertEqual(datos['eliminados'], [eliminada_id])
+        self.assertIn('Nombre corregido', [c['paciente_nombre'] for c in datos['cambios']])
+
+    def test_cursor_devuelto_incluye_margen(self):
+        datos = self._cambios()
+        cursor = datetime.fromisoformat(datos['cursor'])
+        self.assertLess(cursor, timezone.now())
+        # Una cita guardada justo antes de la consulta siguiente sigue apareciendo
+        self._sembrar_historial(1)
+        Cita.objects.update(ultima_actualizacion=timezone.now())
+        self.assertEqual(len(self._cambios(datos['cursor'])['cambios']), 1)
+
+    def test_cursor_invalido_o_vencido(self):
+        self.assertEqual(self.client.get(self.URL, {'cursor': 'ayer'}).status_code, 400)
+        antiguo = (timezone.now() - timedelta(days=60)).isoformat()
+        self.assertTrue(self._cambios(antiguo)['completo'])
+
+    def test_consultas_no_dependen_del_historial(self):
+        cursor = (timezone.now() - timedelta(minutes=1)).isoformat()
+        self.assertConsultasConstantes(self._sembrar_historial, self.URL, data={'cursor': cursor})
+
+
+class PubSubFalso:
+    """Suscripción de Redis de prueba: entrega los mensajes dados y luego corta la conexión."""
+
+    def __init__(self, mensajes):
+        self.mensajes = list(mensajes)
+        self.canales = []
+        self.cerrado = False
+
+    async def subscribe(self, canal):
+        self.canales.append(canal)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if not self.mensajes:
+            raise redis.ConnectionError('fin de la prueba')
+        return self.mensajes.pop(0)
+
+    async def aclose(self):
+        self.cerrado = True
+
+
+class EventosAgendaTest(TestCase):
+    """Las citas publican sus cambios y el flujo SSE los reparte por ventana de fechas."""
+
+    def setUp(self):
+        self.paciente = Paciente.objects.create(
+            rut='12.345.678-5', nombre='Paciente', telefono='912345678', correo='p@example.com'
+        )
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        self.usuario = Usuario.objects.create_user(username='recepcion', password='clave-segura-123')
+        self.jwt = str(RefreshToken.for_user(self.usuario).access_token)
+        self.token = signing.dumps({'usuario': self.usuario.pk}, salt=eventos.SAL_TOKEN_FLUJO)
+
+    def _cita(self, **datos):
+        cita = Cita(paciente=self.paciente, tratamiento=self.tratamiento, fecha=date(2030, 1, 7), hora=time(9), **datos)
+        Cita.objects.bulk_create([cita])
+        return Cita.objects.get(pk=cita.pk)
+
+    def test_publica_creacion_actualizacion_y_eliminacion_despues_del_commit(self):
+        with mock.patch('citas.eventos.publicar_evento') as publicar, \
+                mock.patch.object(eventos.publicador, 'hay_suscriptores', return_value=True), \
+                mock.patch('citas.signals.threading.Thread'):
+            with self.captureOnCommitCallbacks(execute=True):
+                cita = Cita.objects.create(
+                    paciente=self.paciente, tratamiento=self.tratamiento, fecha=date(2030, 1, 7), hora=time(9)
+                )
+            creada = publicar.call_args.args[0]
+            self.assertEqual((creada['accion'], creada['id']), ('creada', cita.id))
+            self.assertEqual(creada['cita']['paciente_nombre'], 'Paciente')
+
+            cita = Cita.objects.get(pk=cita.pk)
+            cita.fecha = date(2030, 1, 8)
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.save()
+            actualizada = publicar.call_args.args[0]
+            self.assertEqual(actualizada['accion'], 'actualizada')
+            self.assertEqual((actualizada['fecha'], actualizada['fecha_anterior']), (date(2030, 1, 8), date(2030, 1, 7)))
+            # La misma instancia movida otra vez informa la fecha guardada en el paso anterior
+            cita.fecha = date(2030, 1, 9)
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.save()
+            actualizada = publicar.call_args.args[0]
+            self.assertEqual((actualizada['fecha'], actualizada['fecha_anterior']), (date(2030, 1, 9), date(2030, 1, 8)))
+
+            cita_id = cita.id
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.delete()
+            self.assertEqual(publicar.call_args.args[0]['accion'], 'eliminada')
+            self.assertEqual(publicar.call_args.args[0]['id'], cita_id)
+
+            # Si la transacción se revierte no se publica nada
+            publicar.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                with transaction.atomic():
+                    self._cita().save()
+                    transaction.set_rollback(True)
+            self.assertEqual(callbacks, [])
+            publicar.assert_not_called()
+
+    def test_sin_suscriptores_no_serializa_ni_publica(self):
+        with mock.patch('citas.eventos.publicar_evento') as publicar, \
+                mock.patch.object(eventos.publicador, 'hay_suscriptores', return_value=False), \
+                mock.patch('citas.serializers.CitaSerializer') as serializador, \
+                mock.patch('citas.signals.threading.Thread'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Cita.objects.create(
+                    paciente=self.paciente, tratamiento=self.tratamiento, fecha=date(2030, 1, 7), hora=time(9)
+                )
+        publicar.assert_not_called()
+        serializador.assert_not_called()
+
+    def test_evento_en_ventana(self):
+        evento = {'fecha': '2030-01-10', 'fecha_anterior': '2030-01-02'}
+        self.assertTrue(evento_en_ventana(evento, date(2030, 1, 1), date(2030, 1, 5)))
+        self.assertTrue(evento_en_ventana(evento, date(2030, 1, 9), None))
+        self.assertFalse(evento_en_ventana(evento, date(2030, 1, 3), date(2030, 1, 9)))
+        self.assertTrue(evento_en_ventana({'fecha': '2030-01-10', 'fecha_anterior': None}, None, None))
+
+    def test_token_de_conexion(self):
+        self.assertEqual(self.client.post('/api/citas/eventos/token/').status_code, 401)
+        response = self.client.post('/api/citas/eventos/token/', HTTP_AUTHORIZATION=f'Bearer {self.jwt}')
+        self.assertEqual(response.status_code, 200)
+
+        fabrica = RequestFactory()
+        self.assertEqual(eventos._usuario_autenticado(fabrica.get('/', {'token': response.data['token']})), self.usuario)
+        self.assertEqual(eventos._usuario_autenticado(fabrica.get('/', HTTP_AUTHORIZATION=f'Bearer {self.jwt}')),
+                         self.usuario)
+        # El JWT de la sesión no se acepta en la URL, ni un token de conexión vencido
+        self.assertIsNone(eventos._usuario_autenticado(fabrica.get('/', {'token': self.jwt})))
+        with mock.patch('django.core.signing.time.time', return_value=time_module.time() + 120):
+            self.assertIsNone(eventos._usuario_autenticado(fabrica.get('/', {'token': response.data['token']})))
+
+    def test_bajo_wsgi_responde_503(self):
+        self.assertEqual(self.client.get('/api/citas/eventos/').status_code, 503)
+
+    async def test_flujo_filtra_por_ventana(self):
+        self.assertEqual((await self.async_client.get('/api/citas/eventos/')).status_code, 401)
+
+        pubsub = PubSubFalso([
+            None,
+            {'data': json.dumps({'accion': 'creada', 'id': 1, 'fecha': '2030-01-07', 'fecha_anterior': None})},
+            {'data': json.dumps({'accion': 'eliminada', 'id': 2, 'fecha': '2030-03-01', 'fecha_anterior': None})},
+        ])
+        cliente = mock.Mock(pubsub=mock.Mock(return_value=pubsub), aclose=mock.AsyncMock())
+        with mock.patch('citas.eventos.redis_asyncio.Redis.from_url', return_value=cliente):
+            response = await self.async_client.get(
+                '/api/citas/eventos/', {'desde': '2030-01-01', 'hasta': '2030-01-31', 'token': self.token}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            contenido = ''.join([parte.decode() async for parte in response.streaming_content])
+
+        self.assertIn('event: conectado', contenido)
+        self.assertIn(': latido', contenido)
+        self.assertIn('event: creada', contenido)
+        self.assertNotIn('event: eliminada', contenido)
+        self.assertTrue(contenido.endswith('retry: 30000\n\n'))
+        self.assertTrue(pubsub.cerrado)
+
+
+class BusInvalidacionTest(TestCase):
+    """Las cachés locales se llenan tras el commit y se invalidan con los cambios de los modelos."""
+
+    def setUp(self):
+        self.cache = CacheLocal('prueba', ['citas.cita', 'citas.tratamiento'])
+        self.addCleanup(invalidacion._caches.remove, self.cache)
+        parche = mock.patch.object(invalidacion.escucha, 'iniciar', return_value=True)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _llenar(self, clave, valor):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.cache.obtener(clave, lambda: valor)
+
+    def test_solo_guarda_lo_confirmado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.cache.obtener('a', lambda: 1)
+                transaction.set_rollback(True)
+        self.assertEqual(len(self.cache), 0)
+
+        self._llenar('a', 1)
+        self.assertEqual(self.cache.obtener('a', lambda: 2), 1)
+
+    def test_sin_escucha_conectada_no_guarda(self):
+        with mock.patch.object(invalidacion.escucha, 'iniciar', return_value=False):
+            self._llenar('a', 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_mensajes_invalidan_por_clave_o_prefijo(self):
+        self._llenar((date(2030, 1, 7), 'podologia'), 'lunes')
+        self._llenar((date(2030, 1, 8), 'podologia'), 'martes')
+        procesar_mensaje('citas.cita|2030-01-07')
+        self.assertEqual(len(self.cache), 1)
+        procesar_mensaje('insumos.insumo|*')
+        self.assertEqual(len(self.cache), 1)
+        procesar_mensaje('citas.tratamiento|*')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_cambios_de_modelos_publican_despues_del_commit(self):
+        tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='p@example.com')
+        Cita.objects.bulk_create([Cita(paciente=paciente, tratamiento=tratamiento, fecha=date(2030, 1, 7), hora=time(9))])
+        cita = Cita.objects.get()
+        self._llenar((date(2030, 1, 7), 'podologia'), 'ocupado')
+        self._llenar('general', tratamiento)
+
+        with mock.patch('podoclinic.invalidacion._publicar') as publicar:
+            with self.captureOnCommitCallbacks(execute=True):
+                cita.fecha = date(2030, 1, 9)
+                cita.save()
+                # Antes del commit la caché sigue intacta
+                self.assertEqual(len(self.cache), 2)
+            mensajes = {llamada.args[0] for llamada in publicar.call_args_list}
+            self.assertTrue({'citas.cita|2030-01-07', 'citas.cita|2030-01-09'} <= mensajes)
+            self.assertEqual(len(self.cache), 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                tratamiento.precio = 12000
+                tratamiento.save()
+            publicar.assert_called_with('citas.tratamiento|*')
+            self.assertEqual(len(self.cache), 0)
+
+    def test_buscar_tratamiento_usa_cache(self):
+        Tratamiento.objects.create(nombre='hongos', precio=10000)
+        with self.captureOnCommitCallbacks(execute=True):
+            buscar_tratamiento('hongos')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(buscar_tratamiento('hongos').nombre, 'hongos')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class ClienteRedisFalso:
+    """Cliente de Redis que falla mientras `caido` sea verdadero."""
+
+    def __init__(self):
+        self.caido = True
+        self.publicados = []
+        self.intentos = 0
+
+    def publish(self, canal, mensaje):
+        self.intentos += 1
+        if self.caido:
+            raise redis.ConnectionError('sin conexión')
+        self.publicados.append((canal, mensaje))
+
+    def pubsub_numsub(self, canal):
+        self.intentos += 1
+        if self.caido:
+            raise redis.ConnectionError('sin conexión')
+        return [(canal.encode(), 0)]
+
+
+class PublicadorRedisTest(TestCase):
+    """La publicación en Redis no bloquea y deja de intentar mientras Redis está caído."""
+
+    def setUp(self):
+        self.cliente = ClienteRedisFalso()
+        parche = mock.patch('podoclinic.publicacion.redis.Redis.from_url', return_value=self.cliente)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.reloj = 1000.0
+        parche = mock.patch('podoclinic.publicacion.time.monotonic', side_effect=lambda: self.reloj)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.publicador = PublicadorRedis('prueba', lambda: 'redis://localhost:6379/0')
+
+    def test_interruptor_tras_fallo(self):
+        with self.assertLogs('podoclinic.publicacion', 'WARNING') as registros:
+            self.assertTrue(self.publicador.publicar('canal', 'a'))
+            self.publicador.esperar()
+            # Con el interruptor abierto se descarta sin intentar conectar
+            for mensaje in 'bcd':
+                self.assertFalse(self.publicador.publicar('canal', mensaje))
+            self.publicador.esperar()
+        self.assertEqual((self.cliente.intentos, self.publicador.descartados, len(registros.output)), (1, 3, 1))
+
+        # Pasada la espera se reintenta; un nuevo fallo duplica la espera
+        self.reloj += PublicadorRedis.ESPERA_INICIAL
+        with self.assertLogs('podoclinic.publicacion', 'WARNING'):
+            self.publicador.publicar('canal', 'e')
+            self.publicador.esperar()
+        self.reloj += PublicadorRedis.ESPERA_INICIAL
+        self.assertFalse(self.publicador.disponible())
+        self.reloj += PublicadorRedis.ESPERA_INICIAL
+
+        self.cliente.caido = False
+        self.publicador.publicar('canal', 'f')
+        self.publicador.esperar()
+        self.assertEqual(self.cliente.publicados, [('canal', 'f')])
+
+    def test_suscriptores(self):
+        self.cliente.caido = False
+        # Mientras no se conoce el conteo se supone que hay suscriptores
+        self.assertTrue(self.publicador.hay_suscriptores('canal'))
+        self.publicador.esperar()
+        self.assertFalse(self.publicador.hay_suscriptores('canal'))
+        self.assertEqual(self.cliente.intentos, 1)
+        self.reloj += PublicadorRedis.VIGENCIA_SUSCRIPTORES + 1
+        self.publicador.hay_suscriptores('canal')
+        self.publicador.esperar()
+        self.assertEqual(self.cliente.intentos, 2)
+
+
+class BusInvalidacionIntegracionTest(TransactionTestCase):
+    """Invalidación real entre conexiones, contra PostgreSQL (LISTEN/NOTIFY) o Redis."""
+
+    def _probar_bus(self):
+        cache = CacheLocal('integracion', ['citas.tratamiento'])
+        self.addCleanup(invalidacion._caches.remove, cache)
+        self.addCleanup(invalidacion.escucha.detener)
+        invalidacion.escucha.iniciar()
+        self.assertTrue(invalidacion.escucha.conectado.wait(10), 'La escucha no se conectó')
+
+        cache.obtener('general', lambda: 'valor')
+        self.assertEqual(len(cache), 1)
+        # Otro proceso publica el cambio: aquí solo se envía el mensaje, sin invalidar localmente
+        invalidacion._publicar('citas.tratamiento|*')
+        limite = time_module.monotonic() + 10
+        while len(cache) and time_module.monotonic() < limite:
+            time_module.sleep(0.05)
+        self.assertEqual(len(cache), 0)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_postgresql_listen_notify(self):
+        with self.settings(INVALIDACION_BACKEND='postgresql'):
+            self._probar_bus()
+
+    def test_redis_pubsub(self):
+        try:
+            redis.Redis.from_url(invalidacion._url_redis(), socket_connect_timeout=1).ping()
+        except redis.RedisError:
+            self.skipTest('Requiere un servidor Redis')
+        with self.settings(INVALIDACION_BACKEND='redis'):
+            self._probar_bus()
+
+
+class OcupacionDiariaTest(TestCase):
+    """El resumen de ocupación debe coincidir siempre con una reconstrucción desde las citas."""
+
+    URL = '/api/citas/citas/ocupacion/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='ocupacion', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        # Sin correo: la señal de confirmación no envía nada
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+
+    def _resumen(self):
+        return sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos'))
+
+    def assertConsistente(self):
+        incremental = self._resumen()
+        reconstruir_ocupacion()
+        self.assertEqual(incremental, self._resumen())
+        return incremental
+
+    def _cita(self, fecha, hora, **campos):
+        return Cita.objects.create(paciente=self.paciente, tratamiento=self.tratamiento,
+                                   fecha=fecha, hora=hora, **campos)
+
+    def test_cambios_de_citas_actualizan_el_resumen(self):
+        lunes, martes = date(2030, 1, 7), date(2030, 1, 8)
+        cita = self._cita(lunes, time(9))
+        # Valores como strings, igual que los envían las vistas
+        self._cita('2030-01-07', '10:00', duracion_cita='120')
+        self._cita(lunes, time(9), tipo_cita='manicura')
+        self.assertEqual(self.assertConsistente(), [
+            (lunes, 'manicura', 1, 60), (lunes, 'podologia', 2, 180),
+        ])
+
+        cita = Cita.objects.get(pk=cita.pk)
+        cita.fecha = martes
+        cita.duracion_cita = 120
+        cita.save()
+        self.assertEqual(self.assertConsistente(), [
+            (lunes, 'manicura', 1, 60), (lunes, 'podologia', 1, 120), (martes, 'podologia', 1, 120),
+        ])
+
+        cita.estado = 'cancelada'
+        cita.save()
+        self.assertNotIn(martes, [fila[0] for fila in self.assertConsistente()])
+        cita.estado = 'confirmada'
+        cita.save()
+        cita.delete()
+        self.assertNotIn(martes, [fila[0] for fila in self.assertConsistente()])
+
+        # Al eliminar el paciente se borran sus citas en cascada
+        self.paciente.delete()
+        self.assertEqual(self.assertConsistente(), [])
+
+    def test_instancia_sin_estado_guardado_recalcula_el_dia(self):
+        cita = self._cita(date(2030, 1, 7), time(9))
+        Cita(id=cita.id, paciente=self.paciente, tratamiento=self.tratamiento, fecha=date(2030, 1, 7),
+             hora=time(9), duracion_cita=120, fecha_creacion=cita.fecha_creacion).save()
+        self.assertEqual(self.assertConsistente(), [(date(2030, 1, 7), 'podologia', 1, 120)])
+
+    def test_transaccion_revertida_no_cambia_el_resumen(self):
+        self._cita(date(2030, 1, 7), time(9))
+        antes = self._resumen()
+        with transaction.atomic():
+            self._cita(date(2030, 1, 7), time(10))
+            transaction.set_rollback(True)
+        self.assertEqual(self._resumen(), antes)
+
+    def test_mapa_del_mes_sin_leer_citas(self):
+        self._cita(date(2030, 1, 31), time(9), duracion_cita=120)
+        self._cita(date(2030, 2, 1), time(9))
+        Recurso.objects.create(nombre='Podóloga 2', tipo_cita='podologia')
+        # Capacidad por recurso activo y el rango del resumen
+        with self.assertNumQueries(2):
+            response = self.client.get(self.URL, {'anio': 2030, 'mes': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['hasta'], date(2030, 1, 31))
+        self.assertEqual(response.data['capacidad_minutos'], {
+            'podologia': 2 * CAPACIDAD_MINUTOS_DIA, 'manicura': CAPACIDAD_MINUTOS_DIA,
+        })
+        self.assertEqual(response.data['dias'], [{
+            'fecha': date(2030, 1, 31), 'tipo_cita': 'podologia', 'citas': 1, 'minutos': 120,
+            'porcentaje': round(100 * 120 / (2 * CAPACIDAD_MINUTOS_DIA), 1),
+        }])
+
+        response = self.client.get(self.URL, {'anio': 2030, 'mes': 12})
+        self.assertEqual(response.data['hasta'], date(2030, 12, 31))
+        self.assertEqual(len(self.client.get(self.URL, {'anio': 2030}).data['dias']), 2)
+        self.assertEqual(len(self.client.get(self.URL, {'anio': 2030, 'tipo_cita': 'manicura'}).data['dias']), 0)
+        self.assertEqual(self.client.get(self.URL, {'anio': 2030, 'mes': 13}).status_code, 400)
+
+    def test_comando_reconstruye_tras_carga_masiva(self):
+        GeneradorDatos(semilla=5).generar(pacientes=20, citas=200, insumos=2)
+        self.assertTrue(self.assertConsistente())
+        Cita.objects.filter(estado='completada').update(estado='cancelada')
+        call_command('reconstruir_ocupacion', stdout=io.StringIO())
+        esperado = self._resumen()
+        self.assertEqual(
+            sum(fila[2] for fila in esperado),
+            Cita.objects.exclude(estado='cancelada').count(),
+        )
+        with self.assertRaises(CommandError):
+            call_command('reconstruir_ocupacion', desde='07-01-2030', stdout=io.StringIO())
+
+
+class AgendaRecursosTest(TestCase):
+    """La disponibilidad considera todos los recursos activos de un tipo de cita."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='recursos', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+        # La migración crea un box por tipo de cita; se agrega una segunda profesional
+        self.box = Recurso.objects.get(tipo_cita='podologia')
+        self.profesional = Recurso.objects.create(nombre='Podóloga 2', tipo_cita='podologia', orden=1)
+        self.fecha = date(2030, 1, 7)
+
+    def _cita(self, hora, **campos):
+        return Cita.objects.create(paciente=self.paciente, tratamiento=self.tratamiento,
+                                   fecha=self.fecha, hora=hora, **campos)
+
+    def test_intervalos_con_duracion_y_cruces(self):
+        agenda = Agenda([1, 2], [
+            (1, self.fecha, time(9), 120), (1, self.fecha, time(10), 60),  # cruce en datos antiguos
+            (2, self.fecha, time(8), 60), (None, self.fecha, time(14), 60), (3, self.fecha, time(15), 60),
+        ])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(8)), [1])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(10)), [2])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(10), 120), [2])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(11)), [1, 2])
+        # Sin recurso: cuenta en el primero; recurso inactivo (3): no afecta
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(14)), [2])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(15)), [1, 2])
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(13), 120), [2])
+
+        agenda.reservar(2, self.fecha, time(11), 120)
+        self.assertEqual(agenda.recursos_libres(self.fecha, time(12)), [1])
+
+    def test_primer_horario_libre_en_una_pasada(self):
+        manana = self.fecha + timedelta(days=1)
+        dias = [(1, self.fecha, time(hora), 60) for hora in range(8, 23)]
+        dias += [(2, self.fecha, time(hora), 60) for hora in range(8, 23)]
+        dias += [(1, manana, time(8), 120), (2, manana, time(8), 60)]
+        agenda = Agenda([1, 2], dias)
+        self.assertEqual(agenda.primer_horario_libre(self.fecha, manana), (manana, time(9), 2))
+        self.assertEqual(agenda.primer_horario_libre(self.fecha, manana, duracion=120), (manana, time(9), 2))
+        self.assertIsNone(agenda.primer_horario_libre(self.fecha, self.fecha))
+
+    def test_carga_en_dos_consultas_para_cualquier_rango(self):
+        Cita.objects.bulk_create([
+            Cita(paciente=self.paciente, tratamiento=self.tratamiento, recurso=self.box,
+                 fecha=self.fecha + timedelta(days=dia), hora=time(9))
+            for dia in range(30)
+        ])
+        with self.assertNumQueries(2):
+            agenda = cargar_agenda('podologia', self.fecha, self.fecha + timedelta(days=29))
+        self.assertEqual(agenda.recursos_libres(self.fecha + timedelta(days=10), time(9)), [self.profesional.id])
+
+    def test_reservas_se_reparten_entre_recursos(self):
+        primera = self._cita(time(9))
+        segunda = self._cita('09:00')
+        self.assertEqual((primera.recurso, segunda.recurso), (self.box, self.profesional))
+        with self.assertRaises(ValidationError):
+            self._cita(time(9))
+        # Una cita de 2 horas a las 8 choca con las de las 9 en ambos recursos
+        with self.assertRaises(ValidationError):
+            self._cita(time(8), duracion_cita=120)
+
+        response = self.client.get('/api/citas/disponibles/', {'fecha': self.fecha.isoformat()})
+        self.assertNotIn('09:00', response.data['horas_disponibles'])
+        self.assertIn('10:00', response.data['horas_disponibles'])
+
+        # Con un recurso libre, la agenda sigue ofreciendo el horario
+        segunda.delete()
+        response = self.client.get('/api/citas/citas/disponibles/', {'fecha': self.fecha.isoformat()})
+        self.assertIn('09:00', response.data['horas_disponibles'])
+
+    def test_mover_cita_conserva_o_cambia_de_recurso(self):
+        cita = self._cita(time(9))
+        self._cita(time(11))
+        self.assertEqual(cita.recurso, self.box)
+
+        response = self.client.put(f'/api/citas/actualizar/{cita.id}/',
+                                   {'fecha': self.fecha.isoformat(), 'hora': '10:00'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['recurso'], self.box.id)
+
+        self._cita(time(11))
+        response = self.client.put(f'/api/citas/actualizar/{cita.id}/',
+                                   {'fecha': self.fecha.isoformat(), 'hora': '11:00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # Un recurso pedido explícitamente se respeta si está libre
+        response = self.client.put(f'/api/citas/actualizar/{cita.id}/',
+                                   {'hora': '10:00', 'recurso': self.profesional.id}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['recurso_nombre'], 'Podóloga 2')
+
+    def test_sin_recursos_se_mantiene_un_recurso_por_tipo(self):
+        self.assertEqual(self._cita(time(9), tipo_cita='manicura').recurso.tipo_cita, 'manicura')
+        Recurso.objects.filter(tipo_cita='manicura').update(activo=False)
+        otra = self._cita(time(10), tipo_cita='manicura')
+        self.assertIsNone(otra.recurso)
+        with self.assertRaises(ValidationError):
+            self._cita(time(10), tipo_cita='manicura')
+
+
+class ProximosLibresTest(TestCase):
+    """Búsqueda de los primeros horarios libres hacia adelante."""
+
+    URL = '/api/citas/citas/proximos_libres/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='recepcion', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+        self.box = Recurso.objects.get(tipo_cita='podologia')
+        self.desde = date(2030, 1, 7)
+
+    def _ocupar(self, fecha, horas, recurso=None):
+        Cita.objects.bulk_create([
+            Cita(paciente=self.paciente, tratamiento=self.tratamiento, recurso=recurso or self.box,
+                 fecha=fecha, hora=time(hora)) for hora in horas
+        ])
+
+    def _buscar(self, **params):
+        response = self.client.get(self.URL, {'desde': self.desde.isoformat(), **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(h['fecha'], h['hora']) for h in response.data['horarios']]
+
+    def test_primer_bloque_de_dos_horas(self):
+        # Día completo salvo huecos de una hora; al día siguiente, libre desde las 10
+        self._ocupar(self.desde, [8, 9, 11, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22])
+        self._ocupar(self.desde + timedelta(days=1), [8, 9])
+        self.assertEqual(self._buscar(duracion=60, limite=2), [(self.desde, '10:00'), (self.desde, '12:00')])
+        self.assertEqual(self._buscar(duracion=120, limite=2), [
+            (self.desde + timedelta(days=1), '10:00'), (self.desde + timedelta(days=1), '11:00'),
+        ])
+
+    def test_respeta_el_cierre_y_el_limite(self):
+        horarios = self._buscar(duracion=120, limite=50, dias=1)
+        self.assertEqual(horarios[-1], (self.desde, '21:00'))
+        self.assertEqual(len(horarios), 14)
+        self.assertEqual(len(self._buscar(limite=500, dias=30)), 50)
+
+    def test_otro_recurso_libre_cuenta(self):
+        profesional = Recurso.objects.create(nombre='Podóloga 2', tipo_cita='podologia')
+        self._ocupar(self.desde, range(8, 23))
+        response = self.client.get(self.URL, {'desde': self.desde.isoformat(), 'limite': 1})
+        self.assertEqual(response.data['horarios'], [{
+            'fecha': self.desde, 'hora': '08:00', 'recursos': [{'id': profesional.id, 'nombre': 'Podóloga 2'}],
+        }])
+
+    def test_horizonte_largo_en_consultas_constantes(self):
+        for dia in range(120):
+            self._ocupar(self.desde + timedelta(days=dia), range(8, 23))
+        with self.assertNumQueries(2):
+            horarios = self._buscar(dias=365, limite=3)
+        self.assertEqual(horarios[0], (self.desde + timedelta(days=120), '08:00'))
+
+    def test_no_ofrece_horarios_pasados(self):
+        ahora = timezone.localtime()
+        response = self.client.get(self.URL, {'desde': ahora.date().isoformat(), 'dias': 1, 'limite': 50})
+        for horario in response.data['horarios']:
+            self.assertGreaterEqual(horario['hora'], ahora.strftime('%H:%M'))
+
+    def test_parametros_invalidos(self):
+        for params in ({'desde': '07-01-2030'}, {'duracion': 90}, {'tipo_cita': 'otro'}, {'limite': 0}):
+            self.assertEqual(self.client.get(self.URL, params).status_code, 400)
+
+
+class SeriesCitasTest(TestCase):
+    """Series recurrentes: creación en bloque y edición de "esta y las siguientes"."""
+
+    URL = '/api/citas/series/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='series', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='hongos', precio=15000)
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+        self.box = Recurso.objects.get(tipo_cita='podologia')
+        self.inicio = date(2030, 1, 7)
+
+    def _crear(self, **datos):
+        datos = {'paciente': self.paciente.rut, 'tratamiento': self.tratamiento.id, 'hora': '10:00',
+                 'fecha_inicio': self.inicio.isoformat(), 'frecuencia': 'semanal', 'repeticiones': 6, **datos}
+        return self.client.post(self.URL, datos, format='json')
+
+    def _resumen_consistente(self):
+        incremental = sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos'))
+        reconstruir_ocupacion()
+        self.assertEqual(incremental, sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos')))
+
+    def test_reglas_y_excepciones(self):
+        serie = SerieCitas(fecha_inicio=date(2030, 1, 31), frecuencia='mensual', repeticiones=3)
+        self.assertEqual(fechas_serie(serie), [date(2030, 1, 31), date(2030, 2, 28), date(2030, 3, 31)])
+        serie = SerieCitas(fecha_inicio=self.inicio, frecuencia='quincenal', fecha_fin=date(2030, 2, 4),
+                           excepciones=['2030-01-21'])
+        self.assertEqual(fechas_serie(serie), [self.inicio, date(2030, 2, 4)])
+        with self.assertRaises(ValidationError):
+            fechas_serie(SerieCitas(fecha_inicio=self.inicio, frecuencia='semanal', fecha_fin=date(2040, 1, 1)))
+        self.assertEqual(len(fechas_serie(SerieCitas(
+            fecha_inicio=self.inicio, frecuencia='semanal', repeticiones=MAX_OCURRENCIAS))), MAX_OCURRENCIAS)
+
+    def test_creacion_en_consultas_constantes(self):
+        def crear(repeticiones, hora):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self._crear(repeticiones=repeticiones, hora=hora)
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertEqual(len(response.data['citas']), repeticiones)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(crear(4, '10:00'), crear(40, '12:00'))
+        self.assertEqual(Cita.objects.filter(serie__isnull=False, recurso=self.box).count(), 44)
+        self._resumen_consistente()
+
+    def test_conflictos(self):
+        Cita.objects.bulk_create([Cita(paciente=self.paciente, tratamiento=self.tratamiento, recurso=self.box,
+                                       fecha=self.inicio + timedelta(weeks=2), hora=time(9), duracion_cita=120)])
+        response = self._crear()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflictos'], [self.inicio + timedelta(weeks=2)])
+        self.assertFalse(SerieCitas.objects.exists())
+
+        response = self._crear(omitir_conflictos=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['citas']), 5)
+        self.assertEqual(response.data['serie']['excepciones'], ['2030-01-21'])
+
+        # Con otra profesional libre no hay conflicto
+        otra = Recurso.objects.create(nombre='Podóloga 2', tipo_cita='podologia')
+        response = self._crear(hora='09:00')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual([c['recurso'] for c in response.data['citas']].count(otra.id), 1)
+        self._resumen_consistente()
+
+    def test_modificar_esta_y_las_siguientes(self):
+        serie_id = self._crear().data['serie']['id']
+        desde = self.inicio + timedelta(weeks=2)
+        url = f'{self.URL}{serie_id}/modificar_siguientes/'
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'desde': desde.isoformat(), 'hora': '15:00', 'duracion_cita': 120},
+                                        format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['modificadas'], 4)
+        actualizaciones = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "citas_cita"')]
+        self.assertEqual(len(actualizaciones), 1)
+
+        # La serie se dividió: las dos primeras citas siguen en la original
+        original = SerieCitas.objects.get(pk=serie_id)
+        nueva = SerieCitas.objects.get(pk=response.data['serie']['id'])
+        self.assertEqual((original.repeticiones, nueva.repeticiones, nueva.fecha_inicio), (2, 4, desde))
+        self.assertEqual(set(original.citas.values_list('hora', flat=True)), {time(10)})
+        self.assertEqual(set(nueva.citas.values_list('hora', 'duracion_cita', 'duracion_extendida')),
+                         {(time(15), 120, True)})
+        self.assertTrue(nueva.citas.filter(ultima_actualizacion__gte=timezone.now() - timedelta(minutes=1)).exists())
+        self._resumen_consistente()
+
+        # Conflicto con otra cita: no se modifica nada
+        Cita.objects.bulk_create([Cita(paciente=self.paciente, tratamiento=self.tratamiento, recurso=self.box,
+                                       fecha=desde + timedelta(weeks=3), hora=time(18))])
+        response = self.client.post(f'{self.URL}{nueva.id}/modificar_siguientes/',
+                                    {'desde': desde.isoformat(), 'hora': '17:00'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(set(nueva.citas.values_list('hora', flat=True)), {time(15)})
+
+        # Cancelar las restantes libera su ocupación
+        response = self.client.post(f'{self.URL}{nueva.id}/modificar_siguientes/',
+                                    {'desde': desde.isoformat(), 'estado': 'cancelada'}, format='json')
+        self.assertEqual(response.data['modificadas'], 4)
+        self.assertFalse(OcupacionDiaria.objects.filter(fecha__gte=desde, fecha__lt=desde + timedelta(weeks=3)).exists())
+        self._resumen_consistente()
+
+    def test_estado_de_creacion_validado(self):
+        response = self._crear(estado='inventado')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('estado', response.data)
+        self.assertFalse(SerieCitas.objects.exists())
+
+        response = self._crear(estado='confirmada', repeticiones=2)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual({cita['estado'] for cita in response.data['citas']}, {'confirmada'})
+
+    def test_estado_activo_no_reactiva_canceladas(self):
+        serie_id = self._crear(repeticiones=3).data['serie']['id']
+        # Una cita cancelada sola y su horario tomado por otra cita
+        cancelada = Cita.objects.get(serie_id=serie_id, fecha=self.inicio + timedelta(weeks=1))
+        cancelada.estado = 'cancelada'
+        cancelada.save()
+        Cita.objects.create(paciente=self.paciente, tratamiento=self.tratamiento, recurso=self.box,
+                            fecha=cancelada.fecha, hora=time(10))
+
+        response = self.client.post(f'{self.URL}{serie_id}/modificar_siguientes/',
+                                    {'desde': self.inicio.isoformat(), 'estado': 'confirmada'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['modificadas'], 3)
+        self.assertEqual(dict(Cita.objects.filter(serie_id=serie_id).values_list('fecha', 'estado')), {
+            self.inicio: 'confirmada',
+            self.inicio + timedelta(weeks=1): 'cancelada',
+            self.inicio + timedelta(weeks=2): 'confirmada',
+        })
+        self._resumen_consistente()
+
+
+class OperacionesMasivasTest(TestCase):
+    """Cancelar, confirmar y reprogramar grupos de citas con una lectura y un bulk_update."""
+
+    URL = '/api/citas/citas/masivo/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='masivo', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='hongos', precio=15000)
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+        self.box = Recurso.objects.get(tipo_cita='podologia')
+        self.dia = date(2030, 3, 11)
+
+    def _citas(self, fecha, horas, **datos):
+        citas = Cita.objects.bulk_create([
+            Cita(paciente=self.paciente, tratamiento=self.tratamiento, recurso=self.box,
+                 fecha=fecha, hora=time(hora), **datos)
+            for hora in horas
+        ])
+        reconstruir_ocupacion()
+        return citas
+
+    def _resumen_consistente(self):
+        incremental = sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos'))
+        reconstruir_ocupacion()
+        self.assertEqual(incremental, sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos')))
+
+    def test_cancelar_dia_en_consultas_constantes(self):
+        self._citas(self.dia, range(9, 12))
+        self._citas(self.dia + timedelta(days=1), range(9, 21))
+        completada = self._citas(self.dia, [15], estado='completada')[0]
+        self._citas(self.dia + timedelta(days=1), [21], estado='completada')
+
+        consultas = []
+        for fecha, total in ((self.dia, 3), (self.dia + timedelta(days=1), 12)):
+            with mock.patch('citas.tasks.enviar_avisos_citas.delay') as delay, \
+                    self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.URL, {'accion': 'cancelar', 'filtro': {'fecha': fecha.isoformat()}},
+                                            format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(response.data['modificadas'], total)
+            # Un solo aviso encolado para todo el lote
+            delay.assert_called_once()
+            self.assertEqual(sorted(delay.call_args.args[0]), sorted(c['id'] for c in response.data['citas']))
+            consultas.append(len(ctx.captured_queries))
+
+        self.assertEqual(consultas[0], consultas[1])
+        self.assertEqual(Cita.objects.filter(estado='cancelada').count(), 15)
+        # Las citas completadas no se cancelan
+        completada.refresh_from_db()
+        self.assertEqual(completada.estado, 'completada')
+        self._resumen_consistente()
+
+    def test_confirmar_por_ids(self):
+        citas = self._citas(self.dia, [9, 10])
+        antes = timezone.now()
+        response = self.client.post(self.URL, {'accion': 'confirmar', 'ids': [citas[0].id], 'notificar': False},
+                                    format='json')
+        self.assertEqual(response.data['modificadas'], 1)
+        confirmada = Cita.objects.get(pk=citas[0].id)
+        self.assertEqual(confirmada.estado, 'confirmada')
+        self.assertGreaterEqual(confirmada.ultima_actualizacion, antes)
+        self.assertEqual(Cita.objects.get(pk=citas[1].id).estado, 'reservada')
+
+        response = self.client.post(self.URL, {'accion': 'confirmar'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_reprogramar_con_conflictos(self):
+        citas = self._citas(self.dia, [9, 10, 11])
+        self._citas(self.dia + timedelta(days=1), [10])
+        datos = {'accion': 'reprogramar', 'filtro': {'fecha': self.dia.isoformat()}, 'desplazar_dias': 1,
+                 'notificar': False}
+
+        response = self.client.post(self.URL, datos, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([c['id'] for c in response.data['conflictos']], [citas[1].id])
+        self.assertEqual(Cita.objects.filter(fecha=self.dia).count(), 3)
+
+        response = self.client.post(self.URL, dict(datos, omitir_conflictos=True), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['modificadas'], 2)
+        self.assertEqual(list(Cita.objects.filter(fecha=self.dia).values_list('id', flat=True)), [citas[1].id])
+        self.assertEqual(Cita.objects.filter(fecha=self.dia + timedelta(days=1)).count(), 3)
+        self._resumen_consistente()
+
+    def test_reprogramar_lote_a_la_misma_hora(self):
+        citas = self._citas(self.dia, [9, 10])
+        datos = {'accion': 'reprogramar', 'ids': [c.id for c in citas], 'fecha': '2030-03-12', 'hora': '15:00',
+                 'notificar': False}
+
+        # Con un solo box, las citas del lote chocan entre sí
+        response = self.client.post(self.URL, datos, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.data['conflictos']), 1)
+
+        otro = Recurso.objects.create(nombre='Podóloga 2', tipo_cita='podologia', orden=5)
+        response = self.client.post(self.URL, datos, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(c['recurso'] for c in response.data['citas']), sorted([self.box.id, otro.id]))
+        self.assertEqual(set(Cita.objects.values_list('fecha', 'hora')), {(date(2030, 3, 12), time(15))})
+        self._resumen_consistente()
+
+    def test_reprogramar_valida_horario_y_pasado(self):
+        citas = self._citas(self.dia, [9, 10])
+        datos = {'accion': 'reprogramar', 'ids': [c.id for c in citas], 'notificar': False}
+
+        # Hora fuera del horario de atención, o no en punto, y fecha pasada: 400 antes de leer las citas
+        for cambios in ({'fecha': '2030-03-12', 'hora': '23:00'}, {'fecha': '2030-03-12', 'hora': '07:00'},
+                        {'fecha': '2030-03-12', 'hora': '10:30'}, {'fecha': '2020-03-12'}):
+            response = self.client.post(self.URL, dict(datos, **cambios), format='json')
+            self.assertEqual(response.status_code, 400, cambios)
+
+        # Con desplazar_dias el horario de cada cita se revisa por separado
+        Cita.objects.filter(pk=citas[1].pk).update(duracion_cita=120, hora=time(22))
+        citas_hoy = self._citas(timezone.localdate(), [8])
+        response = self.client.post(self.URL, {'accion': 'reprogramar', 'notificar': False, 'desplazar_dias': -1,
+                                               'ids': [citas[0].id, citas_hoy[0].id]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['conflictos'][0]['motivo'], 'horario pasado')
+
+        response = self.client.post(self.URL, dict(datos, desplazar_dias=1), format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([(c['id'], c['motivo']) for c in response.data['conflictos']],
+                         [(citas[1].id, 'fuera del horario de atención')])
+        self.assertEqual(Cita.objects.filter(fecha=self.dia).count(), 2)
+
+    def test_avisos_en_una_conexion(self):
+        con_correo = Paciente.objects.create(rut='11.111.111-1', nombre='Ana', telefono='911111111',
+                                             correo='ana@example.com')
+        citas = self._citas(self.dia, [9, 10], estado='cancelada')
+        Cita.objects.filter(pk=citas[0].pk).update(paciente=con_correo)
+
+        with mock.patch('citas.tasks.get_connection', wraps=mail.get_connection) as conexion:
+            resultado = enviar_avisos_citas([c.id for c in citas], 'cancelar')
+        conexion.assert_called_once()
+        self.assertEqual(resultado, 'Enviados 1 avisos')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ana@example.com'])
+        self.assertIn('cancelada', mail.outbox[0].body)
+
+
+@mock.patch('citas.tasks.expirar_oferta_espera.apply_async')
+@mock.patch('citas.tasks.enviar_oferta_espera.delay')
+class ListaEsperaTest(TestCase):
+    """Los horarios liberados por cancelaciones se ofrecen al primero en la lista de espera."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='espera', password='clave-segura-123'))
+        self.tratamiento = Tratamiento.objects.create(nombre='hongos', precio=15000)
+        self.titular = Paciente.objects.create(rut='12.345.678-5', nombre='Titular', telefono='912345678', correo='')
+        self.box = Recurso.objects.get(tipo_cita='podologia')
+        self.dia = timezone.localdate() + timedelta(days=10)
+        self.cita = Cita.objects.create(paciente=self.titular, tratamiento=self.tratamiento, fecha=self.dia,
+                                        hora=time(10))
+
+    def _entrada(self, rut, **datos):
+        paciente = Paciente.objects.create(rut=rut, nombre=f'Espera {rut}', telefono='911111111', correo='')
+        datos = {'fecha_desde': self.dia - timedelta(days=3), 'fecha_hasta': self.dia + timedelta(days=3), **datos}
+        return ListaEspera.objects.create(paciente=paciente, tratamiento=self.tratamiento, **datos)
+
+    def _cancelar(self, cita):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/citas/citas/{cita.id}/', {'estado': 'cancelada'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_cancelar_ofrece_al_primero_que_calza(self, delay, apply_async):
+        primera = self._entrada('11.111.111-1')
+        self._entrada('22.222.222-2')
+        self._entrada('33.333.333-3', hora_desde=time(15))
+        self._entrada('44.444.444-4', tipo_cita='manicura', fecha_desde=self.dia - timedelta(days=30))
+        tardia = self._entrada('55.555.555-5', fecha_desde=self.dia + timedelta(days=1))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._cancelar(self.cita)
+        # Una sola consulta a la lista de espera, sin importar su tamaño
+        busquedas = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'citas_listaespera' in q['sql']]
+        self.assertEqual(len(busquedas), 1)
+
+        primera.refresh_from_db()
+        self.assertEqual((primera.estado, primera.oferta_fecha, primera.oferta_hora, primera.oferta_recurso),
+                         ('ofrecida', self.dia, time(10), self.box))
+        self.assertEqual(ListaEspera.objects.filter(estado='ofrecida').count(), 1)
+        delay.assert_called_once_with(primera.pk)
+        self.assertEqual(apply_async.call_args.kwargs['eta'], primera.oferta_expira)
+        tardia.refresh_from_db()
+        self.assertEqual(tardia.estado, 'esperando')
+
+    def test_aceptar_oferta(self, delay, apply_async):
+        entrada = self._entrada('11.111.111-1')
+        self._cancelar(self.cita)
+        entrada.refresh_from_db()
+
+        cliente = APIClient()
+        response = cliente.post('/api/citas/espera/aceptar/', {'token': str(entrada.token)}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        # El horario de la cita cancelada quedó libre para la nueva
+        nueva = Cita.objects.get(pk=response.data['id'])
+        self.assertEqual((nueva.paciente, nueva.fecha, nueva.hora, nueva.recurso),
+                         (entrada.paciente, self.dia, time(10), self.box))
+        entrada.refresh_from_db()
+        self.assertEqual((entrada.estado, entrada.cita), ('aceptada', nueva))
+
+        response = cliente.post('/api/citas/espera/aceptar/', {'token': str(entrada.token)}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = cliente.post('/api/citas/espera/aceptar/', {'token': 'no-es-un-token'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+        # La cita cancelada no puede reactivarse en un horario ya tomado
+        self.cita.refresh_from_db()
+        self.cita.estado = 'reservada'
+        with self.assertRaises(ValidationError):
+            self.cita.save()
+
+    def test_rechazo_y_vencimiento_pasan_al_siguiente(self, delay, apply_async):
+        primera = self._entrada('11.111.111-1')
+        segunda = self._entrada('22.222.222-2')
+        self._cancelar(self.cita)
+        primera.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/citas/espera/rechazar/', {'token': str(primera.token)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        primera.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertEqual((primera.estado, segunda.estado), ('esperando', 'ofrecida'))
+
+        # Una tarea de vencimiento de otra oferta no afecta a la actual
+        ListaEspera.objects.filter(pk=segunda.pk).update(oferta_expira=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(expirar_oferta(segunda.pk, token='00000000-0000-0000-0000-000000000000'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expirar_ofertas_vencidas()
+        segunda.refresh_from_db()
+        primera.refresh_from_db()
+        # Ninguna de las dos vuelve a recibir el mismo horario
+        self.assertEqual((primera.estado, segunda.estado), ('esperando', 'esperando'))
+        self.assertIsNone(segunda.token)
+        self.assertEqual(delay.call_count, 2)
+
+    def test_horario_tomado_corta_la_cadena(self, delay, apply_async):
+        primera = self._entrada('11.111.111-1')
+        segunda = self._entrada('22.222.222-2')
+        self._cancelar(self.cita)
+        primera.refresh_from_db()
+
+        # Recepción reserva el horario mientras la oferta está pendiente
+        otro = Paciente.objects.create(rut='66.666.666-6', nombre='Otro', telefono='912345678', correo='')
+        Cita.objects.create(paciente=otro, tratamiento=self.tratamiento, fecha=self.dia, hora=time(10))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/citas/espera/rechazar/', {'token': str(primera.token)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        segunda.refresh_from_db()
+        self.assertEqual(segunda.estado, 'esperando')
+        self.assertFalse(ListaEspera.objects.filter(estado='ofrecida').exists())
+        delay.assert_called_once_with(primera.pk)
+
+    def test_eliminar_ofrece_y_masivo_no(self, delay, apply_async):
+        entrada = self._entrada('11.111.111-1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cita.delete()
+        entrada.refresh_from_db()
+        self.assertEqual(entrada.estado, 'ofrecida')
+
+        otra = self._entrada('22.222.222-2')
+        cita = Cita.objects.create(paciente=self.titular, tratamiento=self.tratamiento, fecha=self.dia, hora=time(12))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/citas/citas/masivo/', {'accion': 'cancelar', 'ids': [cita.id], 'notificar': False},
+                             format='json')
+        otra.refresh_from_db()
+        self.assertEqual(otra.estado, 'esperando')
+
+        # Los horarios que ya pasaron no se ofrecen
+        ayer = timezone.localdate() - timedelta(days=1)
+        self._entrada('33.333.333-3', fecha_desde=ayer)
+        self.assertIsNone(ofrecer_horario('podologia', ayer, time(10)))
+
+    def test_correo_de_oferta(self, delay, apply_async):
+        entrada = self._entrada('11.111.111-1')
+        Paciente.objects.filter(pk=entrada.paciente_id).update(correo='espera@example.com')
+        self._cancelar(self.cita)
+        entrada.refresh_from_db()
+
+        self.assertEqual(enviar_oferta_espera(entrada.pk), 'Oferta enviada a espera@example.com')
+        self.assertEqual(mail.outbox[0].to, ['espera@example.com'])
+        self.assertIn(f'token={entrada.token}', mail.outbox[0].body)
+
+
+class CierreCitasTest(TestCase):
+    """El cierre nocturno saca las citas pasadas de los estados activos con UPDATE por lotes."""
+
+    def setUp(self):
+        self.tratamiento = Tratamiento.objects.create(nombre='hongos', precio=15000)
+        self.paciente = Paciente.objects.create(rut='12.345.678-5', nombre='P', telefono='912345678', correo='')
+        self.hoy = timezone.localdate()
+        ayer = self.hoy - timedelta(days=1)
+        horas = count(8)
+        estados = [
+            ('confirmada', ayer), ('reservada', ayer), ('reservada', ayer), ('cancelada', ayer),
+            ('completada', ayer), ('reservada', self.hoy), ('confirmada', self.hoy + timedelta(days=3)),
+        ]
+        self.citas = Cita.objects.bulk_create([
+            Cita(paciente=self.paciente, tratamiento=self.tratamiento, fecha=fecha, hora=time(next(horas)), estado=estado)
+            for estado, fecha in estados
+        ])
+        # La segunda reservada se atendió: tiene ficha clínica
+        FichaClinica.objects.create(paciente=self.paciente, cita=self.citas[2], fecha=ayer,
+                                    descripcion_atencion='-', procedimiento='-', indicaciones='-')
+        reconstruir_ocupacion()
+
+    def _estados(self):
+        return [Cita.objects.get(pk=cita.pk).estado for cita in self.citas]
+
+    def test_cierre_por_lotes_con_auditoria(self):
+        ocupacion = sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos'))
+        antes = timezone.now()
+        with CaptureQueriesContext(connection) as ctx:
+            totales = cerrar_citas_pasadas(lote=1)
+        self.assertEqual(totales, {'completada': 2, 'no_asistio': 1})
+        self.assertEqual(self._estados(), [
+            'completada', 'no_asistio', 'completada', 'cancelada', 'completada', 'reservada', 'confirmada',
+        ])
+        # Un UPDATE por lote, sin guardar cita por cita
+        actualizaciones = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "citas_cita"')]
+        self.assertEqual(len(actualizaciones), 3)
+
+        self.assertEqual(
+            sorted(HistorialEstadoCita.objects.values_list('cita_id', 'estado_anterior', 'estado_nuevo', 'origen')),
+            [(self.citas[0].pk, 'confirmada', 'completada', 'cierre_nocturno'),
+             (self.citas[1].pk, 'reservada', 'no_asistio', 'cierre_nocturno'),
+             (self.citas[2].pk, 'reservada', 'completada', 'cierre_nocturno')],
+        )
+        self.assertEqual(Cita.objects.filter(ultima_actualizacion__gte=antes).count(), 3)
+        # Los estados finales siguen ocupando la agenda: el resumen no cambia
+        self.assertEqual(sorted(OcupacionDiaria.objects.values_list('fecha', 'tipo_cita', 'citas', 'minutos')), ocupacion)
+
+        self.assertEqual(cerrar_citas_pasadas(), {'completada': 0, 'no_asistio': 0})
+        self.assertEqual(HistorialEstadoCita.objects.count(), 3)
+
+    def test_cierre_propaga_como_escritura_masiva(self):
+        antigua = Cita.objects.create(paciente=self.paciente, tratamiento=self.tratamiento,
+                                      fecha=self.hoy - timedelta(days=200), hora=time(9))
+        DiaPendiente.objects.all().delete()
+        with mock.patch('citas.masivo.publicar_evento_cita') as evento, self.captureOnCommitCallbacks(execute=True):
+            cerrar_citas_pasadas()
+        self.assertEqual(evento.call_count, 4)
+        # El día antiguo queda pendiente para los reportes; los recientes los cubre la ventana nocturna
+        self.assertEqual(list(DiaPendiente.objects.values_list('fecha', flat=True)), [antigua.fecha])
+        self.assertEqual(OcupacionDiaria.objects.get(fecha=antigua.fecha).citas, 1)
+
+    def test_comando(self):
+        salida = io.StringIO()
+        call_command('cerrar_citas', '--hasta', (self.hoy + timedelta(days=1)).isoformat(), stdout=salida)
+        self.assertIn('2 completadas, 2 sin asistencia', salida.getvalue())
+        self.assertEqual(self._estados()[5], 'no_asistio')
+        with self.assertRaises(CommandError):
+            call_command('cerrar_citas', '--hasta', 'ayer')
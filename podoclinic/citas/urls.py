@@ -1,18 +1,25 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CitaViewSet, TratamientoViewSet, test_email, test_email_paciente, diagnostico_email
+from .views import CitaViewSet, ListaEsperaViewSet, RecursoViewSet, SerieCitasViewSet, TratamientoViewSet, test_email, test_email_paciente, diagnostico_email
+from .agenda import cargar_agenda
+from .eventos import eventos_agenda, token_eventos
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Cita, Tratamiento
 from .serializers import CitaSerializer
+from .utils import buscar_tratamiento
 from pacientes.models import Paciente
 from datetime import datetime
+from django.core.exceptions import ValidationError
 
 router = DefaultRouter()
 router.register(r'citas', CitaViewSet)
 router.register(r'tratamientos', TratamientoViewSet)
+router.register(r'recursos', RecursoViewSet)
+router.register(r'series', SerieCitasViewSet)
+router.register(r'espera', ListaEsperaViewSet)
 
 # Implementación en línea para evitar problemas con el decorador
 @api_view(['POST'])
@@ -44,7 +51,7 @@ def crear_cita_admin_inline(request):
         # Buscar coincidencia exacta
         for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO:
             if nombre == nombre_tratamiento:
-                tratamiento = Tratamiento.objects.filter(nombre=tipo).first()
+                tratamiento = buscar_tratamiento(tipo)
                 break
         
         # Si no se encontró, crear uno nuevo
@@ -62,13 +69,9 @@ def crear_cita_admin_inline(request):
                 precio=0
             )
         
-        # Verificar si ya existe una cita en esta fecha, hora Y tipo de cita
+        # Crear la cita; al guardar se asigna un recurso libre del tipo de cita
+        # (o el indicado, si está libre) y falla si todos están ocupados
         tipo_cita = data.get('tipo_cita', 'podologia')
-        existing_cita = Cita.objects.filter(fecha=data['fecha'], hora=data['hora'], tipo_cita=tipo_cita).first()
-        if existing_cita:
-            return Response({'error': f'Ya existe una cita de {tipo_cita} programada para la fecha {data["fecha"]} a las {data["hora"]}. Por favor seleccione otro horario.'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Crear la cita
         cita = Cita.objects.create(
             paciente=paciente,
             tratamiento=tratamiento,
@@ -76,13 +79,16 @@ def crear_cita_admin_inline(request):
             hora=data['hora'],
             estado=data.get('estado', 'reservada'),
             tipo_cita=tipo_cita,
-            duracion_cita=data.get('duracion_cita', 60)
+            duracion_cita=data.get('duracion_cita', 60),
+            recurso_id=data.get('recurso') or None
         )
         
         # Devolver la respuesta
         serializer = CitaSerializer(cita)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    except ValidationError as e:
+        return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': f'Error al crear la cita: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -107,20 +113,7 @@ def actualizar_cita(request, cita_id):
                     # Usar solo horas y minutos
                     data['hora'] = f"{partes[0]}:{partes[1]}"
         
-        # Verificar si hay cambio de fecha/hora y validar disponibilidad
-        if ('fecha' in data and 'hora' in data):
-            # Solo verificamos si ha cambiado la fecha o la hora
-            if (data['fecha'] != str(cita.fecha) or data['hora'] != str(cita.hora).split(':')[:2]):
-                # Verificar si ya existe una cita en esta fecha, hora Y tipo de cita (excluyendo la actual)
-                tipo_cita_actualizar = data.get('tipo_cita', cita.tipo_cita)
-                existing_cita = Cita.objects.filter(
-                    fecha=data['fecha'], 
-                    hora=data['hora'],
-                    tipo_cita=tipo_cita_actualizar
-                ).exclude(id=cita_id)
-                
-                if existing_cita.exists():
-                    return Response({'error': f'Ya existe una cita de {tipo_cita_actualizar} programada para la fecha {data["fecha"]} a las {data["hora"]}. Por favor seleccione otro horario.'}, status=status.HTTP_400_BAD_REQUEST)
+        # La disponibilidad del nuevo horario se valida al guardar (Cita.save asigna un recurso libre)
         
         # Actualizar paciente si está presente en la solicitud
         if 'paciente' in data:
@@ -139,7 +132,7 @@ def actualizar_cita(request, cita_id):
             # Buscar coincidencia exacta
             for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO:
                 if nombre == nombre_tratamiento:
-                    tratamiento = Tratamiento.objects.filter(nombre=tipo).first()
+                    tratamiento = buscar_tratamiento(tipo)
                     break
             
             # Si no se encontró, crear uno nuevo
@@ -172,12 +165,17 @@ def actualizar_cita(request, cita_id):
         if 'tipo_cita' in data:
             cita.tipo_cita = data['tipo_cita']
         
+        if 'recurso' in data:
+            cita.recurso_id = data['recurso'] or None
+        
         # Guardar cambios
         cita.save()
         
         # Devolver la respuesta
         serializer = CitaSerializer(cita)
         return Response(serializer.data, status=status.HTTP_200_OK)
+    except ValidationError as e:
+        return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': f'Error al actualizar la cita: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -202,49 +200,15 @@ def horarios_disponibles(request):
         else:
             fecha = datetime.now().date()
             
-        # Filtrar citas por la fecha Y tipo de cita
+        # Horas (de 8:00 a 22:00) con al menos un recurso libre para el tipo de cita
         try:
-            # Primero probar una consulta simple
-            todas_las_citas = Cita.objects.filter(fecha=fecha)
-            citas = todas_las_citas.filter(tipo_cita=tipo_cita)
+            horas_disponibles = cargar_agenda(tipo_cita, fecha, fecha).horas_disponibles(fecha)
         except Exception as db_error:
             # Si hay error de base de datos, devolver un error más específico
             return Response({
                 'error': f'Error al consultar la base de datos: {str(db_error)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Normalizar las horas ocupadas (HH:MM formato)
-        horas_ocupadas = set()
-        try:
-            for cita in citas:
-                try:
-                    hora_str = str(cita.hora)
-                    # Extraer solo horas y minutos
-                    if ':' in hora_str:
-                        partes = hora_str.split(':')
-                        if len(partes) >= 2:
-                            horas_ocupadas.add(f"{partes[0]}:{partes[1]}")
-                            # Si la cita tiene duración extendida, también marcar la siguiente hora como ocupada
-                            if cita.duracion_extendida:
-                                siguiente_hora = (int(partes[0]) + 1) % 24
-                                horas_ocupadas.add(f"{siguiente_hora:02d}:{partes[1]}")
-                    else:
-                        horas_ocupadas.add(hora_str)
-                except Exception as cita_error:
-                    # Si hay error con una cita específica, continuar con las demás
-                    continue
-        except Exception as iter_error:
-            return Response({
-                'error': f'Error al procesar las citas: {str(iter_error)}'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Horas disponibles (de 8:00 a 22:00)
-        horas_disponibles = []
-        for hora in range(8, 23):  # Cambiado para incluir desde las 8:00 hasta las 22:00
-            hora_str = f"{hora:02d}:00"
-            if hora_str not in horas_ocupadas:
-                horas_disponibles.append(hora_str)
-        
         return Response({
             'fecha': fecha,
             'horas_disponibles': horas_disponibles
@@ -271,8 +235,8 @@ def eliminar_cita(request, cita_id):
 @permission_classes([AllowAny])
 def debug_citas(request):
     try:
-        # Obtener todas las citas
-        citas = Cita.objects.all()
+        # Obtener todas las citas (con paciente y tratamiento en la misma consulta)
+        citas = Cita.objects.select_related('paciente', 'tratamiento')
         
         # Serializar manualmente para depuración
         resultado = []
@@ -305,6 +269,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('crear_cita_admin/', crear_cita_admin_inline, name='crear_cita_admin'),
     path('disponibles/', horarios_disponibles, name='horarios_disponibles'),
+    path('eventos/', eventos_agenda, name='eventos_agenda'),
+    path('eventos/token/', token_eventos, name='token_eventos'),
     path('debug/', debug_citas, name='debug_citas'),
     path('eliminar/<int:cita_id>/', eliminar_cita, name='eliminar_cita'),
     path('actualizar/<int:cita_id>/', actualizar_cita, name='actualizar_cita'),
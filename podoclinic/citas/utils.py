@@ -1,6 +1,18 @@
 import requests
 from django.conf import settings
 
+from podoclinic.invalidacion import CacheLocal
+
+# Catálogo de tratamientos por tipo: cambia muy poco y se consulta en cada reserva
+_cache_tratamientos = CacheLocal('tratamientos', ['citas.tratamiento'])
+
+
+def buscar_tratamiento(tipo):
+    """Primer tratamiento del tipo indicado (o None), cacheado por proceso."""
+    from .models import Tratamiento
+    return _cache_tratamientos.obtener(tipo, lambda: Tratamiento.objects.filter(nombre=tipo).first())
+
+
 def enviar_confirmacion_whatsapp(cita):
     """
     Envía un mensaje de confirmación de cita por WhatsApp
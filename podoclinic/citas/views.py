@@ -1,14 +1,26 @@
 from django.shortcuts import render
-from rest_framework import viewsets, status
+from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action, permission_classes, api_view
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters import rest_framework as filters
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
 from django.utils import timezone
-from datetime import datetime
-from .models import Cita, Tratamiento
-from .serializers import CitaSerializer, TratamientoSerializer, ReservaCitaSerializer
+from datetime import date, datetime, timedelta
+from .agenda import cargar_agenda
+from .cambios import respuesta_cambios
+from .models import Cita, ListaEspera, Recurso, SerieCitas, Tratamiento
+from .ocupacion import capacidad_por_tipo, mapa_ocupacion
+from .serializers import (
+    CitaSerializer, ListaEsperaSerializer, ModificarSerieSerializer, OperacionMasivaSerializer,
+    RecursoSerializer, ReservaCitaSerializer, SerieCitasSerializer, TratamientoSerializer,
+)
+from .espera import OfertaNoVigente, aceptar_oferta, rechazar_oferta
+from .operaciones import ConflictoOperacion, operar_citas
+from .series import ConflictoSerie, crear_serie, modificar_siguientes
+from .utils import buscar_tratamiento
 from pacientes.models import Paciente
 from django.core.mail import send_mail, EmailMessage, EmailMultiAlternatives
 from django.conf import settings
@@ -62,7 +74,7 @@ def crear_cita_admin(request):
             tratamiento = None
             for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO:
                 if nombre == nombre_tratamiento:
-                    tratamiento = Tratamiento.objects.filter(nombre=tipo).first()
+                    tratamiento = buscar_tratamiento(tipo)
                     break
             
             # Si no se encontró, crear un tratamiento nuevo
@@ -130,17 +142,35 @@ def crear_cita_admin(request):
 
 # Create your views here.
 
+# Límites de la búsqueda de horarios libres: acotan el tiempo de respuesta
+MAX_DIAS_BUSQUEDA = 366
+MAX_HORARIOS_LIBRES = 50
+
 class CitaFilter(filters.FilterSet):
     fecha = filters.DateFilter(field_name='fecha')
     
     class Meta:
         model = Cita
-        fields = ['fecha']
+        fields = ['fecha', 'recurso', 'tipo_cita', 'estado']
 
 class CitaViewSet(viewsets.ModelViewSet):
-    queryset = Cita.objects.all()
+    # CitaSerializer lee campos de paciente, tratamiento y recurso: cargarlos en la misma consulta
+    queryset = Cita.objects.select_related('paciente', 'tratamiento', 'recurso')
     serializer_class = CitaSerializer
     filterset_class = CitaFilter
+
+    # Cita.save valida que haya un recurso libre en el horario: responder 400, no 500
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'error': e.messages[0]})
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'error': e.messages[0]})
     
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
     def crear_admin(self, request):
@@ -178,7 +208,7 @@ class CitaViewSet(viewsets.ModelViewSet):
                 tratamiento = None
                 for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO:
                     if nombre == nombre_tratamiento:
-                        tratamiento = Tratamiento.objects.filter(nombre=tipo).first()
+                        tratamiento = buscar_tratamiento(tipo)
                         break
                 
                 # Si no se encontró, crear un tratamiento nuevo
@@ -229,6 +259,8 @@ class CitaViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(cita)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': f'Error al crear la cita: {str(e)}'},
@@ -254,6 +286,145 @@ class CitaViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def masivo(self, request):
+        """
+        Cancela, confirma o reprograma varias citas a la vez. Las citas se indican con
+        `ids` o con `filtro` (por ejemplo {"fecha": "2025-03-10"} para cerrar un día).
+        Para reprogramar: `fecha` (desde hoy) o `desplazar_dias`, y opcionalmente `hora`
+        (en punto, de 8:00 a 22:00). Si alguna cita no tiene horario libre, o el nuevo
+        queda en el pasado o pasa del cierre, responde 409 sin cambiar nada, salvo con
+        `omitir_conflictos=true`. Los pacientes se avisan por correo salvo con
+        `notificar=false`.
+        """
+        serializer = OperacionMasivaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+
+        if 'ids' in datos:
+            queryset = Cita.objects.filter(pk__in=datos['ids'])
+        else:
+            filtro = CitaFilter(data=datos['filtro'], queryset=Cita.objects.all())
+            if not filtro.is_valid():
+                return Response({'error': filtro.errors}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = filtro.qs
+
+        try:
+            citas, conflictos = operar_citas(
+                queryset, datos['accion'], fecha=datos.get('fecha'), hora=datos.get('hora'),
+                desplazar_dias=datos.get('desplazar_dias'),
+                omitir_conflictos=datos['omitir_conflictos'], notificar=datos['notificar'],
+            )
+        except ConflictoOperacion as e:
+            return Response({'error': e.message, 'conflictos': e.conflictos}, status=status.HTTP_409_CONFLICT)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'accion': datos['accion'],
+            'modificadas': len(citas),
+            'citas': CitaSerializer(citas, many=True).data,
+            'conflictos': conflictos,
+        })
+
+    @action(detail=False, methods=['get'])
+    def cambios(self, request):
+        """
+        Feed de cambios para el calendario: citas creadas, modificadas o eliminadas
+        desde `?cursor=`. Una cita también cuenta como cambiada si se modificó su
+        paciente, porque la respuesta incluye el nombre y RUT del paciente.
+        """
+        def filtrar_cambios(queryset, desde):
+            pacientes_modificados = Paciente.objects.filter(ultima_actualizacion__gte=desde).values('id')
+            return queryset.filter(
+                Q(ultima_actualizacion__gte=desde) | Q(paciente_id__in=pacientes_modificados)
+            )
+
+        return respuesta_cambios(
+            request, self.filter_queryset(self.get_queryset()), 'cita',
+            serializar=lambda citas: self.get_serializer(citas, many=True).data,
+            filtrar_cambios=filtrar_cambios,
+        )
+
+    @action(detail=False, methods=['get'])
+    def ocupacion(self, request):
+        """
+        Mapa de calor de la agenda: ?anio=YYYY&mes=M&tipo_cita=... devuelve, por día y
+        tipo de cita, las citas activas, los minutos reservados y el porcentaje de la
+        capacidad diaria (de 8:00 a 22:00 por cada recurso activo). Sin `mes` devuelve
+        el año completo. Lee solo el resumen OcupacionDiaria y los recursos, nunca las citas.
+        """
+        try:
+            anio = int(request.query_params.get('anio') or timezone.localdate().year)
+            mes = request.query_params.get('mes')
+            if mes:
+                mes = int(mes)
+                desde = date(anio, mes, 1)
+                hasta = date(anio + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
+            else:
+                desde, hasta = date(anio, 1, 1), date(anio, 12, 31)
+        except ValueError:
+            return Response(
+                {'error': 'Parámetros inválidos. Use anio=YYYY y mes entre 1 y 12'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        capacidad = capacidad_por_tipo()
+        return Response({
+            'desde': desde,
+            'hasta': hasta,
+            'capacidad_minutos': capacidad,
+            'dias': mapa_ocupacion(desde, hasta, request.query_params.get('tipo_cita'), capacidad),
+        })
+
+    @action(detail=False, methods=['get'])
+    def proximos_libres(self, request):
+        """
+        Primeros horarios libres desde una fecha: ?tipo_cita=podologia&duracion=120
+        &desde=YYYY-MM-DD&limite=5&dias=90. Lee los recursos y las citas del horizonte
+        en dos consultas y recorre los horarios (8:00 a 22:00, sin pasar del cierre)
+        en orden, deteniéndose al reunir `limite` horarios.
+        """
+        try:
+            tipo_cita = request.query_params.get('tipo_cita', 'podologia')
+            duracion = int(request.query_params.get('duracion', 60))
+            limite = min(int(request.query_params.get('limite', 5)), MAX_HORARIOS_LIBRES)
+            dias = min(int(request.query_params.get('dias', 60)), MAX_DIAS_BUSQUEDA)
+            desde_str = request.query_params.get('desde')
+            desde = datetime.strptime(desde_str, '%Y-%m-%d').date() if desde_str else timezone.localdate()
+        except ValueError:
+            return Response(
+                {'error': 'Parámetros inválidos. Use desde=YYYY-MM-DD y valores numéricos para duracion, limite y dias'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if tipo_cita not in dict(Cita.TIPOS_CITA) or duracion not in dict(Cita.DURACIONES) or limite < 1 or dias < 1:
+            return Response(
+                {'error': 'tipo_cita, duracion (60 o 120), limite y dias deben ser válidos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        hasta = desde + timedelta(days=dias - 1)
+        agenda = cargar_agenda(tipo_cita, desde, hasta)
+        # No ofrecer horarios que ya empezaron
+        ahora = timezone.localtime().replace(tzinfo=None)
+        horarios = []
+        for fecha, hora, libres in agenda.horarios_libres(desde, hasta, duracion, despues_de=ahora):
+            horarios.append({
+                'fecha': fecha,
+                'hora': f"{hora:%H:%M}",
+                'recursos': [{'id': recurso, 'nombre': agenda.nombres.get(recurso)} for recurso in libres],
+            })
+            if len(horarios) >= limite:
+                break
+
+        return Response({
+            'tipo_cita': tipo_cita,
+            'duracion': duracion,
+            'desde': desde,
+            'hasta': hasta,
+            'horarios': horarios,
+        })
+
     @action(detail=False, methods=['get'])
     def disponibles(self, request):
         try:
@@ -265,30 +436,12 @@ class CitaViewSet(viewsets.ModelViewSet):
             else:
                 fecha = timezone.now().date()
                 
-            # Filtrar citas por la fecha Y tipo de cita
-            citas = Cita.objects.filter(fecha=fecha, tipo_cita=tipo_cita)
-            horas_ocupadas = set()
-            
-            # Procesar cada cita para marcar las horas ocupadas
-            for cita in citas:
-                hora_str = f"{cita.hora.hour:02d}:00"
-                horas_ocupadas.add(hora_str)
-                
-                # Si la cita tiene duración extendida, también marcar la siguiente hora como ocupada
-                if cita.duracion_extendida:
-                    siguiente_hora = f"{(cita.hora.hour + 1):02d}:00"
-                    horas_ocupadas.add(siguiente_hora)
-            
-            # Generar horas disponibles (de 8:00 a 22:00)
-            horas_disponibles = []
-            for hora in range(8, 23):  # Cambiado para incluir desde las 8:00 hasta las 22:00
-                hora_str = f"{hora:02d}:00"
-                if hora_str not in horas_ocupadas:
-                    horas_disponibles.append(hora_str)
+            # Horas (de 8:00 a 22:00) con al menos un recurso libre para el tipo de cita
+            agenda = cargar_agenda(tipo_cita, fecha, fecha)
             
             return Response({
                 'fecha': fecha,
-                'horas_disponibles': horas_disponibles
+                'horas_disponibles': agenda.horas_disponibles(fecha)
             })
         except Exception as e:
             return Response(
@@ -300,6 +453,101 @@ class TratamientoViewSet(viewsets.ModelViewSet):
     queryset = Tratamiento.objects.all()
     serializer_class = TratamientoSerializer
 
+class RecursoViewSet(viewsets.ModelViewSet):
+    queryset = Recurso.objects.all()
+    serializer_class = RecursoSerializer
+    filterset_fields = ['tipo_cita', 'activo']
+
+class SerieCitasViewSet(viewsets.ModelViewSet):
+    """
+    Series de citas recurrentes. Al crear una serie se crean todas sus citas; para
+    cambiarlas se usa `modificar_siguientes` (las citas ya creadas no se regeneran).
+    """
+    queryset = SerieCitas.objects.select_related('paciente', 'tratamiento', 'recurso')
+    serializer_class = SerieCitasSerializer
+    filterset_fields = ['paciente', 'tipo_cita']
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def create(self, request, *args, **kwargs):
+        """
+        Crea la serie y todas sus citas en una transacción. Si alguna fecha choca con
+        otra cita responde 409 con las fechas en conflicto, salvo que se envíe
+        `omitir_conflictos=true` (esas fechas quedan como excepciones).
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        omitir = str(request.data.get('omitir_conflictos', '')).lower() in ('1', 'true')
+        datos = dict(serializer.validated_data)
+        estado = datos.pop('estado', 'reservada')
+        try:
+            serie, citas = crear_serie(SerieCitas(**datos), omitir_conflictos=omitir, estado=estado)
+        except ConflictoSerie as e:
+            return Response({'error': e.message, 'conflictos': e.fechas}, status=status.HTTP_409_CONFLICT)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'serie': self.get_serializer(serie).data,
+            'citas': CitaSerializer(citas, many=True).data,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def modificar_siguientes(self, request, pk=None):
+        """
+        Cambia "esta y las siguientes" citas de la serie desde `desde` (hora,
+        duracion_cita, estado, recurso o tratamiento) con un solo UPDATE.
+        """
+        serializer = ModificarSerieSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cambios = dict(serializer.validated_data)
+        desde = cambios.pop('desde')
+        try:
+            serie, cantidad = modificar_siguientes(self.get_object(), desde, cambios)
+        except ConflictoSerie as e:
+            return Response({'error': e.message, 'conflictos': e.fechas}, status=status.HTTP_409_CONFLICT)
+        except DjangoValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'serie': self.get_serializer(serie).data, 'modificadas': cantidad})
+
+class ListaEsperaViewSet(viewsets.ModelViewSet):
+    """
+    Lista de espera. Los horarios que se liberan al cancelar o eliminar citas se
+    ofrecen automáticamente (ver citas/espera.py); el paciente responde la oferta con
+    el token del correo en `aceptar` o `rechazar`, sin iniciar sesión.
+    """
+    queryset = ListaEspera.objects.select_related('paciente')
+    serializer_class = ListaEsperaSerializer
+    filterset_fields = ['paciente', 'tipo_cita', 'estado']
+
+    def _responder_oferta(self, request, responder):
+        token = request.data.get('token')
+        if not token:
+            return Response({'error': 'Falta el token de la oferta'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return responder(token)
+        except (ListaEspera.DoesNotExist, DjangoValidationError) as e:
+            if isinstance(e, OfertaNoVigente):
+                return Response({'error': e.message}, status=status.HTTP_409_CONFLICT)
+            # Token desconocido o con formato inválido
+            return Response({'error': 'Oferta no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def aceptar(self, request):
+        """Acepta el horario ofrecido: crea la cita si sigue libre y la oferta está vigente."""
+        def responder(token):
+            cita = aceptar_oferta(token)
+            return Response(CitaSerializer(cita).data, status=status.HTTP_201_CREATED)
+        return self._responder_oferta(request, responder)
+
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def rechazar(self, request):
+        """Rechaza el horario ofrecido; el paciente sigue en la lista de espera."""
+        def responder(token):
+            rechazar_oferta(token)
+            return Response({'message': 'Oferta rechazada'})
+        return self._responder_oferta(request, responder)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def test_email(request):
@@ -556,25 +804,7 @@ def actualizar_cita(request, cita_id):
                     # Usar solo horas y minutos
                     data['hora'] = f"{partes[0]}:{partes[1]}"
         
-        # Verificar si hay cambio de fecha/hora y validar disponibilidad
-        if ('fecha' in data and 'hora' in data):
-            # Solo verificamos si ha cambiado la fecha o la hora
-            if (data['fecha'] != str(cita.fecha) or data['hora'] != str(cita.hora).split(':')[:2]):
-                # Verificar si ya existe una cita en esta fecha y hora (excluyendo la actual)
-                existing_cita = Cita.objects.filter(fecha=data['fecha']).exclude(id=cita_id)
-                
-                # Comparar horas normalizadas
-                for existing in existing_cita:
-                    existing_hora = str(existing.hora)
-                    if ':' in existing_hora:
-                        existing_hora_parts = existing_hora.split(':')
-                        existing_hora_norm = f"{existing_hora_parts[0]}:{existing_hora_parts[1]}"
-                        
-                        if existing_hora_norm == data['hora']:
-                            return Response(
-                                {'error': f'Ya existe una cita programada para la fecha {data["fecha"]} a las {data["hora"]}. Por favor seleccione otro horario.'},
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
+        # La disponibilidad del nuevo horario se valida al guardar (Cita.save asigna un recurso libre)
         
         # Actualizar los campos de la cita
         if 'paciente' in data:
@@ -596,7 +826,7 @@ def actualizar_cita(request, cita_id):
                 tratamiento = None
                 for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO:
                     if nombre == nombre_tratamiento:
-                        tratamiento = Tratamiento.objects.filter(nombre=tipo).first()
+                        tratamiento = buscar_tratamiento(tipo)
                         break
                 
                 # Si no se encontró, crear uno nuevo
@@ -644,6 +874,8 @@ def actualizar_cita(request, cita_id):
         serializer = CitaSerializer(cita)
         return Response(serializer.data)
         
+    except DjangoValidationError as e:
+        return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Insumo, MovimientoInsumo
+from .models import Insumo, InsumoLote, MovimientoInsumo, PeriodoCosto, PronosticoInsumo
 
 @admin.register(Insumo)
 class InsumoAdmin(admin.ModelAdmin):
@@ -8,9 +8,28 @@ class InsumoAdmin(admin.ModelAdmin):
     search_fields = ('nombre', 'descripcion')
     ordering = ('nombre',)
 
+@admin.register(InsumoLote)
+class InsumoLoteAdmin(admin.ModelAdmin):
+    list_display = ('id', 'insumo', 'codigo', 'cantidad_disponible', 'cantidad_inicial', 'fecha_vencimiento', 'fecha_ingreso')
+    list_filter = ('insumo',)
+    search_fields = ('insumo__nombre', 'codigo')
+    ordering = ('fecha_vencimiento',)
+
 @admin.register(MovimientoInsumo)
 class MovimientoInsumoAdmin(admin.ModelAdmin):
     list_display = ('id', 'insumo', 'cantidad', 'tipo_movimiento', 'motivo', 'fecha_movimiento', 'usuario')
     list_filter = ('tipo_movimiento', 'insumo', 'usuario')
     search_fields = ('insumo__nombre', 'motivo')
     ordering = ('-fecha_movimiento',)
+
+@admin.register(PronosticoInsumo)
+class PronosticoInsumoAdmin(admin.ModelAdmin):
+    list_display = ('insumo', 'consumo_diario', 'desviacion_diaria', 'punto_reorden', 'nivel_objetivo', 'fecha_calculo')
+    search_fields = ('insumo__nombre',)
+    ordering = ('insumo__nombre',)
+
+@admin.register(PeriodoCosto)
+class PeriodoCostoAdmin(admin.ModelAdmin):
+    list_display = ('mes', 'pendiente', 'calculado_en')
+    list_filter = ('pendiente',)
+    ordering = ('-mes',)
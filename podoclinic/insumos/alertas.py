@@ -0,0 +1,69 @@
+"""
+Alertas de inventario: insumos en stock crítico y próximos a vencer.
+
+Cada lista es una sola consulta sobre un índice parcial: `insumo_stock_critico_idx`
+(solo filas con stock_actual <= stock_critico), `insumo_vencimiento_idx` (solo
+filas con fecha de vencimiento) y `lote_vencimiento_idx` para los lotes. El
+resultado serializado se guarda en una caché local por proceso con clave
+('alertas', fecha, días); cualquier cambio de un Insumo o de sus lotes publica la
+clave 'alertas' en el bus de invalidación (ver insumos/apps.py e insumos/lotes.py),
+y la fecha en la clave hace que la caché se renueve sola al cambiar el día.
+"""
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from podoclinic.invalidacion import CacheLocal
+
+from .models import Insumo, InsumoLote
+
+# Días hacia adelante que se revisan por defecto para los vencimientos
+DIAS_VENCIMIENTO = 30
+MAX_DIAS_VENCIMIENTO = 365
+
+_cache_alertas = CacheLocal('alertas_insumos', ['insumos.insumo', 'insumos.insumolote'])
+
+
+def insumos_stock_critico():
+    return Insumo.objects.filter(stock_actual__lte=F('stock_critico')).order_by('nombre')
+
+
+def insumos_por_vencer(dias=DIAS_VENCIMIENTO, hoy=None):
+    """Insumos con existencias que vencen hasta dentro de `dias` días (incluidos los ya vencidos)."""
+    hoy = hoy or timezone.localdate()
+    return Insumo.objects.filter(
+        fecha_vencimiento__isnull=False, fecha_vencimiento__lte=hoy + timedelta(days=dias),
+        stock_actual__gt=0,
+    ).order_by('fecha_vencimiento', 'nombre')
+
+
+def lotes_por_vencer(dias=DIAS_VENCIMIENTO, hoy=None):
+    """Lotes con existencias que vencen hasta dentro de `dias` días (índice `lote_vencimiento_idx`)."""
+    hoy = hoy or timezone.localdate()
+    return InsumoLote.objects.filter(
+        cantidad_disponible__gt=0, fecha_vencimiento__isnull=False,
+        fecha_vencimiento__lte=hoy + timedelta(days=dias),
+    ).select_related('insumo').order_by('fecha_vencimiento', 'id')
+
+
+def calcular_alertas(dias=DIAS_VENCIMIENTO, hoy=None):
+    """Alertas vigentes, serializadas: stock crítico, vencidos y por vencer en `dias` días."""
+    from .serializers import InsumoLoteSerializer, InsumoSerializer
+
+    hoy = hoy or timezone.localdate()
+    por_vencer = InsumoSerializer(insumos_por_vencer(dias, hoy), many=True).data
+    return {
+        'fecha': hoy.isoformat(),
+        'dias': dias,
+        'stock_critico': InsumoSerializer(insumos_stock_critico(), many=True).data,
+        'vencidos': [insumo for insumo in por_vencer if insumo['fecha_vencimiento'] < hoy.isoformat()],
+        'por_vencer': [insumo for insumo in por_vencer if insumo['fecha_vencimiento'] >= hoy.isoformat()],
+        'lotes_por_vencer': InsumoLoteSerializer(lotes_por_vencer(dias, hoy), many=True).data,
+    }
+
+
+def alertas_insumos(dias=DIAS_VENCIMIENTO):
+    """Como `calcular_alertas`, desde la caché local mientras no cambie ningún insumo."""
+    hoy = timezone.localdate()
+    return _cache_alertas.obtener(('alertas', hoy.isoformat(), dias), lambda: calcular_alertas(dias, hoy))
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class InsumosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'insumos'
+
+    def ready(self):
+        from podoclinic.invalidacion import registrar_modelo
+        from .models import Insumo, InsumoLote
+
+        # Bus de invalidación de cachés locales: un insumo afecta a su id y a las
+        # alertas de inventario (insumos/alertas.py), que dependen de todos
+        registrar_modelo(Insumo, clave=lambda insumo: {insumo.pk, 'alertas'})
+        registrar_modelo(InsumoLote, clave=lambda lote: 'alertas')
+
+        # Costos de materiales por mes (insumos/costos.py): cada ficha deja su mes pendiente
+        from django.db.models.signals import post_delete, post_save
+        from .costos import ficha_eliminada, ficha_guardada
+        post_save.connect(ficha_guardada, sender='pacientes.FichaClinica', dispatch_uid='costos_ficha_guardada')
+        post_delete.connect(ficha_eliminada, sender='pacientes.FichaClinica', dispatch_uid='costos_ficha_eliminada')
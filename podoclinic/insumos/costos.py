@@ -0,0 +1,156 @@
+"""
+Valorización del inventario y costo de materiales por tratamiento y por paciente.
+
+La valorización del stock es un agregado en la base (Σ stock × valor unitario)
+sobre una tabla de cientos de filas, así que se calcula en cada consulta.
+
+Los costos de materiales salen de FichaClinica.costo_total (el valor de los
+productos al momento de la atención) y se precalculan por mes en
+CostoTratamientoMensual y CostoPacienteMensual con dos GROUP BY sobre el rango de
+fechas de los meses (índice `ficha_fecha_idx`). PeriodoCosto lleva qué meses están
+calculados: cada ficha creada, eliminada o con cambios de fecha o costo marca su
+mes como pendiente, la tarea `actualizar_costos_materiales` recalcula solo los
+meses pendientes, y las consultas calculan en el momento los meses que todavía no
+estén al día.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import CostoPacienteMensual, CostoTratamientoMensual, Insumo, InsumoLote, PeriodoCosto
+
+logger = logging.getLogger(__name__)
+
+# Meses que puede abarcar una consulta de costos
+MAX_MESES_COSTOS = 36
+
+
+def inicio_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def mes_siguiente(mes):
+    return (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def meses_entre(desde, hasta):
+    """Primeros días de los meses de `desde` a `hasta`, ambos incluidos."""
+    meses, mes = [], inicio_mes(desde)
+    while mes <= hasta:
+        meses.append(mes)
+        mes = mes_siguiente(mes)
+    return meses
+
+
+def valorizacion_stock(dias_vencimiento=30, hoy=None):
+    """Valor del stock a valor unitario actual, y el de los lotes que vencen en `dias_vencimiento` días."""
+    hoy = hoy or timezone.localdate()
+    valor = DecimalField(max_digits=14, decimal_places=0)
+    con_stock = Q(stock_actual__gt=0)
+    totales = Insumo.objects.aggregate(
+        total=Sum(F('stock_actual') * F('valor_unitario'), filter=con_stock, output_field=valor, default=0),
+        unidades=Sum('stock_actual', filter=con_stock, default=0),
+        insumos=Count('id', filter=con_stock),
+    )
+    totales['por_vencer'] = InsumoLote.objects.filter(
+        cantidad_disponible__gt=0, fecha_vencimiento__isnull=False,
+        fecha_vencimiento__lte=hoy + timedelta(days=dias_vencimiento),
+    ).aggregate(
+        valor=Sum(F('cantidad_disponible') * F('insumo__valor_unitario'), output_field=valor, default=0),
+    )['valor']
+    totales['fecha'] = hoy
+    return totales
+
+
+def marcar_meses_pendientes(fechas):
+    """Marca como pendientes los meses de `fechas` (una consulta, sin importar si ya estaban)."""
+    meses = {inicio_mes(fecha) for fecha in fechas if fecha}
+    if meses:
+        PeriodoCosto.objects.bulk_create(
+            [PeriodoCosto(mes=mes, pendiente=True) for mes in meses],
+            update_conflicts=True, unique_fields=['mes'], update_fields=['pendiente'],
+        )
+
+
+def recalcular_meses(meses):
+    """Recalcula los costos de `meses` (primeros días de mes) con dos agregados."""
+    from pacientes.models import FichaClinica
+
+    meses = sorted(set(meses))
+    if not meses:
+        return
+    with transaction.atomic():
+        # Primero se marcan como calculados: una ficha guardada durante el cálculo
+        # espera este bloqueo y vuelve a dejar el mes pendiente
+        PeriodoCosto.objects.bulk_create(
+            [PeriodoCosto(mes=mes, pendiente=False, calculado_en=timezone.now()) for mes in meses],
+            update_conflicts=True, unique_fields=['mes'], update_fields=['pendiente', 'calculado_en'],
+        )
+        fichas = (
+            FichaClinica.objects.filter(fecha__gte=meses[0], fecha__lt=mes_siguiente(meses[-1]))
+            .annotate(mes=TruncMonth('fecha')).filter(mes__in=meses).order_by()
+        )
+        por_tratamiento = fichas.values(
+            'mes', tipo=Coalesce('cita__tratamiento__nombre', Value('')),
+        ).annotate(cantidad=Count('id'), total=Sum('costo_total'))
+        por_paciente = fichas.values('mes', 'paciente_id').annotate(cantidad=Count('id'), total=Sum('costo_total'))
+
+        CostoTratamientoMensual.objects.filter(mes__in=meses).delete()
+        CostoPacienteMensual.objects.filter(mes__in=meses).delete()
+        CostoTratamientoMensual.objects.bulk_create([
+            CostoTratamientoMensual(
+                mes=fila['mes'], tipo_tratamiento=fila['tipo'], fichas=fila['cantidad'], costo=fila['total'],
+            )
+            for fila in por_tratamiento
+        ], batch_size=2000)
+        CostoPacienteMensual.objects.bulk_create([
+            CostoPacienteMensual(
+                mes=fila['mes'], paciente_id=fila['paciente_id'], fichas=fila['cantidad'], costo=fila['total'],
+            )
+            for fila in por_paciente
+        ], batch_size=2000)
+    logger.info(f"Costos de materiales recalculados para {len(meses)} meses ({meses[0]:%Y-%m} a {meses[-1]:%Y-%m})")
+
+
+def actualizar_costos():
+    """Recalcula los meses pendientes. Devuelve cuántos recalculó."""
+    meses = list(PeriodoCosto.objects.filter(pendiente=True).values_list('mes', flat=True))
+    recalcular_meses(meses)
+    return len(meses)
+
+
+def asegurar_meses(meses):
+    """Recalcula los meses de `meses` que no estén al día (pendientes o nunca calculados)."""
+    al_dia = set(PeriodoCosto.objects.filter(mes__in=meses, pendiente=False).values_list('mes', flat=True))
+    recalcular_meses([mes for mes in meses if mes not in al_dia])
+
+
+def costos_por_tratamiento(desde, hasta):
+    meses = meses_entre(desde, hasta)
+    asegurar_meses(meses)
+    return CostoTratamientoMensual.objects.filter(mes__in=meses).order_by('mes', '-costo', 'tipo_tratamiento')
+
+
+def costos_por_paciente(desde, hasta, paciente=None):
+    meses = meses_entre(desde, hasta)
+    asegurar_meses(meses)
+    costos = CostoPacienteMensual.objects.filter(mes__in=meses).select_related('paciente')
+    if paciente:
+        costos = costos.filter(paciente_id=paciente)
+    return costos.order_by('mes', '-costo', 'paciente_id')
+
+
+# Señales de FichaClinica (conectadas en InsumosConfig.ready)
+
+def ficha_guardada(sender, instance, **kwargs):
+    # La fecha y el costo anteriores los lee el pre_save de pacientes (pacientes/models.py)
+    from pacientes.models import fechas_ficha_cambiadas
+    marcar_meses_pendientes(fechas_ficha_cambiadas(instance))
+
+
+def ficha_eliminada(sender, instance, **kwargs):
+    marcar_meses_pendientes([sender._meta.get_field('fecha').to_python(instance.fecha)])
@@ -0,0 +1,210 @@
+"""
+Lotes de insumos: recepción en bloque y consumo FEFO (primero en vencer, primero en salir).
+
+El consumo bloquea los insumos en orden de id (el mismo orden en todas las
+transacciones, para no producir interbloqueos) y luego sus lotes con existencias
+en una sola consulta ordenada por insumo y vencimiento (índice `lote_fefo_idx`),
+con SELECT ... FOR UPDATE. Los lotes, movimientos e insumos se escriben con
+bulk_update/bulk_create, así que el costo no crece con la cantidad de lotes.
+
+Insumo.stock_actual sigue siendo el total e Insumo.fecha_vencimiento pasa a ser el
+vencimiento más próximo entre los lotes con existencias. Las existencias sin lote
+(stock de insumos que nunca tuvieron lotes) se consumen después de los lotes.
+
+Todo cambio del total pasa por los lotes para que su suma nunca supere a
+stock_actual: las salidas manuales y los ajustes a la baja (`ajustar_stock`) se
+descuentan en orden FEFO, y los ajustes al alza de un insumo con lotes crean un
+lote de ajuste sin vencimiento.
+"""
+from django.db import transaction
+from django.db.models import F, Min, Q, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from podoclinic.invalidacion import publicar_cambio
+
+from .models import Insumo, InsumoLote, MovimientoInsumo
+
+CODIGO_AJUSTE = 'AJUSTE'
+
+
+def orden_fefo():
+    # Los lotes sin vencimiento se consumen al final
+    return (F('fecha_vencimiento').asc(nulls_last=True), 'id')
+
+
+def _bloquear_insumos(ids):
+    return {insumo.pk: insumo for insumo in Insumo.objects.filter(pk__in=ids).order_by('id').select_for_update()}
+
+
+def _sincronizar_insumos(insumos):
+    """
+    Guarda stock_actual (ya calculado) y el vencimiento más próximo de los lotes con
+    existencias de `insumos`, en una agregación y un bulk_update, y avisa a las cachés.
+    """
+    proximos = dict(
+        InsumoLote.objects.filter(insumo_id__in=[insumo.pk for insumo in insumos])
+        .order_by().values('insumo_id')
+        .annotate(proximo=Min('fecha_vencimiento', filter=Q(cantidad_disponible__gt=0)))
+        .values_list('insumo_id', 'proximo')
+    )
+    ahora = timezone.now()
+    for insumo in insumos:
+        # Los insumos que nunca tuvieron lotes conservan su fecha de vencimiento
+        if insumo.pk in proximos:
+            insumo.fecha_vencimiento = proximos[insumo.pk]
+        insumo.ultima_actualizacion = ahora
+    Insumo.objects.bulk_update(insumos, ['stock_actual', 'fecha_vencimiento', 'ultima_actualizacion'])
+    # bulk_update no dispara las señales del bus de invalidación
+    for insumo in insumos:
+        publicar_cambio('insumos.insumo', str(insumo.pk))
+    publicar_cambio('insumos.insumo', 'alertas')
+
+
+def _descontar_lotes(cantidades):
+    """
+    Descuenta {insumo_id: cantidad} de los lotes con existencias en orden FEFO (con
+    los lotes bloqueados). Devuelve los lotes modificados y [(lote, cantidad usada)];
+    lo que no alcanza a salir de lotes queda en `cantidades`.
+    """
+    restante = sum(cantidades.values())
+    lotes, usos = [], []
+    fefo = (
+        InsumoLote.objects.filter(insumo_id__in=cantidades, cantidad_disponible__gt=0)
+        .order_by('insumo_id', *orden_fefo()).select_for_update()
+    )
+    for lote in fefo:
+        falta = cantidades[lote.insumo_id]
+        if not falta:
+            continue
+        usado = min(falta, lote.cantidad_disponible)
+        lote.cantidad_disponible -= usado
+        cantidades[lote.insumo_id] -= usado
+        restante -= usado
+        lotes.append(lote)
+        usos.append((lote, usado))
+        if not restante:
+            break
+    InsumoLote.objects.bulk_update(lotes, ['cantidad_disponible'])
+    return usos
+
+
+def _consumir(insumos, aplicados, motivo, usuario):
+    """Salidas FEFO de `aplicados` ({insumo_id: cantidad}) de `insumos` ya bloqueados."""
+    pendiente = dict(aplicados)
+    movimientos = [
+        MovimientoInsumo(insumo_id=lote.insumo_id, lote=lote, cantidad=usado, tipo_movimiento='salida',
+                         motivo=motivo, usuario=usuario)
+        for lote, usado in _descontar_lotes(pendiente)
+    ]
+    # Lo que no alcanzó a salir de lotes sale de las existencias sin lote
+    movimientos += [
+        MovimientoInsumo(insumo_id=pk, cantidad=falta, tipo_movimiento='salida', motivo=motivo, usuario=usuario)
+        for pk, falta in pendiente.items() if falta
+    ]
+    # bulk_create no dispara la señal actualizar_stock: el stock se ajusta aquí
+    MovimientoInsumo.objects.bulk_create(movimientos)
+    for pk, cantidad in aplicados.items():
+        insumos[pk].stock_actual -= cantidad
+    _sincronizar_insumos([insumos[pk] for pk in aplicados])
+
+
+def consumir_insumos(cantidades, motivo, usuario=None):
+    """
+    Descuenta `cantidades` ({insumo_id: cantidad}) de los lotes de cada insumo en
+    orden FEFO, con un movimiento de salida por lote usado. Los insumos que no
+    existen o no tienen stock suficiente se omiten. Devuelve {insumo_id: cantidad}
+    de los consumos aplicados.
+    """
+    with transaction.atomic():
+        insumos = _bloquear_insumos(cantidades)
+        aplicados = {
+            pk: cantidad for pk, cantidad in cantidades.items()
+            if pk in insumos and cantidad > 0 and insumos[pk].stock_actual >= cantidad
+        }
+        if aplicados:
+            _consumir(insumos, aplicados, motivo, usuario)
+    return aplicados
+
+
+def ajustar_stock(insumo_id, cantidad, motivo='Ajuste manual de stock', usuario=None):
+    """
+    Fija el stock total de un insumo en `cantidad` (>= 0). Una baja sale de los
+    lotes en orden FEFO; un alza entra en un lote de ajuste si el insumo maneja
+    lotes (si no, queda como existencia sin lote), con su movimiento de entrada.
+    Devuelve el insumo actualizado.
+    """
+    if cantidad < 0:
+        raise ValueError('El stock no puede ser negativo')
+    with transaction.atomic():
+        insumos = _bloquear_insumos([insumo_id])
+        if insumo_id not in insumos:
+            raise Insumo.DoesNotExist(f"No existe el insumo {insumo_id}")
+        insumo = insumos[insumo_id]
+        diferencia = cantidad - insumo.stock_actual
+        if diferencia < 0:
+            _consumir(insumos, {insumo_id: -diferencia}, motivo, usuario)
+        elif diferencia > 0:
+            lote = None
+            if InsumoLote.objects.filter(insumo_id=insumo_id).exists():
+                lote = InsumoLote.objects.create(
+                    insumo_id=insumo_id, codigo=CODIGO_AJUSTE, cantidad_inicial=diferencia,
+                    cantidad_disponible=diferencia,
+                )
+            MovimientoInsumo.objects.bulk_create([MovimientoInsumo(
+                insumo_id=insumo_id, lote=lote, cantidad=diferencia, tipo_movimiento='entrada',
+                motivo=motivo, usuario=usuario,
+            )])
+            insumo.stock_actual = cantidad
+            _sincronizar_insumos([insumo])
+    return insumo
+
+
+def registrar_salida(movimiento):
+    """
+    Aplica una salida registrada directamente (sin pasar por consumir_insumos, por
+    ejemplo desde el admin): descuenta el total y, en orden FEFO, los lotes.
+    """
+    with transaction.atomic():
+        insumos = _bloquear_insumos([movimiento.insumo_id])
+        insumo = insumos[movimiento.insumo_id]
+        if movimiento.lote_id:
+            InsumoLote.objects.filter(pk=movimiento.lote_id).update(
+                cantidad_disponible=Greatest(F('cantidad_disponible') - movimiento.cantidad, Value(0))
+            )
+        else:
+            _descontar_lotes({movimiento.insumo_id: movimiento.cantidad})
+        insumo.stock_actual -= movimiento.cantidad
+        _sincronizar_insumos([insumo])
+
+
+def recibir_lotes(lotes, usuario=None, motivo='Recepción de lotes'):
+    """
+    Registra en bloque la recepción de `lotes` (dicts con insumo (id), cantidad,
+    fecha_vencimiento y codigo opcionales): un bulk_create de lotes, uno de
+    movimientos de entrada y un bulk_update de los insumos. Devuelve los lotes creados.
+    """
+    with transaction.atomic():
+        insumos = _bloquear_insumos({lote['insumo'] for lote in lotes})
+        faltantes = {lote['insumo'] for lote in lotes} - set(insumos)
+        if faltantes:
+            raise Insumo.DoesNotExist(f"No existen los insumos {', '.join(map(str, sorted(faltantes)))}")
+
+        creados = InsumoLote.objects.bulk_create([
+            InsumoLote(
+                insumo_id=lote['insumo'], codigo=lote.get('codigo') or '', cantidad_inicial=lote['cantidad'],
+                cantidad_disponible=lote['cantidad'], fecha_vencimiento=lote.get('fecha_vencimiento'),
+            )
+            for lote in lotes
+        ])
+        MovimientoInsumo.objects.bulk_create([
+            MovimientoInsumo(
+                insumo_id=lote.insumo_id, lote=lote, cantidad=lote.cantidad_inicial, tipo_movimiento='entrada',
+                motivo=motivo, usuario=usuario,
+            )
+            for lote in creados
+        ])
+        for lote in creados:
+            insumos[lote.insumo_id].stock_actual += lote.cantidad_inicial
+        _sincronizar_insumos(list(insumos.values()))
+    return creados
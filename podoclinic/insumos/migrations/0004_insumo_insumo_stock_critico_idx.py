@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insumos', '0003_insumo_fecha_vencimiento_insumo_valor_unitario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='insumo',
+            index=models.Index(condition=models.Q(('stock_actual__lte', models.F('stock_critico'))), fields=['nombre'], name='insumo_stock_critico_idx'),
+        ),
+    ]
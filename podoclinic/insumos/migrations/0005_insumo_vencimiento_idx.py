@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insumos', '0004_insumo_insumo_stock_critico_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='insumo',
+            index=models.Index(condition=models.Q(('fecha_vencimiento__isnull', False)), fields=['fecha_vencimiento'], name='insumo_vencimiento_idx'),
+        ),
+    ]
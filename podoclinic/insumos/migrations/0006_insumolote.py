@@ -0,0 +1,52 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def crear_lotes_iniciales(apps, schema_editor):
+    """Un lote inicial por insumo con existencias, con su stock y vencimiento actuales."""
+    Insumo = apps.get_model('insumos', 'Insumo')
+    InsumoLote = apps.get_model('insumos', 'InsumoLote')
+    InsumoLote.objects.bulk_create([
+        InsumoLote(insumo_id=insumo_id, codigo='INICIAL', cantidad_inicial=stock,
+                   cantidad_disponible=stock, fecha_vencimiento=vencimiento)
+        for insumo_id, stock, vencimiento in Insumo.objects.filter(stock_actual__gt=0)
+        .values_list('id', 'stock_actual', 'fecha_vencimiento').iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insumos', '0005_insumo_vencimiento_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InsumoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(blank=True, max_length=50)),
+                ('cantidad_inicial', models.IntegerField()),
+                ('cantidad_disponible', models.IntegerField()),
+                ('fecha_vencimiento', models.DateField(blank=True, null=True)),
+                ('fecha_ingreso', models.DateTimeField(auto_now_add=True)),
+                ('insumo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='insumos.insumo')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movimientoinsumo',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='insumos.insumolote'),
+        ),
+        migrations.AddIndex(
+            model_name='insumolote',
+            index=models.Index(condition=models.Q(('cantidad_disponible__gt', 0)), fields=['insumo', 'fecha_vencimiento', 'id'], name='lote_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insumolote',
+            index=models.Index(condition=models.Q(('cantidad_disponible__gt', 0), ('fecha_vencimiento__isnull', False)), fields=['fecha_vencimiento'], name='lote_vencimiento_idx'),
+        ),
+        migrations.RunPython(crear_lotes_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insumos', '0006_insumolote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoInsumo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumo_diario', models.FloatField(help_text='Consumo medio diario en el período analizado')),
+                ('desviacion_diaria', models.FloatField(help_text='Desviación estándar del consumo diario')),
+                ('stock_seguridad', models.IntegerField()),
+                ('punto_reorden', models.IntegerField(help_text='Stock bajo el cual conviene reponer')),
+                ('nivel_objetivo', models.IntegerField(help_text='Stock al que se repone (cubre plazo de entrega y de cobertura)')),
+                ('dias_historia', models.IntegerField()),
+                ('fecha_calculo', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinsumo',
+            index=models.Index(condition=models.Q(('tipo_movimiento', 'salida')), fields=['fecha_movimiento', 'insumo'], name='movimiento_salida_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='pronosticoinsumo',
+            name='insumo',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pronostico', to='insumos.insumo'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('insumos', '0007_pronosticoinsumo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientoinsumo',
+            index=models.Index(fields=['-fecha_movimiento', '-id'], name='movimiento_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinsumo',
+            index=models.Index(fields=['insumo', '-fecha_movimiento', '-id'], name='movimiento_insumo_fecha_idx'),
+        ),
+    ]
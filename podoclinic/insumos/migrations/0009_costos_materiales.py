@@ -0,0 +1,50 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0007_ficha_fecha_idx'),
+        ('insumos', '0008_movimiento_historial_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodoCosto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(help_text='Primer día del mes', unique=True)),
+                ('pendiente', models.BooleanField(default=True)),
+                ('calculado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CostoTratamientoMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('tipo_tratamiento', models.CharField(blank=True, max_length=100)),
+                ('fichas', models.IntegerField()),
+                ('costo', models.DecimalField(decimal_places=0, max_digits=12)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes', 'tipo_tratamiento'], name='costo_tratamiento_mes_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CostoPacienteMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('fichas', models.IntegerField()),
+                ('costo', models.DecimalField(decimal_places=0, max_digits=12)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pacientes.paciente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['mes', '-costo'], name='costo_paciente_mes_idx'), models.Index(fields=['paciente', 'mes'], name='costo_paciente_idx')],
+            },
+        ),
+    ]
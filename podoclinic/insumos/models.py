@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
@@ -12,6 +13,20 @@ class Insumo(models.Model):
     fecha_vencimiento = models.DateField(null=True, blank=True, help_text="Fecha de vencimiento del insumo (opcional)")
     ultima_actualizacion = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # stock_critico: índice parcial con solo los insumos bajo el mínimo
+            models.Index(
+                fields=['nombre'], name='insumo_stock_critico_idx',
+                condition=models.Q(stock_actual__lte=models.F('stock_critico')),
+            ),
+            # Revisión de vencimientos: solo los insumos que tienen fecha de vencimiento
+            models.Index(
+                fields=['fecha_vencimiento'], name='insumo_vencimiento_idx',
+                condition=models.Q(fecha_vencimiento__isnull=False),
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.nombre} ({self.stock_actual} {self.unidad_medida})"
     
@@ -23,6 +38,37 @@ class Insumo(models.Model):
     def valor_unitario_formato(self):
         return f"${self.valor_unitario:,.0f}"
 
+class InsumoLote(models.Model):
+    """
+    Lote de un insumo con su propio vencimiento. Los consumos salen del lote que
+    vence primero (FEFO, ver insumos/lotes.py). Insumo.stock_actual sigue siendo el
+    total del insumo e Insumo.fecha_vencimiento, el vencimiento más próximo entre
+    sus lotes con existencias.
+    """
+    insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE, related_name='lotes')
+    codigo = models.CharField(max_length=50, blank=True)
+    cantidad_inicial = models.IntegerField()
+    cantidad_disponible = models.IntegerField()
+    fecha_vencimiento = models.DateField(null=True, blank=True)
+    fecha_ingreso = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Consumo FEFO: lotes con existencias de un insumo, del que vence primero al último
+            models.Index(
+                fields=['insumo', 'fecha_vencimiento', 'id'], name='lote_fefo_idx',
+                condition=models.Q(cantidad_disponible__gt=0),
+            ),
+            # Reportes de vencimiento por lote
+            models.Index(
+                fields=['fecha_vencimiento'], name='lote_vencimiento_idx',
+                condition=models.Q(cantidad_disponible__gt=0, fecha_vencimiento__isnull=False),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Lote {self.codigo or self.id} de {self.insumo.nombre} ({self.cantidad_disponible}, vence {self.fecha_vencimiento})"
+
 class MovimientoInsumo(models.Model):
     TIPOS = [
         ('entrada', 'Entrada'),
@@ -30,21 +76,100 @@ class MovimientoInsumo(models.Model):
     ]
     
     insumo = models.ForeignKey(Insumo, on_delete=models.CASCADE)
+    lote = models.ForeignKey(InsumoLote, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos')
     cantidad = models.IntegerField()
     tipo_movimiento = models.CharField(max_length=10, choices=TIPOS)
     motivo = models.CharField(max_length=200)
     fecha_movimiento = models.DateTimeField(auto_now_add=True)
     usuario = models.ForeignKey('usuarios.Usuario', on_delete=models.SET_NULL, null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            # Series de consumo (insumos/pronostico.py): solo las salidas, por fecha
+            models.Index(
+                fields=['fecha_movimiento', 'insumo'], name='movimiento_salida_fecha_idx',
+                condition=models.Q(tipo_movimiento='salida'),
+            ),
+            # Historial paginado por cursor (insumos/views.py), general y por insumo
+            models.Index(fields=['-fecha_movimiento', '-id'], name='movimiento_fecha_idx'),
+            models.Index(fields=['insumo', '-fecha_movimiento', '-id'], name='movimiento_insumo_fecha_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.get_tipo_movimiento_display()} de {self.cantidad} {self.insumo.unidad_medida} de {self.insumo.nombre}"
 
+class PronosticoInsumo(models.Model):
+    """
+    Pronóstico de consumo y punto de reorden de un insumo, calculado cada noche
+    desde el historial de salidas (ver insumos/pronostico.py).
+    """
+    insumo = models.OneToOneField(Insumo, on_delete=models.CASCADE, related_name='pronostico')
+    consumo_diario = models.FloatField(help_text="Consumo medio diario en el período analizado")
+    desviacion_diaria = models.FloatField(help_text="Desviación estándar del consumo diario")
+    stock_seguridad = models.IntegerField()
+    punto_reorden = models.IntegerField(help_text="Stock bajo el cual conviene reponer")
+    nivel_objetivo = models.IntegerField(help_text="Stock al que se repone (cubre plazo de entrega y de cobertura)")
+    dias_historia = models.IntegerField()
+    fecha_calculo = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Pronóstico de {self.insumo.nombre}: {self.consumo_diario:.2f}/día, reorden en {self.punto_reorden}"
+
+class PeriodoCosto(models.Model):
+    """
+    Mes con costos de materiales precalculados (CostoTratamientoMensual y
+    CostoPacienteMensual). `pendiente` se marca cuando cambia una ficha del mes y
+    el mes se recalcula en la próxima actualización (ver insumos/costos.py).
+    """
+    mes = models.DateField(unique=True, help_text="Primer día del mes")
+    pendiente = models.BooleanField(default=True)
+    calculado_en = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Costos de {self.mes:%Y-%m}{' (pendiente)' if self.pendiente else ''}"
+
+class CostoTratamientoMensual(models.Model):
+    """Costo de materiales de las fichas de un mes, por tipo de tratamiento ('' = ficha sin cita)."""
+    mes = models.DateField()
+    tipo_tratamiento = models.CharField(max_length=100, blank=True)
+    fichas = models.IntegerField()
+    costo = models.DecimalField(max_digits=12, decimal_places=0)
+    
+    class Meta:
+        indexes = [models.Index(fields=['mes', 'tipo_tratamiento'], name='costo_tratamiento_mes_idx')]
+    
+    def __str__(self):
+        return f"{self.tipo_tratamiento or 'Sin tratamiento'} {self.mes:%Y-%m}: ${self.costo:,.0f}"
+
+class CostoPacienteMensual(models.Model):
+    """Costo de materiales de las fichas de un mes, por paciente."""
+    mes = models.DateField()
+    paciente = models.ForeignKey('pacientes.Paciente', on_delete=models.CASCADE)
+    fichas = models.IntegerField()
+    costo = models.DecimalField(max_digits=12, decimal_places=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['mes', '-costo'], name='costo_paciente_mes_idx'),
+            models.Index(fields=['paciente', 'mes'], name='costo_paciente_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.paciente.nombre} {self.mes:%Y-%m}: ${self.costo:,.0f}"
+
 @receiver(post_save, sender=MovimientoInsumo)
 def actualizar_stock(sender, instance, created, **kwargs):
-    if created:
-        insumo = instance.insumo
-        if instance.tipo_movimiento == 'entrada':
-            insumo.stock_actual += instance.cantidad
-        else:  # salida
-            insumo.stock_actual -= instance.cantidad
-        insumo.save()
\ No newline at end of file
+    if not created:
+        return
+    if instance.tipo_movimiento == 'salida':
+        # Las salidas también descuentan los lotes (FEFO), no solo el total
+        from .lotes import registrar_salida
+        registrar_salida(instance)
+        instance.insumo.refresh_from_db(fields=['stock_actual', 'fecha_vencimiento'])
+        return
+    insumo = instance.insumo
+    # Incremento en la base (F): la instancia puede traer un stock desactualizado
+    # respecto de los lotes (insumos/lotes.py)
+    insumo.stock_actual = F('stock_actual') + instance.cantidad
+    insumo.save(update_fields=['stock_actual', 'ultima_actualizacion'])
+    insumo.refresh_from_db(fields=['stock_actual'])
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Pronóstico de consumo y sugerencias de reposición de insumos.
+
+El historial de salidas se lee como series diarias con un solo GROUP BY (insumo,
+día) sobre el índice parcial `movimiento_salida_fecha_idx`: la base devuelve a lo
+sumo una fila por insumo y día con consumo, sin importar cuántos movimientos haya.
+Las series se reducen en una pasada a suma y suma de cuadrados por insumo (los días
+sin consumo cuentan como cero), de donde salen la media y la desviación diaria. Un
+insumo con menos historia que el período se promedia sobre los días desde su primer
+movimiento, y los ajustes de inventario y las mermas no cuentan como consumo.
+
+Con plazo de entrega L y cobertura C (días, ver settings.PRONOSTICO_*):
+
+- stock de seguridad = Z * desviación * sqrt(L)
+- punto de reorden = consumo diario * L + stock de seguridad
+- nivel objetivo = consumo diario * (L + C) + stock de seguridad
+
+El resultado se guarda en PronosticoInsumo (tarea nocturna de Celery), que hace de
+caché entre procesos; la cantidad sugerida se calcula al leer, contra el stock actual.
+"""
+import logging
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Min, Q, Sum, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import Insumo, MovimientoInsumo, PronosticoInsumo
+
+logger = logging.getLogger(__name__)
+
+# Nivel de servicio de ~95%: probabilidad de no quedar sin stock durante la entrega
+Z_NIVEL_SERVICIO = 1.65
+
+# Salidas que no son consumo (motivo que empieza con alguno de estos prefijos):
+# los ajustes a la baja de `lotes.ajustar_stock` ('Ajuste manual de stock') y las mermas
+PREFIJOS_SIN_CONSUMO = ('ajuste', 'merma')
+
+
+def _dias(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def series_consumo(desde, hasta):
+    """
+    Consumo diario (insumo_id, día, total) de las salidas entre `desde` y `hasta`
+    (fechas locales, ambas incluidas), agregado en la base. Excluye ajustes y mermas.
+    """
+    sin_consumo = Q()
+    for prefijo in PREFIJOS_SIN_CONSUMO:
+        sin_consumo |= Q(motivo__istartswith=prefijo)
+    zona = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(desde, datetime.min.time()), zona)
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), datetime.min.time()), zona)
+    return (
+        MovimientoInsumo.objects
+        .filter(tipo_movimiento='salida', fecha_movimiento__gte=inicio, fecha_movimiento__lt=fin)
+        .exclude(sin_consumo)
+        .annotate(dia=TruncDate('fecha_movimiento', tzinfo=zona))
+        .order_by().values('insumo_id', 'dia')
+        .annotate(total=Sum('cantidad'))
+        .values_list('insumo_id', 'dia', 'total')
+    )
+
+
+def calcular_pronosticos(hoy=None, dias_historia=None):
+    """
+    Recalcula el pronóstico de todos los insumos con los `dias_historia` días
+    anteriores a `hoy` (o los días desde su primer movimiento, si son menos) y lo
+    guarda en PronosticoInsumo. Devuelve cuántos calculó.
+    """
+    hoy = hoy or timezone.localdate()
+    dias_historia = dias_historia or _dias('PRONOSTICO_DIAS_HISTORIA', 180)
+    entrega = _dias('PRONOSTICO_DIAS_ENTREGA', 7)
+    cobertura = _dias('PRONOSTICO_DIAS_COBERTURA', 30)
+
+    sumas = {}
+    for insumo_id, _, total in series_consumo(hoy - timedelta(days=dias_historia), hoy - timedelta(days=1)).iterator():
+        suma, cuadrados = sumas.get(insumo_id, (0, 0))
+        sumas[insumo_id] = (suma + total, cuadrados + total * total)
+
+    ahora = timezone.now()
+    pronosticos = []
+    insumos = Insumo.objects.annotate(primer_movimiento=Min('movimientoinsumo__fecha_movimiento'))
+    for insumo_id, primer_movimiento in insumos.values_list('id', 'primer_movimiento').iterator():
+        suma, cuadrados = sumas.get(insumo_id, (0, 0))
+        dias = dias_historia
+        if primer_movimiento:
+            # Un insumo nuevo no tuvo consumo antes de existir: no se cuentan esos días como cero
+            dias = max(min(dias_historia, (hoy - timezone.localtime(primer_movimiento).date()).days), 1)
+        media = suma / dias
+        desviacion = math.sqrt(max(cuadrados / dias - media * media, 0))
+        seguridad = math.ceil(Z_NIVEL_SERVICIO * desviacion * math.sqrt(entrega))
+        pronosticos.append(PronosticoInsumo(
+            insumo_id=insumo_id, consumo_diario=media, desviacion_diaria=desviacion,
+            stock_seguridad=seguridad,
+            punto_reorden=math.ceil(media * entrega) + seguridad,
+            nivel_objetivo=math.ceil(media * (entrega + cobertura)) + seguridad,
+            dias_historia=dias, fecha_calculo=ahora,
+        ))
+
+    PronosticoInsumo.objects.bulk_create(
+        pronosticos, batch_size=1000, update_conflicts=True, unique_fields=['insumo'],
+        update_fields=['consumo_diario', 'desviacion_diaria', 'stock_seguridad', 'punto_reorden',
+                       'nivel_objetivo', 'dias_historia', 'fecha_calculo'],
+    )
+    logger.info(f"Pronóstico de consumo calculado para {len(pronosticos)} insumos ({dias_historia} días de historial)")
+    return len(pronosticos)
+
+
+def sugerencias_reposicion(solo_reponer=False):
+    """
+    Insumos con su pronóstico y la cantidad sugerida a pedir: lo que falta para el
+    nivel objetivo cuando el stock actual llegó al punto de reorden (0 si no).
+    """
+    insumos = (
+        Insumo.objects.filter(pronostico__isnull=False).select_related('pronostico')
+        .annotate(cantidad_sugerida=Case(
+            When(stock_actual__lte=F('pronostico__punto_reorden'), pronostico__consumo_diario__gt=0,
+                 then=Greatest(F('pronostico__nivel_objetivo') - F('stock_actual'), Value(0))),
+            default=Value(0), output_field=IntegerField(),
+        ))
+        .order_by('-cantidad_sugerida', 'nombre')
+    )
+    if solo_reponer:
+        insumos = insumos.filter(cantidad_sugerida__gt=0)
+    return insumos
@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Insumo, MovimientoInsumo
+from .models import (
+    CostoPacienteMensual, CostoTratamientoMensual, Insumo, InsumoLote, MovimientoInsumo, PronosticoInsumo,
+)
 
 class InsumoSerializer(serializers.ModelSerializer):
     en_stock_critico = serializers.ReadOnlyField()
@@ -15,4 +17,56 @@ class MovimientoInsumoSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = MovimientoInsumo
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class InsumoLoteSerializer(serializers.ModelSerializer):
+    insumo_nombre = serializers.ReadOnlyField(source='insumo.nombre')
+    
+    class Meta:
+        model = InsumoLote
+        fields = '__all__'
+
+class RecepcionLoteSerializer(serializers.Serializer):
+    """Un lote recibido; `recibir_lotes` acepta una lista de estos."""
+    insumo = serializers.IntegerField()
+    cantidad = serializers.IntegerField(min_value=1)
+    fecha_vencimiento = serializers.DateField(required=False, allow_null=True)
+    codigo = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+class PronosticoInsumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PronosticoInsumo
+        exclude = ['id', 'insumo']
+
+class SugerenciaReposicionSerializer(serializers.ModelSerializer):
+    """Insumo con su pronóstico y la cantidad sugerida (anotada por `sugerencias_reposicion`)."""
+    pronostico = PronosticoInsumoSerializer(read_only=True)
+    cantidad_sugerida = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Insumo
+        fields = ['id', 'nombre', 'unidad_medida', 'stock_actual', 'stock_critico', 'pronostico', 'cantidad_sugerida']
+
+class CostoTratamientoMensualSerializer(serializers.ModelSerializer):
+    tratamiento_nombre = serializers.SerializerMethodField()
+    costo_promedio = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = CostoTratamientoMensual
+        fields = ['mes', 'tipo_tratamiento', 'tratamiento_nombre', 'fichas', 'costo', 'costo_promedio']
+    
+    def get_tratamiento_nombre(self, obj):
+        from citas.models import Tratamiento
+        if not obj.tipo_tratamiento:
+            return 'Sin tratamiento'
+        return dict(Tratamiento.TIPOS_TRATAMIENTO).get(obj.tipo_tratamiento, obj.tipo_tratamiento)
+    
+    def get_costo_promedio(self, obj):
+        return round(obj.costo / obj.fichas) if obj.fichas else 0
+
+class CostoPacienteMensualSerializer(serializers.ModelSerializer):
+    paciente_nombre = serializers.ReadOnlyField(source='paciente.nombre')
+    
+    class Meta:
+        model = CostoPacienteMensual
+        fields = ['mes', 'paciente', 'paciente_nombre', 'fichas', 'costo']
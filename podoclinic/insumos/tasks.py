@@ -0,0 +1,60 @@
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mail
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def revisar_alertas_insumos(dias=None):
+    """
+    Tarea programada (diaria) que revisa el stock crítico y los vencimientos de
+    insumos, y envía el resumen a ALERTAS_INSUMOS_CORREOS si hay algo que avisar.
+    """
+    from insumos.alertas import DIAS_VENCIMIENTO, calcular_alertas
+
+    alertas = calcular_alertas(dias if dias is not None else DIAS_VENCIMIENTO)
+    lineas = []
+    for titulo, clave in (('Vencidos', 'vencidos'), ('Por vencer', 'por_vencer')):
+        lineas += [f"{titulo}: {i['nombre']} ({i['stock_actual']} {i['unidad_medida']}), vence el {i['fecha_vencimiento']}"
+                   for i in alertas[clave]]
+    lineas += [f"Stock crítico: {i['nombre']} ({i['stock_actual']} de mínimo {i['stock_critico']} {i['unidad_medida']})"
+               for i in alertas['stock_critico']]
+
+    resumen = (f"{len(alertas['vencidos'])} vencidos, {len(alertas['por_vencer'])} por vencer, "
+               f"{len(alertas['stock_critico'])} en stock crítico")
+    logger.info(f"Alertas de insumos: {resumen}")
+
+    destinatarios = getattr(settings, 'ALERTAS_INSUMOS_CORREOS', [])
+    if lineas and destinatarios:
+        try:
+            send_mail(
+                subject=f"Alertas de inventario - PodoClinic ({resumen})",
+                message="\n".join(lineas),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=destinatarios,
+                fail_silently=False,
+            )
+        except Exception as e:
+            logger.error(f"Error al enviar alertas de insumos: {str(e)}")
+    return resumen
+
+@shared_task
+def calcular_pronosticos_insumos(dias_historia=None):
+    """
+    Tarea programada (nocturna) que recalcula el pronóstico de consumo y los puntos
+    de reorden de todos los insumos (insumos/pronostico.py).
+    """
+    from insumos.pronostico import calcular_pronosticos
+
+    return calcular_pronosticos(dias_historia=dias_historia)
+
+@shared_task
+def actualizar_costos_materiales():
+    """
+    Tarea programada que recalcula los costos de materiales de los meses con fichas
+    nuevas o modificadas desde la última ejecución (insumos/costos.py).
+    """
+    from insumos.costos import actualizar_costos
+
+    return actualizar_costos()
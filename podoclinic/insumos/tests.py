@@ -1,3 +1,507 @@
-from django.test import TestCase
+from datetime import datetime, time, timedelta
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from podoclinic import invalidacion
+from podoclinic.testing import PlanConsultaMixin, PresupuestoConsultasMixin
+from usuarios.models import Usuario
+from .alertas import insumos_por_vencer
+from .costos import valorizacion_stock
+from .lotes import consumir_insumos, recibir_lotes
+from .models import Insumo, MovimientoInsumo, PeriodoCosto, PronosticoInsumo
+from .tasks import actualizar_costos_materiales, calcular_pronosticos_insumos, revisar_alertas_insumos
+
+
+class InsumosQueryBudgetTest(PresupuestoConsultasMixin, TestCase):
+    """Los endpoints de insumos no deben ejecutar más consultas al crecer los datos."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='bodega', password='clave-segura-123')
+        self.client.force_authenticate(self.usuario)
+        self.secuencia = count()
+
+    def _sembrar_insumos(self, cantidad):
+        # La mitad queda en stock crítico
+        Insumo.objects.bulk_create([
+            Insumo(nombre=f'Insumo {i}', unidad_medida='unidad', stock_actual=i % 2 * 10, stock_critico=5)
+            for i in (next(self.secuencia) for _ in range(cantidad))
+        ])
+
+    def test_listado_insumos(self):
+        self.assertConsultasConstantes(self._sembrar_insumos, '/api/insumos/')
+
+    def test_stock_critico(self):
+        self.assertConsultasConstantes(self._sembrar_insumos, '/api/insumos/stock_critico/')
+
+
+class StockCriticoPlanConsultaTest(PlanConsultaMixin, TestCase):
+    """La consulta de stock crítico debe usar el índice parcial con muchos insumos."""
+
+    def test_stock_critico_usa_indice(self):
+        # 1 de cada 100 insumos bajo el mínimo
+        Insumo.objects.bulk_create([
+            Insumo(nombre=f'Insumo {i}', unidad_medida='unidad',
+                   stock_actual=0 if i % 100 == 0 else 50, stock_critico=5)
+            for i in range(20000)
+        ], batch_size=2000)
+        self.analizar_tablas(Insumo)
+        self.assertUsaIndice(Insumo.objects.filter(stock_actual__lte=F('stock_critico')))
+
+    def test_vencimientos_usan_indice(self):
+        # 1 de cada 100 insumos con fecha de vencimiento
+        hoy = timezone.localdate()
+        Insumo.objects.bulk_create([
+            Insumo(nombre=f'Insumo {i}', unidad_medida='unidad', stock_actual=50,
+                   fecha_vencimiento=hoy + timedelta(days=i % 400) if i % 100 == 0 else None)
+            for i in range(20000)
+        ], batch_size=2000)
+        self.analizar_tablas(Insumo)
+        self.assertUsaIndice(insumos_por_vencer(30, hoy))
+
+
+class AlertasInsumosTest(TestCase):
+    """Alertas de stock crítico y vencimientos, cacheadas hasta el próximo movimiento de stock."""
+
+    URL = '/api/insumos/alertas/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='bodega', password='clave-segura-123'))
+        hoy = timezone.localdate()
+        crear = lambda nombre, **datos: Insumo.objects.create(nombre=nombre, unidad_medida='unidad', **datos)
+        self.critico = crear('Gasa', stock_actual=2, stock_critico=5)
+        self.por_vencer = crear('Alcohol', stock_actual=10, fecha_vencimiento=hoy + timedelta(days=10))
+        self.vencido = crear('Povidona', stock_actual=10, fecha_vencimiento=hoy - timedelta(days=1))
+        crear('Crema', stock_actual=10, fecha_vencimiento=hoy + timedelta(days=60))
+        crear('Agotado', stock_actual=0, stock_critico=0, fecha_vencimiento=hoy - timedelta(days=5))
+        for parche in (mock.patch.object(invalidacion.escucha, 'iniciar', return_value=True),
+                       mock.patch('podoclinic.invalidacion._publicar')):
+            parche.start()
+            self.addCleanup(parche.stop)
+        self.addCleanup(invalidacion.invalidar_todo)
+
+    def _nombres(self, datos, clave):
+        return [insumo['nombre'] for insumo in datos[clave]]
+
+    def _alertas(self, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.URL, params)
+
+    def test_listas_de_alertas(self):
+        response = self._alertas(dias=30)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._nombres(response.data, 'stock_critico'), ['Agotado', 'Gasa'])
+        self.assertEqual(self._nombres(response.data, 'vencidos'), ['Povidona'])
+        self.assertEqual(self._nombres(response.data, 'por_vencer'), ['Alcohol'])
+        self.assertEqual(self._nombres(self._alertas(dias=90).data, 'por_vencer'), ['Alcohol', 'Crema'])
+        self.assertEqual(self._alertas(dias='x').status_code, 400)
+        self.assertEqual(self._alertas(dias=1000).status_code, 400)
+
+    def test_cache_invalidada_por_movimientos(self):
+        self._alertas()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._nombres(self._alertas().data, 'stock_critico'), ['Agotado', 'Gasa'])
+        with self.assertNumQueries(0):
+            self.client.get('/api/insumos/stock_critico/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInsumo.objects.create(insumo=self.critico, cantidad=10, tipo_movimiento='entrada', motivo='compra')
+        self.assertEqual(self._nombres(self._alertas().data, 'stock_critico'), ['Agotado'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Insumo.objects.filter(pk=self.vencido.pk).first().delete()
+        self.assertEqual(self._nombres(self._alertas().data, 'vencidos'), [])
+
+    @override_settings(ALERTAS_INSUMOS_CORREOS=['bodega@example.com'])
+    def test_resumen_diario(self):
+        self.assertEqual(revisar_alertas_insumos(), '1 vencidos, 1 por vencer, 2 en stock crítico')
+        self.assertEqual(mail.outbox[0].to, ['bodega@example.com'])
+        self.assertIn('Vencidos: Povidona', mail.outbox[0].body)
+
+
+class LotesInsumosTest(TestCase):
+    """Recepción de lotes y consumo FEFO con escrituras en bloque."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='bodega', password='clave-segura-123')
+        self.client.force_authenticate(self.usuario)
+        self.hoy = timezone.localdate()
+        self.gasa = Insumo.objects.create(nombre='Gasa', unidad_medida='unidad', stock_actual=0)
+        self.alcohol = Insumo.objects.create(nombre='Alcohol', unidad_medida='ml', stock_actual=0)
+
+    def _recibir(self, *lotes):
+        return recibir_lotes([
+            {'insumo': insumo.pk, 'cantidad': cantidad, 'fecha_vencimiento': vence, 'codigo': codigo}
+            for insumo, cantidad, vence, codigo in lotes
+        ], usuario=self.usuario)
+
+    def _disponible(self, insumo):
+        return dict(insumo.lotes.values_list('codigo', 'cantidad_disponible'))
+
+    def test_recepcion_actualiza_totales(self):
+        response = self.client.post('/api/insumos/recibir_lotes/', {'lotes': [
+            {'insumo': self.gasa.pk, 'cantidad': 10, 'fecha_vencimiento': str(self.hoy + timedelta(days=90)), 'codigo': 'G1'},
+            {'insumo': self.gasa.pk, 'cantidad': 5, 'fecha_vencimiento': str(self.hoy + timedelta(days=20)), 'codigo': 'G2'},
+            {'insumo': self.alcohol.pk, 'cantidad': 500},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 3)
+        self.gasa.refresh_from_db()
+        self.assertEqual(self.gasa.stock_actual, 15)
+        self.assertEqual(self.gasa.fecha_vencimiento, self.hoy + timedelta(days=20))
+        self.alcohol.refresh_from_db()
+        self.assertEqual((self.alcohol.stock_actual, self.alcohol.fecha_vencimiento), (500, None))
+        self.assertEqual(MovimientoInsumo.objects.filter(tipo_movimiento='entrada', lote__isnull=False).count(), 3)
+
+        lotes = self.client.get(f'/api/insumos/{self.gasa.pk}/lotes/')
+        self.assertEqual([lote['codigo'] for lote in lotes.data], ['G2', 'G1'])
+
+        self.assertEqual(self.client.post('/api/insumos/recibir_lotes/', {'lotes': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/insumos/recibir_lotes/', {
+            'lotes': [{'insumo': 999999, 'cantidad': 1}]}, format='json').status_code, 400)
+
+    def test_consumo_fefo(self):
+        self._recibir(
+            (self.gasa, 4, None, 'SIN-VENC'),
+            (self.gasa, 5, self.hoy + timedelta(days=60), 'TARDE'),
+            (self.gasa, 3, self.hoy + timedelta(days=5), 'PRONTO'),
+        )
+        self.assertEqual(consumir_insumos({self.gasa.pk: 6}, motivo='uso'), {self.gasa.pk: 6})
+        self.assertEqual(self._disponible(self.gasa), {'PRONTO': 0, 'TARDE': 2, 'SIN-VENC': 4})
+        self.gasa.refresh_from_db()
+        self.assertEqual(self.gasa.stock_actual, 6)
+        self.assertEqual(self.gasa.fecha_vencimiento, self.hoy + timedelta(days=60))
+        salidas = MovimientoInsumo.objects.filter(tipo_movimiento='salida').order_by('id')
+        self.assertEqual([(m.lote.codigo, m.cantidad) for m in salidas], [('PRONTO', 3), ('TARDE', 3)])
+
+        # Sin stock suficiente no se consume nada
+        self.assertEqual(consumir_insumos({self.gasa.pk: 7}, motivo='uso'), {})
+        self.gasa.refresh_from_db()
+        self.assertEqual(self.gasa.stock_actual, 6)
+
+    def test_existencias_sin_lote_se_consumen_al_final(self):
+        self._recibir((self.gasa, 2, self.hoy + timedelta(days=5), 'L1'))
+        MovimientoInsumo.objects.create(insumo=self.gasa, cantidad=3, tipo_movimiento='entrada', motivo='ajuste')
+        self.assertEqual(consumir_insumos({self.gasa.pk: 4}, motivo='uso'), {self.gasa.pk: 4})
+        salidas = MovimientoInsumo.objects.filter(tipo_movimiento='salida').order_by('id')
+        self.assertEqual([(m.lote_id is not None, m.cantidad) for m in salidas], [(True, 2), (False, 2)])
+        self.gasa.refresh_from_db()
+        self.assertEqual(self.gasa.stock_actual, 1)
+
+    def test_ajustes_de_stock_pasan_por_los_lotes(self):
+        self._recibir(
+            (self.gasa, 5, self.hoy + timedelta(days=60), 'TARDE'),
+            (self.gasa, 3, self.hoy + timedelta(days=5), 'PRONTO'),
+        )
+
+        def comprobar(stock, disponible):
+            self.gasa.refresh_from_db()
+            self.assertEqual(self.gasa.stock_actual, stock)
+            self.assertEqual(self._disponible(self.gasa), disponible)
+
+        # Salida registrada directamente: sale de los lotes en orden FEFO
+        MovimientoInsumo.objects.create(insumo=self.gasa, cantidad=4, tipo_movimiento='salida', motivo='merma')
+        comprobar(4, {'PRONTO': 0, 'TARDE': 4})
+        self.assertEqual(self.gasa.fecha_vencimiento, self.hoy + timedelta(days=60))
+
+        url = f'/api/insumos/{self.gasa.pk}/actualizar_stock/'
+        self.assertEqual(self.client.patch(url, {'cantidad': 2}, format='json').status_code, 200)
+        comprobar(2, {'PRONTO': 0, 'TARDE': 2})
+        response = self.client.patch(url, {'cantidad': 6}, format='json')
+        self.assertEqual(response.data['stock_actual'], 6)
+        comprobar(6, {'PRONTO': 0, 'TARDE': 2, 'AJUSTE': 4})
+        self.assertEqual(self.client.patch(url, {'cantidad': -1}, format='json').status_code, 400)
+
+        # Editar stock_actual del insumo también es un ajuste
+        response = self.client.patch(f'/api/insumos/{self.gasa.pk}/', {'stock_actual': 1, 'stock_critico': 2},
+                                     format='json')
+        self.assertEqual((response.status_code, response.data['stock_actual']), (200, 1))
+        comprobar(1, {'PRONTO': 0, 'TARDE': 0, 'AJUSTE': 1})
+        self.assertEqual(self.gasa.stock_critico, 2)
+        self.assertEqual(self.client.patch(f'/api/insumos/{self.gasa.pk}/', {'stock_actual': -3},
+                                           format='json').status_code, 400)
+        ajustes = MovimientoInsumo.objects.filter(motivo='Ajuste manual de stock', usuario=self.usuario)
+        self.assertEqual(sorted(ajustes.values_list('tipo_movimiento', 'cantidad')),
+                         [('entrada', 4), ('salida', 2), ('salida', 2), ('salida', 3)])
+
+    def test_consultas_no_crecen_con_los_lotes(self):
+        def medir(cantidad_lotes):
+            insumos = [Insumo.objects.create(nombre=f'I{cantidad_lotes}-{i}', unidad_medida='unidad') for i in range(3)]
+            self._recibir(*[
+                (insumo, 1, self.hoy + timedelta(days=dia), f'L{dia}')
+                for insumo in insumos for dia in range(cantidad_lotes)
+            ])
+            with CaptureQueriesContext(connection) as consultas:
+                consumir_insumos({insumo.pk: cantidad_lotes for insumo in insumos}, motivo='uso')
+            return len(consultas)
+
+        self.assertEqual(medir(2), medir(20))
+
+    def test_ficha_consume_lotes(self):
+        from pacientes.models import FichaClinica, Paciente
+
+        self._recibir(
+            (self.gasa, 5, self.hoy + timedelta(days=60), 'TARDE'),
+            (self.gasa, 2, self.hoy + timedelta(days=5), 'PRONTO'),
+        )
+        paciente = Paciente.objects.create(nombre='Ana', rut='11111111-1', telefono='1', correo='')
+        response = self.client.post('/api/pacientes/fichas/', {
+            'paciente': paciente.pk, 'fecha': str(self.hoy), 'descripcion_atencion': 'control',
+            'procedimiento': 'curación', 'indicaciones': 'reposo',
+            'productos_usados': [{'insumo': self.gasa.pk, 'cantidad': 3}, {'insumo': self.alcohol.pk, 'cantidad': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        ficha = FichaClinica.objects.get(pk=response.data['id'])
+        # El alcohol no tiene stock: se omite
+        self.assertEqual(list(ficha.productos_usados.values_list('insumo_id', 'cantidad')), [(self.gasa.pk, 3)])
+        self.assertEqual(self._disponible(self.gasa), {'PRONTO': 0, 'TARDE': 4})
+
+
+@override_settings(PRONOSTICO_DIAS_HISTORIA=10, PRONOSTICO_DIAS_ENTREGA=7, PRONOSTICO_DIAS_COBERTURA=30)
+class PronosticoInsumosTest(TestCase):
+    """Pronóstico de consumo desde las series diarias de salidas y cantidades sugeridas."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='bodega', password='clave-segura-123'))
+        self.hoy = timezone.localdate()
+        crear = lambda nombre, stock: Insumo.objects.create(nombre=nombre, unidad_medida='unidad', stock_actual=stock)
+        self.constante = crear('Gasa', 10)
+        self.esporadico = crear('Alcohol', 100)
+        self.sin_uso = crear('Crema', 3)
+
+    def _movimientos(self, insumo, dias_atras, cantidad, tipo='salida', motivo='uso'):
+        """Movimientos sin la señal de stock, con la fecha (local, 12:00) de hace `dias_atras` días."""
+        for dia in dias_atras:
+            fecha = timezone.make_aware(datetime.combine(self.hoy - timedelta(days=dia), time(12)))
+            [movimiento] = MovimientoInsumo.objects.bulk_create([
+                MovimientoInsumo(insumo=insumo, cantidad=cantidad, tipo_movimiento=tipo, motivo=motivo)
+            ])
+            MovimientoInsumo.objects.filter(pk=movimiento.pk).update(fecha_movimiento=fecha)
+
+    def _sembrar(self):
+        # 2 por día durante los 10 días del historial
+        self._movimientos(self.constante, range(1, 11), 2)
+        self._movimientos(self.constante, [0], 50)  # Hoy: fuera del historial
+        self._movimientos(self.constante, [3], 40, tipo='entrada')
+        self._movimientos(self.esporadico, [4], 10)
+        self._movimientos(self.esporadico, [11], 500)  # Antes del historial
+
+    def test_puntos_de_reorden(self):
+        self._sembrar()
+        self.assertEqual(calcular_pronosticos_insumos(), 3)
+        constante = PronosticoInsumo.objects.get(insumo=self.constante)
+        self.assertEqual((constante.consumo_diario, constante.desviacion_diaria), (2, 0))
+        self.assertEqual((constante.stock_seguridad, constante.punto_reorden, constante.nivel_objetivo), (0, 14, 74))
+        # Media 1 y desviación 3: seguridad = ceil(1.65 * 3 * sqrt(7)) = 14
+        esporadico = PronosticoInsumo.objects.get(insumo=self.esporadico)
+        self.assertAlmostEqual(esporadico.desviacion_diaria, 3)
+        self.assertEqual((esporadico.stock_seguridad, esporadico.punto_reorden, esporadico.nivel_objetivo), (14, 21, 51))
+        self.assertEqual(PronosticoInsumo.objects.get(insumo=self.sin_uso).punto_reorden, 0)
+
+        response = self.client.get('/api/insumos/reposicion/')
+        self.assertEqual(response.status_code, 200)
+        sugeridas = {insumo['nombre']: insumo['cantidad_sugerida'] for insumo in response.data}
+        self.assertEqual(sugeridas, {'Gasa': 64, 'Alcohol': 0, 'Crema': 0})
+        self.assertEqual(response.data[0]['pronostico']['punto_reorden'], 14)
+        response = self.client.get('/api/insumos/reposicion/', {'solo_reponer': 'true'})
+        self.assertEqual([insumo['nombre'] for insumo in response.data], ['Gasa'])
+
+    def test_insumo_nuevo_sin_ajustes_ni_mermas(self):
+        # Comprado hace 4 días: se promedia sobre esos días, no sobre los 10 del historial
+        nuevo = Insumo.objects.create(nombre='Venda', unidad_medida='unidad', stock_actual=20)
+        self._movimientos(nuevo, [4], 30, tipo='entrada')
+        self._movimientos(nuevo, range(1, 5), 2)
+        self._movimientos(nuevo, [2], 5, motivo='Ajuste manual de stock')
+        self._movimientos(nuevo, [1], 3, motivo='Merma o ajuste de inventario')
+        self._movimientos(self.constante, range(1, 11), 2)
+        calcular_pronosticos_insumos()
+        pronostico = PronosticoInsumo.objects.get(insumo=nuevo)
+        self.assertEqual((pronostico.consumo_diario, pronostico.desviacion_diaria, pronostico.dias_historia), (2, 0, 4))
+        self.assertEqual(PronosticoInsumo.objects.get(insumo=self.constante).dias_historia, 10)
+        self.assertEqual(PronosticoInsumo.objects.get(insumo=self.sin_uso).dias_historia, 10)
+
+    def test_recalculo_actualiza_y_consultas_fijas(self):
+        calcular_pronosticos_insumos()
+        self._sembrar()
+        # Series agregadas + insumos con su primer movimiento + un upsert, sin importar los movimientos
+        with self.assertNumQueries(3):
+            calcular_pronosticos_insumos()
+        self.assertEqual(PronosticoInsumo.objects.count(), 3)
+        self.assertEqual(PronosticoInsumo.objects.get(insumo=self.constante).punto_reorden, 14)
+
+
+class MovimientosInsumoTest(TestCase):
+    """Historial de movimientos paginado por cursor y resumen por período."""
+
+    URL = '/api/insumos/movimientos/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='bodega', password='clave-segura-123')
+        self.client.force_authenticate(self.usuario)
+        self.gasa = Insumo.objects.create(nombre='Gasa', unidad_medida='unidad')
+        self.alcohol = Insumo.objects.create(nombre='Alcohol', unidad_medida='ml')
+        # Lunes 2 de junio de 2025 y los días siguientes, a mediodía local
+        self.inicio = timezone.make_aware(datetime(2025, 6, 2, 12))
+
+    def _sembrar(self, dias, insumo=None, **datos):
+        movimientos = MovimientoInsumo.objects.bulk_create([
+            MovimientoInsumo(insumo=insumo or self.gasa, usuario=self.usuario, motivo='uso',
+                             **{'cantidad': 1, 'tipo_movimiento': 'salida', **datos})
+            for _ in dias
+        ])
+        for movimiento, dia in zip(movimientos, dias):
+            MovimientoInsumo.objects.filter(pk=movimiento.pk).update(fecha_movimiento=self.inicio + timedelta(days=dia))
+
+    def _recorrer(self, params):
+        """Ids de todas las páginas, siguiendo `next`, y la cantidad de consultas de cada página."""
+        ids, consultas, url = [], [], self.URL
+        while url:
+            with CaptureQueriesContext(connection) as capturadas:
+                response = self.client.get(url, params if url == self.URL else None)
+            self.assertEqual(response.status_code, 200)
+            consultas.append(len(capturadas))
+            ids += [movimiento['id'] for movimiento in response.data['results']]
+            url = response.data['next']
+        return ids, consultas
+
+    def test_paginacion_por_cursor(self):
+        self._sembrar(range(12))
+        self._sembrar(range(5), insumo=self.alcohol, tipo_movimiento='entrada', cantidad=3)
+        ids, consultas = self._recorrer({'page_size': 5})
+        esperados = list(MovimientoInsumo.objects.order_by('-fecha_movimiento', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperados)
+        # Sin N+1 por insumo_nombre/usuario_nombre: las páginas cuestan lo mismo
+        self.assertEqual(len(set(consultas)), 1)
+
+        response = self.client.get(self.URL, {'insumo': self.alcohol.pk})
+        self.assertEqual([m['insumo_nombre'] for m in response.data['results']], ['Alcohol'] * 5)
+        self.assertEqual(response.data['results'][0]['usuario_nombre'], self.usuario.get_full_name())
+        response = self.client.get(self.URL, {'tipo_movimiento': 'salida', 'desde': '2025-06-05', 'hasta': '2025-06-06'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_resumen_por_periodo(self):
+        self._sembrar([0, 0, 1, 7, 30])
+        self._sembrar([1, 8], tipo_movimiento='entrada', cantidad=10)
+        response = self.client.get(f'{self.URL}resumen/', {'periodo': 'dia', 'hasta': '2025-06-03'})
+        self.assertEqual([(str(f['inicio']), f['entradas'], f['salidas'], f['neto']) for f in response.data],
+                         [('2025-06-02', 0, 2, -2), ('2025-06-03', 10, 1, 9)])
+        response = self.client.get(f'{self.URL}resumen/', {'periodo': 'semana'})
+        self.assertEqual([(str(f['inicio']), f['movimientos']) for f in response.data],
+                         [('2025-06-02', 4), ('2025-06-09', 2), ('2025-06-30', 1)])
+        response = self.client.get(f'{self.URL}resumen/', {'periodo': 'mes', 'tipo_movimiento': 'salida'})
+        self.assertEqual([(str(f['inicio']), f['salidas']) for f in response.data],
+                         [('2025-06-01', 4), ('2025-07-01', 1)])
+        self.assertEqual(self.client.get(f'{self.URL}resumen/', {'periodo': 'año'}).status_code, 400)
+
+
+class CostosMaterialesTest(TestCase):
+    """Valorización del stock y costos de materiales por mes, recalculados solo en los meses con cambios."""
+
+    URL = '/api/insumos/costos/'
+
+    def setUp(self):
+        from citas.models import Cita, Tratamiento
+        from pacientes.models import FichaClinica, Paciente
+
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='bodega', password='clave-segura-123'))
+        general = Tratamiento.objects.create(nombre='general', precio=20000)
+        hongos = Tratamiento.objects.create(nombre='hongos', precio=25000)
+        self.ana = Paciente.objects.create(nombre='Ana', rut='11111111-1', telefono='1', correo='')
+        self.luis = Paciente.objects.create(nombre='Luis', rut='22222222-2', telefono='2', correo='')
+
+        def ficha(paciente, fecha, costo, tratamiento=None):
+            cita = None
+            if tratamiento:
+                [cita] = Cita.objects.bulk_create([Cita(paciente=paciente, tratamiento=tratamiento, fecha=fecha,
+                                                        hora=time(10), estado='completada')])
+            return FichaClinica.objects.create(
+                paciente=paciente, cita=cita, fecha=fecha, descripcion_atencion='-', procedimiento='-',
+                indicaciones='-', costo_total=costo,
+            )
+
+        ficha(self.ana, datetime(2025, 5, 20).date(), 700, general)
+        self.junio = ficha(self.ana, datetime(2025, 6, 3).date(), 1000, general)
+        ficha(self.ana, datetime(2025, 6, 10).date(), 3000, hongos)
+        ficha(self.luis, datetime(2025, 6, 12).date(), 2000, general)
+        ficha(self.luis, datetime(2025, 6, 30).date(), 500)
+
+    def _costos(self, **params):
+        response = self.client.get(self.URL, {'desde': '2025-05', 'hasta': '2025-06', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_costos_por_tratamiento_y_paciente(self):
+        filas = [(str(f['mes']), f['tratamiento_nombre'], f['fichas'], f['costo'], f['costo_promedio'])
+                 for f in self._costos()]
+        self.assertEqual(filas, [
+            ('2025-05-01', 'Podología general', 1, '700', 700),
+            ('2025-06-01', 'Podología general', 2, '3000', 1500),
+            ('2025-06-01', 'Uñas con hongos (Onicomicosis)', 1, '3000', 3000),
+            ('2025-06-01', 'Sin tratamiento', 1, '500', 500),
+        ])
+        filas = [(str(f['mes']), f['paciente_nombre'], f['costo']) for f in self._costos(agrupar='paciente')]
+        self.assertEqual(filas, [('2025-05-01', 'Ana', '700'), ('2025-06-01', 'Ana', '4000'), ('2025-06-01', 'Luis', '2500')])
+        self.assertEqual(len(self._costos(agrupar='paciente', paciente=self.luis.pk)), 1)
+
+        for params in ({'agrupar': 'insumo'}, {'desde': '2025-13'}, {'desde': '2025-07'}, {'desde': '2020-01'}):
+            self.assertEqual(self.client.get(self.URL, {'desde': '2025-05', 'hasta': '2025-06', **params}).status_code, 400)
+
+    def test_recalculo_incremental(self):
+        self._costos()
+        # Meses al día: solo se leen los agregados
+        with self.assertNumQueries(2):
+            self._costos()
+        self.assertEqual(actualizar_costos_materiales(), 0)
+
+        self.junio.costo_total = 1500
+        self.junio.save(update_fields=['costo_total'])
+        self.assertEqual(list(PeriodoCosto.objects.filter(pendiente=True).values_list('mes', flat=True)),
+                         [datetime(2025, 6, 1).date()])
+        self.assertEqual(actualizar_costos_materiales(), 1)
+        self.assertEqual(self._costos()[1]['costo'], '3500')
+
+        # Guardar sin cambiar la fecha ni el costo no deja meses pendientes
+        self.junio.indicaciones = 'Control en un mes'
+        self.junio.save()
+        self.assertFalse(PeriodoCosto.objects.filter(pendiente=True).exists())
+
+        # Cambiar la ficha de mes deja pendientes el mes anterior y el nuevo; la fila
+        # anterior se lee una sola vez para costos y reportes
+        self.junio.fecha = datetime(2025, 5, 31).date()
+        with CaptureQueriesContext(connection) as consultas:
+            self.junio.save()
+        lecturas = [q['sql'] for q in consultas.captured_queries
+                    if q['sql'].startswith('SELECT') and 'pacientes_fichaclinica' in q['sql']]
+        self.assertEqual(len(lecturas), 1)
+        self.assertEqual(PeriodoCosto.objects.filter(pendiente=True).count(), 2)
+        self.assertEqual([(str(f['mes']), f['fichas'], f['costo']) for f in self._costos()][:2],
+                         [('2025-05-01', 2, '2200'), ('2025-06-01', 1, '3000')])
+
+        self.junio.delete()
+        self.assertEqual(self._costos()[0]['costo'], '700')
+
+    def test_valorizacion(self):
+        hoy = timezone.localdate()
+        gasa = Insumo.objects.create(nombre='Gasa', unidad_medida='unidad', valor_unitario=100)
+        Insumo.objects.create(nombre='Agotado', unidad_medida='unidad', valor_unitario=900)
+        recibir_lotes([
+            {'insumo': gasa.pk, 'cantidad': 10, 'fecha_vencimiento': hoy + timedelta(days=10)},
+            {'insumo': gasa.pk, 'cantidad': 5, 'fecha_vencimiento': hoy + timedelta(days=90)},
+        ])
+        valor = valorizacion_stock(30, hoy)
+        self.assertEqual((valor['total'], valor['unidades'], valor['insumos'], valor['por_vencer']), (1500, 15, 1, 1000))
+        response = self.client.get('/api/insumos/valorizacion/')
+        self.assertEqual(response.data['total'], 1500)
@@ -1,8 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import InsumoViewSet
+from .views import InsumoViewSet, MovimientoInsumoViewSet
 
 router = DefaultRouter()
+# Antes que el prefijo vacío, para que 'movimientos' no se lea como id de insumo
+router.register(r'movimientos', MovimientoInsumoViewSet)
 router.register(r'', InsumoViewSet)
 
 urlpatterns = [
@@ -1,11 +1,25 @@
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
 from django.shortcuts import render
+from django.utils import timezone
+from django_filters import rest_framework as filters
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import F
-from .models import Insumo
-from .serializers import InsumoSerializer
+from .alertas import DIAS_VENCIMIENTO, MAX_DIAS_VENCIMIENTO, alertas_insumos
+from .costos import MAX_MESES_COSTOS, costos_por_paciente, costos_por_tratamiento, meses_entre, valorizacion_stock
+from .lotes import ajustar_stock, orden_fefo, recibir_lotes
+from .models import Insumo, MovimientoInsumo
+from .pronostico import sugerencias_reposicion
+from .serializers import (
+    CostoPacienteMensualSerializer, CostoTratamientoMensualSerializer, InsumoLoteSerializer, InsumoSerializer, MovimientoInsumoSerializer, RecepcionLoteSerializer,
+    SugerenciaReposicionSerializer,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,25 +35,21 @@ class InsumoViewSet(viewsets.ModelViewSet):
         serializer.save()
 
     def perform_update(self, serializer):
-        serializer.save()
+        # Un cambio de stock_actual es un ajuste: pasa por los lotes y deja su movimiento
+        stock = serializer.validated_data.pop('stock_actual', None)
+        if stock is not None and stock < 0:
+            raise ValidationError({'stock_actual': ['El stock no puede ser negativo']})
+        with transaction.atomic():
+            insumo = serializer.save()
+            if stock is not None and stock != insumo.stock_actual:
+                ajustado = ajustar_stock(insumo.pk, stock, usuario=self.request.user)
+                insumo.stock_actual, insumo.fecha_vencimiento = ajustado.stock_actual, ajustado.fecha_vencimiento
 
     @action(detail=False, methods=['get'])
     def stock_critico(self, request):
         try:
-            # Obtener todos los insumos para debug
-            todos_insumos = Insumo.objects.all()
-            logger.info(f"Total de insumos: {todos_insumos.count()}")
-            
-            # Obtener insumos críticos
-            insumos_criticos = Insumo.objects.filter(stock_actual__lte=F('stock_critico'))
-            logger.info(f"Insumos críticos encontrados: {insumos_criticos.count()}")
-            
-            # Log de cada insumo para debug
-            for insumo in insumos_criticos:
-                logger.info(f"Insumo crítico: {insumo.nombre} - Stock actual: {insumo.stock_actual} - Stock crítico: {insumo.stock_critico}")
-            
-            serializer = self.get_serializer(insumos_criticos, many=True)
-            return Response(serializer.data)
+            # Misma lista que las alertas (caché local; una consulta sobre el índice parcial)
+            return Response(alertas_insumos()['stock_critico'])
         except Exception as e:
             logger.error(f"Error al obtener insumos críticos: {str(e)}")
             return Response(
@@ -47,6 +57,92 @@ class InsumoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def alertas(self, request):
+        """
+        Alertas de inventario: insumos en stock crítico, vencidos y por vencer en los
+        próximos `?dias=` (30 por defecto). Se cachea hasta el próximo cambio de stock.
+        """
+        try:
+            dias = int(request.query_params.get('dias', DIAS_VENCIMIENTO))
+        except ValueError:
+            return Response({'error': 'dias debe ser un número entero'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= dias <= MAX_DIAS_VENCIMIENTO:
+            return Response(
+                {'error': f'dias debe estar entre 0 y {MAX_DIAS_VENCIMIENTO}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(alertas_insumos(dias))
+
+    @action(detail=False, methods=['get'])
+    def reposicion(self, request):
+        """
+        Pronóstico de consumo y cantidad sugerida a pedir de cada insumo, según el
+        último cálculo nocturno. Con `?solo_reponer=true`, solo los que hay que pedir.
+        """
+        solo_reponer = request.query_params.get('solo_reponer', '').lower() in ('1', 'true')
+        insumos = sugerencias_reposicion(solo_reponer)
+        return Response(SugerenciaReposicionSerializer(insumos, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def valorizacion(self, request):
+        """Valor del inventario (stock × valor unitario) y de los lotes por vencer en 30 días."""
+        return Response(valorizacion_stock(DIAS_VENCIMIENTO))
+
+    @action(detail=False, methods=['get'])
+    def costos(self, request):
+        """
+        Costo de materiales por mes, agrupado por `?agrupar=` tratamiento (por defecto)
+        o paciente (opcionalmente `&paciente=<id>`), entre `?desde=` y `?hasta=` (AAAA-MM;
+        por defecto, los últimos 12 meses). Se lee de los agregados mensuales.
+        """
+        agrupar = request.query_params.get('agrupar', 'tratamiento')
+        if agrupar not in ('tratamiento', 'paciente'):
+            return Response({'error': 'agrupar debe ser tratamiento o paciente'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            hasta = datetime.strptime(request.query_params['hasta'], '%Y-%m').date() \
+                if 'hasta' in request.query_params else timezone.localdate().replace(day=1)
+            desde = datetime.strptime(request.query_params['desde'], '%Y-%m').date() \
+                if 'desde' in request.query_params else (hasta - timedelta(days=334)).replace(day=1)
+            paciente = int(request.query_params['paciente']) if 'paciente' in request.query_params else None
+        except ValueError:
+            return Response({'error': 'Use desde/hasta con formato AAAA-MM y un id de paciente numérico'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < len(meses_entre(desde, hasta)) <= MAX_MESES_COSTOS:
+            return Response({'error': f'El rango debe abarcar entre 1 y {MAX_MESES_COSTOS} meses'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if agrupar == 'tratamiento':
+            return Response(CostoTratamientoMensualSerializer(costos_por_tratamiento(desde, hasta), many=True).data)
+        return Response(CostoPacienteMensualSerializer(costos_por_paciente(desde, hasta, paciente), many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def lotes(self, request, pk=None):
+        """Lotes con existencias del insumo, en el orden en que se consumen (FEFO)."""
+        lotes = (
+            self.get_object().lotes.filter(cantidad_disponible__gt=0)
+            .select_related('insumo').order_by(*orden_fefo())
+        )
+        return Response(InsumoLoteSerializer(lotes, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def recibir_lotes(self, request):
+        """
+        Recepción de mercadería: crea varios lotes (de uno o más insumos) con sus
+        movimientos de entrada en una sola transacción. Cuerpo: {"lotes": [{insumo,
+        cantidad, fecha_vencimiento, codigo}, ...], "motivo": opcional}.
+        """
+        serializer = RecepcionLoteSerializer(data=request.data.get('lotes'), many=True, allow_empty=False)
+        serializer.is_valid(raise_exception=True)
+        try:
+            lotes = recibir_lotes(
+                serializer.validated_data, usuario=request.user,
+                motivo=request.data.get('motivo') or 'Recepción de lotes',
+            )
+        except Insumo.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(InsumoLoteSerializer(lotes, many=True).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['patch'])
     def actualizar_stock(self, request, pk=None):
         insumo = self.get_object()
@@ -60,12 +156,85 @@ class InsumoViewSet(viewsets.ModelViewSet):
             
         try:
             cantidad = int(cantidad)
-            insumo.stock_actual = cantidad
-            insumo.save()
-            serializer = self.get_serializer(insumo)
-            return Response(serializer.data)
-        except ValueError:
+        except (TypeError, ValueError):
             return Response(
                 {'error': 'La cantidad debe ser un número entero'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        try:
+            # Baja en orden FEFO desde los lotes; alza en un lote de ajuste
+            insumo = ajustar_stock(insumo.pk, cantidad, usuario=request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(insumo)
+        return Response(serializer.data)
+
+class MovimientoInsumoPagination(CursorPagination):
+    """
+    Paginación por cursor (keyset) del historial: cada página es un rango del índice
+    (fecha_movimiento, id), así que el costo no crece al avanzar en el historial.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-fecha_movimiento', '-id')
+
+class MovimientoInsumoFilter(filters.FilterSet):
+    # Días locales completos, como rango de fecha_movimiento para usar los índices
+    desde = filters.DateFilter(method='filtrar_desde')
+    hasta = filters.DateFilter(method='filtrar_hasta')
+    
+    class Meta:
+        model = MovimientoInsumo
+        fields = ['insumo', 'tipo_movimiento', 'usuario', 'lote']
+
+    @staticmethod
+    def _inicio_dia(fecha):
+        return timezone.make_aware(datetime.combine(fecha, time.min))
+
+    def filtrar_desde(self, queryset, name, value):
+        return queryset.filter(fecha_movimiento__gte=self._inicio_dia(value))
+
+    def filtrar_hasta(self, queryset, name, value):
+        return queryset.filter(fecha_movimiento__lt=self._inicio_dia(value + timedelta(days=1)))
+
+class MovimientoInsumoViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Historial de movimientos de inventario (solo lectura: los movimientos se
+    registran con las acciones de stock y lotes de InsumoViewSet).
+    """
+    # El serializer lee el nombre del insumo y del usuario: cargarlos en la misma consulta
+    queryset = MovimientoInsumo.objects.select_related('insumo', 'usuario')
+    serializer_class = MovimientoInsumoSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = MovimientoInsumoPagination
+    filterset_class = MovimientoInsumoFilter
+
+    PERIODOS = {'dia': TruncDay, 'semana': TruncWeek, 'mes': TruncMonth}
+
+    @action(detail=False, methods=['get'])
+    def resumen(self, request):
+        """
+        Totales de entradas y salidas por `?periodo=` (dia, semana o mes), agregados
+        en la base. Acepta los mismos filtros que el listado.
+        """
+        periodo = request.query_params.get('periodo', 'dia')
+        if periodo not in self.PERIODOS:
+            return Response(
+                {'error': f"periodo debe ser uno de: {', '.join(self.PERIODOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        truncar = self.PERIODOS[periodo]('fecha_movimiento', tzinfo=timezone.get_current_timezone())
+        filas = (
+            self.filter_queryset(MovimientoInsumo.objects.all())
+            .annotate(inicio=truncar).order_by('inicio').values('inicio')
+            .annotate(
+                entradas=Sum('cantidad', filter=Q(tipo_movimiento='entrada'), default=0),
+                salidas=Sum('cantidad', filter=Q(tipo_movimiento='salida'), default=0),
+                movimientos=Count('id'),
+            )
+        )
+        return Response([
+            {**fila, 'inicio': timezone.localtime(fila['inicio']).date(), 'neto': fila['entradas'] - fila['salidas']}
+            for fila in filas
+        ])
@@ -0,0 +1,199 @@
+"""
+Fotos clínicas de las fichas: subida por partes, variantes y limpieza.
+
+Subida: se crea el AdjuntoFicha con el nombre, tipo y tamaño del archivo (estado
+'subiendo'); el cliente envía partes de hasta TAMANO_PARTE bytes, que se guardan
+como archivos sueltos en el almacenamiento configurado (así funciona igual en
+disco que en S3, que no permite agregar datos a un archivo); al completar, las
+partes se unen en el original, se verifica que sea una imagen y se encola la
+tarea `procesar_adjunto_ficha`.
+
+Variantes: la tarea (en el pool de workers de Celery, fuera de la petición)
+genera la miniatura y la versión web en JPEG, con la orientación de la cámara
+aplicada y sin metadatos EXIF (ubicación, equipo, fecha). El listado de fichas
+solo expone la miniatura; el original se conserva tal como se subió y solo se
+entrega como descarga explícita.
+
+Los archivos de un adjunto no cambian después de procesados, así que se sirven
+con caché de larga duración (CACHE_ADJUNTOS) y ETag.
+"""
+import logging
+import math
+import tempfile
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import AdjuntoFicha
+
+logger = logging.getLogger(__name__)
+
+TAMANO_PARTE = 5 * 1024 * 1024
+MAX_TAMANO_ADJUNTO = 30 * 1024 * 1024
+# tipo de contenido: (formato de Pillow, extensión del original)
+TIPOS_CONTENIDO = {'image/jpeg': ('JPEG', '.jpg'), 'image/png': ('PNG', '.png'), 'image/webp': ('WEBP', '.webp')}
+
+# variante: lado mayor en píxeles y calidad JPEG
+VARIANTES = {
+    'miniatura': (320, 80),
+    'web': (1600, 85),
+}
+
+CACHE_ADJUNTOS = 'private, max-age=31536000, immutable'
+
+# Horas tras las que una subida sin completar se descarta
+HORAS_SUBIDA = 24
+
+
+def total_partes(adjunto):
+    return max(1, math.ceil(adjunto.tamano / TAMANO_PARTE))
+
+
+def _directorio_partes(adjunto):
+    return f'fichas_adjuntos/partes/{adjunto.id}'
+
+
+def _ruta_parte(adjunto, numero):
+    return f'{_directorio_partes(adjunto)}/{numero:05d}'
+
+
+def iniciar_subida(ficha, nombre, tipo_contenido, tamano, tipo='otro', descripcion=''):
+    """Crea el adjunto que recibirá las partes. Lanza ValueError si el archivo no se acepta."""
+    if tipo_contenido not in TIPOS_CONTENIDO:
+        raise ValueError(f"Tipo de archivo no permitido. Use: {', '.join(TIPOS_CONTENIDO)}")
+    if not 0 < tamano <= MAX_TAMANO_ADJUNTO:
+        raise ValueError(f"El tamaño debe estar entre 1 y {MAX_TAMANO_ADJUNTO} bytes")
+    if tipo not in dict(AdjuntoFicha.TIPOS):
+        raise ValueError(f"Tipo de adjunto no válido: {tipo}")
+    return AdjuntoFicha.objects.create(
+        ficha=ficha, nombre_original=nombre[:200], tipo_contenido=tipo_contenido, tamano=tamano,
+        tipo=tipo, descripcion=descripcion[:200],
+    )
+
+
+def guardar_parte(adjunto, numero, archivo):
+    """Guarda la parte `numero` (desde 0). Reenviar una parte la reemplaza."""
+    if adjunto.estado != 'subiendo':
+        raise ValueError('La subida de este adjunto ya se completó')
+    partes = total_partes(adjunto)
+    if not 0 <= numero < partes:
+        raise ValueError(f"Número de parte fuera de rango (0 a {partes - 1})")
+    esperado = TAMANO_PARTE if numero < partes - 1 else adjunto.tamano - TAMANO_PARTE * (partes - 1)
+    if archivo.size != esperado:
+        raise ValueError(f"La parte {numero} debe tener {esperado} bytes")
+    ruta = _ruta_parte(adjunto, numero)
+    default_storage.delete(ruta)
+    default_storage.save(ruta, archivo)
+
+
+def _borrar_partes(adjunto):
+    directorio = _directorio_partes(adjunto)
+    if default_storage.exists(directorio):
+        for nombre in default_storage.listdir(directorio)[1]:
+            default_storage.delete(f'{directorio}/{nombre}')
+
+
+def completar_subida(adjunto):
+    """
+    Une las partes en el original, verifica que sea una imagen del tipo declarado
+    y encola la generación de variantes. Lanza ValueError si faltan partes o el
+    archivo no es válido.
+    """
+    from .tasks import procesar_adjunto_ficha
+
+    if adjunto.estado != 'subiendo':
+        raise ValueError('La subida de este adjunto ya se completó')
+    faltantes = [numero for numero in range(total_partes(adjunto))
+                 if not default_storage.exists(_ruta_parte(adjunto, numero))]
+    if faltantes:
+        raise ValueError(f"Faltan partes: {', '.join(map(str, faltantes))}")
+
+    # Las partes se copian a un temporal (en memoria hasta TAMANO_PARTE) para verificarlo y guardarlo
+    with tempfile.SpooledTemporaryFile(max_size=TAMANO_PARTE) as temporal:
+        for numero in range(total_partes(adjunto)):
+            with default_storage.open(_ruta_parte(adjunto, numero), 'rb') as parte:
+                for bloque in iter(lambda: parte.read(1024 * 1024), b''):
+                    temporal.write(bloque)
+        temporal.seek(0)
+        try:
+            with Image.open(temporal) as imagen:
+                formato = imagen.format
+                imagen.verify()
+        except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+            formato = None
+        formato_esperado, extension = TIPOS_CONTENIDO[adjunto.tipo_contenido]
+        if formato != formato_esperado:
+            # Las partes se borran con el adjunto (señal adjunto_eliminado)
+            adjunto.delete()
+            raise ValueError('El archivo no es una imagen válida del tipo declarado')
+        temporal.seek(0)
+        adjunto.original.save(f'original{extension}', File(temporal), save=False)
+
+    adjunto.estado = 'procesando'
+    adjunto.save(update_fields=['original', 'estado'])
+    _borrar_partes(adjunto)
+    transaction.on_commit(lambda: procesar_adjunto_ficha.delay(adjunto.id))
+    return adjunto
+
+
+def _jpeg(imagen, lado, calidad):
+    variante = imagen.copy()
+    variante.thumbnail((lado, lado), Image.LANCZOS)
+    salida = BytesIO()
+    # Sin exif=...: el JPEG resultante no lleva metadatos
+    variante.save(salida, 'JPEG', quality=calidad, optimize=True, progressive=True)
+    return salida.getvalue()
+
+
+def generar_variantes(adjunto):
+    """Genera la miniatura y la versión web del original, sin EXIF, y deja el adjunto 'listo'."""
+    try:
+        with adjunto.original.open('rb') as original, Image.open(original) as imagen:
+            # La orientación EXIF se aplica a los píxeles antes de descartar los metadatos
+            imagen = ImageOps.exif_transpose(imagen)
+            if imagen.mode != 'RGB':
+                fondo = Image.new('RGB', imagen.size, 'white')
+                con_alfa = imagen.convert('RGBA')
+                fondo.paste(con_alfa, mask=con_alfa.getchannel('A'))
+                imagen = fondo
+            adjunto.ancho, adjunto.alto = imagen.size
+            for variante, (lado, calidad) in VARIANTES.items():
+                campo = getattr(adjunto, variante)
+                if campo:
+                    campo.delete(save=False)
+                campo.save(f'{variante}.jpg', ContentFile(_jpeg(imagen, lado, calidad)), save=False)
+        adjunto.estado = 'listo'
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.error(f"No se pudieron generar las variantes del adjunto {adjunto.id}: {str(e)}")
+        adjunto.estado = 'error'
+    adjunto.save(update_fields=['miniatura', 'web', 'ancho', 'alto', 'estado'])
+    return adjunto.estado
+
+
+def borrar_archivos(adjunto):
+    for campo in (adjunto.original, adjunto.miniatura, adjunto.web):
+        if campo:
+            campo.delete(save=False)
+    _borrar_partes(adjunto)
+
+
+def depurar_subidas(ahora=None):
+    """Elimina las subidas que quedaron sin completar por más de HORAS_SUBIDA horas."""
+    limite = (ahora or timezone.now()) - timedelta(hours=HORAS_SUBIDA)
+    abandonados = list(AdjuntoFicha.objects.filter(estado='subiendo', fecha_creacion__lt=limite))
+    for adjunto in abandonados:
+        adjunto.delete()
+    return len(abandonados)
+
+
+# Señal de AdjuntoFicha (conectada en PacientesConfig.ready)
+
+def adjunto_eliminado(sender, instance, **kwargs):
+    """Los archivos se borran del almacenamiento después de confirmar la eliminación."""
+    transaction.on_commit(lambda: borrar_archivos(instance))
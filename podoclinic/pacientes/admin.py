@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Paciente, FichaClinica, UsoProductoEnFicha
+from .models import Paciente, FichaClinica, UsoProductoEnFicha, AdjuntoFicha
 
 @admin.register(UsoProductoEnFicha)
 class UsoProductoEnFichaAdmin(admin.ModelAdmin):
@@ -20,3 +20,10 @@ class FichaClinicaAdmin(admin.ModelAdmin):
     list_filter = ('fecha',)
     search_fields = ('paciente__nombre', 'descripcion_atencion')
     raw_id_fields = ('paciente', 'cita')
+
+@admin.register(AdjuntoFicha)
+class AdjuntoFichaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'ficha', 'tipo', 'estado', 'nombre_original', 'tamano', 'fecha_creacion')
+    list_filter = ('tipo', 'estado')
+    search_fields = ('ficha__paciente__nombre', 'nombre_original', 'descripcion')
+    raw_id_fields = ('ficha',)
@@ -4,3 +4,24 @@ from django.apps import AppConfig
 class PacientesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pacientes'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save, pre_save
+        from podoclinic.invalidacion import registrar_modelo
+        from .adjuntos import adjunto_eliminado
+        from .busqueda import ficha_eliminada, ficha_guardada, paciente_guardado
+        from .models import AdjuntoFicha, FichaClinica, Paciente, ficha_por_guardar
+
+        # Bus de invalidación de cachés locales: el RUT puede cambiar, así que se invalida todo
+        registrar_modelo(Paciente)
+
+        # Los archivos de una foto se borran del almacenamiento junto con el adjunto
+        post_delete.connect(adjunto_eliminado, sender=AdjuntoFicha, dispatch_uid='adjunto_eliminado')
+
+        # Fecha y costo guardados de la ficha, leídos una vez para reportes y costos
+        pre_save.connect(ficha_por_guardar, sender=FichaClinica, dispatch_uid='ficha_por_guardar')
+
+        # Documentos de la búsqueda de texto completo (pacientes/busqueda.py)
+        post_save.connect(ficha_guardada, sender=FichaClinica, dispatch_uid='busqueda_ficha_guardada')
+        post_save.connect(paciente_guardado, sender=Paciente, dispatch_uid='busqueda_paciente_guardado')
+        post_delete.connect(ficha_eliminada, sender=FichaClinica, dispatch_uid='busqueda_ficha_eliminada')
@@ -0,0 +1,240 @@
+"""
+Búsqueda de texto completo en las notas clínicas: descripción, procedimiento e
+indicaciones de las fichas, y enfermedad de base y caso clínico de los pacientes.
+
+Cada ficha o paciente con texto tiene un DocumentoBusqueda, que se actualiza con
+señales al guardar (y se borra al eliminar). Para recargar todo, por ejemplo
+después de cargas masivas con bulk_create: `manage.py indexar_busqueda`.
+
+- PostgreSQL: el documento guarda un tsvector con la configuración 'spanish'
+  (raíces, sin palabras vacías) y pesos por campo, indexado con GIN
+  (`documento_busqueda_vector_idx`). La consulta usa la sintaxis de
+  websearch_to_tsquery ("frase exacta", -excluir, or), se ordena con ts_rank y
+  los fragmentos salen de ts_headline.
+- Otras bases (SQLite en desarrollo): un índice invertido en TerminoBusqueda con
+  los términos normalizados (minúsculas, sin tildes, sin plurales simples ni
+  palabras vacías) y su peso en el documento. Todos los términos de la consulta
+  deben aparecer; la relevancia es la suma de sus pesos.
+
+Los fragmentos se devuelven como HTML escapado, con los términos encontrados
+entre <b> y </b>.
+"""
+import html
+import logging
+import re
+import unicodedata
+from functools import reduce
+from operator import add
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, TextField, Value
+
+from .models import DocumentoBusqueda, FichaClinica, Paciente, TerminoBusqueda
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACION = 'spanish'
+
+# Pesos de ts_rank por defecto para A, B y C; el índice invertido usa los mismos
+PESOS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+# Campos indexados de cada modelo y su peso
+CAMPOS_FICHA = (('procedimiento', 'A'), ('descripcion_atencion', 'B'), ('indicaciones', 'C'))
+CAMPOS_PACIENTE = (('enfermedad_base', 'A'), ('caso_clinico', 'B'))
+
+PALABRAS_FRAGMENTO = 30
+
+PALABRAS_VACIAS = frozenset("""
+    a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellos
+    en entre era es esa ese eso esta estas este esto estos fue ha hay la las le les lo los mas me mi muy nada ni
+    no nos o otra otras otro otros para pero poco por porque que quien se sea ser si sin sobre su sus tambien
+    te todo todos tu un una uno unos y ya yo
+""".split())
+
+_PALABRA = re.compile(r'\w+')
+# Marcas de inicio y fin de coincidencia, reemplazadas por <b> y </b> después de escapar
+_INICIO, _FIN = '\x02', '\x03'
+
+
+def usa_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def normalizar(palabra):
+    """Minúsculas y sin tildes (la ñ se conserva), sin plurales simples."""
+    palabra = palabra.lower().replace('ñ', '\x00')
+    palabra = ''.join(c for c in unicodedata.normalize('NFKD', palabra) if not unicodedata.combining(c))
+    palabra = palabra.replace('\x00', 'ñ')
+    if len(palabra) > 4 and palabra.endswith('es'):
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith('s'):
+        return palabra[:-1]
+    return palabra
+
+
+def terminos(texto):
+    """Términos indexables de `texto`, en orden de aparición (con repeticiones)."""
+    resultado = []
+    for palabra in _PALABRA.findall(texto or ''):
+        termino = normalizar(palabra)
+        if len(termino) > 1 and termino not in PALABRAS_VACIAS:
+            resultado.append(termino[:50])
+    return resultado
+
+
+def _secciones(instancia, campos):
+    return [(texto.strip(), peso) for texto, peso in ((getattr(instancia, campo) or '', peso) for campo, peso in campos)
+            if texto.strip()]
+
+
+def indexar(tipo, objeto_id, paciente_id, fecha, secciones):
+    """Crea, actualiza o borra (si no hay texto) el documento de búsqueda de un objeto."""
+    if not secciones:
+        DocumentoBusqueda.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+        return None
+    datos = {'paciente_id': paciente_id, 'fecha': fecha, 'contenido': '\n'.join(texto for texto, _ in secciones)}
+    if usa_postgres():
+        datos['vector'] = reduce(add, [
+            SearchVector(Value(texto, output_field=TextField()), weight=peso, config=CONFIGURACION)
+            for texto, peso in secciones
+        ])
+    with transaction.atomic():
+        documento, _ = DocumentoBusqueda.objects.update_or_create(tipo=tipo, objeto_id=objeto_id, defaults=datos)
+        if not usa_postgres():
+            pesos = {}
+            for texto, peso in secciones:
+                for termino in terminos(texto):
+                    pesos[termino] = pesos.get(termino, 0) + PESOS[peso]
+            documento.terminos.all().delete()
+            TerminoBusqueda.objects.bulk_create(
+                [TerminoBusqueda(documento=documento, termino=termino, peso=peso) for termino, peso in pesos.items()],
+                batch_size=500,
+            )
+    return documento
+
+
+def indexar_ficha(ficha):
+    return indexar('ficha', ficha.id, ficha.paciente_id, ficha.fecha, _secciones(ficha, CAMPOS_FICHA))
+
+
+def indexar_paciente(paciente):
+    return indexar('paciente', paciente.id, paciente.id, None, _secciones(paciente, CAMPOS_PACIENTE))
+
+
+def reindexar(tamano_bloque=500):
+    """Reconstruye todos los documentos de búsqueda. Devuelve cuántos objetos revisó."""
+    total = 0
+    for modelo, indexador, campos in ((FichaClinica, indexar_ficha, CAMPOS_FICHA),
+                                      (Paciente, indexar_paciente, CAMPOS_PACIENTE)):
+        columnas = ['paciente', 'fecha'] if modelo is FichaClinica else []
+        objetos = modelo.objects.only(*columnas, *(campo for campo, _ in campos)).order_by('id')
+        bloque = []
+        for objeto in objetos.iterator(chunk_size=tamano_bloque):
+            bloque.append(objeto)
+            if len(bloque) >= tamano_bloque:
+                with transaction.atomic():
+                    for elemento in bloque:
+                        indexador(elemento)
+                total += len(bloque)
+                bloque = []
+        with transaction.atomic():
+            for elemento in bloque:
+                indexador(elemento)
+        total += len(bloque)
+    # Documentos de objetos que ya no existen (eliminados con queryset.delete() sin señales)
+    for tipo, modelo in (('ficha', FichaClinica), ('paciente', Paciente)):
+        DocumentoBusqueda.objects.filter(tipo=tipo).exclude(objeto_id__in=modelo.objects.values('id')).delete()
+    logger.info(f"Índice de búsqueda reconstruido: {total} objetos revisados")
+    return total
+
+
+def buscar(consulta, tipo=None, paciente=None):
+    """
+    Documentos que coinciden con `consulta`, anotados con `relevancia` y ordenados
+    de más a menos relevante. Lanza ValueError si la consulta no tiene términos.
+    """
+    if not terminos(consulta):
+        raise ValueError('La búsqueda no tiene términos válidos')
+    if usa_postgres():
+        busqueda = SearchQuery(consulta, config=CONFIGURACION, search_type='websearch')
+        documentos = DocumentoBusqueda.objects.filter(vector=busqueda).annotate(
+            relevancia=SearchRank(F('vector'), busqueda),
+        )
+    else:
+        buscados = sorted(set(terminos(consulta)))
+        documentos = DocumentoBusqueda.objects.filter(terminos__termino__in=buscados).annotate(
+            coincidencias=Count('terminos'), relevancia=Sum('terminos__peso'),
+        ).filter(coincidencias=len(buscados))
+    if tipo:
+        documentos = documentos.filter(tipo=tipo)
+    if paciente:
+        documentos = documentos.filter(paciente_id=paciente)
+    return documentos.select_related('paciente').order_by('-relevancia', F('fecha').desc(nulls_last=True), '-id')
+
+
+def _html(fragmento):
+    return html.escape(fragmento).replace(_INICIO, '<b>').replace(_FIN, '</b>')
+
+
+def _fragmento_local(contenido, buscados):
+    palabras = list(_PALABRA.finditer(contenido))
+    if not palabras:
+        return ''
+    coincide = [normalizar(palabra.group()) in buscados for palabra in palabras]
+    primera = coincide.index(True) if True in coincide else 0
+    inicio = max(0, primera - PALABRAS_FRAGMENTO // 3)
+    fin = min(len(palabras), inicio + PALABRAS_FRAGMENTO)
+    partes, posicion = [], palabras[inicio].start()
+    for indice in range(inicio, fin):
+        palabra = palabras[indice]
+        partes.append(contenido[posicion:palabra.start()])
+        partes.append(_INICIO + palabra.group() + _FIN if coincide[indice] else palabra.group())
+        posicion = palabra.end()
+    texto = ''.join(partes).replace('\n', ' ')
+    return ('… ' if inicio > 0 else '') + texto + (' …' if fin < len(palabras) else '')
+
+
+def agregar_fragmentos(documentos, consulta):
+    """Asigna `fragmento` (HTML) a cada documento de la página de resultados."""
+    if not documentos:
+        return documentos
+    if usa_postgres():
+        busqueda = SearchQuery(consulta, config=CONFIGURACION, search_type='websearch')
+        fragmentos = dict(
+            DocumentoBusqueda.objects.filter(pk__in=[documento.pk for documento in documentos]).annotate(
+                fragmento=SearchHeadline(
+                    'contenido', busqueda, config=CONFIGURACION, start_sel=_INICIO, stop_sel=_FIN,
+                    max_words=PALABRAS_FRAGMENTO, min_words=PALABRAS_FRAGMENTO // 2, max_fragments=2,
+                    fragment_delimiter=' … ',
+                ),
+            ).values_list('pk', 'fragmento')
+        )
+        for documento in documentos:
+            documento.fragmento = _html(fragmentos.get(documento.pk, ''))
+    else:
+        buscados = set(terminos(consulta))
+        for documento in documentos:
+            documento.fragmento = _html(_fragmento_local(documento.contenido, buscados))
+    return documentos
+
+
+# Señales de FichaClinica y Paciente (conectadas en PacientesConfig.ready)
+
+def _cambia_texto(campos, update_fields):
+    return update_fields is None or any(campo in update_fields for campo, _ in campos)
+
+
+def ficha_guardada(sender, instance, update_fields=None, **kwargs):
+    # calcular_costo_total guarda solo costo_total: no cambia el texto
+    if _cambia_texto(CAMPOS_FICHA + (('fecha', None), ('paciente', None)), update_fields):
+        indexar_ficha(instance)
+
+
+def paciente_guardado(sender, instance, update_fields=None, **kwargs):
+    if _cambia_texto(CAMPOS_PACIENTE, update_fields):
+        indexar_paciente(instance)
+
+
+def ficha_eliminada(sender, instance, **kwargs):
+    DocumentoBusqueda.objects.filter(tipo='ficha', objeto_id=instance.id).delete()
@@ -0,0 +1,219 @@
+"""
+PDF de fichas clínicas, individuales o por lote (fichas de un paciente o de un
+rango de fechas), con caché por ficha y hash del contenido.
+
+El contenido de una ficha (datos del paciente, atención, productos usados) se lee
+con select_related/prefetch_related y se reduce a un diccionario de textos; su
+SHA-256 da la ruta del PDF en el almacenamiento: `fichas_pdf/<id>/<hash>.pdf`. Si
+el archivo existe se reutiliza sin volver a generarlo; si la ficha (o su paciente,
+tratamiento o productos) cambió, el hash es otro y se genera el PDF nuevo.
+
+Las versiones anteriores no se borran al generar la nueva: un lote terminado
+guarda las rutas de sus PDF y puede descargarse después de que la ficha cambie.
+La tarea programada `depurar_pdfs_fichas` borra las versiones reemplazadas con más
+de HORAS_VERSIONES horas, y antes de armar el ZIP se regeneran las que falten.
+
+Los lotes se reparten entre los workers de Celery con un chord: una tarea
+`generar_pdfs_fichas` por cada FICHAS_POR_TAREA fichas, que genera sus PDF en
+secuencia (los workers prefork son procesos daemon y no pueden crear procesos
+hijos), y `unir_pdfs_fichas` que junta los resultados; la descarga arma el ZIP en
+streaming desde los PDF guardados.
+"""
+import hashlib
+import json
+import logging
+import zipfile
+from datetime import timedelta
+
+from celery import chord
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from podoclinic.exportacion import BufferSalida
+from podoclinic.pdf import generar_pdf
+
+from .models import FichaClinica
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_PDF = 'fichas_pdf'
+
+# Máximo de fichas por lote
+MAX_FICHAS_LOTE = 2000
+# Fichas por tarea del chord de un lote
+FICHAS_POR_TAREA = 100
+# Horas que se conserva una versión reemplazada (más que la expiración de resultados de Celery, 1 día)
+HORAS_VERSIONES = 48
+
+
+def fichas_para_pdf(queryset=None):
+    """Fichas con todo lo que aparece en el PDF, en cuatro consultas fijas."""
+    queryset = FichaClinica.objects.all() if queryset is None else queryset
+    return queryset.select_related('paciente', 'cita__tratamiento').prefetch_related(
+        'productos_usados__insumo'
+    ).order_by('fecha', 'id')
+
+
+def _fecha(valor):
+    return valor.strftime('%d-%m-%Y') if valor else ''
+
+
+def datos_ficha(ficha):
+    """Contenido del PDF de `ficha` como textos (serializable y sin acceso a la base)."""
+    paciente = ficha.paciente
+    cita = ficha.cita
+    return {
+        'id': ficha.id,
+        'fecha': _fecha(ficha.fecha),
+        'paciente': paciente.nombre,
+        'rut': paciente.rut,
+        'fecha_nacimiento': _fecha(paciente.fecha_nacimiento),
+        'telefono': paciente.telefono or '',
+        'enfermedad_base': paciente.enfermedad_base or '',
+        'tratamiento': cita.tratamiento.get_nombre_display() if cita and cita.tratamiento else '',
+        'tipo_cita': cita.get_tipo_cita_display() if cita else '',
+        'descripcion_atencion': ficha.descripcion_atencion,
+        'procedimiento': ficha.procedimiento,
+        'indicaciones': ficha.indicaciones,
+        'proxima_sesion_estimada': _fecha(ficha.proxima_sesion_estimada),
+        'productos': [
+            f"{uso.insumo.nombre}: {uso.cantidad} {uso.insumo.unidad_medida}"
+            for uso in sorted(ficha.productos_usados.all(), key=lambda uso: uso.id)
+        ],
+        'costo_total': f"${int(ficha.costo_total or 0):,d}",
+    }
+
+
+def huella(datos):
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def ruta_pdf(ficha_id, hash_contenido):
+    return f'{DIRECTORIO_PDF}/{ficha_id}/{hash_contenido}.pdf'
+
+
+def nombre_pdf(datos):
+    """Nombre del archivo dentro del ZIP (o de la descarga individual)."""
+    fecha = '-'.join(reversed(datos['fecha'].split('-')))
+    return f"ficha_{datos['rut']}_{fecha}_{datos['id']}.pdf"
+
+
+def renderizar_ficha(datos):
+    """Bytes del PDF de una ficha. Se ejecuta en los procesos del pool: solo usa `datos`."""
+    bloques = [
+        ('titulo', f"Ficha clínica N° {datos['id']}"),
+        ('subtitulo', f"Fecha de atención: {datos['fecha']}"),
+        ('seccion', 'Paciente'),
+        ('texto', f"{datos['paciente']} - RUT {datos['rut']}"),
+    ]
+    if datos['fecha_nacimiento']:
+        bloques.append(('texto', f"Fecha de nacimiento: {datos['fecha_nacimiento']}"))
+    if datos['telefono']:
+        bloques.append(('texto', f"Teléfono: {datos['telefono']}"))
+    if datos['enfermedad_base']:
+        bloques.append(('texto', f"Enfermedad de base: {datos['enfermedad_base']}"))
+    if datos['tratamiento'] or datos['tipo_cita']:
+        bloques.append(('seccion', 'Atención'))
+        bloques.append(('texto', ' - '.join(filter(None, (datos['tipo_cita'], datos['tratamiento'])))))
+    bloques += [
+        ('seccion', 'Descripción de la atención'), ('texto', datos['descripcion_atencion']),
+        ('seccion', 'Procedimiento'), ('texto', datos['procedimiento']),
+        ('seccion', 'Indicaciones'), ('texto', datos['indicaciones']),
+    ]
+    if datos['proxima_sesion_estimada']:
+        bloques.append(('texto', f"Próxima sesión estimada: {datos['proxima_sesion_estimada']}"))
+    if datos['productos']:
+        bloques.append(('seccion', 'Productos utilizados'))
+        bloques += [('texto', f"- {producto}") for producto in datos['productos']]
+        bloques.append(('texto', f"Costo total de productos: {datos['costo_total']}"))
+    return generar_pdf(bloques, titulo=f"Ficha clínica {datos['id']}", pie=f"{datos['paciente']} - {datos['rut']}")
+
+
+def preparar_pdfs(fichas):
+    """
+    Asegura en el almacenamiento el PDF vigente de cada ficha de `fichas` (generando
+    solo los que no estén en caché) y devuelve [[nombre del archivo, ruta], ...].
+    """
+    archivos, generados = [], 0
+    for ficha in fichas:
+        datos = datos_ficha(ficha)
+        ruta = ruta_pdf(ficha.id, huella(datos))
+        archivos.append([nombre_pdf(datos), ruta])
+        if not default_storage.exists(ruta):
+            default_storage.save(ruta, ContentFile(renderizar_ficha(datos)))
+            generados += 1
+    logger.info(f"PDF de fichas: {len(archivos)} pedidos, {generados} generados, "
+                f"{len(archivos) - generados} desde caché")
+    return archivos
+
+
+def encolar_lote(ficha_ids):
+    """Reparte la generación del lote en tareas de FICHAS_POR_TAREA fichas. Devuelve el resultado del chord."""
+    from .tasks import generar_pdfs_fichas, unir_pdfs_fichas
+
+    bloques = [ficha_ids[i:i + FICHAS_POR_TAREA] for i in range(0, len(ficha_ids), FICHAS_POR_TAREA)]
+    return chord(generar_pdfs_fichas.s(bloque) for bloque in bloques)(unir_pdfs_fichas.s())
+
+
+def _ficha_de_ruta(ruta):
+    return int(ruta.split('/')[-2])
+
+
+def resolver_archivos(archivos):
+    """
+    Regenera los PDF de `archivos` que ya no están en el almacenamiento (depurados
+    por antigüedad) con el contenido vigente de la ficha; las fichas eliminadas se
+    omiten. Se llama antes de empezar a enviar el ZIP.
+    """
+    faltantes = {_ficha_de_ruta(ruta) for _, ruta in archivos if not default_storage.exists(ruta)}
+    if not faltantes:
+        return archivos
+    vigentes = {
+        _ficha_de_ruta(ruta): [nombre, ruta]
+        for nombre, ruta in preparar_pdfs(fichas_para_pdf(FichaClinica.objects.filter(id__in=faltantes)))
+    }
+    resueltos = []
+    for nombre, ruta in archivos:
+        ficha_id = _ficha_de_ruta(ruta)
+        if ficha_id not in faltantes:
+            resueltos.append([nombre, ruta])
+        elif ficha_id in vigentes:
+            resueltos.append(vigentes[ficha_id])
+    return resueltos
+
+
+def depurar_pdfs(ahora=None):
+    """
+    Borra las versiones de PDF reemplazadas (todas menos la más reciente de cada
+    ficha) con más de HORAS_VERSIONES horas. Devuelve cuántos archivos borró.
+    """
+    if not default_storage.exists(DIRECTORIO_PDF):
+        return 0
+    limite = (ahora or timezone.now()) - timedelta(hours=HORAS_VERSIONES)
+    borrados = 0
+    for ficha in default_storage.listdir(DIRECTORIO_PDF)[0]:
+        directorio = f'{DIRECTORIO_PDF}/{ficha}'
+        versiones = sorted(
+            ((default_storage.get_modified_time(f'{directorio}/{archivo}'), f'{directorio}/{archivo}')
+             for archivo in default_storage.listdir(directorio)[1]),
+            reverse=True,
+        )
+        for modificado, ruta in versiones[1:]:
+            if modificado < limite:
+                default_storage.delete(ruta)
+                borrados += 1
+    logger.info(f"PDF de fichas: {borrados} versiones reemplazadas borradas")
+    return borrados
+
+
+def zip_pdfs(archivos):
+    """ZIP con los PDF de `archivos` ([nombre, ruta]), entregado por partes a medida que se arma."""
+    buffer = BufferSalida(b'')
+    # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as libro:
+        for nombre, ruta in archivos:
+            with default_storage.open(ruta, 'rb') as archivo:
+                libro.writestr(nombre, archivo.read())
+            yield buffer.vaciar()
+    yield buffer.vaciar()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from pacientes.busqueda import reindexar
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye el índice de búsqueda de texto completo de fichas y pacientes '
+        '(después de migrar o de cargas masivas que no disparan señales).'
+    )
+
+    def handle(self, *args, **options):
+        total = reindexar()
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda reconstruido: {total} fichas y pacientes revisados'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0004_fichaclinica_costo_total'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fichaclinica',
+            index=models.Index(fields=['paciente', '-fecha', '-id'], name='ficha_paciente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0005_fichaclinica_ficha_paciente_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='ultima_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
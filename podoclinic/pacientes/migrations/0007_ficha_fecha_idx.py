@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0006_paciente_ultima_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fichaclinica',
+            index=models.Index(fields=['fecha'], name='ficha_fecha_idx'),
+        ),
+    ]
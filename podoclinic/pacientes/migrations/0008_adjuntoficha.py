@@ -0,0 +1,39 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pacientes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0007_ficha_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdjuntoFicha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('antes', 'Antes'), ('despues', 'Después'), ('otro', 'Otro')], default='otro', max_length=10)),
+                ('descripcion', models.CharField(blank=True, default='', max_length=200)),
+                ('nombre_original', models.CharField(max_length=200)),
+                ('tipo_contenido', models.CharField(max_length=50)),
+                ('tamano', models.PositiveIntegerField(help_text='Tamaño del original en bytes')),
+                ('estado', models.CharField(choices=[('subiendo', 'Subiendo'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='subiendo', max_length=10)),
+                ('original', models.FileField(blank=True, max_length=200, upload_to=pacientes.models._ruta_adjunto)),
+                ('miniatura', models.FileField(blank=True, max_length=200, upload_to=pacientes.models._ruta_adjunto)),
+                ('web', models.FileField(blank=True, max_length=200, upload_to=pacientes.models._ruta_adjunto)),
+                ('ancho', models.PositiveIntegerField(blank=True, null=True)),
+                ('alto', models.PositiveIntegerField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('ficha', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjuntos', to='pacientes.fichaclinica')),
+            ],
+            options={
+                'verbose_name': 'Adjunto de ficha',
+                'verbose_name_plural': 'Adjuntos de fichas',
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='adjunto_estado_fecha_idx')],
+            },
+        ),
+    ]
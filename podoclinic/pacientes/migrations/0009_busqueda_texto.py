@@ -0,0 +1,58 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:17
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def crear_indice_vector(apps, schema_editor):
+    # GIN sobre el tsvector; solo PostgreSQL tiene búsqueda de texto (en SQLite se usa TerminoBusqueda)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX documento_busqueda_vector_idx ON pacientes_documentobusqueda USING GIN (vector)'
+        )
+
+
+def borrar_indice_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS documento_busqueda_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0008_adjuntoficha'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('ficha', 'Ficha clínica'), ('paciente', 'Paciente')], max_length=10)),
+                ('objeto_id', models.BigIntegerField()),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('contenido', models.TextField()),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documentos_busqueda', to='pacientes.paciente')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(max_length=50)),
+                ('peso', models.FloatField(help_text='Suma de los pesos de las apariciones del término en el documento')),
+                ('documento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terminos', to='pacientes.documentobusqueda')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='terminobusqueda',
+            constraint=models.UniqueConstraint(fields=('termino', 'documento'), name='termino_documento_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentobusqueda',
+            constraint=models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='documento_busqueda_uniq'),
+        ),
+        migrations.RunPython(crear_indice_vector, borrar_indice_vector),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import RegexValidator
 
@@ -19,6 +20,7 @@ class Paciente(models.Model):
     fecha_registro = models.DateTimeField(auto_now_add=True)
     direccion = models.CharField(max_length=200, blank=True, null=True)
     fecha_nacimiento = models.DateField(blank=True, null=True)
+    ultima_actualizacion = models.DateTimeField(auto_now=True, db_index=True)  # Cursor del feed de cambios
 
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
@@ -33,16 +35,32 @@ class FichaClinica(models.Model):
     proxima_sesion_estimada = models.DateField(null=True, blank=True)
     costo_total = models.DecimalField(max_digits=10, decimal_places=0, default=0, help_text="Costo total de los productos utilizados")
     
+    class Meta:
+        indexes = [
+            # Listado de fichas de un paciente, ordenado de la más reciente a la más antigua
+            models.Index(fields=['paciente', '-fecha', '-id'], name='ficha_paciente_fecha_idx'),
+            # Agregados de costos por mes (insumos/costos.py)
+            models.Index(fields=['fecha'], name='ficha_fecha_idx'),
+        ]
+    
+    def sumar_costo_productos(self):
+        """
+        Suma valor_unitario * cantidad de los productos usados, sin guardar.
+        Aprovecha el prefetch de productos_usados__insumo si está disponible.
+        """
+        total = 0
+        for uso in self.productos_usados.all():
+            try:
+                if uso.insumo and uso.insumo.valor_unitario is not None:
+                    total += uso.insumo.valor_unitario * uso.cantidad
+            except Exception as e:
+                print(f"Error al calcular costo para producto {uso.insumo_id if uso.insumo_id else 'desconocido'}: {str(e)}")
+                continue
+        return total
+    
     def calcular_costo_total(self):
         try:
-            total = 0
-            for uso in self.productos_usados.all():
-                try:
-                    if uso.insumo and uso.insumo.valor_unitario is not None:
-                        total += uso.insumo.valor_unitario * uso.cantidad
-                except Exception as e:
-                    print(f"Error al calcular costo para producto {uso.insumo_id if uso.insumo_id else 'desconocido'}: {str(e)}")
-                    continue
+            total = self.sumar_costo_productos()
             
             self.costo_total = total
             self.save(update_fields=['costo_total'])
@@ -57,6 +75,41 @@ class FichaClinica(models.Model):
     def __str__(self):
         return f"Ficha de {self.paciente.nombre} - {self.fecha}"
 
+
+# Valores guardados de FichaClinica (pre_save conectado en PacientesConfig.ready).
+# Reportes (reportes/hechos.py) y costos de materiales (insumos/costos.py) dependen
+# de la fecha y el costo de cada ficha: se leen una sola vez antes de guardar y
+# sus señales post_save usan fechas_ficha_cambiadas.
+
+CAMPOS_AGREGADOS_FICHA = ('fecha', 'costo_total')
+
+
+def ficha_por_guardar(sender, instance, update_fields=None, **kwargs):
+    instance._valores_guardados = None
+    if not instance.pk:
+        return
+    if update_fields is None or set(CAMPOS_AGREGADOS_FICHA) & set(update_fields):
+        instance._valores_guardados = (
+            sender.objects.filter(pk=instance.pk).values(*CAMPOS_AGREGADOS_FICHA).first()
+        )
+    else:
+        # El guardado no toca la fecha ni el costo
+        instance._valores_guardados = {campo: getattr(instance, campo) for campo in CAMPOS_AGREGADOS_FICHA}
+
+
+def fechas_ficha_cambiadas(instance):
+    """
+    Fechas cuyos agregados cambian con el guardado de la ficha: la actual y, si se
+    movió, la anterior. Vacío si no cambiaron ni la fecha ni el costo.
+    """
+    fecha = FichaClinica._meta.get_field('fecha').to_python(instance.fecha)
+    guardados = getattr(instance, '_valores_guardados', None)
+    if guardados is None:
+        return [fecha]
+    if guardados['fecha'] == fecha and guardados['costo_total'] == instance.costo_total:
+        return []
+    return [fecha, guardados['fecha']]
+
 class UsoProductoEnFicha(models.Model):
     ficha = models.ForeignKey(FichaClinica, on_delete=models.CASCADE, related_name='productos_usados')
     insumo = models.ForeignKey('insumos.Insumo', on_delete=models.PROTECT)
@@ -68,4 +121,90 @@ class UsoProductoEnFicha(models.Model):
         verbose_name_plural = "Usos de productos en fichas"
         
     def __str__(self):
-        return f"{self.cantidad} de {self.insumo.nombre} en ficha de {self.ficha.paciente.nombre} ({self.ficha.fecha})"
\ No newline at end of file
+        return f"{self.cantidad} de {self.insumo.nombre} en ficha de {self.ficha.paciente.nombre} ({self.ficha.fecha})"
+
+def _ruta_adjunto(instance, filename):
+    return f'fichas_adjuntos/{instance.ficha_id}/{instance.id}_{filename}'
+
+
+class AdjuntoFicha(models.Model):
+    """
+    Foto clínica de una ficha (antes/después del tratamiento). El original se sube
+    por partes y las variantes (miniatura y web, sin EXIF) se generan en segundo
+    plano (pacientes/adjuntos.py).
+    """
+    TIPOS = [
+        ('antes', 'Antes'),
+        ('despues', 'Después'),
+        ('otro', 'Otro'),
+    ]
+    ESTADOS = [
+        ('subiendo', 'Subiendo'),
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+
+    ficha = models.ForeignKey(FichaClinica, on_delete=models.CASCADE, related_name='adjuntos')
+    tipo = models.CharField(max_length=10, choices=TIPOS, default='otro')
+    descripcion = models.CharField(max_length=200, blank=True, default='')
+    nombre_original = models.CharField(max_length=200)
+    tipo_contenido = models.CharField(max_length=50)
+    tamano = models.PositiveIntegerField(help_text="Tamaño del original en bytes")
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='subiendo')
+    original = models.FileField(upload_to=_ruta_adjunto, max_length=200, blank=True)
+    miniatura = models.FileField(upload_to=_ruta_adjunto, max_length=200, blank=True)
+    web = models.FileField(upload_to=_ruta_adjunto, max_length=200, blank=True)
+    ancho = models.PositiveIntegerField(null=True, blank=True)
+    alto = models.PositiveIntegerField(null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Adjunto de ficha"
+        verbose_name_plural = "Adjuntos de fichas"
+        indexes = [
+            # Limpieza de subidas abandonadas
+            models.Index(fields=['estado', 'fecha_creacion'], name='adjunto_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} - ficha {self.ficha_id} ({self.nombre_original})"
+
+
+class DocumentoBusqueda(models.Model):
+    """
+    Texto libre de una ficha o de un paciente para la búsqueda de texto completo
+    (pacientes/busqueda.py). Se mantiene con señales al guardar o eliminar.
+    """
+    TIPOS = [
+        ('ficha', 'Ficha clínica'),
+        ('paciente', 'Paciente'),
+    ]
+
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    objeto_id = models.BigIntegerField()
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='documentos_busqueda')
+    fecha = models.DateField(null=True, blank=True)
+    contenido = models.TextField()
+    # tsvector (configuración 'spanish') con índice GIN; solo se usa en PostgreSQL
+    vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'objeto_id'], name='documento_busqueda_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.objeto_id}"
+
+
+class TerminoBusqueda(models.Model):
+    """Índice invertido de DocumentoBusqueda para las bases sin búsqueda de texto (SQLite)."""
+    documento = models.ForeignKey(DocumentoBusqueda, on_delete=models.CASCADE, related_name='terminos')
+    termino = models.CharField(max_length=50)
+    peso = models.FloatField(help_text="Suma de los pesos de las apariciones del término en el documento")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['termino', 'documento'], name='termino_documento_uniq'),
+        ]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Paciente, FichaClinica, UsoProductoEnFicha
+from .models import Paciente, FichaClinica, UsoProductoEnFicha, AdjuntoFicha, DocumentoBusqueda
 from .utils import formatear_rut, validar_rut
 import logging
 
@@ -39,7 +39,7 @@ class UsoProductoEnFichaSerializer(serializers.ModelSerializer):
         # Asegurarnos de que el insumo se represente como su ID (entero)
         ret = super().to_representation(instance)
         if 'insumo' in ret and ret['insumo'] is not None:
-            ret['insumo'] = instance.insumo.id
+            ret['insumo'] = instance.insumo_id
         return ret
     
     def to_internal_value(self, data):
@@ -52,10 +52,61 @@ class UsoProductoEnFichaSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError({'insumo': 'El ID del insumo debe ser un número entero'})
         return super().to_internal_value(data)
 
+class AdjuntoMiniaturaSerializer(serializers.ModelSerializer):
+    """Adjunto en el listado de fichas: solo la URL de la miniatura."""
+    url_miniatura = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AdjuntoFicha
+        fields = ['id', 'tipo', 'descripcion', 'estado', 'url_miniatura']
+
+    def _url(self, obj, variante):
+        if obj.estado != 'listo' and not (variante == 'original' and obj.original):
+            return None
+        # Ruta fija: pacientes.urls también se incluye bajo api/database/ y reverse() elegiría esa
+        ruta = f'/api/pacientes/adjuntos/{obj.id}/{variante}/'
+        request = self.context.get('request')
+        return request.build_absolute_uri(ruta) if request else ruta
+
+    def get_url_miniatura(self, obj):
+        return self._url(obj, 'miniatura')
+
+class AdjuntoFichaSerializer(AdjuntoMiniaturaSerializer):
+    url_web = serializers.SerializerMethodField()
+    url_original = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AdjuntoFicha
+        fields = ['id', 'ficha', 'tipo', 'descripcion', 'estado', 'nombre_original', 'tipo_contenido', 'tamano',
+                  'ancho', 'alto', 'fecha_creacion', 'url_miniatura', 'url_web', 'url_original']
+        read_only_fields = fields
+
+    def get_url_web(self, obj):
+        return self._url(obj, 'web')
+
+    def get_url_original(self, obj):
+        return self._url(obj, 'original')
+
+class ResultadoBusquedaSerializer(serializers.ModelSerializer):
+    """Resultado de la búsqueda de texto: la ficha o paciente, su relevancia y el fragmento (HTML)."""
+    id = serializers.IntegerField(source='objeto_id')
+    paciente_nombre = serializers.ReadOnlyField(source='paciente.nombre')
+    paciente_rut = serializers.ReadOnlyField(source='paciente.rut')
+    relevancia = serializers.SerializerMethodField()
+    fragmento = serializers.ReadOnlyField()
+
+    class Meta:
+        model = DocumentoBusqueda
+        fields = ['tipo', 'id', 'paciente', 'paciente_nombre', 'paciente_rut', 'fecha', 'relevancia', 'fragmento']
+
+    def get_relevancia(self, obj):
+        return round(obj.relevancia, 4)
+
 class FichaClinicaSerializer(serializers.ModelSerializer):
     productos_usados = UsoProductoEnFichaSerializer(many=True, read_only=True)
     productos_usados_data = UsoProductoEnFichaSerializer(many=True, write_only=True, required=False)
     costo_total_formato = serializers.SerializerMethodField()
+    adjuntos = AdjuntoMiniaturaSerializer(many=True, read_only=True)
     
     class Meta:
         model = FichaClinica
@@ -72,13 +123,10 @@ class FichaClinicaSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         try:
-            # Asegurarse de que los productos usados existan
-            productos = instance.productos_usados.all()
-            logger.info(f"Productos encontrados para ficha {instance.id}: {len(productos)}")
-            
-            # Intentar calcular el costo total
+            # Recalcular el costo total en memoria (sin guardar): en un listado
+            # guardar cada ficha agregaría un UPDATE por fila
             try:
-                instance.calcular_costo_total()
+                instance.costo_total = instance.sumar_costo_productos()
             except Exception as e:
                 logger.error(f"Error al calcular costo total para ficha {instance.id}: {str(e)}")
             
@@ -178,7 +226,7 @@ class FichaClinicaSerializer(serializers.ModelSerializer):
         return instance
 
     def _procesar_productos(self, ficha, productos_data):
-        from insumos.models import Insumo, MovimientoInsumo
+        from insumos.lotes import consumir_insumos
         
         if not productos_data and 'productos_usados' in self.initial_data:
             productos_data = self.initial_data.get('productos_usados', [])
@@ -188,10 +236,12 @@ class FichaClinicaSerializer(serializers.ModelSerializer):
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             usuario = request.user
         
+        # Cantidades por insumo; los productos con datos inválidos se omiten
+        cantidades = {}
         for producto_data in productos_data:
             try:
                 insumo_id = producto_data.get('insumo')
-                cantidad = producto_data.get('cantidad', 0)
+                cantidad = int(producto_data.get('cantidad', 0))
                 
                 if not insumo_id or cantidad <= 0:
                     continue
@@ -199,24 +249,16 @@ class FichaClinicaSerializer(serializers.ModelSerializer):
                 if not isinstance(insumo_id, int):
                     insumo_id = int(insumo_id) if not hasattr(insumo_id, 'id') else insumo_id.id
                 
-                insumo = Insumo.objects.get(id=insumo_id)
-                
-                if insumo.stock_actual < cantidad:
-                    continue
-                
-                uso = UsoProductoEnFicha.objects.create(
-                    ficha=ficha,
-                    insumo_id=insumo_id,
-                    cantidad=cantidad
-                )
-                
-                MovimientoInsumo.objects.create(
-                    insumo=insumo,
-                    cantidad=cantidad,
-                    tipo_movimiento='salida',
-                    motivo=f"Uso en ficha clínica #{ficha.id}",
-                    usuario=usuario
-                )
-                
-            except (ValueError, TypeError, Insumo.DoesNotExist):
-                continue
\ No newline at end of file
+                cantidades[insumo_id] = cantidades.get(insumo_id, 0) + cantidad
+            except (ValueError, TypeError):
+                continue
+        
+        if not cantidades:
+            return
+        
+        # Descuenta de los lotes que vencen primero; los insumos sin stock suficiente se omiten
+        aplicados = consumir_insumos(cantidades, motivo=f"Uso en ficha clínica #{ficha.id}", usuario=usuario)
+        UsoProductoEnFicha.objects.bulk_create([
+            UsoProductoEnFicha(ficha=ficha, insumo_id=insumo_id, cantidad=cantidad)
+            for insumo_id, cantidad in aplicados.items()
+        ])
\ No newline at end of file
@@ -0,0 +1,46 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def generar_pdfs_fichas(ficha_ids):
+    """
+    Genera en secuencia los PDF que falten de las fichas `ficha_ids` (un bloque de
+    un lote, ver fichas_pdf.encolar_lote) y devuelve [[nombre, ruta], ...].
+    """
+    from pacientes.fichas_pdf import fichas_para_pdf, preparar_pdfs
+    from pacientes.models import FichaClinica
+
+    return preparar_pdfs(fichas_para_pdf(FichaClinica.objects.filter(id__in=ficha_ids)))
+
+@shared_task
+def unir_pdfs_fichas(resultados):
+    """Junta los [[nombre, ruta], ...] de los bloques de un lote para armar el ZIP de descarga."""
+    return [archivo for resultado in resultados for archivo in resultado]
+
+@shared_task
+def depurar_pdfs_fichas():
+    """Tarea programada que borra las versiones antiguas de los PDF de fichas."""
+    from pacientes.fichas_pdf import depurar_pdfs
+
+    return depurar_pdfs()
+
+@shared_task
+def procesar_adjunto_ficha(adjunto_id):
+    """Genera la miniatura y la versión web (sin EXIF) de una foto recién subida."""
+    from pacientes.adjuntos import generar_variantes
+    from pacientes.models import AdjuntoFicha
+
+    adjunto = AdjuntoFicha.objects.filter(id=adjunto_id, estado__in=('procesando', 'error')).first()
+    if adjunto is None:
+        logger.warning(f"Adjunto {adjunto_id} no encontrado o ya procesado")
+        return None
+    return generar_variantes(adjunto)
+
+@shared_task
+def depurar_subidas_adjuntos():
+    """Tarea programada que elimina las subidas de fotos abandonadas sin completar."""
+    from pacientes.adjuntos import depurar_subidas
+
+    return depurar_subidas()
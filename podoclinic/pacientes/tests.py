@@ -1,3 +1,695 @@
+from datetime import date, time, timedelta
+import csv
+import io
+import re
+import shutil
+import tempfile
+import zipfile
+import zlib
+from datetime import datetime
+from io import BytesIO
+from itertools import count
+from unittest import mock, skipUnless
+
+from django.db import connection
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from citas.models import Cita, Tratamiento
+from insumos.models import Insumo, MovimientoInsumo
+from podoclinic import exportacion
+from podoclinic.sembrado import GeneradorDatos
+from podoclinic.testing import PlanConsultaMixin, PresupuestoConsultasMixin
+from usuarios.models import Usuario
+from PIL import Image
+
+from . import adjuntos, fichas_pdf
+from .models import AdjuntoFicha, DocumentoBusqueda, Paciente, FichaClinica, UsoProductoEnFicha
+from .tasks import generar_pdfs_fichas, procesar_adjunto_ficha, unir_pdfs_fichas
+
+
+class FichaClinicaListQueryBudgetTest(TestCase):
+    """
+    El listado de fichas debe ejecutar un número fijo de consultas,
+    sin importar cuántas fichas (y productos usados) tenga el paciente.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.paciente = Paciente.objects.create(
+            rut='12.345.678-5', nombre='Paciente Prueba',
+            telefono='912345678', correo='paciente@example.com'
+        )
+        self.insumos = [
+            Insumo.objects.create(nombre=f'Insumo {i}', unidad_medida='unidad', stock_actual=100, valor_unitario=1000)
+            for i in range(3)
+        ]
+
+    def _crear_fichas(self, cantidad):
+        inicio = FichaClinica.objects.count()
+        for i in range(inicio, inicio + cantidad):
+            ficha = FichaClinica.objects.create(
+                paciente=self.paciente,
+                fecha=date(2024, 1, 1) + timedelta(days=i),
+                descripcion_atencion='Atención', procedimiento='Procedimiento', indicaciones='Indicaciones'
+            )
+            for insumo in self.insumos:
+                UsoProductoEnFicha.objects.create(ficha=ficha, insumo=insumo, cantidad=2)
+
+    def _contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_listado_sin_paginar_consultas_fijas(self):
+        url = f'/api/pacientes/fichas/?paciente={self.paciente.id}'
+        self._crear_fichas(3)
+        consultas_pocas, response = self._contar_consultas(url)
+        self.assertEqual(len(response.data), 3)
+
+        self._crear_fichas(27)
+        consultas_muchas, response = self._contar_consultas(url)
+        self.assertEqual(len(response.data), 30)
+
+        # fichas + productos_usados + insumos + adjuntos
+        self.assertEqual(consultas_pocas, 4)
+        self.assertEqual(consultas_muchas, consultas_pocas)
+        self.assertEqual(response['X-Consultas-DB'], str(consultas_muchas))
+
+    def test_listado_paginado_consultas_fijas(self):
+        url = f'/api/pacientes/fichas/?paciente={self.paciente.id}&page_size=10'
+        self._crear_fichas(5)
+        consultas_pocas, response = self._contar_consultas(url)
+        self.assertEqual(response.data['count'], 5)
+
+        self._crear_fichas(45)
+        consultas_muchas, response = self._contar_consultas(url)
+        self.assertEqual(response.data['count'], 50)
+        self.assertEqual(len(response.data['results']), 10)
+
+        # count + fichas + productos_usados + insumos + adjuntos
+        self.assertEqual(consultas_pocas, 5)
+        self.assertEqual(consultas_muchas, consultas_pocas)
+
+    def test_listado_no_escribe_en_la_base(self):
+        self._crear_fichas(2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/pacientes/fichas/?paciente={self.paciente.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in ctx.captured_queries))
+        # 3 productos x 2 unidades x $1000
+        self.assertEqual(response.data[0]['costo_total_formato'], '$6,000')
+
+
+class PacientesQueryBudgetTest(PresupuestoConsultasMixin, TestCase):
+    """Los endpoints de pacientes no deben ejecutar más consultas al crecer los datos."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='recepcion', password='clave-segura-123')
+        self.client.force_authenticate(self.usuario)
+        self.secuencia = count()
+        self.insumo = Insumo.objects.create(nombre='Gasa', unidad_medida='unidad', stock_actual=1000, valor_unitario=500)
+        self.tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+
+    def _sembrar_pacientes(self, cantidad):
+        pacientes = []
+        for _ in range(cantidad):
+            i = next(self.secuencia)
+            pacientes.append(Paciente(
+                rut=f'{10000000 + i}-0', nombre=f'Paciente {i}',
+                telefono='912345678', correo=f'p{i}@example.com'
+            ))
+        return Paciente.objects.bulk_create(pacientes)
+
+    def _sembrar_todo(self, cantidad):
+        """Pacientes con cita, ficha, producto usado y movimiento de stock."""
+        for paciente in self._sembrar_pacientes(cantidad):
+            i = next(self.secuencia)
+            cita = Cita.objects.bulk_create([Cita(
+                paciente=paciente, tratamiento=self.tratamiento,
+                fecha=date(2030, 1, 1) + timedelta(days=i), hora=time(9, 0)
+            )])[0]
+            ficha = FichaClinica.objects.create(
+                paciente=paciente, cita=cita, fecha=cita.fecha,
+                descripcion_atencion='Atención', procedimiento='Procedimiento', indicaciones='Indicaciones'
+            )
+            UsoProductoEnFicha.objects.create(ficha=ficha, insumo=self.insumo, cantidad=1)
+            MovimientoInsumo.objects.bulk_create([MovimientoInsumo(
+                insumo=self.insumo, cantidad=1, tipo_movimiento='salida',
+                motivo=f'Uso en ficha clínica #{ficha.id}', usuario=self.usuario
+            )])
+
+    def test_listado_pacientes(self):
+        self.assertConsultasConstantes(self._sembrar_pacientes, '/api/pacientes/')
+
+    def test_listado_fichas_todas(self):
+        self.assertConsultasConstantes(self._sembrar_todo, '/api/pacientes/fichas/')
+
+    def test_verificar_rut(self):
+        Paciente.objects.create(rut='12.345.678-5', nombre='Existente', telefono='912345678', correo='e@example.com')
+        consultas = self.assertConsultasConstantes(self._sembrar_pacientes, '/api/pacientes/verificar_rut/?rut=12345678-5')
+        self.assertEqual(consultas, 1)
+
+    def test_backup_sql(self):
+        self.assertConsultasConstantes(self._sembrar_todo, '/api/pacientes/backup/')
+
+    def test_paciente_por_rut(self):
+        Paciente.objects.create(rut='12.345.678-5', nombre='Existente', telefono='912345678', correo='e@example.com')
+        self.assertConsultasConstantes(self._sembrar_pacientes, '/api/pacientes/?rut=12345678-5')
+
+    def test_fichas_de_un_paciente(self):
+        paciente = Paciente.objects.create(rut='12.345.678-5', nombre='Existente', telefono='912345678', correo='')
+
+        def sembrar(cantidad):
+            for _ in range(cantidad):
+                ficha = FichaClinica.objects.create(
+                    paciente=paciente, fecha=date(2030, 1, 1) + timedelta(days=next(self.secuencia)),
+                    descripcion_atencion='Atención', procedimiento='Procedimiento', indicaciones='Indicaciones'
+                )
+                UsoProductoEnFicha.objects.create(ficha=ficha, insumo=self.insumo, cantidad=1)
+
+        self.assertConsultasConstantes(sembrar, f'/api/pacientes/fichas/?paciente={paciente.id}')
+
+    def test_buscar_notas(self):
+        def sembrar(cantidad):
+            for paciente in self._sembrar_pacientes(cantidad):
+                FichaClinica.objects.create(
+                    paciente=paciente, fecha=date(2030, 1, 1), descripcion_atencion='Onicocriptosis en hallux',
+                    procedimiento='Espiculotomía', indicaciones='Control en quince días'
+                )
+
+        self.assertConsultasConstantes(sembrar, '/api/pacientes/buscar/?q=onicocriptosis')
+
+    def _medir_escritura(self, peticion):
+        """Mide `peticion()` (que devuelve (consultas, respuesta)) con N y con 10N pacientes con datos."""
+        self._sembrar_todo(self.N)
+        consultas_n, response = peticion()
+        self.assertLess(response.status_code, 300, getattr(response, 'data', None))
+
+        self._sembrar_todo(self.N * 9)
+        consultas_10n, response = peticion()
+        self.assertLess(response.status_code, 300, getattr(response, 'data', None))
+        self.assertEqual(consultas_10n, consultas_n)
+
+    def test_crear_paciente_admin(self):
+        ruts = iter(['11.111.111-1', '22.222.222-2'])
+        self._medir_escritura(lambda: self.contar_consultas('/api/pacientes/crear_paciente_admin/', 'post', {
+            'rut': next(ruts), 'nombre': 'Nuevo', 'telefono': '912345678', 'correo': 'nuevo@example.com',
+        }, format='json'))
+
+    def test_actualizar_paciente_admin(self):
+        Paciente.objects.create(rut='12.345.678-5', nombre='Existente', telefono='912345678', correo='')
+        nombres = iter(['Primero', 'Segundo'])
+        self._medir_escritura(lambda: self.contar_consultas('/api/pacientes/actualizar_paciente_admin/', 'put', {
+            'rut': '12.345.678-5', 'nombre': next(nombres), 'telefono': '912345678', 'correo': 'e@example.com',
+        }, format='json'))
+
+    def test_eliminar_paciente_admin(self):
+        # Cada medición elimina un paciente con una cita y una ficha
+        def eliminar():
+            self._sembrar_todo(1)
+            rut = Paciente.objects.latest('id').rut
+            return self.contar_consultas(f'/api/pacientes/eliminar_paciente_admin/{rut}/', 'delete')
+
+        self._medir_escritura(eliminar)
+
+    def test_backup_sql_exporta_ids_de_llaves_foraneas(self):
+        self._sembrar_todo(1)
+        lineas = self.client.get('/api/pacientes/backup/').content.decode().splitlines()
+        encabezado = next(i for i, l in enumerate(lineas) if l.startswith('COPY public.citas_cita '))
+        columnas = lineas[encabezado].split('(', 1)[1].split(')', 1)[0].split(', ')
+        fila = dict(zip(columnas, lineas[encabezado + 1].split('\t')))
+        cita = Cita.objects.get()
+        self.assertEqual(fila['paciente_id'], str(cita.paciente_id))
+        self.assertEqual(fila['tratamiento_id'], str(cita.tratamiento_id))
+
+
+class FichasPlanConsultaTest(PlanConsultaMixin, TestCase):
+    """El listado de fichas de un paciente debe usar el índice (paciente, fecha)."""
+
+    def test_fichas_por_paciente_usa_indice(self):
+        GeneradorDatos(semilla=5).generar(pacientes=300, citas=6000, insumos=5, proporcion_fichas=1, max_productos=0)
+        self.analizar_tablas(FichaClinica)
+        paciente_id = FichaClinica.objects.values_list('paciente_id', flat=True).first()
+        self.assertUsaIndice(FichaClinica.objects.filter(paciente_id=paciente_id).order_by('-fecha', '-id'))
+
+
+class CambiosPacientesTest(TestCase):
+    """El feed de cambios de pacientes registra eliminaciones, incluidas las citas en cascada."""
+
+    def test_eliminar_paciente_deja_registro_para_pacientes_y_citas(self):
+        client = APIClient()
+        client.force_authenticate(Usuario.objects.create_user(username='agenda', password='clave-segura-123'))
+        paciente = Paciente.objects.create(
+            rut='12.345.678-5', nombre='Paciente', telefono='912345678', correo='p@example.com'
+        )
+        tratamiento = Tratamiento.objects.create(nombre='general', precio=10000)
+        Cita.objects.bulk_create([Cita(paciente=paciente, tratamiento=tratamiento, fecha=date(2030, 1, 1), hora=time(9))])
+        cita_id = Cita.objects.get().id
+        cursor = client.get('/api/pacientes/cambios/').data['cursor']
+        paciente_id = paciente.id
+
+        paciente.delete()
+
+        datos = client.get('/api/pacientes/cambios/', {'cursor': cursor}).data
+        self.assertFalse(datos['completo'])
+        self.assertEqual(datos['eliminados'], [paciente_id])
+        datos = client.get('/api/citas/citas/cambios/', {'cursor': cursor}).data
+        self.assertEqual(datos['eliminados'], [cita_id])
+
+
+class ExportacionesTest(TestCase):
+    """Exportaciones CSV y XLSX en streaming, con columnas elegidas y rango de fechas."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123'))
+        self.ana = Paciente.objects.create(rut='11111111-1', nombre='Ana Muñoz', telefono='1', correo='')
+        self.luis = Paciente.objects.create(rut='22222222-2', nombre='=Luis', telefono='2', correo='')
+        Paciente.objects.filter(pk=self.luis.pk).update(
+            fecha_registro=timezone.make_aware(datetime(2025, 6, 2, 23, 30)))
+        Paciente.objects.filter(pk=self.ana.pk).update(
+            fecha_registro=timezone.make_aware(datetime(2025, 6, 3, 0, 15)))
+        tratamiento = Tratamiento.objects.create(nombre='general', precio=20000)
+        Cita.objects.bulk_create([
+            Cita(paciente=paciente, tratamiento=tratamiento, fecha=date(2025, 6, dia), hora=time(9 + dia))
+            for paciente, dia in ((self.ana, 1), (self.luis, 2), (self.ana, 3))
+        ])
+
+    def _leer(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_con_columnas_y_fechas(self):
+        response = self.client.get('/api/exportar/citas/', {
+            'columnas': 'fecha,paciente_nombre,precio', 'desde': '2025-06-02', 'hasta': '2025-06-03',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="citas_', response['Content-Disposition'])
+        contenido = self._leer(response).decode('utf-8')
+        self.assertTrue(contenido.startswith('\ufeff'))
+        filas = list(csv.reader(io.StringIO(contenido[1:])))
+        # El nombre que empieza con = no se abre como fórmula
+        self.assertEqual(filas, [
+            ['fecha', 'paciente_nombre', 'precio'],
+            ['2025-06-02', "'=Luis", '20000.00'],
+            ['2025-06-03', 'Ana Muñoz', '20000.00'],
+        ])
+        # Tampoco los que empiezan con tabulador o retorno, que algunas planillas descartan
+        self.assertEqual([exportacion._celda_csv(texto) for texto in ('\t=1+1', '\r@SUMA(A1)', 'Ana')],
+                         ["'\t=1+1", "'\r@SUMA(A1)", 'Ana'])
+
+    @override_settings(TIME_ZONE='America/Santiago')
+    def test_fechas_con_hora_por_dia_local(self):
+        response = self.client.get('/api/exportar/pacientes/', {'columnas': 'rut', 'desde': '2025-06-03'})
+        filas = list(csv.reader(io.StringIO(self._leer(response).decode('utf-8-sig'))))
+        self.assertEqual(filas, [['rut'], ['11111111-1']])
+
+    def test_xlsx_por_bloques(self):
+        with mock.patch.object(exportacion, 'CHUNK_FILAS', 2):
+            response = self.client.get('/api/exportar/citas/', {'formato': 'xlsx', 'columnas': 'id,paciente_rut'})
+            partes = list(response.streaming_content)
+        self.assertEqual(response['Content-Type'], exportacion.FORMATOS['xlsx'])
+        # Encabezado, dos bloques de filas y el cierre del ZIP
+        self.assertEqual(len(partes), 4)
+        with zipfile.ZipFile(io.BytesIO(b''.join(partes))) as libro:
+            self.assertIn('xl/workbook.xml', libro.namelist())
+            hoja = libro.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertEqual(hoja.count('<row>'), 4)
+        self.assertIn('<t xml:space="preserve">22222222-2</t>', hoja)
+        self.assertIn(f'<c><v>{Cita.objects.order_by("id").first().id}</v></c>', hoja)
+
+    def test_todas_las_columnas(self):
+        for recurso, definicion in exportacion.EXPORTACIONES.items():
+            response = self.client.get(f'/api/exportar/{recurso}/')
+            self.assertEqual(response.status_code, 200, recurso)
+            encabezado = next(csv.reader(io.StringIO(self._leer(response).decode('utf-8-sig'))))
+            self.assertEqual(encabezado, list(definicion['columnas']))
+
+    def test_parametros_invalidos(self):
+        for recurso, parametros in (
+            ('citas', {'columnas': 'fecha,clave'}),
+            ('citas', {'formato': 'pdf'}),
+            ('citas', {'desde': '02-06-2025'}),
+            ('usuarios', {}),
+        ):
+            response = self.client.get(f'/api/exportar/{recurso}/', parametros)
+            self.assertEqual(response.status_code, 400, (recurso, parametros))
+            self.assertIn('error', response.data)
+
+
+class FichasPdfTest(TestCase):
+    """PDF de fichas: caché por contenido, lotes repartidos en tareas y ZIP en streaming."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123'))
+        self.ana = Paciente.objects.create(rut='11.111.111-1', nombre='Ana Muñoz', telefono='1', correo='')
+        self.luis = Paciente.objects.create(rut='22.222.222-2', nombre='Luis', telefono='2', correo='')
+        tratamiento = Tratamiento.objects.create(nombre='general', precio=20000)
+        insumo = Insumo.objects.create(nombre='Gasa', descripcion='-', unidad_medida='unidades',
+                                       stock_actual=10, stock_critico=1, valor_unitario=500)
+        citas = Cita.objects.bulk_create([
+            Cita(paciente=paciente, tratamiento=tratamiento, fecha=date(2025, 6, dia), hora=time(9 + dia))
+            for paciente, dia in ((self.ana, 1), (self.ana, 2), (self.luis, 3))
+        ])
+        self.fichas = [
+            FichaClinica.objects.create(
+                paciente=cita.paciente, cita=cita, fecha=cita.fecha, descripcion_atencion='Control (anual)',
+                procedimiento='Corte de uñas\nLimpieza', indicaciones='Reposo', costo_total=1000,
+            )
+            for cita in citas
+        ]
+        UsoProductoEnFicha.objects.create(ficha=self.fichas[0], insumo=insumo, cantidad=2)
+
+    def _textos(self, pdf):
+        flujos = re.findall(rb'stream\n(.*?)\nendstream', pdf, re.S)
+        return ''.join(zlib.decompress(flujo).decode('cp1252') for flujo in flujos)
+
+    def test_pdf_de_una_ficha(self):
+        response = self.client.get(f'/api/pacientes/fichas/{self.fichas[0].id}/pdf/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('ficha_11.111.111-1_2025-06-01_', response['Content-Disposition'])
+        self.assertTrue(response.content.startswith(b'%PDF-1.4'))
+        self.assertTrue(response.content.endswith(b'%%EOF\n'))
+        textos = self._textos(response.content)
+        for texto in ('Ana Muñoz', 'Control \\(anual\\)', 'Limpieza', 'Gasa: 2 unidades', '$1,000'):
+            self.assertIn(texto, textos)
+
+    def test_cache_por_contenido(self):
+        fichas = lambda: fichas_pdf.fichas_para_pdf(FichaClinica.objects.filter(paciente=self.ana))
+        primera = fichas_pdf.preparar_pdfs(fichas())
+        with mock.patch.object(fichas_pdf, 'renderizar_ficha', wraps=fichas_pdf.renderizar_ficha) as renderizar:
+            self.assertEqual(fichas_pdf.preparar_pdfs(fichas()), primera)
+            renderizar.assert_not_called()
+
+            # Un cambio en el paciente cambia el hash de sus fichas: se generan de nuevo
+            Paciente.objects.filter(pk=self.ana.pk).update(telefono='999')
+            segunda = fichas_pdf.preparar_pdfs(fichas())
+            self.assertEqual(renderizar.call_count, 2)
+        self.assertNotEqual(segunda[0][1], primera[0][1])
+        # La versión anterior se conserva hasta que la depuración la considere antigua
+        directorio = f'{fichas_pdf.DIRECTORIO_PDF}/{self.fichas[0].id}'
+        self.assertEqual(len(default_storage.listdir(directorio)[1]), 2)
+        self.assertEqual(fichas_pdf.depurar_pdfs(), 0)
+        despues = timezone.now() + timedelta(hours=fichas_pdf.HORAS_VERSIONES + 1)
+        self.assertEqual(fichas_pdf.depurar_pdfs(ahora=despues), 2)
+        self.assertEqual(default_storage.listdir(directorio)[1], [segunda[0][1].rsplit('/', 1)[1]])
+
+    def test_tarea_en_proceso_hijo_de_billiard(self):
+        # Los workers prefork de Celery son procesos daemon de billiard: la tarea no puede crear procesos
+        import billiard
+
+        ids = [ficha.id for ficha in self.fichas]
+        with billiard.Pool(1) as pool:
+            archivos = pool.apply(generar_pdfs_fichas, (ids,))
+        self.assertEqual(len(archivos), 3)
+        for nombre, ruta in archivos:
+            with default_storage.open(ruta, 'rb') as archivo:
+                self.assertTrue(archivo.read().startswith(b'%PDF-1.4'))
+
+    def test_lote_por_paciente_y_descarga_zip(self):
+        # El chord se ejecuta en el momento (sin broker), con una tarea por ficha
+        resultado = None
+
+        def encolar(ids):
+            nonlocal resultado
+            resultado = fichas_pdf.encolar_lote(ids)
+            return resultado
+
+        conf = generar_pdfs_fichas.app.conf
+        self.addCleanup(setattr, conf, 'task_always_eager', conf.task_always_eager)
+        conf.task_always_eager = True
+        with mock.patch.object(fichas_pdf, 'FICHAS_POR_TAREA', 1), \
+                mock.patch.object(generar_pdfs_fichas, 's', wraps=generar_pdfs_fichas.s) as bloque, \
+                mock.patch('pacientes.views.encolar_lote', side_effect=encolar):
+            response = self.client.post('/api/pacientes/fichas/pdf-lote/', {'paciente': self.ana.id}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['fichas'], 2)
+        self.assertEqual([llamada.args[0] for llamada in bloque.call_args_list],
+                         [[self.fichas[0].id], [self.fichas[1].id]])
+        self.assertEqual(len(resultado.result), 2)
+
+        # Una versión depurada después de terminar el lote se regenera antes de armar el ZIP
+        default_storage.delete(resultado.result[0][1])
+        with mock.patch.object(unir_pdfs_fichas, 'AsyncResult', return_value=resultado):
+            response = self.client.get(f"/api/pacientes/fichas/pdf-lote/{resultado.id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/zip')
+            with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as libro:
+                nombres = libro.namelist()
+                self.assertTrue(all(libro.read(nombre).startswith(b'%PDF') for nombre in nombres))
+        self.assertEqual(len(nombres), 2)
+        self.assertTrue(all(nombre.startswith('ficha_11.111.111-1_2025-06-0') for nombre in nombres))
+
+        pendiente = mock.Mock(state='STARTED', **{'failed.return_value': False, 'successful.return_value': False})
+        with mock.patch.object(unir_pdfs_fichas, 'AsyncResult', return_value=pendiente):
+            response = self.client.get('/api/pacientes/fichas/pdf-lote/abc-123/')
+        self.assertEqual((response.status_code, response.data['estado']), (202, 'STARTED'))
+
+    def test_resolver_archivos(self):
+        archivos = fichas_pdf.preparar_pdfs(fichas_pdf.fichas_para_pdf())
+        self.assertEqual(fichas_pdf.resolver_archivos(archivos), archivos)
+        # Ficha editada y versión depurada: se usa la vigente; ficha eliminada: se omite
+        FichaClinica.objects.filter(pk=self.fichas[0].pk).update(indicaciones='Control en 15 días')
+        default_storage.delete(archivos[0][1])
+        default_storage.delete(archivos[2][1])
+        self.fichas[2].delete()
+        resueltos = fichas_pdf.resolver_archivos(archivos)
+        self.assertEqual(len(resueltos), 2)
+        self.assertNotEqual(resueltos[0][1], archivos[0][1])
+        self.assertTrue(default_storage.exists(resueltos[0][1]))
+        self.assertEqual(resueltos[1], archivos[1])
+
+    def test_lote_por_fechas_y_validaciones(self):
+        with mock.patch('pacientes.views.encolar_lote') as delay:
+            delay.return_value.id = 'tarea-1'
+            response = self.client.post('/api/pacientes/fichas/pdf-lote/',
+                                        {'desde': '2025-06-02', 'hasta': '2025-06-03'}, format='json')
+            self.assertEqual((response.status_code, response.data['tarea']), (202, 'tarea-1'))
+            self.assertEqual(delay.call_args.args[0], [self.fichas[1].id, self.fichas[2].id])
+
+            for datos in ({}, {'desde': '2025-06-02'}, {'paciente': 'x'}, {'desde': '02-06-2025', 'hasta': '2025-06-03'}):
+                self.assertEqual(self.client.post('/api/pacientes/fichas/pdf-lote/', datos, format='json').status_code, 400)
+            response = self.client.post('/api/pacientes/fichas/pdf-lote/',
+                                        {'desde': '2024-01-01', 'hasta': '2024-01-31'}, format='json')
+            self.assertEqual(response.status_code, 404)
+            delay.assert_called_once()
+
+
+@mock.patch.object(adjuntos, 'TAMANO_PARTE', 4096)
+class AdjuntosFichaTest(TestCase):
+    """Fotos de fichas: subida por partes, variantes sin EXIF y caché de los archivos."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123'))
+        paciente = Paciente.objects.create(rut='11.111.111-1', nombre='Ana', telefono='1', correo='')
+        self.ficha = FichaClinica.objects.create(paciente=paciente, fecha=date(2025, 6, 1), descripcion_atencion='-',
+                                                 procedimiento='-', indicaciones='-')
+
+    def _foto(self):
+        """JPEG de 800x400 girado por EXIF (orientación 6) y con la marca de la cámara."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'CamaraPrueba'
+        salida = BytesIO()
+        Image.linear_gradient('L').resize((800, 400)).convert('RGB').save(salida, 'JPEG', exif=exif.tobytes())
+        return salida.getvalue()
+
+    def _subir(self, contenido, tipo_contenido='image/jpeg'):
+        response = self.client.post(f'/api/pacientes/fichas/{self.ficha.id}/adjuntos/', {
+            'nombre': 'pie.jpg', 'tipo_contenido': tipo_contenido, 'tamano': len(contenido), 'tipo': 'antes',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        adjunto_id, tamano_parte = response.data['id'], response.data['tamano_parte']
+        self.assertEqual(response.data['total_partes'], -(-len(contenido) // tamano_parte))
+        for numero in range(response.data['total_partes']):
+            parte = contenido[numero * tamano_parte:(numero + 1) * tamano_parte]
+            response = self.client.put(f'/api/pacientes/adjuntos/{adjunto_id}/partes/{numero}/',
+                                       {'parte': SimpleUploadedFile('parte', parte)}, format='multipart')
+            self.assertEqual(response.status_code, 200)
+        with mock.patch.object(procesar_adjunto_ficha, 'delay', side_effect=procesar_adjunto_ficha) as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/pacientes/adjuntos/{adjunto_id}/completar/')
+        return adjunto_id, response, delay
+
+    def test_subida_por_partes_y_variantes(self):
+        foto = self._foto()
+        adjunto_id, response, delay = self._subir(foto)
+        self.assertEqual((response.status_code, response.data['estado']), (202, 'procesando'))
+        delay.assert_called_once_with(adjunto_id)
+
+        adjunto = AdjuntoFicha.objects.get(id=adjunto_id)
+        self.assertEqual((adjunto.estado, adjunto.ancho, adjunto.alto), ('listo', 400, 800))
+        with adjunto.original.open('rb') as original:
+            self.assertEqual(original.read(), foto)
+        with adjunto.miniatura.open('rb') as archivo:
+            contenido = archivo.read()
+        self.assertNotIn(b'CamaraPrueba', contenido)
+        with Image.open(BytesIO(contenido)) as miniatura:
+            self.assertEqual(miniatura.size, (160, 320))
+            self.assertEqual(len(miniatura.getexif()), 0)
+        with adjunto.web.open('rb') as archivo, Image.open(archivo) as web:
+            self.assertEqual(web.size, (400, 800))
+        # Las partes se borran al completar
+        self.assertFalse(default_storage.listdir(f'fichas_adjuntos/partes/{adjunto_id}')[1])
+
+    def test_listado_solo_miniaturas_y_cache(self):
+        adjunto_id, _, _ = self._subir(self._foto())
+        datos = self.client.get('/api/pacientes/fichas/', {'paciente': self.ficha.paciente_id}).data
+        [foto] = datos[0]['adjuntos']
+        self.assertEqual(set(foto), {'id', 'tipo', 'descripcion', 'estado', 'url_miniatura'})
+        self.assertTrue(foto['url_miniatura'].endswith(f'/api/pacientes/adjuntos/{adjunto_id}/miniatura/'))
+
+        response = self.client.get(f'/api/pacientes/adjuntos/{adjunto_id}/miniatura/')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        self.assertEqual(response['Cache-Control'], adjuntos.CACHE_ADJUNTOS)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\xff\xd8'))
+        response = self.client.get(f'/api/pacientes/adjuntos/{adjunto_id}/miniatura/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/api/pacientes/adjuntos/{adjunto_id}/original/')
+        self.assertIn('attachment; filename="pie.jpg"', response['Content-Disposition'])
+
+    def test_subidas_invalidas(self):
+        response = self.client.post(f'/api/pacientes/fichas/{self.ficha.id}/adjuntos/', {
+            'nombre': 'informe.pdf', 'tipo_contenido': 'application/pdf', 'tamano': 100,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        adjunto = adjuntos.iniciar_subida(self.ficha, 'pie.jpg', 'image/jpeg', 5000)
+        # Una parte de tamaño incorrecto, y completar con partes faltantes
+        response = self.client.put(f'/api/pacientes/adjuntos/{adjunto.id}/partes/0/',
+                                   {'parte': SimpleUploadedFile('parte', b'x' * 10)}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/api/pacientes/adjuntos/{adjunto.id}/completar/')
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Faltan partes: 0, 1'))
+
+        # Un archivo que no es imagen se descarta al completar
+        adjunto_id, response, delay = self._subir(b'no es una imagen')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AdjuntoFicha.objects.filter(id=adjunto_id).exists())
+        delay.assert_not_called()
+
+    def test_eliminar_y_depurar(self):
+        adjunto_id, _, _ = self._subir(self._foto())
+        rutas = [AdjuntoFicha.objects.get(id=adjunto_id).miniatura.name]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/pacientes/adjuntos/{adjunto_id}/').status_code, 204)
+        self.assertFalse(default_storage.exists(rutas[0]))
+
+        abandonado = adjuntos.iniciar_subida(self.ficha, 'pie.jpg', 'image/jpeg', 5000)
+        reciente = adjuntos.iniciar_subida(self.ficha, 'pie.jpg', 'image/jpeg', 5000)
+        AdjuntoFicha.objects.filter(id=abandonado.id).update(fecha_creacion=timezone.now() - timedelta(days=2))
+        self.assertEqual(adjuntos.depurar_subidas(), 1)
+        self.assertEqual(list(AdjuntoFicha.objects.values_list('id', flat=True)), [reciente.id])
+
+
+class BusquedaNotasTest(TestCase):
+    """Búsqueda de texto en las notas clínicas: relevancia, fragmentos y mantenimiento del índice."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123'))
+        self.ana = Paciente.objects.create(rut='11.111.111-1', nombre='Ana', telefono='1', correo='',
+                                           enfermedad_base='Diabetes tipo 2')
+        self.luis = Paciente.objects.create(rut='22.222.222-2', nombre='Luis', telefono='2', correo='',
+                                            caso_clinico='Onicomicosis recurrente en ambos pies')
+        self.curacion = self._ficha(self.ana, 1, procedimiento='Curación de uñas encarnadas',
+                                    descripcion_atencion='Dolor en el hallux', indicaciones='Calzado amplio')
+        self.limpieza = self._ficha(self.luis, 2, procedimiento='Limpieza',
+                                    descripcion_atencion='Onicomicosis en uñas <b>del pie</b>', indicaciones='Antifúngico')
+
+    def _ficha(self, paciente, dia, **textos):
+        return FichaClinica.objects.create(paciente=paciente, fecha=date(2025, 6, dia), **textos)
+
+    def _buscar(self, **parametros):
+        response = self.client.get('/api/pacientes/buscar/', parametros)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_resultados_por_relevancia_con_fragmentos(self):
+        datos = self._buscar(q='uña')
+        self.assertEqual(datos['count'], 2)
+        # La coincidencia en el procedimiento pesa más que en la descripción
+        self.assertEqual([(r['tipo'], r['id']) for r in datos['results']],
+                         [('ficha', self.curacion.id), ('ficha', self.limpieza.id)])
+        self.assertGreater(datos['results'][0]['relevancia'], datos['results'][1]['relevancia'])
+        self.assertEqual(datos['results'][0]['paciente_nombre'], 'Ana')
+        self.assertIn('<b>uñas</b>', datos['results'][0]['fragmento'])
+        # El texto de las notas se escapa: solo las coincidencias llevan HTML
+        self.assertIn('&lt;b&gt;del pie&lt;/b&gt;', datos['results'][1]['fragmento'])
+
+        self.assertEqual(self._buscar(q='CURACION')['results'][0]['id'], self.curacion.id)
+        resultados = self._buscar(q='onicomicosis')['results']
+        self.assertEqual({(r['tipo'], r['id']) for r in resultados},
+                         {('ficha', self.limpieza.id), ('paciente', self.luis.id)})
+        self.assertEqual([r['tipo'] for r in self._buscar(q='onicomicosis', tipo='paciente')['results']], ['paciente'])
+        self.assertEqual(self._buscar(q='uñas', paciente=self.luis.id)['count'], 1)
+        # Todos los términos deben aparecer
+        self.assertEqual(self._buscar(q='onicomicosis calzado')['count'], 0)
+
+    def test_paginacion_y_validaciones(self):
+        datos = self._buscar(q='uñas', page_size=1)
+        self.assertEqual((datos['count'], len(datos['results'])), (2, 1))
+        self.assertIsNotNone(datos['next'])
+        for parametros in ({}, {'q': 'de la'}, {'q': 'uñas', 'tipo': 'cita'}, {'q': 'uñas', 'paciente': 'x'}):
+            self.assertEqual(self.client.get('/api/pacientes/buscar/', parametros).status_code, 400, parametros)
+
+    def test_indice_sigue_los_cambios(self):
+        self.curacion.procedimiento = 'Quiropodia'
+        self.curacion.save()
+        self.assertEqual(self._buscar(q='quiropodia')['results'][0]['id'], self.curacion.id)
+        self.assertEqual(self._buscar(q='encarnadas')['count'], 0)
+
+        # Guardar solo el costo no vuelve a indexar
+        with CaptureQueriesContext(connection) as contexto:
+            self.curacion.calcular_costo_total()
+        self.assertFalse(any('busqueda' in consulta['sql'] for consulta in contexto.captured_queries))
+
+        self.limpieza.delete()
+        self.assertEqual(self._buscar(q='antifúngico')['count'], 0)
+        self.ana.enfermedad_base = ''
+        self.ana.save()
+        self.assertFalse(DocumentoBusqueda.objects.filter(tipo='paciente', objeto_id=self.ana.id).exists())
+
+    def test_reindexar(self):
+        FichaClinica.objects.bulk_create([FichaClinica(
+            paciente=self.ana, fecha=date(2025, 6, 9), descripcion_atencion='Verruga plantar',
+            procedimiento='-', indicaciones='-',
+        )])
+        DocumentoBusqueda.objects.filter(tipo='paciente').delete()
+        self.assertEqual(self._buscar(q='verruga')['count'], 0)
+
+        salida = io.StringIO()
+        call_command('indexar_busqueda', stdout=salida)
+        self.assertIn('5 fichas y pacientes revisados', salida.getvalue())
+        self.assertEqual(self._buscar(q='verruga')['count'], 1)
+        self.assertEqual(self._buscar(q='diabetes')['results'][0]['tipo'], 'paciente')
 
-# Create your tests here.
+    @skipUnless(connection.vendor == 'postgresql', 'Requiere PostgreSQL')
+    def test_tsvector_en_postgresql(self):
+        self.assertTrue(DocumentoBusqueda.objects.filter(vector__isnull=False).exists())
+        self.assertEqual(self._buscar(q='"uñas encarnadas"')['results'][0]['id'], self.curacion.id)
+        self.assertEqual(self._buscar(q='uñas -hallux')['results'][0]['id'], self.limpieza.id)
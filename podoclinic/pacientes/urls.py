@@ -4,6 +4,7 @@ from . import views
 
 router = DefaultRouter()
 router.register(r'fichas', views.FichaClinicaViewSet, basename='fichas')
+router.register(r'adjuntos', views.AdjuntoFichaViewSet, basename='adjuntos')
 router.register(r'', views.PacienteViewSet, basename='pacientes')
 
 urlpatterns = [
@@ -11,6 +12,7 @@ urlpatterns = [
     path('actualizar_paciente_admin/', views.actualizar_paciente_admin, name='actualizar_paciente_admin'),
     path('eliminar_paciente_admin/<str:rut>/', views.eliminar_paciente_admin, name='eliminar_paciente_admin'),
     path('verificar_rut/', views.verificar_rut_existente, name='verificar_rut_existente'),
+    path('buscar/', views.buscar_notas, name='buscar_notas'),
     path('backup/', views.backup_database, name='backup_database'),
 
     path('', include(router.urls)),
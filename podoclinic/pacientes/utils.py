@@ -39,11 +39,17 @@ def validar_rut(rut):
     if not cuerpo.isdigit():
         return False
     
-    # Calcula dígito verificador
+    # Compara dígito verificador calculado con el proporcionado
+    return dv == calcular_digito_verificador(cuerpo)
+
+def calcular_digito_verificador(cuerpo):
+    """
+    Calcula el dígito verificador (módulo 11) para el cuerpo numérico de un RUT.
+    """
     suma = 0
     multiplicador = 2
     
-    for d in reversed(cuerpo):
+    for d in reversed(str(cuerpo)):
         suma += int(d) * multiplicador
         multiplicador += 1
         if multiplicador > 7:
@@ -53,11 +59,7 @@ def validar_rut(rut):
     dv_calculado = 11 - resto
     
     if dv_calculado == 11:
-        dv_calculado = '0'
+        return '0'
     elif dv_calculado == 10:
-        dv_calculado = 'K'
-    else:
-        dv_calculado = str(dv_calculado)
-    
-    # Compara dígito verificador calculado con el proporcionado
-    return dv == dv_calculado
\ No newline at end of file
+        return 'K'
+    return str(dv_calculado)
\ No newline at end of file
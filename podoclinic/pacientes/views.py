@@ -1,20 +1,34 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from .models import Paciente, FichaClinica, UsoProductoEnFicha
-from .serializers import PacienteSerializer, FichaClinicaSerializer, UsoProductoEnFichaSerializer
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
+from .models import Paciente, FichaClinica, UsoProductoEnFicha, AdjuntoFicha, DocumentoBusqueda
+from .serializers import (
+    PacienteSerializer, FichaClinicaSerializer, UsoProductoEnFichaSerializer, AdjuntoFichaSerializer,
+    ResultadoBusquedaSerializer,
+)
 import logging
 from django.db import transaction, connection
+from django.db.models import Prefetch
 import json
 import io
+import itertools
 from datetime import datetime
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core import serializers
 from django.apps import apps
+from django.core.files.storage import default_storage
+from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
+from citas.cambios import respuesta_cambios
+from podoclinic.consultas import ContadorConsultas
+from . import adjuntos, busqueda
+from .fichas_pdf import MAX_FICHAS_LOTE, encolar_lote, fichas_para_pdf, preparar_pdfs, resolver_archivos, zip_pdfs
+from .tasks import unir_pdfs_fichas
 
 logger = logging.getLogger(__name__)
 
@@ -285,36 +299,59 @@ class PacienteViewSet(viewsets.ModelViewSet):
                 
         return queryset
 
+    @action(detail=False, methods=['get'])
+    def cambios(self, request):
+        """Feed de cambios: pacientes creados, modificados o eliminados desde `?cursor=`."""
+        return respuesta_cambios(
+            request, self.get_queryset(), 'paciente',
+            serializar=lambda pacientes: self.get_serializer(pacientes, many=True).data,
+        )
+
+class FichaClinicaPagination(PageNumberPagination):
+    """
+    Paginación opcional para las fichas clínicas.
+    Solo se aplica si el cliente envía `page` o `page_size`; sin esos parámetros
+    la respuesta sigue siendo una lista simple (compatibilidad con el frontend).
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.page_query_param not in request.query_params
+                and self.page_size_query_param not in request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
 class FichaClinicaViewSet(viewsets.ModelViewSet):
     queryset = FichaClinica.objects.all()
     serializer_class = FichaClinicaSerializer
     permission_classes = [AllowAny]
+    pagination_class = FichaClinicaPagination
     
     def get_queryset(self):
         try:
-            logger.info("Iniciando get_queryset en FichaClinicaViewSet")
             queryset = FichaClinica.objects.all()
             
-            # Primero obtenemos las fichas sin los productos
             paciente_id = self.request.query_params.get('paciente', None)
-            logger.info(f"Parámetro paciente_id recibido: {paciente_id}")
             
             if paciente_id is not None:
                 try:
                     paciente_id = int(paciente_id)
                     queryset = queryset.filter(paciente_id=paciente_id)
-                    logger.info(f"Filtrado por paciente_id: {paciente_id}")
                 except ValueError:
                     logger.error(f"ID de paciente inválido: {paciente_id}")
                     return FichaClinica.objects.none()
             
-            # Luego hacemos el prefetch_related
+            # Los productos e insumos se cargan con dos consultas fijas (prefetch),
+            # sin importar cuántas fichas haya
             queryset = queryset.prefetch_related(
                 'productos_usados',
-                'productos_usados__insumo'
-            )
+                'productos_usados__insumo',
+                # De las fotos, el listado solo entrega la URL de la miniatura
+                Prefetch('adjuntos', queryset=AdjuntoFicha.objects.exclude(estado='subiendo').order_by('id')),
+            ).order_by('-fecha', '-id')
             
-            logger.info(f"Número de fichas encontradas: {queryset.count()}")
             return queryset
             
         except Exception as e:
@@ -323,23 +360,20 @@ class FichaClinicaViewSet(viewsets.ModelViewSet):
     
     def list(self, request, *args, **kwargs):
         try:
-            logger.info("Iniciando list en FichaClinicaViewSet")
-            queryset = self.get_queryset()
-            
-            # Verificar si el queryset está vacío
-            if not queryset.exists():
-                logger.info("No se encontraron fichas clínicas")
-                return Response([], status=status.HTTP_200_OK)
+            with ContadorConsultas() as contador:
+                queryset = self.filter_queryset(self.get_queryset())
+                
+                page = self.paginate_queryset(queryset)
+                if page is not None:
+                    serializer = self.get_serializer(page, many=True)
+                    response = self.get_paginated_response(serializer.data)
+                else:
+                    serializer = self.get_serializer(queryset, many=True)
+                    response = Response(serializer.data)
             
-            # Serializar los datos con manejo de errores
-            try:
-                serializer = self.get_serializer(queryset, many=True)
-                data = serializer.data
-                logger.info(f"Datos serializados correctamente. Número de fichas: {len(data)}")
-                return Response(data)
-            except Exception as e:
-                logger.error(f"Error al serializar datos: {str(e)}", exc_info=True)
-                raise
+            logger.info(f"list fichas: {len(serializer.data)} fichas en {contador.total} consultas")
+            response['X-Consultas-DB'] = str(contador.total)
+            return response
                 
         except Exception as e:
             logger.error(f"Error en list: {str(e)}", exc_info=True)
@@ -409,6 +443,150 @@ class FichaClinicaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def pdf(self, request, pk=None):
+        """PDF de la ficha (desde la caché si su contenido no cambió)."""
+        ficha = get_object_or_404(fichas_para_pdf(), pk=pk)
+        [[nombre, ruta]] = preparar_pdfs([ficha])
+        with default_storage.open(ruta, 'rb') as archivo:
+            response = HttpResponse(archivo.read(), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='pdf-lote', permission_classes=[IsAuthenticated])
+    def pdf_lote(self, request):
+        """
+        Inicia la generación de los PDF de las fichas de un paciente (`paciente`) o
+        de un rango de fechas (`desde` y `hasta`, YYYY-MM-DD). Responde 202 con el id
+        de la tarea; el ZIP se descarga desde pdf-lote/<tarea>/.
+        """
+        fichas = FichaClinica.objects.all()
+        try:
+            paciente = request.data.get('paciente')
+            desde_str, hasta_str = request.data.get('desde'), request.data.get('hasta')
+            if not paciente and not (desde_str and hasta_str):
+                raise ValueError('Indique paciente, o desde y hasta')
+            if paciente:
+                fichas = fichas.filter(paciente_id=int(paciente))
+            if desde_str:
+                fichas = fichas.filter(fecha__gte=datetime.strptime(desde_str, '%Y-%m-%d').date())
+            if hasta_str:
+                fichas = fichas.filter(fecha__lte=datetime.strptime(hasta_str, '%Y-%m-%d').date())
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Parámetros inválidos. Use paciente=<id>, o desde=YYYY-MM-DD y hasta=YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids = list(fichas.order_by('fecha', 'id').values_list('id', flat=True)[:MAX_FICHAS_LOTE + 1])
+        if not ids:
+            return Response({'error': 'No hay fichas para exportar'}, status=status.HTTP_404_NOT_FOUND)
+        if len(ids) > MAX_FICHAS_LOTE:
+            return Response(
+                {'error': f'El lote supera las {MAX_FICHAS_LOTE} fichas; acote el rango de fechas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        tarea = encolar_lote(ids)
+        return Response({'tarea': tarea.id, 'fichas': len(ids)}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'pdf-lote/(?P<tarea>[\w-]+)',
+            permission_classes=[IsAuthenticated])
+    def descargar_pdf_lote(self, request, tarea=None):
+        """Estado de la tarea de un lote; cuando terminó, el ZIP con los PDF en streaming."""
+        resultado = unir_pdfs_fichas.AsyncResult(tarea)
+        if resultado.failed():
+            logger.error(f"Falló la generación del lote de PDF {tarea}: {resultado.result}")
+            return Response({'error': 'Error al generar los PDF de las fichas'},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if not resultado.successful():
+            return Response({'tarea': tarea, 'estado': resultado.state}, status=status.HTTP_202_ACCEPTED)
+
+        # Las versiones depuradas se regeneran antes de empezar: el ZIP no puede cortarse a medias
+        archivos = resolver_archivos(resultado.result)
+        response = StreamingHttpResponse(zip_pdfs(archivos), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="fichas_{tarea}.zip"'
+        return response
+
+    @action(detail=True, methods=['get', 'post'], url_path='adjuntos', permission_classes=[IsAuthenticated])
+    def adjuntos_ficha(self, request, pk=None):
+        """
+        GET: fotos de la ficha. POST: inicia la subida por partes de una foto con
+        `nombre`, `tipo_contenido`, `tamano` (bytes), `tipo` (antes/despues/otro) y
+        `descripcion`; responde con el adjunto, el tamaño de cada parte y cuántas son.
+        """
+        ficha = get_object_or_404(FichaClinica, pk=pk)
+        if request.method == 'GET':
+            fotos = ficha.adjuntos.exclude(estado='subiendo').order_by('id')
+            return Response(AdjuntoFichaSerializer(fotos, many=True, context={'request': request}).data)
+        try:
+            adjunto = adjuntos.iniciar_subida(
+                ficha, str(request.data.get('nombre', '')), request.data.get('tipo_contenido', ''),
+                int(request.data.get('tamano', 0)), tipo=request.data.get('tipo', 'otro'),
+                descripcion=str(request.data.get('descripcion', '')),
+            )
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        datos = AdjuntoFichaSerializer(adjunto, context={'request': request}).data
+        datos.update({'tamano_parte': adjuntos.TAMANO_PARTE, 'total_partes': adjuntos.total_partes(adjunto)})
+        return Response(datos, status=status.HTTP_201_CREATED)
+
+class AdjuntoFichaViewSet(mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Fotos de las fichas (pacientes/adjuntos.py): envío de partes, cierre de la
+    subida y descarga de la miniatura, la versión web o el original.
+    """
+    queryset = AdjuntoFicha.objects.all()
+    serializer_class = AdjuntoFichaSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['put'], url_path=r'partes/(?P<numero>\d+)', parser_classes=[MultiPartParser])
+    def partes(self, request, pk=None, numero=None):
+        """Recibe la parte `numero` (desde 0) en el campo multipart `parte`."""
+        adjunto = self.get_object()
+        archivo = request.FILES.get('parte')
+        if archivo is None:
+            return Response({'error': 'Falta el archivo de la parte (campo "parte")'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            adjuntos.guardar_parte(adjunto, int(numero), archivo)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'parte': int(numero), 'total_partes': adjuntos.total_partes(adjunto)})
+
+    @action(detail=True, methods=['post'])
+    def completar(self, request, pk=None):
+        """Une las partes y encola la generación de la miniatura y la versión web."""
+        adjunto = self.get_object()
+        try:
+            adjuntos.completar_subida(adjunto)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(adjunto).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path=r'(?P<variante>miniatura|web|original)')
+    def archivo(self, request, pk=None, variante=None):
+        """
+        Archivo de una variante. No cambia nunca para un mismo adjunto, así que se
+        entrega con caché de un año y ETag (304 si el cliente ya lo tiene).
+        """
+        adjunto = self.get_object()
+        campo = getattr(adjunto, variante)
+        if (variante != 'original' and adjunto.estado != 'listo') or not campo:
+            return Response({'error': 'El archivo aún no está disponible', 'estado': adjunto.estado},
+                            status=status.HTTP_404_NOT_FOUND)
+        etiqueta = f'"{adjunto.id}-{variante}"'
+        if request.headers.get('If-None-Match') == etiqueta:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            es_original = variante == 'original'
+            response = FileResponse(
+                campo.open('rb'), content_type=adjunto.tipo_contenido if es_original else 'image/jpeg',
+                as_attachment=es_original, filename=adjunto.nombre_original if es_original else None,
+            )
+        response['ETag'] = etiqueta
+        response['Cache-Control'] = adjuntos.CACHE_ADJUNTOS
+        return response
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 @csrf_exempt
@@ -501,9 +679,11 @@ def _generate_sql_backup(models_to_backup):
                 app_label, model_class_name = model_name.split('.')
                 model_class = apps.get_model(app_label, model_class_name)
                 table_name = model_class._meta.db_table
-                objects = model_class.objects.all()
+                objects = model_class.objects.all().order_by('pk')
+                rows = objects.iterator()
+                primero = next(rows, None)
                 
-                if objects.exists():
+                if primero is not None:
                     # Obtener nombres de columnas
                     field_names = []
                     for field in model_class._meta.fields:
@@ -526,10 +706,11 @@ def _generate_sql_backup(models_to_backup):
                     ])
                     
                     # Generar datos en formato COPY (separados por tabs)
-                    for obj in objects:
+                    for obj in itertools.chain([primero], rows):
                         values = []
                         for field in model_class._meta.fields:
-                            field_value = getattr(obj, field.name)
+                            # attname devuelve el id de las llaves foráneas sin consultar el objeto relacionado
+                            field_value = getattr(obj, field.attname)
                             
                             if field_value is None:
                                 values.append('\\N')
@@ -568,7 +749,7 @@ def _generate_insert_sql(obj, table_name):
     
     for field in obj._meta.fields:
         field_name = field.column
-        field_value = getattr(obj, field.name)
+        field_value = getattr(obj, field.attname)
         
         fields.append(f'"{field_name}"')
         
@@ -626,12 +807,10 @@ def verificar_rut_existente(request):
                 status=status.HTTP_200_OK
             )
         
-        # Verificar si existe un paciente con ese RUT
-        existe = Paciente.objects.filter(rut=rut_formateado).exists()
+        # Buscar el paciente con ese RUT (una sola consulta)
+        paciente = Paciente.objects.filter(rut=rut_formateado).first()
         
-        if existe:
-            # Obtener información básica del paciente existente
-            paciente = Paciente.objects.get(rut=rut_formateado)
+        if paciente is not None:
             return Response({
                 'existe': True,
                 'rut_valido': True,
@@ -655,4 +834,33 @@ def verificar_rut_existente(request):
         return Response(
             {'error': f'Error al verificar el RUT: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+class BusquedaPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def buscar_notas(request):
+    """
+    Búsqueda de texto completo en las notas clínicas (pacientes/busqueda.py).
+    Parámetros: ?q= (obligatorio), ?tipo=ficha|paciente, ?paciente=<id>, ?page= y ?page_size=.
+    Resultados ordenados por relevancia, con un fragmento del texto (HTML, coincidencias en <b>).
+    """
+    consulta = request.query_params.get('q', '').strip()
+    tipo = request.query_params.get('tipo') or None
+    try:
+        if tipo and tipo not in dict(DocumentoBusqueda.TIPOS):
+            raise ValueError('Tipo no válido. Use ficha o paciente')
+        paciente = int(request.query_params['paciente']) if request.query_params.get('paciente') else None
+        documentos = busqueda.buscar(consulta, tipo=tipo, paciente=paciente)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginador = BusquedaPagination()
+    pagina = busqueda.agregar_fragmentos(paginador.paginate_queryset(documentos, request), consulta)
+    return paginador.get_paginated_response(ResultadoBusquedaSerializer(pagina, many=True).data)
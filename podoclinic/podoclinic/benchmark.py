@@ -0,0 +1,45 @@
+import math
+import statistics
+import time
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolación lineal sobre valores ordenados."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100
+    inferior = math.floor(posicion)
+    superior = math.ceil(posicion)
+    if inferior == superior:
+        return ordenados[inferior]
+    fraccion = posicion - inferior
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * fraccion
+
+
+def medir(funcion, repeticiones=20, calentamiento=2):
+    """
+    Ejecuta `funcion(i)` `calentamiento` veces sin medir y luego `repeticiones`
+    veces midiendo cada llamada. Devuelve latencias en milisegundos y throughput.
+    `i` es el número de iteración, útil para generar datos distintos por llamada.
+    """
+    for i in range(calentamiento):
+        funcion(i)
+
+    tiempos = []
+    inicio_total = time.perf_counter()
+    for i in range(calentamiento, calentamiento + repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    total = time.perf_counter() - inicio_total
+
+    return {
+        'repeticiones': repeticiones,
+        'p50_ms': round(percentil(tiempos, 50), 3),
+        'p95_ms': round(percentil(tiempos, 95), 3),
+        'media_ms': round(statistics.fmean(tiempos), 3),
+        'min_ms': round(min(tiempos), 3),
+        'max_ms': round(max(tiempos), 3),
+        'req_por_segundo': round(repeticiones / total, 2) if total else None,
+    }
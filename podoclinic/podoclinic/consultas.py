@@ -0,0 +1,28 @@
+from django.db import connection
+
+
+class ContadorConsultas:
+    """
+    Cuenta las consultas SQL ejecutadas dentro de un bloque `with`.
+    Usa connection.execute_wrapper, por lo que funciona también con DEBUG=False
+    y no agrega consultas propias (a diferencia de hacer count() para registrar).
+    """
+
+    def __init__(self, using=None):
+        self.connection = using or connection
+        self.total = 0
+        self._contexto = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.total = 0
+        self._contexto = self.connection.execute_wrapper(self)
+        self._contexto.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._contexto.__exit__(exc_type, exc_value, traceback)
+        self._contexto = None
@@ -0,0 +1,248 @@
+"""
+Exportaciones en streaming (CSV y XLSX) de citas, pacientes, fichas y movimientos.
+
+Las filas se leen con values_list(...).iterator(): en PostgreSQL es un cursor del
+servidor que trae CHUNK_FILAS filas por vez, sin instanciar modelos, y las columnas
+de otras tablas salen del mismo JOIN. Cada bloque de filas se escribe y se entrega
+a StreamingHttpResponse antes de leer el siguiente, así que la memoria no depende
+del tamaño de la exportación y el primer byte sale con el primer bloque.
+
+El XLSX se arma sin dependencias: es un ZIP (escrito con zipfile sobre un buffer
+que se vacía en cada bloque, sin volver atrás en el archivo) con una sola hoja de
+texto y números en línea.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+# Filas por lectura del cursor y por bloque entregado al cliente
+CHUNK_FILAS = 2000
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _modelo(etiqueta):
+    from django.apps import apps
+    return apps.get_model(etiqueta)
+
+
+# recurso: modelo, campo de fecha para desde/hasta y columnas {nombre: ruta para values_list}
+EXPORTACIONES = {
+    'citas': {
+        'modelo': 'citas.Cita',
+        'campo_fecha': 'fecha',
+        'columnas': {
+            'id': 'id', 'fecha': 'fecha', 'hora': 'hora', 'estado': 'estado', 'tipo_cita': 'tipo_cita',
+            'duracion_cita': 'duracion_cita', 'paciente_rut': 'paciente__rut', 'paciente_nombre': 'paciente__nombre',
+            'tratamiento': 'tratamiento__nombre', 'precio': 'tratamiento__precio', 'recurso': 'recurso__nombre',
+            'fecha_creacion': 'fecha_creacion',
+        },
+    },
+    'pacientes': {
+        'modelo': 'pacientes.Paciente',
+        'campo_fecha': 'fecha_registro',
+        'columnas': {
+            'id': 'id', 'rut': 'rut', 'nombre': 'nombre', 'telefono': 'telefono', 'correo': 'correo',
+            'fecha_nacimiento': 'fecha_nacimiento', 'direccion': 'direccion', 'enfermedad_base': 'enfermedad_base',
+            'contacto_emergencia': 'contacto_emergencia', 'fecha_registro': 'fecha_registro',
+        },
+    },
+    'fichas': {
+        'modelo': 'pacientes.FichaClinica',
+        'campo_fecha': 'fecha',
+        'columnas': {
+            'id': 'id', 'fecha': 'fecha', 'paciente_rut': 'paciente__rut', 'paciente_nombre': 'paciente__nombre',
+            'cita': 'cita_id', 'tratamiento': 'cita__tratamiento__nombre',
+            'descripcion_atencion': 'descripcion_atencion', 'procedimiento': 'procedimiento',
+            'indicaciones': 'indicaciones', 'proxima_sesion_estimada': 'proxima_sesion_estimada',
+            'costo_total': 'costo_total',
+        },
+    },
+    'movimientos': {
+        'modelo': 'insumos.MovimientoInsumo',
+        'campo_fecha': 'fecha_movimiento',
+        'columnas': {
+            'id': 'id', 'fecha_movimiento': 'fecha_movimiento', 'insumo': 'insumo__nombre',
+            'tipo_movimiento': 'tipo_movimiento', 'cantidad': 'cantidad', 'lote': 'lote__codigo',
+            'motivo': 'motivo', 'usuario': 'usuario__username',
+        },
+    },
+}
+
+
+def filas_exportacion(recurso, columnas=None, desde=None, hasta=None):
+    """
+    (encabezados, iterador de filas) de `recurso`, con las `columnas` pedidas (por
+    defecto, todas) y filtrado por días locales completos de `desde` a `hasta`.
+    Lanza ValueError si el recurso o alguna columna no existen.
+    """
+    if recurso not in EXPORTACIONES:
+        raise ValueError(f"Exportación no válida: {recurso}")
+    definicion = EXPORTACIONES[recurso]
+    columnas = columnas or list(definicion['columnas'])
+    desconocidas = [columna for columna in columnas if columna not in definicion['columnas']]
+    if desconocidas:
+        raise ValueError(f"Columnas no válidas: {', '.join(desconocidas)}")
+
+    modelo = _modelo(definicion['modelo'])
+    campo = definicion['campo_fecha']
+    queryset = modelo.objects.all()
+    # Los campos de fecha y hora se filtran como rango, para usar sus índices
+    con_hora = modelo._meta.get_field(campo).get_internal_type() == 'DateTimeField'
+    limite = (lambda dia: timezone.make_aware(datetime.combine(dia, time.min))) if con_hora else (lambda dia: dia)
+    if desde:
+        queryset = queryset.filter(**{f'{campo}__gte': limite(desde)})
+    if hasta:
+        queryset = queryset.filter(**{f'{campo}__lt': limite(hasta + timedelta(days=1))})
+
+    rutas = [definicion['columnas'][columna] for columna in columnas]
+    filas = queryset.order_by('id').values_list(*rutas).iterator(chunk_size=CHUNK_FILAS)
+    return columnas, filas
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S') if timezone.is_aware(valor) else valor.isoformat(' ')
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _bloques(filas):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= CHUNK_FILAS:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+class BufferSalida:
+    """Destino de escritura que acumula lo escrito hasta que se lo vacía (sin seek ni tell)."""
+
+    def __init__(self, vacio):
+        self._vacio = vacio
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = self._vacio.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _celda_csv(valor):
+    texto = _texto(valor)
+    # Un texto que empieza con =, +, - o @ se abriría como fórmula en una planilla; un
+    # tabulador o retorno inicial también, porque algunas planillas lo descartan al importar
+    if isinstance(valor, str) and texto[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + texto
+    return texto
+
+
+def generar_csv(encabezados, filas):
+    """CSV en UTF-8 con BOM (para que las planillas reconozcan los acentos), por bloques."""
+    buffer = BufferSalida('')
+    escritor = csv.writer(buffer)
+    yield '\ufeff'
+    escritor.writerow(encabezados)
+    yield buffer.vaciar()
+    for bloque in _bloques(filas):
+        escritor.writerows([_celda_csv(valor) for valor in fila] for fila in bloque)
+        yield buffer.vaciar()
+
+
+# Caracteres no permitidos en XML 1.0
+_NO_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda_xlsx(valor):
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    texto = _NO_XML.sub('', _texto(valor))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _fila_xlsx(valores):
+    return '<row>' + ''.join(_celda_xlsx(valor) for valor in valores) + '</row>'
+
+
+def generar_xlsx(encabezados, filas):
+    """Libro XLSX de una hoja, escrito y entregado por bloques."""
+    buffer = BufferSalida(b'')
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _XLSX_ESTATICOS.items():
+            libro.writestr(nombre, contenido)
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _fila_xlsx(encabezados)
+            ).encode('utf-8'))
+            yield buffer.vaciar()
+            for bloque in _bloques(filas):
+                hoja.write(''.join(_fila_xlsx(fila) for fila in bloque).encode('utf-8'))
+                yield buffer.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield buffer.vaciar()
+
+
+def generar(formato, encabezados, filas):
+    return generar_xlsx(encabezados, filas) if formato == 'xlsx' else generar_csv(encabezados, filas)
@@ -0,0 +1,271 @@
+"""
+Bus de invalidación de cachés locales entre procesos (workers de gunicorn y Celery).
+
+Cada modelo registrado con `registrar_modelo` publica, después del commit, un
+mensaje compacto "app.modelo|clave" al guardarse o eliminarse. El transporte es
+LISTEN/NOTIFY de PostgreSQL, o pub/sub de Redis como alternativa (otros motores
+o INVALIDACION_BACKEND='redis'). Un hilo por proceso escucha el canal y elimina
+las entradas correspondientes de las instancias de `CacheLocal`. Con Redis la
+publicación se encola y no bloquea la petición (podoclinic/publicacion.py).
+
+Las cachés solo guardan valores leídos en transacciones confirmadas (on_commit),
+y cada entrada vence tras un TTL como red de seguridad si el bus se cae.
+"""
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'podoclinic_invalidacion'
+
+# Clave que invalida todas las entradas dependientes de un modelo
+TODAS = '*'
+
+_caches = []
+_claves_por_modelo = {}
+
+
+def _configuracion(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+class CacheLocal:
+    """
+    Caché en memoria del proceso, acotada (LRU) y con TTL, que se invalida cuando
+    cambia alguno de los `modelos` de los que depende (etiquetas 'app.modelo').
+
+    Las claves se comparan como texto y pueden ser tuplas: un mensaje con clave `k`
+    elimina la entrada `k` y todas las entradas cuya tupla empieza por `k`.
+    """
+
+    def __init__(self, nombre, modelos, ttl=None, max_entradas=1024):
+        self.nombre = nombre
+        self.modelos = set(modelos)
+        self.ttl = ttl if ttl is not None else _configuracion('INVALIDACION_TTL', 300)
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._generacion = 0
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def obtener(self, clave, calcular):
+        """Devuelve el valor cacheado para `clave` o lo calcula con `calcular()`."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[1] > time.monotonic():
+                self._entradas.move_to_end(clave)
+                return entrada[0]
+            generacion = self._generacion
+
+        valor = calcular()
+        # Guardar solo lo leído en una transacción confirmada
+        transaction.on_commit(lambda: self._guardar(clave, valor, generacion))
+        return valor
+
+    def _guardar(self, clave, valor, generacion):
+        # Sin escucha conectada este proceso no se enteraría de cambios hechos en otros
+        if not escucha.iniciar():
+            return
+        with self._lock:
+            # Si hubo una invalidación mientras se calculaba, el valor puede estar obsoleto
+            if generacion != self._generacion:
+                return
+            self._entradas[clave] = (valor, time.monotonic() + self.ttl)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave=TODAS):
+        with self._lock:
+            self._generacion += 1
+            if clave == TODAS:
+                self._entradas.clear()
+                return
+            clave = str(clave)
+            for k in [k for k in self._entradas
+                      if str(k) == clave or (isinstance(k, tuple) and k and str(k[0]) == clave)]:
+                del self._entradas[k]
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+def procesar_mensaje(mensaje):
+    """Aplica un mensaje "app.modelo|clave" a las cachés locales que dependen del modelo."""
+    etiqueta, _, clave = mensaje.partition('|')
+    for cache in _caches:
+        if etiqueta in cache.modelos:
+            cache.invalidar(clave or TODAS)
+
+
+def invalidar_todo():
+    """Vacía todas las cachés locales (por ejemplo, tras perder mensajes del bus)."""
+    for cache in _caches:
+        cache.invalidar()
+
+
+def _backend():
+    backend = _configuracion('INVALIDACION_BACKEND', None)
+    if backend:
+        return backend
+    return 'postgresql' if connections['default'].vendor == 'postgresql' else 'redis'
+
+
+def _url_redis():
+    return _configuracion('INVALIDACION_REDIS_URL', None) or settings.CELERY_BROKER_URL
+
+
+_publicador = None
+
+
+def _publicador_redis():
+    global _publicador
+    if _publicador is None:
+        from .publicacion import PublicadorRedis
+        _publicador = PublicadorRedis('invalidación de cachés', _url_redis)
+    return _publicador
+
+
+def _publicar(mensaje):
+    """Envía el mensaje a los demás procesos. Un fallo se registra y no interrumpe al llamador."""
+    if _backend() != 'postgresql':
+        # Encolado: si Redis está caído se descarta sin esperar (las entradas vencen por TTL)
+        _publicador_redis().publicar(CANAL, mensaje)
+        return
+    try:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, mensaje])
+    except Exception as e:
+        logger.warning(f"No se pudo publicar la invalidación {mensaje}: {str(e)}")
+
+
+def publicar_cambio(etiqueta, clave=TODAS):
+    """Invalida localmente y avisa a los demás procesos, ambos después del commit."""
+    mensaje = f'{etiqueta}|{clave}'
+
+    def enviar():
+        procesar_mensaje(mensaje)
+        _publicar(mensaje)
+
+    transaction.on_commit(enviar)
+
+
+def registrar_modelo(modelo, clave=None):
+    """
+    Conecta post_save/post_delete de `modelo` al bus. `clave(instancia)` indica
+    qué parte de las cachés afecta el cambio (por defecto, todas las entradas);
+    puede devolver un valor o un set/lista de valores.
+    """
+    etiqueta = modelo._meta.label_lower
+    _claves_por_modelo[etiqueta] = clave
+
+    def al_cambiar(sender, instance, **kwargs):
+        funcion = _claves_por_modelo.get(etiqueta)
+        valores = funcion(instance) if funcion else TODAS
+        if not isinstance(valores, (set, frozenset, list)):
+            valores = [valores]
+        for valor in valores:
+            if valor is not None:
+                publicar_cambio(etiqueta, str(valor))
+
+    post_save.connect(al_cambiar, sender=modelo, weak=False, dispatch_uid=f'invalidacion_{etiqueta}_save')
+    post_delete.connect(al_cambiar, sender=modelo, weak=False, dispatch_uid=f'invalidacion_{etiqueta}_delete')
+
+
+class _Escucha:
+    """Hilo por proceso que recibe los mensajes del bus y los aplica a las cachés locales."""
+
+    ESPERA_MAXIMA = 60
+
+    def __init__(self):
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self.conectado = threading.Event()
+
+    def _activo(self):
+        # Tras un fork (workers de gunicorn/Celery) el hilo del padre no existe en el hijo
+        return self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive()
+
+    def iniciar(self):
+        """Inicia el hilo si no está corriendo. Devuelve True si ya está escuchando el canal."""
+        if not self._activo():
+            with self._lock:
+                if not self._activo():
+                    self._pid = os.getpid()
+                    self.conectado.clear()
+                    self._detener.clear()
+                    self._hilo = threading.Thread(target=self._ejecutar, name='invalidacion-cache', daemon=True)
+                    self._hilo.start()
+        return self.conectado.is_set()
+
+    def detener(self, espera=10):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+
+    def _ejecutar(self):
+        espera = 1
+        while not self._detener.is_set():
+            try:
+                if _backend() == 'postgresql':
+                    self._escuchar_postgresql()
+                else:
+                    self._escuchar_redis()
+                espera = 1
+            except Exception as e:
+                self.conectado.clear()
+                logger.warning(f"Bus de invalidación desconectado ({str(e)}); reintento en {espera} s")
+                self._detener.wait(espera)
+                espera = min(espera * 2, self.ESPERA_MAXIMA)
+            self.conectado.clear()
+            # Pudieron perderse mensajes mientras no había conexión
+            invalidar_todo()
+
+    def _escuchar_postgresql(self):
+        # Conexión propia y fuera de Django: LISTEN necesita autocommit y una conexión dedicada
+        base = connections['default']
+        conexion = base.get_new_connection(base.get_connection_params())
+        try:
+            conexion.autocommit = True
+            with conexion.cursor() as cursor:
+                cursor.execute(f'LISTEN {CANAL}')
+            invalidar_todo()
+            self.conectado.set()
+            while not self._detener.is_set():
+                if select.select([conexion], [], [], 5) == ([], [], []):
+                    continue
+                conexion.poll()
+                while conexion.notifies:
+                    procesar_mensaje(conexion.notifies.pop(0).payload)
+        finally:
+            conexion.close()
+
+    def _escuchar_redis(self):
+        import redis
+        cliente = redis.Redis.from_url(_url_redis(), socket_connect_timeout=1)
+        pubsub = cliente.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CANAL)
+            invalidar_todo()
+            self.conectado.set()
+            while not self._detener.is_set():
+                mensaje = pubsub.get_message(timeout=5)
+                if mensaje:
+                    datos = mensaje['data']
+                    procesar_mensaje(datos.decode() if isinstance(datos, bytes) else str(datos))
+        finally:
+            pubsub.close()
+            cliente.close()
+
+
+escucha = _Escucha()
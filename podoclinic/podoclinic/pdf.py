@@ -0,0 +1,116 @@
+"""
+Generador mínimo de documentos PDF de texto (A4, Helvetica), sin dependencias.
+
+Un documento es una lista de bloques (estilo, texto); el texto se corta en líneas
+según el ancho de la página y las líneas se reparten en páginas con pie de página
+numerado. Se usan las fuentes estándar de PDF (no se incrustan fuentes) con la
+codificación WinAnsi, que cubre los acentos y la ñ.
+
+La salida es determinista: el mismo contenido produce siempre los mismos bytes
+(no hay fechas de creación ni identificadores aleatorios), así que puede guardarse
+en caché por el hash de su contenido.
+
+El corte de líneas usa un ancho promedio por carácter en lugar de las métricas
+exactas de Helvetica; el margen de ESTILOS evita que un texto con muchas
+mayúsculas se salga de la página.
+"""
+import textwrap
+import zlib
+
+ANCHO_PAGINA, ALTO_PAGINA = 595, 842  # A4 en puntos
+MARGEN = 50
+ANCHO_UTIL = ANCHO_PAGINA - 2 * MARGEN
+
+# estilo: (fuente, tamaño, espacio antes, ancho promedio de un carácter en em)
+ESTILOS = {
+    'titulo': ('F2', 16, 0, 0.62),
+    'subtitulo': ('F1', 10, 4, 0.55),
+    'seccion': ('F2', 11, 14, 0.62),
+    'texto': ('F1', 10, 2, 0.55),
+}
+INTERLINEADO = 1.35
+TAMANO_PIE = 8
+
+
+def _texto_pdf(texto):
+    """Cadena literal de PDF en WinAnsi, con los caracteres especiales escapados."""
+    datos = texto.encode('cp1252', errors='replace')
+    return b'(' + datos.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _lineas(estilo, texto):
+    fuente, tamano, _, ancho_caracter = ESTILOS[estilo]
+    caracteres = max(1, int(ANCHO_UTIL / (tamano * ancho_caracter)))
+    for parrafo in (texto or '').replace('\r\n', '\n').split('\n'):
+        # Un párrafo vacío deja una línea en blanco
+        for linea in textwrap.wrap(parrafo.expandtabs(4), caracteres, break_long_words=True) or ['']:
+            yield fuente, tamano, linea
+
+
+def _paginas(bloques):
+    """Reparte los bloques en páginas: listas de (fuente, tamaño, y, línea)."""
+    paginas, actual = [], []
+    y = ALTO_PAGINA - MARGEN
+    for estilo, texto in bloques:
+        espacio = ESTILOS[estilo][2] if actual else 0
+        y -= espacio
+        for fuente, tamano, linea in _lineas(estilo, texto):
+            alto = tamano * INTERLINEADO
+            if y - alto < MARGEN + TAMANO_PIE * 2:
+                paginas.append(actual)
+                actual, y = [], ALTO_PAGINA - MARGEN
+            y -= alto
+            actual.append((fuente, tamano, y, linea))
+    paginas.append(actual)
+    return paginas
+
+
+def _contenido(lineas, pie):
+    partes = []
+    for fuente, tamano, y, linea in lineas + [('F1', TAMANO_PIE, MARGEN - TAMANO_PIE, pie)]:
+        if linea:
+            partes.append(b'BT /%s %d Tf %d %.2f Td %s Tj ET' % (
+                fuente.encode(), tamano, MARGEN, y, _texto_pdf(linea)))
+    return zlib.compress(b'\n'.join(partes))
+
+
+def generar_pdf(bloques, titulo='', pie=''):
+    """
+    Bytes de un PDF con los `bloques` [(estilo, texto)], estilos de ESTILOS.
+    Cada página lleva al pie `pie` y su número.
+    """
+    paginas = _paginas(bloques)
+    total = len(paginas)
+    # 1 catálogo, 2 árbol de páginas, 3 y 4 fuentes, 5 información; luego página y contenido
+    objetos = {
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        4: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        5: b'<< /Title %s /Producer (PodoClinic) >>' % _texto_pdf(titulo),
+    }
+    hijos = []
+    for numero, lineas in enumerate(paginas, start=1):
+        pagina, contenido = 4 + 2 * numero, 5 + 2 * numero
+        hijos.append(b'%d 0 R' % pagina)
+        texto_pie = f'{pie} - Página {numero} de {total}' if pie else f'Página {numero} de {total}'
+        flujo = _contenido(lineas, texto_pie)
+        objetos[pagina] = (
+            b'<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> '
+            b'/Contents %d 0 R >>' % contenido
+        )
+        objetos[contenido] = b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(flujo), flujo)
+    objetos[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+    objetos[2] = b'<< /Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %d %d] >>' % (
+        b' '.join(hijos), total, ANCHO_PAGINA, ALTO_PAGINA)
+
+    salida = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    posiciones = {}
+    for numero in sorted(objetos):
+        posiciones[numero] = len(salida)
+        salida += b'%d 0 obj\n%s\nendobj\n' % (numero, objetos[numero])
+    inicio_xref = len(salida)
+    salida += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1)
+    for numero in sorted(objetos):
+        salida += b'%010d 00000 n \n' % posiciones[numero]
+    salida += b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        len(objetos) + 1, inicio_xref)
+    return bytes(salida)
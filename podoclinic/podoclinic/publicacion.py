@@ -0,0 +1,128 @@
+"""
+Publicación en canales pub/sub de Redis sin bloquear al llamador.
+
+Los mensajes se encolan y un hilo por proceso los envía. Si Redis no responde se
+abre un interruptor: durante `espera` segundos (que se duplica con cada fallo
+seguido, hasta ESPERA_MAXIMA) los mensajes se descartan sin intentar conectar, y
+solo se registra una advertencia cada vez que se abre.
+
+Los mensajes son avisos (eventos de agenda, invalidaciones de caché) que tienen su
+propia red de seguridad (feed de cambios, TTL), así que perder algunos mientras
+Redis está caído es preferible a demorar las peticiones que los generan.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+class PublicadorRedis:
+    """Cola de publicación hacia Redis con interruptor ante fallos de conexión."""
+
+    ESPERA_INICIAL = 1
+    ESPERA_MAXIMA = 60
+    # Segundos que se considera vigente el conteo de suscriptores de un canal
+    VIGENCIA_SUSCRIPTORES = 5
+    MAX_PENDIENTES = 1000
+
+    def __init__(self, nombre, url):
+        """`url`: función que devuelve la URL de Redis (se lee al conectar, no al importar)."""
+        self.nombre = nombre
+        self._url = url
+        self._cola = queue.Queue(self.MAX_PENDIENTES)
+        self._cliente = None
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._abierto_hasta = 0.0
+        self._espera = self.ESPERA_INICIAL
+        self._suscriptores = {}
+        self.descartados = 0
+
+    def disponible(self):
+        """False mientras el interruptor está abierto tras un fallo de conexión."""
+        return time.monotonic() >= self._abierto_hasta
+
+    def hay_suscriptores(self, canal):
+        """
+        Indica si vale la pena publicar en `canal`: el último conteo conocido de
+        suscriptores (se supone que hay mientras no se conozca), actualizado en
+        segundo plano cuando tiene más de VIGENCIA_SUSCRIPTORES segundos.
+        """
+        if not self.disponible():
+            return False
+        hay, momento = self._suscriptores.get(canal, (True, None))
+        if momento is None or time.monotonic() - momento > self.VIGENCIA_SUSCRIPTORES:
+            self._suscriptores[canal] = (hay, time.monotonic())
+            self._encolar(('suscriptores', canal, None))
+        return hay
+
+    def publicar(self, canal, mensaje):
+        """Encola el mensaje. Nunca bloquea ni lanza excepciones; devuelve False si se descartó."""
+        if not self.disponible():
+            self.descartados += 1
+            return False
+        return self._encolar(('publicar', canal, mensaje))
+
+    def esperar(self):
+        """Bloquea hasta que se procesen los mensajes encolados (para pruebas y cierre ordenado)."""
+        self._cola.join()
+
+    def _encolar(self, tarea):
+        self._iniciar()
+        try:
+            self._cola.put_nowait(tarea)
+            return True
+        except queue.Full:
+            self.descartados += 1
+            return False
+
+    def _activo(self):
+        # Tras un fork (workers de gunicorn/Celery) el hilo del padre no existe en el hijo
+        return self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive()
+
+    def _iniciar(self):
+        if self._activo():
+            return
+        with self._lock:
+            if not self._activo():
+                if self._pid != os.getpid():
+                    # La cola y el cliente heredados del padre no sirven en el hijo
+                    self._cola = queue.Queue(self.MAX_PENDIENTES)
+                    self._cliente = None
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._ejecutar, name=f'publicador-{self.nombre}', daemon=True)
+                self._hilo.start()
+
+    def _ejecutar(self):
+        while True:
+            accion, canal, mensaje = self._cola.get()
+            try:
+                if not self.disponible():
+                    self.descartados += 1
+                    continue
+                if self._cliente is None:
+                    self._cliente = redis.Redis.from_url(self._url(), socket_connect_timeout=1, socket_timeout=1)
+                if accion == 'publicar':
+                    self._cliente.publish(canal, mensaje)
+                else:
+                    [(_, cantidad)] = self._cliente.pubsub_numsub(canal)
+                    self._suscriptores[canal] = (cantidad > 0, time.monotonic())
+                self._espera = self.ESPERA_INICIAL
+            except (redis.RedisError, OSError) as e:
+                self._abrir(e)
+            except Exception as e:
+                logger.error(f"Error al publicar en Redis ({self.nombre}): {str(e)}", exc_info=True)
+            finally:
+                self._cola.task_done()
+
+    def _abrir(self, error):
+        self._abierto_hasta = time.monotonic() + self._espera
+        logger.warning(f"Redis no disponible para {self.nombre} ({str(error)}); "
+                       f"se descartan los mensajes por {self._espera} s")
+        self._espera = min(self._espera * 2, self.ESPERA_MAXIMA)
@@ -0,0 +1,369 @@
+"""
+Generador de datos sintéticos para pruebas de escala, benchmarks y ensayos de migraciones.
+
+Todos los registros se insertan por lotes con un generador aleatorio con semilla, de
+modo que la misma semilla produce siempre los mismos datos. En PostgreSQL cada lote
+se carga con COPY FROM STDIN desde un CSV en memoria (los ids se reservan antes en
+la secuencia de la tabla, porque COPY no los devuelve); en las demás bases, y para
+los lotes que deben omitir conflictos, con bulk_create.
+"""
+import csv
+import io
+import random
+import time as reloj
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from citas.models import Cita, Tratamiento
+from citas.ocupacion import reconstruir_ocupacion
+from insumos.models import Insumo, MovimientoInsumo
+from pacientes.models import Paciente, FichaClinica, UsoProductoEnFicha
+from pacientes.utils import calcular_digito_verificador, formatear_rut
+
+NOMBRES = [
+    'Camila', 'Valentina', 'Javiera', 'Francisca', 'Catalina', 'Constanza', 'Fernanda', 'Daniela',
+    'Sofia', 'Isidora', 'Maria', 'Carolina', 'Matias', 'Benjamin', 'Vicente', 'Martin', 'Joaquin',
+    'Sebastian', 'Diego', 'Nicolas', 'Felipe', 'Tomas', 'Cristobal', 'Jose', 'Juan', 'Pedro',
+]
+APELLIDOS = [
+    'Gonzalez', 'Munoz', 'Rojas', 'Diaz', 'Perez', 'Soto', 'Contreras', 'Silva', 'Martinez',
+    'Sepulveda', 'Morales', 'Rodriguez', 'Lopez', 'Fuentes', 'Hernandez', 'Torres', 'Araya',
+    'Flores', 'Espinoza', 'Valenzuela', 'Castillo', 'Tapia', 'Reyes', 'Gutierrez', 'Castro',
+]
+ENFERMEDADES = [None, None, None, 'Diabetes tipo 2', 'Hipertensión arterial', 'Artritis', 'Insuficiencia venosa']
+INSUMOS_BASE = [
+    ('Gasa estéril', 'unidad'), ('Alcohol 70%', 'ml'), ('Povidona yodada', 'ml'), ('Bisturí N°15', 'unidad'),
+    ('Guantes de nitrilo', 'par'), ('Fresa de pulido', 'unidad'), ('Crema hidratante', 'ml'),
+    ('Antimicótico tópico', 'ml'), ('Apósito', 'unidad'), ('Brackets ungueales', 'unidad'),
+]
+HORA_APERTURA = 8
+HORA_CIERRE = 22  # última hora de inicio (horarios_disponibles ofrece 8:00 a 22:00)
+
+
+@contextmanager
+def fechas_manuales(*campos):
+    """Desactiva auto_now_add temporalmente para poder sembrar fechas históricas."""
+    originales = [(campo, campo.auto_now_add) for campo in campos]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, valor in originales:
+            campo.auto_now_add = valor
+
+
+def generar_rut(cuerpo):
+    """RUT válido con formato XX.XXX.XXX-X para un cuerpo numérico de 7 u 8 dígitos."""
+    return formatear_rut(f'{cuerpo}{calcular_digito_verificador(cuerpo)}')
+
+
+class GeneradorDatos:
+    """
+    Genera pacientes, tratamientos, citas sin solapes, fichas con productos usados y
+    un libro de MovimientoInsumo consistente con el stock final de cada insumo.
+    """
+
+    def __init__(self, semilla=42, lote=5000, log=None):
+        self.rng = random.Random(semilla)
+        self.lote = lote
+        self.log = log or (lambda mensaje: None)
+        self.resumen = {}
+        self.zona = timezone.get_current_timezone()
+
+    def generar(self, pacientes=1000, citas=10000, insumos=len(INSUMOS_BASE), proporcion_fichas=0.8,
+                max_productos=3, movimientos=0, ocupacion=0.6, hasta=None):
+        """
+        Genera todos los datos en una transacción y devuelve un resumen con las
+        cantidades creadas y el tiempo de cada etapa.
+
+        - `citas` se reparten hacia atrás desde `hasta` (por defecto hoy + 60 días),
+          o desde el día anterior a la cita más antigua si ya hay citas.
+        - `movimientos` es un mínimo: si los usos en fichas no alcanzan, se agregan mermas.
+        """
+        inicio = reloj.perf_counter()
+        campos_fecha = [
+            Paciente._meta.get_field('fecha_registro'),
+            Cita._meta.get_field('fecha_creacion'),
+            UsoProductoEnFicha._meta.get_field('fecha_uso'),
+            MovimientoInsumo._meta.get_field('fecha_movimiento'),
+        ]
+        with transaction.atomic(), fechas_manuales(*campos_fecha):
+            tratamientos = self._etapa('tratamientos', self._tratamientos)
+            paciente_ids = self._etapa('pacientes', self._pacientes, pacientes)
+            completadas = self._etapa('citas', self._citas, citas, paciente_ids, tratamientos, ocupacion, hasta)
+            catalogo = self._etapa('insumos', self._insumos, insumos)
+            salidas = self._etapa('fichas', self._fichas, completadas, catalogo, tratamientos, proporcion_fichas, max_productos)
+            self._etapa('movimientos', self._movimientos, salidas, catalogo, movimientos)
+        self.resumen['segundos_total'] = round(reloj.perf_counter() - inicio, 2)
+        return self.resumen
+
+    def _etapa(self, nombre, funcion, *args):
+        inicio = reloj.perf_counter()
+        self.log(f'Generando {nombre}...')
+        resultado = funcion(*args)
+        self.resumen.setdefault('segundos', {})[nombre] = round(reloj.perf_counter() - inicio, 2)
+        return resultado
+
+    def _crear(self, modelo, objetos, **kwargs):
+        """Inserta por lotes (COPY o bulk_create); devuelve los objetos creados y suma al resumen."""
+        if connection.vendor == 'postgresql' and not kwargs:
+            creados = self._copiar(modelo, objetos)
+        else:
+            creados = modelo.objects.bulk_create(objetos, batch_size=self.lote, **kwargs)
+        clave = modelo._meta.model_name
+        self.resumen[clave] = self.resumen.get(clave, 0) + len(creados)
+        return creados
+
+    def _copiar(self, modelo, objetos):
+        """COPY de `objetos` en lotes de self.lote, con los ids tomados de la secuencia de la tabla."""
+        if not objetos:
+            return objetos
+        tabla = modelo._meta.db_table
+        campos = modelo._meta.concrete_fields
+        columnas = ', '.join(connection.ops.quote_name(campo.column) for campo in campos)
+        sentencia = f"COPY {connection.ops.quote_name(tabla)} ({columnas}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                [tabla, modelo._meta.pk.column, len(objetos)],
+            )
+            for objeto, (pk,) in zip(objetos, cursor.fetchall()):
+                objeto.pk = pk
+            for desde in range(0, len(objetos), self.lote):
+                buffer = io.StringIO()
+                escritor = csv.writer(buffer)
+                for objeto in objetos[desde:desde + self.lote]:
+                    # pre_save aplica auto_now como bulk_create; None se escribe como \N (NULL del COPY)
+                    valores = (campo.get_db_prep_save(campo.pre_save(objeto, True), connection) for campo in campos)
+                    escritor.writerow(['\\N' if valor is None else valor for valor in valores])
+                buffer.seek(0)
+                cursor.copy_expert(sentencia, buffer)
+        for objeto in objetos:
+            objeto._state.adding = False
+            objeto._state.db = connection.alias
+        return objetos
+
+    def _fecha_hora(self, fecha, hora=None):
+        # Equivalente a timezone.make_aware, sin su costo por fila
+        hora = hora or time(self.rng.randint(HORA_APERTURA, HORA_CIERRE), self.rng.choice((0, 15, 30, 45)))
+        return datetime.combine(fecha, hora, tzinfo=self.zona)
+
+    # ----- Catálogo -----
+
+    def _tratamientos(self):
+        """Un tratamiento por tipo; reutiliza los existentes."""
+        existentes = {}
+        for tratamiento in Tratamiento.objects.order_by('id'):
+            existentes.setdefault(tratamiento.nombre, tratamiento)
+        faltantes = [
+            Tratamiento(nombre=tipo, descripcion=nombre, duracion_minutos=60,
+                        precio=Decimal(self.rng.randrange(15000, 40000, 1000)))
+            for tipo, nombre in Tratamiento.TIPOS_TRATAMIENTO if tipo not in existentes
+        ]
+        for tratamiento in self._crear(Tratamiento, faltantes):
+            existentes[tratamiento.nombre] = tratamiento
+        return existentes
+
+    def _pacientes(self, cantidad):
+        """Pacientes con RUT válido; los RUT ya existentes se omiten."""
+        base = self.rng.randrange(5_000_000, 20_000_000)
+        for desde in range(0, cantidad, self.lote):
+            lote = []
+            for i in range(desde, min(desde + self.lote, cantidad)):
+                nombre = self.rng.choice(NOMBRES)
+                apellido = self.rng.choice(APELLIDOS)
+                registro = timezone.now() - timedelta(days=self.rng.randint(0, 3650))
+                lote.append(Paciente(
+                    rut=generar_rut(base + i),
+                    nombre=f'{nombre} {apellido} {self.rng.choice(APELLIDOS)}',
+                    telefono=f'9{self.rng.randrange(10000000, 99999999)}',
+                    correo=f'{nombre.lower()}.{apellido.lower()}{base + i}@example.com',
+                    enfermedad_base=self.rng.choice(ENFERMEDADES),
+                    fecha_nacimiento=date(1940, 1, 1) + timedelta(days=self.rng.randint(0, 365 * 65)),
+                    fecha_registro=registro,
+                ))
+            self._crear(Paciente, lote, ignore_conflicts=True)
+        return list(Paciente.objects.values_list('id', flat=True))
+
+    def _insumos(self, cantidad):
+        """Insumos nuevos; devuelve {id: valor_unitario} de todo el catálogo."""
+        nuevos = []
+        for i in range(cantidad):
+            nombre, unidad = INSUMOS_BASE[i % len(INSUMOS_BASE)]
+            if i >= len(INSUMOS_BASE):
+                nombre = f'{nombre} ({i // len(INSUMOS_BASE) + 1})'
+            nuevos.append(Insumo(
+                nombre=nombre, unidad_medida=unidad, stock_actual=0,
+                stock_critico=self.rng.randint(5, 20),
+                valor_unitario=Decimal(self.rng.randrange(200, 15000, 100)),
+                fecha_vencimiento=date.today() + timedelta(days=self.rng.randint(-30, 720)),
+            ))
+        self._crear(Insumo, nuevos)
+        return dict(Insumo.objects.values_list('id', 'valor_unitario'))
+
+    # ----- Agenda -----
+
+    def _bloques_dia(self, ocupacion):
+        """(hora, duración) sin solapes entre la apertura y la última hora de inicio."""
+        bloques = []
+        hora = HORA_APERTURA
+        while hora <= HORA_CIERRE:
+            if self.rng.random() < ocupacion:
+                duracion = 120 if hora < HORA_CIERRE and self.rng.random() < 0.15 else 60
+                bloques.append((hora, duracion))
+                hora += duracion // 60
+            else:
+                hora += 1
+        return bloques
+
+    def _citas(self, cantidad, paciente_ids, tratamientos, ocupacion, hasta):
+        """
+        Citas hacia atrás día a día (sin domingos), sin solapes por tipo_cita considerando
+        duracion_cita. Devuelve (id, paciente_id, tratamiento_id, fecha, hora) de las completadas.
+        """
+        mas_antigua = Cita.objects.order_by('fecha').values_list('fecha', flat=True).first()
+        if mas_antigua is not None:
+            dia = mas_antigua - timedelta(days=1)
+        else:
+            dia = hasta or date.today() + timedelta(days=60)
+
+        hoy = date.today()
+        podologia = [t.id for nombre, t in tratamientos.items() if nombre != 'manicura']
+        manicura = tratamientos['manicura'].id
+        completadas = []
+        pendientes = []
+        creadas = 0
+
+        def guardar():
+            for cita in self._crear(Cita, pendientes):
+                if cita.estado == 'completada':
+                    completadas.append((cita.id, cita.paciente_id, cita.tratamiento_id, cita.fecha, cita.hora))
+            pendientes.clear()
+
+        while creadas < cantidad:
+            if dia.weekday() != 6:
+                for tipo_cita in ('podologia', 'manicura'):
+                    for hora, duracion in self._bloques_dia(ocupacion):
+                        if creadas >= cantidad:
+                            break
+                        if dia < hoy:
+                            estado = 'completada' if self.rng.random() < 0.9 else 'cancelada'
+                        else:
+                            estado = 'confirmada' if self.rng.random() < 0.5 else 'reservada'
+                        tratamiento_id = manicura if tipo_cita == 'manicura' else self.rng.choice(podologia)
+                        pendientes.append(Cita(
+                            paciente_id=self.rng.choice(paciente_ids), tratamiento_id=tratamiento_id,
+                            fecha=dia, hora=time(hora, 0), estado=estado, tipo_cita=tipo_cita,
+                            duracion_cita=duracion, duracion_extendida=duracion == 120,
+                            recordatorio_enviado=dia <= hoy,
+                            fecha_creacion=self._fecha_hora(dia - timedelta(days=self.rng.randint(1, 30))),
+                        ))
+                        creadas += 1
+                if len(pendientes) >= self.lote:
+                    guardar()
+            dia -= timedelta(days=1)
+        guardar()
+        # bulk_create no dispara las señales que mantienen el resumen de ocupación
+        reconstruir_ocupacion(desde=dia)
+        return completadas
+
+    # ----- Fichas e inventario -----
+
+    def _fichas(self, completadas, catalogo, tratamientos, proporcion, max_productos):
+        """Fichas para una proporción de citas completadas, con productos usados.
+        Devuelve las salidas de stock (fecha_hora, insumo_id, cantidad, motivo)."""
+        insumo_ids = list(catalogo)
+        descripciones = {t.id: f'Atención de {t.get_nombre_display().lower()}' for t in tratamientos.values()}
+        salidas = []
+        for desde in range(0, len(completadas), self.lote):
+            fichas = []
+            usos_por_ficha = []
+            for cita_id, paciente_id, tratamiento_id, fecha, hora in completadas[desde:desde + self.lote]:
+                if self.rng.random() >= proporcion:
+                    continue
+                cantidad_productos = self.rng.randint(0, min(max_productos, len(insumo_ids)))
+                usos = [(insumo_id, self.rng.randint(1, 3))
+                        for insumo_id in self.rng.sample(insumo_ids, cantidad_productos)]
+                fichas.append(FichaClinica(
+                    paciente_id=paciente_id, cita_id=cita_id, fecha=fecha,
+                    descripcion_atencion=descripciones[tratamiento_id],
+                    procedimiento='Procedimiento según protocolo clínico',
+                    indicaciones='Mantener higiene y control en la próxima sesión',
+                    proxima_sesion_estimada=fecha + timedelta(days=self.rng.choice((15, 30, 60))),
+                    costo_total=sum(catalogo[insumo_id] * cantidad for insumo_id, cantidad in usos),
+                ))
+                usos_por_ficha.append((self._fecha_hora(fecha, hora), usos))
+
+            objetos_uso = []
+            for ficha, (momento, usos) in zip(self._crear(FichaClinica, fichas), usos_por_ficha):
+                for insumo_id, cantidad in usos:
+                    objetos_uso.append(UsoProductoEnFicha(
+                        ficha_id=ficha.id, insumo_id=insumo_id, cantidad=cantidad, fecha_uso=momento
+                    ))
+                    salidas.append((momento, insumo_id, cantidad, f'Uso en ficha clínica #{ficha.id}'))
+            self._crear(UsoProductoEnFicha, objetos_uso)
+        return salidas
+
+    def _movimientos(self, salidas, catalogo, minimo):
+        """
+        Libro de movimientos cronológico: entradas de stock inicial y reposición
+        cada vez que el stock no alcanza, de modo que el stock nunca es negativo
+        y stock_actual = entradas - salidas al final.
+        """
+        if salidas:
+            primera = min(s[0] for s in salidas)
+            ultima = max(s[0] for s in salidas)
+        else:
+            ultima = timezone.now()
+            primera = ultima - timedelta(days=365)
+        rango = max(int((ultima - primera).total_seconds()), 1)
+        insumo_ids = list(catalogo)
+
+        # Completar con mermas hasta el mínimo pedido (las entradas se suman después)
+        faltantes = max(minimo - len(salidas), 0)
+        salidas = salidas + [
+            (primera + timedelta(seconds=self.rng.randrange(rango)), self.rng.choice(insumo_ids),
+             self.rng.randint(1, 2), 'Merma o ajuste de inventario')
+            for _ in range(faltantes)
+        ]
+        salidas.sort(key=lambda salida: salida[0])
+
+        # Los insumos existentes parten de su stock actual
+        stock = dict(Insumo.objects.filter(id__in=insumo_ids).values_list('id', 'stock_actual'))
+        pendientes = []
+
+        def entrada(momento, insumo_id, cantidad, motivo):
+            stock[insumo_id] += cantidad
+            pendientes.append(MovimientoInsumo(
+                insumo_id=insumo_id, cantidad=cantidad, tipo_movimiento='entrada',
+                motivo=motivo, fecha_movimiento=momento
+            ))
+
+        for insumo_id in insumo_ids:
+            if stock[insumo_id] <= 0:
+                entrada(primera - timedelta(days=1), insumo_id, self.rng.randint(50, 200), 'Stock inicial')
+
+        for momento, insumo_id, cantidad, motivo in salidas:
+            if stock[insumo_id] < cantidad:
+                entrada(momento - timedelta(hours=1), insumo_id, self.rng.randint(50, 200) + cantidad,
+                        'Reposición de stock')
+            stock[insumo_id] -= cantidad
+            pendientes.append(MovimientoInsumo(
+                insumo_id=insumo_id, cantidad=cantidad, tipo_movimiento='salida',
+                motivo=motivo, fecha_movimiento=momento
+            ))
+            if len(pendientes) >= self.lote:
+                self._crear(MovimientoInsumo, pendientes)
+                pendientes.clear()
+        self._crear(MovimientoInsumo, pendientes)
+
+        # bulk_create no dispara la señal actualizar_stock: fijar el stock final del libro
+        insumos = list(Insumo.objects.filter(id__in=insumo_ids).only('id', 'stock_actual'))
+        for insumo in insumos:
+            insumo.stock_actual = stock[insumo.id]
+        Insumo.objects.bulk_update(insumos, ['stock_actual'], batch_size=self.lote)
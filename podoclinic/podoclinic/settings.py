@@ -14,6 +14,8 @@ from pathlib import Path
 from datetime import timedelta
 import os
 
+from celery.schedules import crontab
+
 # Intentar cargar variables de entorno desde .env si existe
 try:
     from dotenv import load_dotenv
@@ -65,6 +67,7 @@ INSTALLED_APPS = [
     'citas',
     'insumos',
     'usuarios',
+    'reportes',
 ]
 
 AUTH_USER_MODEL = 'usuarios.Usuario'
@@ -168,6 +171,15 @@ DATABASES = {
     }
 }
 
+# SQLite para desarrollo local y benchmarks (DB_ENGINE=sqlite)
+if os.environ.get('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -195,6 +207,51 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': timedelta(hours=24),
         'args': (),
     },
+    'depurar-eliminaciones-diario': {
+        'task': 'citas.tasks.depurar_eliminaciones',
+        'schedule': timedelta(hours=24),
+        'args': (),
+    },
+    'cerrar-citas-pasadas': {
+        'task': 'citas.tasks.cerrar_citas_pasadas',
+        'schedule': crontab(hour=2, minute=0),  # De madrugada, con la agenda del día anterior cerrada
+        'args': (),
+    },
+    'revisar-alertas-insumos': {
+        'task': 'insumos.tasks.revisar_alertas_insumos',
+        'schedule': crontab(hour=7, minute=0),  # Antes de abrir la clínica
+        'args': (),
+    },
+    'pronosticar-consumo-insumos': {
+        'task': 'insumos.tasks.calcular_pronosticos_insumos',
+        'schedule': crontab(hour=3, minute=0),  # Antes de la revisión de alertas de las 07:00
+        'args': (),
+    },
+    'construir-hechos-reportes': {
+        'task': 'reportes.tasks.construir_hechos_reportes',
+        'schedule': crontab(hour=4, minute=0),  # Después del cierre de citas de las 02:00
+        'args': (),
+    },
+    'actualizar-costos-materiales': {
+        'task': 'insumos.tasks.actualizar_costos_materiales',
+        'schedule': timedelta(hours=1),  # Solo recalcula los meses con fichas cambiadas
+        'args': (),
+    },
+    'depurar-subidas-adjuntos': {
+        'task': 'pacientes.tasks.depurar_subidas_adjuntos',
+        'schedule': timedelta(hours=6),
+        'args': (),
+    },
+    'depurar-pdfs-fichas': {
+        'task': 'pacientes.tasks.depurar_pdfs_fichas',
+        'schedule': timedelta(hours=6),
+        'args': (),
+    },
+    'expirar-ofertas-espera': {
+        'task': 'citas.tasks.expirar_ofertas_vencidas',
+        'schedule': timedelta(minutes=10),
+        'args': (),
+    },
 }
 
 # Internationalization
@@ -203,6 +260,7 @@ CELERY_BEAT_SCHEDULE = {
 LANGUAGE_CODE = 'es-cl'
 
 TIME_ZONE = 'America/Santiago'
+CELERY_TIMEZONE = TIME_ZONE  # Horarios crontab de la programación de Celery en hora local
 
 USE_I18N = True
 
@@ -363,3 +421,27 @@ if missing_vars and not DEBUG:
 if not DEBUG:
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+
+# Redis pub/sub para los eventos en vivo de la agenda (SSE); por defecto, el mismo Redis de Celery
+AGENDA_EVENTOS_REDIS_URL = os.environ.get('AGENDA_EVENTOS_REDIS_URL', CELERY_BROKER_URL)
+
+# Bus de invalidación de cachés locales: 'postgresql' (LISTEN/NOTIFY) o 'redis';
+# vacío elige PostgreSQL si es el motor de la base de datos y Redis en otro caso
+INVALIDACION_BACKEND = os.environ.get('INVALIDACION_BACKEND', '')
+INVALIDACION_REDIS_URL = os.environ.get('INVALIDACION_REDIS_URL', CELERY_BROKER_URL)
+# Vencimiento (segundos) de las entradas de caché local si se pierde algún mensaje
+INVALIDACION_TTL = int(os.environ.get('INVALIDACION_TTL', '300'))
+
+# Lista de espera: minutos que tiene el paciente para aceptar un horario ofrecido,
+# y página del frontend que recibe el token de la oferta (enlace del correo)
+LISTA_ESPERA_VIGENCIA_OFERTA = int(os.environ.get('LISTA_ESPERA_VIGENCIA_OFERTA', '120'))
+LISTA_ESPERA_URL_RESPUESTA = os.environ.get('LISTA_ESPERA_URL_RESPUESTA', 'http://localhost:3000/lista-espera/oferta')
+
+# Destinatarios del resumen diario de alertas de inventario (separados por comas)
+ALERTAS_INSUMOS_CORREOS = [c.strip() for c in os.environ.get('ALERTAS_INSUMOS_CORREOS', '').split(',') if c.strip()]
+
+# Pronóstico de consumo de insumos (insumos/pronostico.py): días de historial
+# analizados, plazo de entrega del proveedor y días de consumo que cubre cada pedido
+PRONOSTICO_DIAS_HISTORIA = int(os.environ.get('PRONOSTICO_DIAS_HISTORIA', '180'))
+PRONOSTICO_DIAS_ENTREGA = int(os.environ.get('PRONOSTICO_DIAS_ENTREGA', '7'))
+PRONOSTICO_DIAS_COBERTURA = int(os.environ.get('PRONOSTICO_DIAS_COBERTURA', '30'))
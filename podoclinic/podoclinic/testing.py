@@ -0,0 +1,95 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class PresupuestoConsultasMixin:
+    """
+    Mixin para TestCase que verifica que un endpoint ejecuta un número de
+    consultas que no crece con el volumen de datos (detecta patrones N+1).
+
+    La clase de prueba debe tener `self.client` (APIClient o Client).
+    """
+
+    # Cantidad base de registros; la segunda medición usa 10 veces esta cantidad
+    N = 3
+
+    def contar_consultas(self, url, metodo='get', data=None, **extra):
+        """Ejecuta la petición y devuelve (número de consultas, respuesta)."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, metodo)(url, data=data, **extra)
+        return len(ctx.captured_queries), response
+
+    def assertConsultasConstantes(self, sembrar, url, metodo='get', data=None,
+                                  status_esperado=200, **extra):
+        """
+        Siembra N registros, mide la petición; siembra hasta 10N, vuelve a medir
+        y exige el mismo número de consultas. `sembrar(cantidad)` debe crear
+        `cantidad` registros adicionales. Devuelve el número de consultas medido.
+        """
+        sembrar(self.N)
+        consultas_n, response = self.contar_consultas(url, metodo, data, **extra)
+        self.assertEqual(response.status_code, status_esperado, getattr(response, 'data', None))
+
+        sembrar(self.N * 9)
+        consultas_10n, response = self.contar_consultas(url, metodo, data, **extra)
+        self.assertEqual(response.status_code, status_esperado, getattr(response, 'data', None))
+
+        self.assertEqual(
+            consultas_10n, consultas_n,
+            f"{metodo.upper()} {url}: {consultas_n} consultas con {self.N} registros "
+            f"y {consultas_10n} con {self.N * 10}"
+        )
+        return consultas_n
+
+
+class PlanConsultaMixin:
+    """
+    Mixin para TestCase que revisa el plan de ejecución (EXPLAIN) de un queryset
+    y falla si la base de datos recorre completa una tabla (Seq Scan) en vez de
+    usar un índice. Soporta PostgreSQL y SQLite; en otros motores omite la prueba.
+    """
+
+    def analizar_tablas(self, *modelos):
+        """Actualiza las estadísticas del planificador después de sembrar datos."""
+        with connection.cursor() as cursor:
+            for modelo in modelos:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(modelo._meta.db_table)}')
+
+    def plan_consulta(self, queryset):
+        """Devuelve los nodos del plan como (operación, tabla, índice en PostgreSQL o detalle en SQLite)."""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                nodos, pendientes = [], [plan[0]['Plan']]
+                while pendientes:
+                    nodo = pendientes.pop()
+                    nodos.append((nodo['Node Type'], nodo.get('Relation Name'), nodo.get('Index Name')))
+                    pendientes.extend(nodo.get('Plans', []))
+                return nodos
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                nodos = []
+                for fila in cursor.fetchall():
+                    detalle = fila[-1]
+                    partes = detalle.split()
+                    # "SCAN tabla", "SCAN tabla USING INDEX x", "SEARCH tabla USING INDEX x (...)"
+                    tabla = partes[1] if len(partes) > 1 else None
+                    nodos.append((partes[0], tabla, detalle))
+                return nodos
+        self.skipTest(f'EXPLAIN no soportado para {connection.vendor}')
+
+    def assertUsaIndice(self, queryset):
+        """Exige que el queryset no haga un recorrido secuencial de su tabla principal."""
+        tabla = queryset.model._meta.db_table
+        nodos = self.plan_consulta(queryset)
+        if connection.vendor == 'postgresql':
+            secuenciales = [n for n in nodos if n[0] == 'Seq Scan' and n[1] == tabla]
+        else:
+            secuenciales = [n for n in nodos if n[0] == 'SCAN' and n[1] == tabla and 'INDEX' not in n[2]]
+        self.assertFalse(secuenciales, f'Recorrido secuencial de {tabla}: {nodos}\n{queryset.query}')
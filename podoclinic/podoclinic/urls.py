@@ -24,6 +24,7 @@ from django.middleware.csrf import get_token
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 # from .views import database_backup, database_restore
+from .views import exportar
 
 # Vista para manejar 404 en rutas de API
 def api_not_found(request):
@@ -47,7 +48,9 @@ urlpatterns = [
     path('api/citas/', include('citas.urls')),
     path('api/insumos/', include('insumos.urls')),
     path('api/usuarios/', include('usuarios.urls')),
+    path('api/reportes/', include('reportes.urls')),
     path('api/database/', include('pacientes.urls')),
+    path('api/exportar/<str:recurso>/', exportar, name='exportar'),
     path('favicon.ico', favicon_view),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
@@ -4,17 +4,20 @@ import tempfile
 import shutil
 import json
 from datetime import datetime
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.utils import timezone
 from django.core import serializers
 from django.db import transaction, connection
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework import status
 from citas.models import Cita, Tratamiento
 from pacientes.models import Paciente
 from usuarios.models import Usuario
+from .exportacion import FORMATOS, filas_exportacion, generar
 
 def check_pg_dump():
     """Verifica si pg_dump está instalado y accesible."""
@@ -602,4 +605,31 @@ def restore_from_sql(sql_content, clear_database=False):
         
     except Exception as e:
         resultado['errores'].append(f'Error general en restauración SQL: {str(e)}')
-        return resultado
\ No newline at end of file
+        return resultado
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def exportar(request, recurso):
+    """
+    Exporta citas, pacientes, fichas o movimientos de insumos en CSV o XLSX, en
+    streaming (ver podoclinic/exportacion.py).
+    Parámetros: ?formato=csv|xlsx, ?columnas=a,b,c (por defecto, todas) y
+    ?desde=/?hasta= (YYYY-MM-DD, días completos).
+    """
+    formato = request.query_params.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return Response({'error': 'Formato no válido. Use csv o xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        columnas = [c.strip() for c in request.query_params.get('columnas', '').split(',') if c.strip()]
+        desde_str, hasta_str = request.query_params.get('desde'), request.query_params.get('hasta')
+        desde = datetime.strptime(desde_str, '%Y-%m-%d').date() if desde_str else None
+        hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date() if hasta_str else None
+        encabezados, filas = filas_exportacion(recurso, columnas, desde, hasta)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(generar(formato, encabezados, filas), content_type=FORMATOS[formato])
+    timestamp = timezone.localtime().strftime('%Y%m%d_%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{recurso}_{timestamp}.{formato}"'
+    return response
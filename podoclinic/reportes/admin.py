@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import HechoCitasDiario, HechoDiario
+
+@admin.register(HechoCitasDiario)
+class HechoCitasDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'tipo_cita', 'tratamiento', 'estado', 'citas', 'ingresos')
+    list_filter = ('tipo_cita', 'estado', 'tratamiento')
+    date_hierarchy = 'fecha'
+    ordering = ('-fecha',)
+
+@admin.register(HechoDiario)
+class HechoDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'pacientes', 'pacientes_nuevos', 'fichas', 'costo_materiales', 'calculado_en')
+    date_hierarchy = 'fecha'
+    ordering = ('-fecha',)
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class ReportesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'reportes'
+
+    def ready(self):
+        # Días de los hechos desactualizados fuera de la ventana nocturna (reportes/hechos.py)
+        from django.db.models.signals import post_delete, post_save
+        from .hechos import cita_cambiada, ficha_eliminada, ficha_guardada
+        post_save.connect(cita_cambiada, sender='citas.Cita', dispatch_uid='reportes_cita_guardada')
+        post_delete.connect(cita_cambiada, sender='citas.Cita', dispatch_uid='reportes_cita_eliminada')
+        post_save.connect(ficha_guardada, sender='pacientes.FichaClinica', dispatch_uid='reportes_ficha_guardada')
+        post_delete.connect(ficha_eliminada, sender='pacientes.FichaClinica', dispatch_uid='reportes_ficha_eliminada')
@@ -0,0 +1,248 @@
+"""
+Tablas de hechos de los reportes de la clínica y consultas sobre ellas.
+
+Cada noche se reconstruyen los días de la ventana [hoy - DIAS_RECALCULO,
+hoy + DIAS_FUTUROS] (los días pasados cambian con el cierre nocturno y las
+ediciones; los futuros dan los ingresos proyectados), más los días fuera de ella
+que quedaron desactualizados:
+
+- DiaPendiente: las señales de Cita y FichaClinica (y las escrituras masivas de
+  citas, citas/masivo.py) marcan el día de cada cita o ficha guardada o
+  eliminada y, si se movió, también su día anterior.
+- Citas con ultima_actualizacion posterior a la construcción previa, para las
+  escrituras que no pasan por las señales. La marca `calculado_en` se toma antes
+  de leer, con el margen MARGEN_CURSOR para las transacciones en curso.
+
+Un rango se reconstruye con tres GROUP BY sobre Cita y FichaClinica, un borrado y
+un bulk_create por tabla, en una transacción. Para reconstruir todo el historial:
+`manage.py construir_reportes --desde ...`.
+
+Las consultas de los reportes leen solo HechoCitasDiario y HechoDiario, que tienen
+unas pocas filas por día, sin importar cuántas citas haya.
+
+Los ingresos usan el precio actual de cada tratamiento. Los pacientes se cuentan
+por día: en un rango, `pacientes` son atenciones (un paciente que vuelve otro día
+cuenta de nuevo) y `pacientes_nuevos` es exacto (un paciente es nuevo un solo día).
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from citas.cambios import MARGEN_CURSOR
+
+from .models import DiaPendiente, HechoCitasDiario, HechoDiario
+
+logger = logging.getLogger(__name__)
+
+DIAS_RECALCULO = 60
+DIAS_FUTUROS = 90
+# Los días a esta distancia del borde de la ventana también se marcan como pendientes,
+# por si la construcción nocturna corre al día siguiente de la modificación
+MARGEN_VENTANA = 2
+
+PERIODOS = {'dia': TruncDay, 'semana': TruncWeek, 'mes': TruncMonth}
+
+# Estados que cuentan como ingresos proyectados (citas por atender)
+ESTADOS_PROYECTADOS = ('reservada', 'confirmada')
+
+
+def _construir(filtro_fechas, dias, calculado_en=None):
+    """Reconstruye los hechos de `dias`; `filtro_fechas` es el filtro equivalente sobre `fecha`."""
+    from citas.models import Cita
+    from pacientes.models import FichaClinica
+
+    citas = Cita.objects.filter(**filtro_fechas).order_by()
+    grupos = citas.values('fecha', 'tipo_cita', 'estado', tipo_tratamiento=F('tratamiento__nombre')).annotate(
+        cantidad=Count('id'), total=Sum('tratamiento__precio'),
+    )
+    completadas = citas.filter(estado='completada')
+    atendidos = {}
+    for fecha, paciente_id in completadas.values_list('fecha', 'paciente_id').distinct():
+        atendidos.setdefault(fecha, set()).add(paciente_id)
+    # Primera cita completada de cada paciente atendido en los días reconstruidos
+    primeras = dict(
+        Cita.objects.filter(estado='completada', paciente_id__in=completadas.values('paciente_id'))
+        .order_by().values('paciente_id').annotate(primera=Min('fecha')).values_list('paciente_id', 'primera')
+    )
+    fichas = {
+        fila['fecha']: fila
+        for fila in FichaClinica.objects.filter(**filtro_fechas).order_by().values('fecha').annotate(
+            cantidad=Count('id'), costo=Sum('costo_total'),
+        )
+    }
+
+    ahora = calculado_en or timezone.now()
+    with transaction.atomic():
+        HechoCitasDiario.objects.filter(**filtro_fechas).delete()
+        HechoDiario.objects.filter(**filtro_fechas).delete()
+        HechoCitasDiario.objects.bulk_create([
+            HechoCitasDiario(
+                fecha=fila['fecha'], tipo_cita=fila['tipo_cita'], tratamiento=fila['tipo_tratamiento'],
+                estado=fila['estado'], citas=fila['cantidad'], ingresos=fila['total'] or 0,
+            )
+            for fila in grupos
+        ], batch_size=2000)
+        HechoDiario.objects.bulk_create([
+            HechoDiario(
+                fecha=dia,
+                pacientes=len(atendidos.get(dia, ())),
+                pacientes_nuevos=sum(1 for paciente in atendidos.get(dia, ()) if primeras.get(paciente) == dia),
+                fichas=fichas[dia]['cantidad'] if dia in fichas else 0,
+                costo_materiales=fichas[dia]['costo'] if dia in fichas else 0,
+                calculado_en=ahora,
+            )
+            for dia in dias
+        ], batch_size=2000)
+
+
+def construir_hechos(desde, hasta, calculado_en=None):
+    """Reconstruye los hechos de los días de `desde` a `hasta` (incluidos). Devuelve cuántos días."""
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    if dias:
+        _construir({'fecha__range': (desde, hasta)}, dias, calculado_en)
+    return len(dias)
+
+
+def construir_hechos_recientes(hoy=None):
+    """
+    Construcción nocturna: la ventana de días recientes y futuros, más los días
+    fuera de ella marcados como pendientes o con citas modificadas desde la
+    construcción previa.
+    """
+    from citas.models import Cita
+
+    # Marca de esta construcción, antes de leer: lo confirmado después entra en la próxima
+    marca = timezone.now() - MARGEN_CURSOR
+    hoy = hoy or timezone.localdate()
+    desde, hasta = hoy - timedelta(days=DIAS_RECALCULO), hoy + timedelta(days=DIAS_FUTUROS)
+    anterior = HechoDiario.objects.aggregate(ultima=Max('calculado_en'))['ultima']
+    pendientes = set(DiaPendiente.objects.values_list('fecha', flat=True))
+
+    total = construir_hechos(desde, hasta, calculado_en=marca)
+    antiguos = {fecha for fecha in pendientes if not desde <= fecha <= hasta}
+    if anterior:
+        antiguos.update(
+            Cita.objects.filter(ultima_actualizacion__gte=anterior, fecha__lt=desde)
+            .order_by().values_list('fecha', flat=True).distinct()
+        )
+    if antiguos:
+        antiguos = sorted(antiguos)
+        _construir({'fecha__in': antiguos}, antiguos, calculado_en=marca)
+        total += len(antiguos)
+    # Solo se quitan las marcas leídas y anteriores a la marca: las nuevas siguen pendientes
+    DiaPendiente.objects.filter(fecha__in=list(pendientes), marcado_en__lte=marca).delete()
+    logger.info(f"Hechos de reportes reconstruidos para {total} días")
+    return total
+
+
+def marcar_dias_pendientes(fechas):
+    """
+    Marca como pendientes los días de `fechas` que la construcción nocturna no
+    cubre con su ventana (una consulta, sin importar si ya estaban marcados).
+    """
+    hoy = timezone.localdate()
+    desde = hoy - timedelta(days=DIAS_RECALCULO - MARGEN_VENTANA)
+    hasta = hoy + timedelta(days=DIAS_FUTUROS - MARGEN_VENTANA)
+    dias = {fecha for fecha in fechas if fecha and not desde <= fecha <= hasta}
+    if dias:
+        ahora = timezone.now()
+        DiaPendiente.objects.bulk_create(
+            [DiaPendiente(fecha=dia, marcado_en=ahora) for dia in dias],
+            update_conflicts=True, unique_fields=['fecha'], update_fields=['marcado_en'],
+        )
+
+
+# Señales de Cita y FichaClinica (conectadas en ReportesConfig.ready)
+
+def _fecha(sender, instance):
+    return sender._meta.get_field('fecha').to_python(instance.fecha)
+
+
+def cita_cambiada(sender, instance, **kwargs):
+    # _fecha_guardada es la fecha anterior: Cita.save la actualiza después de las señales
+    marcar_dias_pendientes([_fecha(sender, instance), getattr(instance, '_fecha_guardada', None)])
+
+
+def ficha_guardada(sender, instance, **kwargs):
+    # La fecha y el costo anteriores los lee el pre_save de pacientes (pacientes/models.py)
+    from pacientes.models import fechas_ficha_cambiadas
+    marcar_dias_pendientes(fechas_ficha_cambiadas(instance))
+
+
+def ficha_eliminada(sender, instance, **kwargs):
+    marcar_dias_pendientes([_fecha(sender, instance)])
+
+
+def _metricas_citas():
+    return {
+        'total_citas': Sum('citas'),
+        'completadas': Sum('citas', filter=Q(estado='completada')),
+        'canceladas': Sum('citas', filter=Q(estado='cancelada')),
+        'no_asistio': Sum('citas', filter=Q(estado='no_asistio')),
+        'ingresos_realizados': Sum('ingresos', filter=Q(estado='completada')),
+        'ingresos_proyectados': Sum('ingresos', filter=Q(estado__in=ESTADOS_PROYECTADOS)),
+    }
+
+
+def _tasas(fila):
+    """Completa con ceros y agrega las tasas de inasistencia y cancelación."""
+    fila = {clave: valor or 0 for clave, valor in fila.items()}
+    atendibles = fila['completadas'] + fila['no_asistio']
+    fila['tasa_inasistencia'] = round(fila['no_asistio'] / atendibles, 4) if atendibles else 0
+    fila['tasa_cancelacion'] = round(fila['canceladas'] / fila['total_citas'], 4) if fila['total_citas'] else 0
+    return fila
+
+
+def indicadores(desde, hasta):
+    """Indicadores del rango: totales, tasas y desgloses por tratamiento y tipo de cita."""
+    citas = HechoCitasDiario.objects.filter(fecha__range=(desde, hasta)).order_by()
+    resumen = _tasas(citas.aggregate(**_metricas_citas()))
+    resumen.update({
+        clave: valor or 0 for clave, valor in HechoDiario.objects.filter(fecha__range=(desde, hasta)).aggregate(
+            pacientes=Sum('pacientes'), pacientes_nuevos=Sum('pacientes_nuevos'),
+            fichas=Sum('fichas'), costo_materiales=Sum('costo_materiales'),
+        ).items()
+    })
+    resumen['pacientes_recurrentes'] = resumen['pacientes'] - resumen['pacientes_nuevos']
+    resumen['por_tratamiento'] = [
+        _tasas(fila) for fila in citas.values('tratamiento').annotate(**_metricas_citas()).order_by('tratamiento')
+    ]
+    resumen['por_tipo_cita'] = [
+        _tasas(fila) for fila in citas.values('tipo_cita').annotate(**_metricas_citas()).order_by('tipo_cita')
+    ]
+    return resumen
+
+
+def serie(desde, hasta, periodo='dia'):
+    """Indicadores por día, semana o mes del rango."""
+    truncar = PERIODOS[periodo]
+    citas = (
+        HechoCitasDiario.objects.filter(fecha__range=(desde, hasta))
+        .annotate(inicio=truncar('fecha')).order_by().values('inicio')
+        .annotate(**_metricas_citas())
+    )
+    diarios = {
+        fila['inicio']: fila
+        for fila in HechoDiario.objects.filter(fecha__range=(desde, hasta))
+        .annotate(inicio=truncar('fecha')).order_by().values('inicio')
+        .annotate(pacientes_total=Sum('pacientes'), nuevos=Sum('pacientes_nuevos'),
+                  fichas_total=Sum('fichas'), costo=Sum('costo_materiales'))
+    }
+    por_inicio = {fila['inicio']: _tasas(fila) for fila in citas}
+    vacia = _tasas({clave: 0 for clave in _metricas_citas()})
+    resultado = []
+    for inicio in sorted(set(por_inicio) | set(diarios)):
+        fila = {**vacia, **por_inicio.get(inicio, {}), 'inicio': inicio}
+        diario = diarios.get(inicio, {})
+        fila.update({
+            'pacientes': diario.get('pacientes_total') or 0,
+            'pacientes_nuevos': diario.get('nuevos') or 0,
+            'fichas': diario.get('fichas_total') or 0,
+            'costo_materiales': diario.get('costo') or 0,
+        })
+        resultado.append(fila)
+    return resultado
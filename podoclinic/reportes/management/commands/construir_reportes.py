@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from reportes.hechos import construir_hechos
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye las tablas de hechos de los reportes en un rango de fechas '
+        '(por defecto, todo el historial de citas).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día YYYY-MM-DD (por defecto, la primera cita)')
+        parser.add_argument('--hasta', help='Último día YYYY-MM-DD (por defecto, la última cita)')
+
+    def handle(self, *args, **options):
+        from citas.models import Cita
+
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError:
+            raise CommandError('Formato de fecha inválido. Use YYYY-MM-DD')
+
+        extremos = Cita.objects.aggregate(primera=Min('fecha'), ultima=Max('fecha'))
+        desde = desde or extremos['primera']
+        hasta = hasta or extremos['ultima']
+        if not desde or not hasta:
+            self.stdout.write('No hay citas: nada que reconstruir')
+            return
+
+        # Por bloques de un año: acota el tamaño de cada transacción
+        total, inicio = 0, desde
+        while inicio <= hasta:
+            fin = min(inicio + timedelta(days=365), hasta)
+            total += construir_hechos(inicio, fin)
+            inicio = fin + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Hechos de reportes reconstruidos para {total} días ({desde} a {hasta})'))
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HechoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('pacientes', models.IntegerField(help_text='Pacientes distintos con citas completadas')),
+                ('pacientes_nuevos', models.IntegerField(help_text='De ellos, los que completaron su primera cita')),
+                ('fichas', models.IntegerField()),
+                ('costo_materiales', models.DecimalField(decimal_places=0, max_digits=14)),
+                ('calculado_en', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HechoCitasDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_cita', models.CharField(max_length=20)),
+                ('tratamiento', models.CharField(help_text='Tipo de tratamiento (Tratamiento.nombre)', max_length=100)),
+                ('estado', models.CharField(max_length=20)),
+                ('citas', models.IntegerField()),
+                ('ingresos', models.DecimalField(decimal_places=2, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha', 'estado'], name='hecho_citas_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import models
+
+class HechoCitasDiario(models.Model):
+    """
+    Citas de un día por tipo de cita, tipo de tratamiento y estado, con la suma de
+    Tratamiento.precio. Tabla de hechos reconstruida cada noche (reportes/hechos.py).
+    """
+    fecha = models.DateField()
+    tipo_cita = models.CharField(max_length=20)
+    tratamiento = models.CharField(max_length=100, help_text="Tipo de tratamiento (Tratamiento.nombre)")
+    estado = models.CharField(max_length=20)
+    citas = models.IntegerField()
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2)
+    
+    class Meta:
+        indexes = [models.Index(fields=['fecha', 'estado'], name='hecho_citas_fecha_idx')]
+    
+    def __str__(self):
+        return f"{self.fecha} {self.tipo_cita}/{self.tratamiento}/{self.estado}: {self.citas}"
+
+class HechoDiario(models.Model):
+    """
+    Indicadores de pacientes y materiales de un día (una fila por día reconstruido,
+    aunque no haya actividad).
+    """
+    fecha = models.DateField(unique=True)
+    pacientes = models.IntegerField(help_text="Pacientes distintos con citas completadas")
+    pacientes_nuevos = models.IntegerField(help_text="De ellos, los que completaron su primera cita")
+    fichas = models.IntegerField()
+    costo_materiales = models.DecimalField(max_digits=14, decimal_places=0)
+    calculado_en = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.fecha}: {self.pacientes} pacientes ({self.pacientes_nuevos} nuevos)"
+
+class DiaPendiente(models.Model):
+    """
+    Día fuera de la ventana de reconstrucción nocturna cuyos hechos quedaron
+    desactualizados: una cita o ficha de ese día se modificó, se movió a otro día
+    o se eliminó (ver reportes/hechos.py).
+    """
+    fecha = models.DateField(unique=True)
+    marcado_en = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.fecha} (marcado {self.marcado_en:%Y-%m-%d %H:%M})"
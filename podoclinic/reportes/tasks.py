@@ -0,0 +1,14 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def construir_hechos_reportes():
+    """
+    Tarea programada (nocturna, después del cierre de citas) que reconstruye las
+    tablas de hechos de los reportes de los días recientes y futuros.
+    """
+    from reportes.hechos import construir_hechos_recientes
+
+    return construir_hechos_recientes()
@@ -0,0 +1,160 @@
+from datetime import date, time, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.models import F, Max
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from citas.models import Cita, Tratamiento
+from pacientes.models import FichaClinica, Paciente
+from usuarios.models import Usuario
+from .hechos import construir_hechos, construir_hechos_recientes, indicadores
+from .models import DiaPendiente, HechoCitasDiario, HechoDiario
+from .tasks import construir_hechos_reportes
+
+
+class ReportesTest(TestCase):
+    """Indicadores servidos desde las tablas de hechos, sin leer Cita ni FichaClinica."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(Usuario.objects.create_user(username='admin', password='clave-segura-123'))
+        self.general = Tratamiento.objects.create(nombre='general', precio=20000)
+        self.hongos = Tratamiento.objects.create(nombre='hongos', precio=25000)
+        self.ana, self.luis, self.eva = [
+            Paciente.objects.create(nombre=nombre, rut=rut, telefono='1', correo='')
+            for nombre, rut in (('Ana', '11111111-1'), ('Luis', '22222222-2'), ('Eva', '33333333-3'))
+        ]
+        self.dia1, self.dia2 = date(2025, 6, 2), date(2025, 6, 3)
+        self.citas = Cita.objects.bulk_create([
+            self._cita(self.luis, self.general, date(2025, 5, 1), 'completada'),
+            self._cita(self.ana, self.general, self.dia1, 'completada'),
+            self._cita(self.luis, self.hongos, self.dia1, 'completada', hora=11),
+            self._cita(self.eva, self.general, self.dia1, 'no_asistio', hora=13),
+            self._cita(self.ana, self.general, self.dia1, 'cancelada', hora=12),
+            self._cita(self.ana, self.hongos, self.dia2, 'completada'),
+            self._cita(self.eva, self.general, self.dia2, 'completada', hora=11),
+            self._cita(self.luis, self.general, self.dia2, 'reservada', hora=12, tipo_cita='manicura'),
+        ])
+        FichaClinica.objects.create(
+            paciente=self.ana, cita=self.citas[1], fecha=self.dia1, descripcion_atencion='-',
+            procedimiento='-', indicaciones='-', costo_total=1500,
+        )
+
+    def _cita(self, paciente, tratamiento, fecha, estado, hora=10, tipo_cita='podologia'):
+        return Cita(paciente=paciente, tratamiento=tratamiento, fecha=fecha, hora=time(hora),
+                    estado=estado, tipo_cita=tipo_cita)
+
+    def test_indicadores(self):
+        construir_hechos(date(2025, 5, 1), date(2025, 6, 30))
+        self.assertEqual(HechoDiario.objects.count(), 61)
+
+        response = self.client.get('/api/reportes/indicadores/', {'desde': '2025-06-02', 'hasta': '2025-06-03'})
+        self.assertEqual(response.status_code, 200)
+        datos = response.data
+        self.assertEqual((datos['total_citas'], datos['completadas'], datos['canceladas'], datos['no_asistio']), (7, 4, 1, 1))
+        self.assertEqual((datos['ingresos_realizados'], datos['ingresos_proyectados']), (90000, 20000))
+        self.assertEqual((datos['tasa_inasistencia'], datos['tasa_cancelacion']), (0.2, 0.1429))
+        # Luis ya se había atendido en mayo; Ana y Eva completan su primera cita en el rango
+        self.assertEqual((datos['pacientes'], datos['pacientes_nuevos'], datos['pacientes_recurrentes']), (4, 2, 2))
+        self.assertEqual((datos['fichas'], datos['costo_materiales']), (1, 1500))
+        por_tratamiento = {fila['tratamiento']: (fila['total_citas'], fila['completadas'], fila['ingresos_realizados'])
+                           for fila in datos['por_tratamiento']}
+        self.assertEqual(por_tratamiento, {'general': (5, 2, 40000), 'hongos': (2, 2, 50000)})
+        self.assertEqual([fila['tipo_cita'] for fila in datos['por_tipo_cita']], ['manicura', 'podologia'])
+
+        response = self.client.get('/api/reportes/indicadores/', {'desde': '2025-06-05', 'hasta': '2025-06-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_consultas_no_leen_citas(self):
+        construir_hechos(date(2025, 5, 1), date(2025, 6, 30))
+        with self.assertNumQueries(5) as contexto:
+            self.client.get('/api/reportes/indicadores/', {'desde': '2025-01-01', 'hasta': '2025-12-31'})
+        for consulta in contexto.captured_queries:
+            self.assertNotIn('citas_cita', consulta['sql'])
+            self.assertNotIn('pacientes_fichaclinica', consulta['sql'])
+
+    def test_serie_por_semana(self):
+        construir_hechos(date(2025, 5, 1), date(2025, 6, 30))
+        response = self.client.get('/api/reportes/serie/',
+                                   {'desde': '2025-05-01', 'hasta': '2025-06-08', 'periodo': 'semana'})
+        self.assertEqual(response.status_code, 200)
+        serie = {str(fila['inicio'])[:10]: fila for fila in response.data['serie']}
+        self.assertEqual(serie['2025-04-28']['completadas'], 1)
+        self.assertEqual(serie['2025-04-28']['pacientes_nuevos'], 1)
+        self.assertEqual((serie['2025-06-02']['total_citas'], serie['2025-06-02']['costo_materiales']), (7, 1500))
+        self.assertEqual(serie['2025-05-05']['total_citas'], 0)
+        self.assertEqual(self.client.get('/api/reportes/serie/', {'periodo': 'hora'}).status_code, 400)
+
+    def _envejecer_marcas(self):
+        # Las marcas de los últimos segundos (MARGEN_CURSOR) se conservan para la construcción siguiente
+        DiaPendiente.objects.update(marcado_en=F('marcado_en') - timedelta(minutes=1))
+
+    def test_construccion_nocturna(self):
+        hoy = date(2025, 6, 10)
+        with mock.patch('django.utils.timezone.localdate', return_value=hoy):
+            self.assertEqual(construir_hechos_recientes(hoy), 151)
+            self.assertFalse(HechoDiario.objects.filter(fecha=date(2025, 3, 1)).exists())
+
+            # Una cita antigua modificada después de la construcción: su día se reconstruye
+            antigua = Cita.objects.create(paciente=self.eva, tratamiento=self.hongos, fecha=date(2025, 3, 1),
+                                          hora=time(9), estado='completada')
+            self._envejecer_marcas()
+            self.assertEqual(construir_hechos_recientes(hoy), 152)
+            self.assertEqual(HechoCitasDiario.objects.get(fecha=antigua.fecha).ingresos, 25000)
+            # Eva ya no es paciente nueva el 3 de junio
+            self.assertEqual(indicadores(self.dia2, self.dia2)['pacientes_nuevos'], 0)
+
+            # La cita se modificó dentro del margen de la construcción anterior: se vuelve a incluir
+            self.assertEqual(construir_hechos_reportes(), 152)
+
+    def test_dias_antiguos_eliminados_movidos_y_fichas(self):
+        hoy = date(2025, 6, 10)
+        marzo = [date(2025, 3, dia) for dia in (1, 2, 3, 4)]
+        # La ficha de setUp se creó con la fecha real y dejó su día marcado
+        DiaPendiente.objects.all().delete()
+        with mock.patch('django.utils.timezone.localdate', return_value=hoy):
+            eliminada = Cita.objects.create(paciente=self.eva, tratamiento=self.hongos, fecha=marzo[0],
+                                            hora=time(9), estado='completada')
+            movida = Cita.objects.create(paciente=self.luis, tratamiento=self.general, fecha=marzo[1],
+                                         hora=time(9), estado='completada')
+            ficha = FichaClinica.objects.create(
+                paciente=self.eva, fecha=marzo[2], descripcion_atencion='-', procedimiento='-',
+                indicaciones='-', costo_total=1000,
+            )
+            self.assertEqual(set(DiaPendiente.objects.values_list('fecha', flat=True)), set(marzo[:3]))
+            self._envejecer_marcas()
+            self.assertEqual(construir_hechos_recientes(hoy), 154)
+            self.assertFalse(DiaPendiente.objects.exists())
+            self.assertEqual(HechoDiario.objects.get(fecha=marzo[2]).costo_materiales, 1000)
+
+            # Cita eliminada, cita movida a la ventana y ficha editada y movida de día:
+            # los días de origen se reconstruyen aunque ninguna cita los tenga ya
+            eliminada.delete()
+            movida.fecha = date(2025, 6, 5)
+            movida.save()
+            ficha.costo_total = 2500
+            ficha.fecha = marzo[3]
+            ficha.save()
+            self._envejecer_marcas()
+            inicio = timezone.now()
+            self.assertEqual(construir_hechos_recientes(hoy), 155)
+            self.assertFalse(HechoCitasDiario.objects.filter(fecha__in=marzo).exists())
+            self.assertEqual(HechoDiario.objects.get(fecha=marzo[2]).fichas, 0)
+            self.assertEqual(HechoDiario.objects.get(fecha=marzo[3]).costo_materiales, 2500)
+            # La marca de la construcción es anterior a sus lecturas
+            self.assertLess(HechoDiario.objects.aggregate(ultima=Max('calculado_en'))['ultima'], inicio)
+
+            # Una marca de los últimos segundos se reconstruye ahora y también en la próxima
+            Cita.objects.create(paciente=self.eva, tratamiento=self.general, fecha=marzo[0], hora=time(9))
+            construir_hechos_recientes(hoy)
+            self.assertEqual(list(DiaPendiente.objects.values_list('fecha', flat=True)), [marzo[0]])
+
+    def test_comando_reconstruye_historial(self):
+        salida = StringIO()
+        call_command('construir_reportes', stdout=salida)
+        self.assertIn('34 días (2025-05-01 a 2025-06-03)', salida.getvalue())
+        self.assertEqual(HechoCitasDiario.objects.filter(fecha=self.dia1).count(), 4)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import indicadores_clinica, serie_indicadores
+
+urlpatterns = [
+    path('indicadores/', indicadores_clinica, name='indicadores_clinica'),
+    path('serie/', serie_indicadores, name='serie_indicadores'),
+]
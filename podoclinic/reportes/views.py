@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .hechos import PERIODOS, indicadores, serie
+from .models import HechoDiario
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rango por defecto: los últimos 30 días
+DIAS_POR_DEFECTO = 30
+
+
+def _leer_rango(request):
+    """(desde, hasta) de ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD; lanza ValueError si no son válidos."""
+    hasta_str = request.query_params.get('hasta')
+    hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date() if hasta_str else timezone.localdate()
+    desde_str = request.query_params.get('desde')
+    desde = datetime.strptime(desde_str, '%Y-%m-%d').date() if desde_str else hasta - timedelta(days=DIAS_POR_DEFECTO - 1)
+    if desde > hasta:
+        raise ValueError('desde es posterior a hasta')
+    return desde, hasta
+
+
+def _actualizado_en():
+    return HechoDiario.objects.order_by('-calculado_en').values_list('calculado_en', flat=True).first()
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def indicadores_clinica(request):
+    """
+    Indicadores de la clínica entre ?desde= y ?hasta= (YYYY-MM-DD; por defecto, los
+    últimos 30 días): citas por estado, ingresos, tasas de inasistencia y cancelación,
+    pacientes nuevos y recurrentes, costo de materiales, y desgloses por tratamiento
+    y tipo de cita. Lee solo las tablas de hechos (reportes/hechos.py).
+    """
+    try:
+        desde, hasta = _leer_rango(request)
+    except ValueError:
+        return Response(
+            {'error': 'Parámetros inválidos. Use desde=YYYY-MM-DD y hasta=YYYY-MM-DD, con desde <= hasta'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({'desde': desde, 'hasta': hasta, 'actualizado_en': _actualizado_en(), **indicadores(desde, hasta)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def serie_indicadores(request):
+    """Los mismos indicadores por ?periodo= (dia, semana o mes) entre ?desde= y ?hasta=."""
+    periodo = request.query_params.get('periodo', 'dia')
+    try:
+        desde, hasta = _leer_rango(request)
+    except ValueError:
+        return Response(
+            {'error': 'Parámetros inválidos. Use desde=YYYY-MM-DD y hasta=YYYY-MM-DD, con desde <= hasta'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if periodo not in PERIODOS:
+        return Response(
+            {'error': f"periodo debe ser uno de: {', '.join(PERIODOS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return Response({
+        'desde': desde, 'hasta': hasta, 'periodo': periodo, 'actualizado_en': _actualizado_en(),
+        'serie': serie(desde, hasta, periodo),
+    })
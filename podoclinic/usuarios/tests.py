@@ -1,3 +1,35 @@
+from itertools import count
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from podoclinic.testing import PresupuestoConsultasMixin
+from .models import Usuario
+
+
+class UsuariosQueryBudgetTest(PresupuestoConsultasMixin, TestCase):
+    """Los endpoints de usuarios no deben ejecutar más consultas al crecer los datos."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.usuario = Usuario.objects.create_user(username='admin', password='clave-segura-123', rol='admin')
+        self.client.force_authenticate(self.usuario)
+        self.secuencia = count()
+
+    def _sembrar_usuarios(self, cantidad):
+        Usuario.objects.bulk_create([
+            Usuario(username=f'usuario{i}') for i in (next(self.secuencia) for _ in range(cantidad))
+        ])
+
+    def test_listado_usuarios(self):
+        self.assertConsultasConstantes(self._sembrar_usuarios, '/api/usuarios/')
+
+    def test_me(self):
+        self.assertConsultasConstantes(self._sembrar_usuarios, '/api/usuarios/me/')
 
-# Create your tests here.
+    def test_login(self):
+        self.client.force_authenticate(None)
+        self.assertConsultasConstantes(
+            self._sembrar_usuarios, '/api/usuarios/auth/login/', 'post',
+            {'username': 'admin', 'password': 'clave-segura-123'}, format='json'
+        )